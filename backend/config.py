@@ -12,9 +12,14 @@ PROJECT_ROOT = BASE_DIR.parent
 # Generated Files Directory: backend/generated/
 GENERATED_DIR = BASE_DIR / "generated"
 
+# Internal cache (parquet sidecars, partial uploads): backend/cache/
+# Kept outside GENERATED_DIR so it is not served under /files
+CACHE_DIR = BASE_DIR / "cache"
+
 # Ensure directories exist
 os.makedirs(GENERATED_DIR, exist_ok=True)
 os.makedirs(GENERATED_DIR / "meta", exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 
 # Load Env
 load_dotenv(BASE_DIR / ".env")
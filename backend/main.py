@@ -5,7 +5,7 @@ load_dotenv("backend/.env")
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.routers import synthetic, sheets, analytics, orchestrator, ml, meta, system
+from backend.routers import synthetic, sheets, analytics, orchestrator, ml, meta, system, uploads
 
 from fastapi.staticfiles import StaticFiles
 import os
@@ -26,6 +26,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Build the dataset catalog from disk once at startup, and pre-fork the code sandbox
+@app.on_event("startup")
+def build_catalog():
+    from backend.services.catalog import catalog
+    from backend.services.sandbox import sandbox_pool
+    catalog.rebuild()
+    sandbox_pool.start()
+
+@app.on_event("shutdown")
+def stop_sandbox():
+    from backend.services.sandbox import sandbox_pool
+    sandbox_pool.shutdown()
+
+@app.on_event("shutdown")
+def stop_worker_pools():
+    from backend.services.concurrency import concurrency
+    concurrency.shutdown()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    from backend.services.llm_client import get_llm_client
+    await get_llm_client().aclose()
+
 # Include Routers
 app.include_router(system.router)
 app.include_router(synthetic.router)
@@ -34,6 +57,7 @@ app.include_router(analytics.router)
 app.include_router(orchestrator.router)
 app.include_router(ml.router)
 app.include_router(meta.router)
+app.include_router(uploads.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -4,12 +4,17 @@ Analytics Router - Fixed with proper JSON error handling
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import pandas as pd
 import numpy as np
 import os
 import traceback
-from backend.config import UPLOAD_DIR
+from backend.services.catalog import catalog
+from backend.services.concurrency import concurrency
+from backend.services.dataset_cache import dataset_cache, resolve_sheet, SheetNotFound
+from backend.services.result_cache import result_cache
+from backend.services.stream_stats import should_stream, stream_test
+from backend.services.regression import check_columns, fit_regression, linreg_result
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
@@ -18,38 +23,90 @@ class RunTestRequest(BaseModel):
     sheet: str = "data"
     test: str
     params: Dict[str, Any]
+    mode: str = "auto"                          # memory, stream (chunked, out-of-core) or auto
 
 class AgentRequest(BaseModel):
     dataset_id: str
     command: str
     sheet: str = "data"
 
-def load_dataframe(dataset_id: str) -> Optional[pd.DataFrame]:
-    """Load a DataFrame from dataset_id"""
+class BatchTestRequest(BaseModel):
+    dataset_id: str
+    sheet: str = "data"
+    tests: List[Dict[str, Any]] = []            # [{"test": "t-test", "params": {...}}, ...]
+    group_col: Optional[str] = None             # shorthand: every numeric column vs this group
+    group_tests: List[str] = ["t-test"]         # "t-test" and/or "anova" for group_col
+    target_col: Optional[str] = None            # shorthand: pearson of every numeric column with this
+    columns: Optional[List[str]] = None         # restrict the shorthands to these columns
+    adjust: str = "fdr_bh"                      # none, bonferroni, holm, fdr_bh, fdr_by
+    alpha: float = 0.05
+
+class CorrelationMatrixRequest(BaseModel):
+    dataset_id: str
+    sheet: str = "data"
+    columns: Optional[List[str]] = None         # default: every numeric column
+    method: str = "pearson"                     # pearson or spearman
+    min_periods: int = 3                        # fewer pairwise-complete rows -> r is null
+    threshold: Optional[float] = None           # only pairs with |r| >= threshold
+    top_k: Optional[int] = None                 # only the k strongest pairs
+    adjust: str = "none"                        # p-value correction over all pairs
+    include_matrix: bool = True                 # heatmap payload
+    digits: int = 4
+
+class ResampleRequest(BaseModel):
+    dataset_id: str
+    sheet: str = "data"
+    method: str = "bootstrap"                   # bootstrap (CI) or permutation (p-value)
+    statistic: str = "mean_diff"                # mean_diff, median_diff (group_col/value_col) or correlation (col1/col2)
+    params: Dict[str, Any]
+    n_resamples: int = 10000
+    confidence: float = 0.95
+    alternative: str = "two-sided"              # permutation only: two-sided, greater, less
+    seed: int = 0                               # same seed -> same result
+
+class RegressionRequest(BaseModel):
+    dataset_id: str
+    sheet: str = "data"
+    targets: List[str]                          # each target is fit on the same design
+    features: List[str]
+    categorical: Optional[List[str]] = None     # dummy-encode these too (text/bool columns always are)
+    alpha: float = 0.05                         # for the coefficient confidence intervals
+    mode: str = "auto"                          # memory, stream (chunked, out-of-core) or auto
+
+def load_dataframe(dataset_id: str, sheet: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Load a DataFrame from dataset_id (one sheet of a workbook; the request default "data"
+    falls back to the first sheet). Served from the dataset cache, so treat it as read-only.
+    Raises SheetNotFound for unknown sheets.
+    """
     try:
-        if dataset_id.startswith("http"):
-            filename = dataset_id.split("/")[-1]
-        else:
-            filename = dataset_id
-        
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        
-        if not os.path.exists(filepath):
-            # Try matching partial name
-            for f in os.listdir(UPLOAD_DIR):
-                if filename in f:
-                    filepath = os.path.join(UPLOAD_DIR, f)
-                    break
-        
-        if os.path.exists(filepath):
-            if filepath.endswith('.csv'):
-                return pd.read_csv(filepath)
-            else:
-                return pd.read_excel(filepath)
+        filepath = catalog.resolve(dataset_id)
+        
+        if filepath:
+            return dataset_cache.get_df(filepath, sheet)
+    except SheetNotFound:
+        raise
     except Exception as e:
         print(f"Error loading dataframe: {e}")
     return None
 
+def cached_result(dataset_id: str, sheet: Optional[str], test: str, params: Dict[str, Any],
+                  compute) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    compute(df) memoized per dataset version, test and params (services/result_cache.py);
+    a cache hit doesn't load the dataset at all.
+    Returns (result, cache info), result None when the dataset can't be loaded.
+    """
+    entry = catalog.get(dataset_id)
+    if entry is None:
+        return None, None
+    
+    def run():
+        df = load_dataframe(dataset_id, sheet)
+        return compute(df) if df is not None else None
+    
+    return result_cache.memoize(entry.path, sheet, entry.version, test, params, run)
+
 def run_statistical_test(test: str, params: Dict[str, Any], df: pd.DataFrame) -> Dict[str, Any]:
     """Run a statistical test on the dataframe"""
     from scipy import stats
@@ -80,7 +137,7 @@ def run_statistical_test(test: str, params: Dict[str, Any], df: pd.DataFrame) ->
                 "p_value": float(p_val),
                 "group1_mean": float(g1.mean()),
                 "group2_mean": float(g2.mean()),
-                "significant": p_val < 0.05,
+                "significant": bool(p_val < 0.05),
                 "meaning": f"The difference between groups is {'statistically significant' if p_val < 0.05 else 'not statistically significant'} (p={p_val:.4f})"
             }
             
@@ -91,13 +148,18 @@ def run_statistical_test(test: str, params: Dict[str, Any], df: pd.DataFrame) ->
             if not col1 or not col2:
                 return {"error": "Pearson requires col1 and col2 parameters"}
             
-            r, p_val = stats.pearsonr(df[col1].dropna(), df[col2].dropna())
+            # Drop rows missing either value, so the two columns stay aligned
+            pair = df[[col1, col2]].apply(pd.to_numeric, errors="coerce").dropna()
+            if len(pair) < 3:
+                return {"error": f"Pearson needs at least 3 rows with both {col1} and {col2}"}
+            r, p_val = stats.pearsonr(pair[col1], pair[col2])
             
             return {
                 "test": "pearson",
                 "correlation": float(r),
+                "n": len(pair),
                 "p_value": float(p_val),
-                "significant": p_val < 0.05,
+                "significant": bool(p_val < 0.05),
                 "meaning": f"{'Strong' if abs(r) > 0.7 else 'Moderate' if abs(r) > 0.4 else 'Weak'} {'positive' if r > 0 else 'negative'} correlation (r={r:.3f})"
             }
             
@@ -112,7 +174,7 @@ def run_statistical_test(test: str, params: Dict[str, Any], df: pd.DataFrame) ->
                 "test": "anova",
                 "f_statistic": float(f_stat),
                 "p_value": float(p_val),
-                "significant": p_val < 0.05
+                "significant": bool(p_val < 0.05)
             }
 
         elif test == "linreg":
@@ -122,38 +184,22 @@ def run_statistical_test(test: str, params: Dict[str, Any], df: pd.DataFrame) ->
             if not target or not features:
                 return {"error": "Regression requires target_col and feature_cols"}
             
-            # Simple linear regression with 1 feature for now (scipy stats linregress)
-            # Or use statsmodels/sklearn for multiple. Let's stick to simple 1v1 for robustness without extra deps if possible.
-            # But the agent might pass multiple features.
-            
-            # Use single feature if list provided
-            feature = features[0] if isinstance(features, list) else features
-            
-            slope, intercept, r_value, p_value, std_err = stats.linregress(df[feature], df[target])
-            
-            return {
-                "test": "linreg",
-                "slope": float(slope),
-                "intercept": float(intercept),
-                "r_squared": float(r_value**2),
-                "p_value": float(p_value),
-                "significant": p_value < 0.05
-            }
+            # All features together; text/bool columns (or categorical_cols) become dummies
+            features = list(features) if isinstance(features, (list, tuple)) else [features]
+            categorical = params.get("categorical_cols")
+            check_columns(df.columns, [target], features, categorical)
+            fit = fit_regression([df], [target], features, categorical)
+            return linreg_result(fit, target, features)
 
         elif test == "chi2":
             col1 = params.get("col1")
             col2 = params.get("col2")
+            if not col1 or not col2:
+                return {"error": "chi2 requires col1 and col2 parameters"}
             
-            contingency_table = pd.crosstab(df[col1], df[col2])
-            chi2, p, dof, expected = stats.chi2_contingency(contingency_table)
-            
-            return {
-                "test": "chi2",
-                "chi2_statistic": float(chi2),
-                "p_value": float(p),
-                "dof": int(dof),
-                "significant": p < 0.05
-            }
+            # Sparse counts of factorized codes: fine for columns with thousands of levels
+            from backend.services.contingency import contingency_table, chi2_result
+            return chi2_result(contingency_table([df], col1, col2))
         
         else:
             return {"error": f"Unknown test: {test}"}
@@ -162,55 +208,293 @@ def run_statistical_test(test: str, params: Dict[str, Any], df: pd.DataFrame) ->
         return {"error": str(e)}
 
 @router.post("/run")
+@concurrency.limit("analytics.run")
 async def run_analytics(req: RunTestRequest):
     """Run a statistical test"""
     try:
-        df = load_dataframe(req.dataset_id)
-        if df is None:
+        if req.mode not in ("auto", "memory", "stream"):
+            return JSONResponse(status_code=400, content={"error": f"Unknown mode: {req.mode}. Use auto, memory or stream"})
+        entry = catalog.get(req.dataset_id)
+        if entry is not None and should_stream(entry.path, req.test, dataset_cache.contains(entry.path, req.sheet), req.mode):
+            # Large file not parsed yet: chunked pass over the needed columns, O(groups) memory
+            result, cache = await concurrency.run_io(
+                result_cache.memoize, entry.path, req.sheet, entry.version, req.test, req.params,
+                lambda: stream_test(entry.path, req.sheet, req.test, req.params))
+        else:
+            result, cache = await concurrency.run_io(
+                cached_result, req.dataset_id, req.sheet, req.test, req.params,
+                lambda df: run_statistical_test(req.test, req.params, df))
+        if result is None:
             return JSONResponse(
                 status_code=400,
                 content={"error": f"Could not load dataset: {req.dataset_id}"}
             )
         
-        result = run_statistical_test(req.test, req.params, df)
+        if "error" in result:
+            return JSONResponse(status_code=400, content=result)
         
+        return {"status": "success", "results": result, "cache": cache}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/run_batch")
+@concurrency.limit("analytics.run_batch", 4)
+async def run_analytics_batch(req: BatchTestRequest):
+    """
+    Run many tests on one dataset load. t-tests/ANOVAs sharing a group column and all
+    Pearson pairs are computed as vectorized passes over a column matrix
+    (services/stat_batch.py); other tests run one by one on the same frame.
+    p-values are adjusted for multiple comparisons across the batch (`adjust`).
+    """
+    from backend.services.stat_batch import expand_specs, run_batch, ADJUST_METHODS
+    
+    try:
+        if req.adjust not in ADJUST_METHODS:
+            return JSONResponse(status_code=400, content={"error": f"Unknown adjustment: {req.adjust}. Use one of {sorted(ADJUST_METHODS)}"})
+        
+        def compute(df):
+            for col in [req.group_col, req.target_col] + (req.columns or []):
+                if col and col not in df.columns:
+                    return {"error": f"Column not found: {col}. Available: {list(df.columns)}"}
+            specs = expand_specs(df, req.tests, req.group_col, req.target_col, req.columns, req.group_tests)
+            if not specs:
+                return {"error": "No tests requested"}
+            results = run_batch(df, specs, req.adjust, req.alpha, run_statistical_test)
+            significant = sum(1 for r in results if r.get("significant"))
+            return {"status": "success", "adjust": req.adjust, "alpha": req.alpha, "total": len(results),
+                    "significant": significant, "results": results}
+        
+        params = req.model_dump(exclude={"dataset_id", "sheet"})
+        result, cache = await concurrency.run_io(cached_result, req.dataset_id, req.sheet, "batch", params, compute)
+        if result is None:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Could not load dataset: {req.dataset_id}"}
+            )
         if "error" in result:
             return JSONResponse(status_code=400, content=result)
+        return {**result, "cache": cache}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/correlation_matrix")
+@concurrency.limit("analytics.correlation_matrix", 4)
+async def correlation_matrix_endpoint(req: CorrelationMatrixRequest):
+    """
+    Pearson/Spearman correlation of every pair of columns, each pair over its own
+    pairwise-complete rows, computed as blocked matrix products (services/stat_batch.py).
+    Returns the pairs strongest first (optionally cut by `threshold` / `top_k`) with n and
+    p-values, and a heatmap payload {x, y, z, n} over the columns.
+    """
+    from backend.services.stat_batch import (correlation_matrix, correlation_pairs, numeric_columns,
+                                             numeric_matrix, matrix_list, ADJUST_METHODS,
+                                             CORRELATION_METHODS, CORR_HEATMAP_MAX_COLUMNS)
+    
+    try:
+        if req.method not in CORRELATION_METHODS:
+            return JSONResponse(status_code=400, content={"error": f"Unknown method: {req.method}. Use one of {sorted(CORRELATION_METHODS)}"})
+        if req.adjust not in ADJUST_METHODS:
+            return JSONResponse(status_code=400, content={"error": f"Unknown adjustment: {req.adjust}. Use one of {sorted(ADJUST_METHODS)}"})
+        if req.top_k is not None and req.top_k < 1:
+            return JSONResponse(status_code=400, content={"error": "top_k must be at least 1"})
+        
+        def compute(df):
+            missing = [c for c in (req.columns or []) if c not in df.columns]
+            if missing:
+                return {"error": f"Columns not found: {missing}. Available: {list(df.columns)}"}
+            columns = list(dict.fromkeys(req.columns)) if req.columns else numeric_columns(df)
+            if len(columns) < 2:
+                return {"error": "Need at least 2 numeric columns"}
+            corr = correlation_matrix(numeric_matrix(df, columns), req.method, req.min_periods)
+            pairs, matched = correlation_pairs(corr, [str(c) for c in columns], req.threshold, req.top_k, req.adjust)
+            heatmap = None
+            if req.include_matrix:
+                # Wide tables: only the columns that appear in the returned pairs
+                shown = list(range(len(columns)))
+                if len(columns) > CORR_HEATMAP_MAX_COLUMNS:
+                    names = {c for pair in pairs for c in (pair["col1"], pair["col2"])}
+                    shown = [i for i, c in enumerate(columns) if str(c) in names][:CORR_HEATMAP_MAX_COLUMNS]
+                if shown:
+                    sub = np.ix_(shown, shown)
+                    labels = [str(columns[i]) for i in shown]
+                    heatmap = {"x": labels, "y": labels, "zmin": -1, "zmax": 1,
+                               "z": matrix_list(corr["r"][sub], req.digits),
+                               "n": corr["n"][sub].tolist()}
+            return {"status": "success", "method": req.method, "adjust": req.adjust, "rows": len(df),
+                    "columns": [str(c) for c in columns], "pairs_total": len(columns) * (len(columns) - 1) // 2,
+                    "pairs_matched": matched, "pairs": pairs, "heatmap": heatmap}
         
-        return {"status": "success", "results": result}
+        params = req.model_dump(exclude={"dataset_id", "sheet"})
+        result, cache = await concurrency.run_io(cached_result, req.dataset_id, req.sheet, "correlation_matrix",
+                                                params, compute)
+        if result is None:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Could not load dataset: {req.dataset_id}"}
+            )
+        if "error" in result:
+            return JSONResponse(status_code=400, content=result)
+        return {**result, "cache": cache}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/resample")
+@concurrency.limit("analytics.resample", 2)
+async def resample_endpoint(req: ResampleRequest):
+    """
+    Bootstrap confidence intervals and permutation tests (no normality assumption) for
+    mean/median differences between two groups and for correlations. Resamples are
+    vectorized and spread over worker processes (services/resampling.py); results are
+    deterministic for a given seed, so they are memoized like the other tests.
+    """
+    from backend.services.resampling import resample_test
+    
+    try:
+        def compute(df):
+            try:
+                return resample_test(df, req.method, req.statistic, req.params, req.n_resamples,
+                                     req.confidence, req.alternative, req.seed)
+            except (ValueError, KeyError) as e:
+                return {"error": str(e)}
+        
+        params = req.model_dump(exclude={"dataset_id", "sheet"})
+        result, cache = await concurrency.run_io(cached_result, req.dataset_id, req.sheet, "resample", params, compute)
+        if result is None:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Could not load dataset: {req.dataset_id}"}
+            )
+        if "error" in result:
+            return JSONResponse(status_code=400, content=result)
+        return {"status": "success", "results": result, "cache": cache}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/regression")
+@concurrency.limit("analytics.regression", 4)
+async def regression_endpoint(req: RegressionRequest):
+    """
+    Multiple linear regression of one or more targets on the same features, with
+    categorical features dummy-encoded (first level as reference). Coefficients, standard
+    errors, confidence intervals and fit diagnostics per target, from one pass that only
+    accumulates X'X and X'Y (services/regression.py); big files are read in chunks.
+    """
+    from backend.services.regression import RegressionError
+    from backend.services.sheet_export import iter_frame_chunks
+    from backend.services.stream_stats import STREAM_CHUNK_ROWS
+    
+    try:
+        if req.mode not in ("auto", "memory", "stream"):
+            return JSONResponse(status_code=400, content={"error": f"Unknown mode: {req.mode}. Use auto, memory or stream"})
+        entry = catalog.get(req.dataset_id)
+        if entry is None:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Could not load dataset: {req.dataset_id}"}
+            )
+        columns = list(dict.fromkeys(req.targets + req.features + (req.categorical or [])))
+        
+        def fit(chunks):
+            try:
+                return fit_regression(chunks, req.targets, req.features, req.categorical, req.alpha)
+            except (RegressionError, KeyError) as e:
+                return {"error": str(e.args[0]) if isinstance(e, KeyError) and e.args else str(e)}
+        
+        def compute(df):
+            try:
+                check_columns(df.columns, req.targets, req.features, req.categorical)
+            except RegressionError as e:
+                return {"error": str(e)}
+            return fit([df])
+        
+        def stream():
+            try:
+                check_columns(columns, req.targets, req.features, req.categorical)
+            except RegressionError as e:
+                return {"error": str(e)}
+            return fit(iter_frame_chunks(entry.path, STREAM_CHUNK_ROWS, sheet=resolve_sheet(entry.path, req.sheet),
+                                         columns=columns))
+        
+        params = req.model_dump(exclude={"dataset_id", "sheet", "mode"})
+        if should_stream(entry.path, "linreg", dataset_cache.contains(entry.path, req.sheet), req.mode):
+            result, cache = await concurrency.run_io(
+                result_cache.memoize, entry.path, req.sheet, entry.version, "regression", params, stream)
+        else:
+            result, cache = await concurrency.run_io(cached_result, req.dataset_id, req.sheet, "regression", params, compute)
+        if result is None:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Could not load dataset: {req.dataset_id}"}
+            )
+        if "error" in result:
+            return JSONResponse(status_code=400, content=result)
+        return {"status": "success", "results": result, "cache": cache}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.post("/agent")
+@concurrency.limit("analytics.agent")
 async def run_agent(req: AgentRequest):
     """Parse natural language command and run analysis"""
     try:
         from backend.services.agent_core import AgentCore
+        from backend.services.profiler import profile_dtypes, profile_sample_text, profile_frame
         
-        df = load_dataframe(req.dataset_id)
-        
-        if df is None:
+        entry = catalog.get(req.dataset_id)
+        if entry is None:
             return JSONResponse(
                 status_code=400,
                 content={"error": f"Could not load dataset: {req.dataset_id}"}
             )
         
-        columns = {c: str(df[c].dtype) for c in df.columns}
-        sample_data = df.head(3).to_string()
+        # Prompt context comes from the stored column profile, not the data file
+        # (stored profiles cover the first sheet; other sheets are profiled from the cache)
+        def load_profile():
+            sheet = resolve_sheet(entry.path, req.sheet)
+            return entry.profile() if sheet is None else profile_frame(dataset_cache.get_df(entry.path, sheet))
+        
+        profile = await concurrency.run_io(load_profile)
+        columns = profile_dtypes(profile)
+        sample_data = profile_sample_text(profile)
         
         agent = AgentCore()
-        plan = agent.parse_stat_command(req.command, columns, sample_data)
+        plan = await agent.parse_stat_command(req.command, columns, sample_data)
         
         if plan.get("error"):
             return {"status": "error", "plan": plan, "message": plan["error"]}
         
-        # Run the test if we got a valid plan
+        # Run the test if we got a valid plan (only now is the data loaded)
         if plan.get("test"):
-            result = run_statistical_test(plan["test"], plan.get("params", {}), df)
-            return {"status": "success", "plan": plan, "results": result}
+            # Different phrasings often map to the same test: shares the /run cache
+            test, params = plan["test"], plan.get("params", {})
+            result, cache = await concurrency.run_io(
+                cached_result, req.dataset_id, req.sheet, test, params,
+                lambda df: run_statistical_test(test, params, df))
+            if result is None:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": f"Could not load dataset: {req.dataset_id}"}
+                )
+            return {"status": "success", "plan": plan, "results": result, "cache": cache}
         
         return {"status": "parsed", "plan": plan}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
@@ -221,7 +505,7 @@ async def explain_result(results: Dict[str, Any]):
     try:
         from backend.services.agent_core import AgentCore
         agent = AgentCore()
-        explanation = agent.explain_result(results)
+        explanation = await agent.explain_result(results)
         return {"explanation": explanation}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
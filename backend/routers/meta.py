@@ -1,5 +1,5 @@
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, BackgroundTasks
 from fastapi.responses import JSONResponse
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
@@ -8,6 +8,7 @@ import numpy as np
 import io
 import os
 import traceback
+from backend.services.concurrency import concurrency
 
 router = APIRouter(prefix="/meta", tags=["meta-scientist"])
 
@@ -40,18 +41,22 @@ class SyngenRequest(BaseModel):
     heterogeneity: float = 0.01
 
 @router.post("/upload")
-async def upload_experiments(files: List[UploadFile] = File(...)):
-    """Upload experiment files locally"""
+@concurrency.limit("meta.upload")
+async def upload_experiments(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
+    """Upload experiment files locally (large files: use /uploads with target="meta")"""
+    from backend.services.chunked_upload import save_upload_stream
+    from backend.services.ingest import ingest_dataset
+    
     uploaded = []
     
     for f in files:
         try:
-            contents = await f.read()
             filename = f"{pd.Timestamp.now().strftime('%Y%m%d%H%M%S')}_{f.filename}"
             filepath = os.path.join(LOCAL_META_DIR, filename)
             
-            with open(filepath, "wb") as out:
-                out.write(contents)
+            # Stream to disk in blocks
+            await concurrency.run_io(save_upload_stream, f.file, filepath)
+            background_tasks.add_task(ingest_dataset, filepath, register=False)
             
             uploaded.append({
                 "file_id": filename,
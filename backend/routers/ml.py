@@ -7,6 +7,11 @@ from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from supabase import create_client, Client
 from backend.config import UPLOAD_DIR
+from backend.services.catalog import catalog
+from backend.services.concurrency import concurrency
+from backend.services.dataset_cache import dataset_cache, SheetNotFound
+from backend.services.live_sync import live_sync
+from backend.services.sandbox import sandbox_pool
 
 # Try Import AutoGluon
 try:
@@ -38,25 +43,15 @@ class PredictRequest(BaseModel):
 
 @router.post("/train")
 def train_model(req: TrainRequest):
-    # 1. Load Data from file path or URL
+    # 1. Load Data (URL, filename or alias); only the requested sheet is parsed
     df = None
-    
-    # Check if dataset_id is a local path
-    if req.dataset_id.startswith("http"):
-        # It's a URL, extract filename and load from generated/
-        filename = req.dataset_id.split("/")[-1]
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        if os.path.exists(filepath):
-            if filename.endswith('.csv'):
-                df = pd.read_csv(filepath)
-            else:
-                df = pd.read_excel(filepath)
-    elif os.path.exists(os.path.join(UPLOAD_DIR, req.dataset_id)):
-        filepath = os.path.join(UPLOAD_DIR, req.dataset_id)
-        if req.dataset_id.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        else:
-            df = pd.read_excel(filepath)
+    filepath = catalog.resolve(req.dataset_id)
+    if filepath:
+        try:
+            # Copy: training must not touch the shared cached frame
+            df = dataset_cache.get_df(filepath, req.sheet).copy()
+        except SheetNotFound as e:
+            return {"error": str(e)}
     
     # Fallback to mock data if file not found
     if df is None:
@@ -106,6 +101,7 @@ class AgentRouterRequest(BaseModel):
     command: str
 
 @router.post("/agent_interact")
+@concurrency.limit("ml.agent_interact")
 async def interact_with_agent(req: AgentRouterRequest):
     """
     Unified Agent Endpoint using the 'Two-Engine' Framework
@@ -114,36 +110,20 @@ async def interact_with_agent(req: AgentRouterRequest):
         from backend.services.agent_core import AgentCore
         agent = AgentCore()
         
-        # Resolve File
-        # Check if dataset_id is a local path
-        if req.dataset_id.startswith("http"):
-             filename = req.dataset_id.split("/")[-1]
-             filepath = os.path.join(UPLOAD_DIR, filename)
-        else:
-             filepath = os.path.join(UPLOAD_DIR, req.dataset_id)
-        
-        # Try finding file if not exact match
-        if not os.path.exists(filepath):
-            for f in os.listdir(UPLOAD_DIR):
-                if req.dataset_id in f:
-                    filepath = os.path.join(UPLOAD_DIR, f)
-                    break
-                    
-        if not os.path.exists(filepath):
+        # Resolve File (URL, filename or alias) via the dataset catalog
+        filepath = catalog.resolve(req.dataset_id)
+        if not filepath:
              return {"error": "Dataset not found"}
 
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        else:
-            df = pd.read_excel(filepath)
-            
-        # 1. Ask Router
+        # 1. Ask Router (context from the stored column profile, no data load)
+        from backend.services.profiler import profile_store, profile_column_names, profile_sample_text
+        profile = await concurrency.run_io(profile_store.get, filepath)
         context = {
-            "columns": list(df.columns),
-            "sample": df.head(3).to_string()
+            "columns": profile_column_names(profile),
+            "sample": profile_sample_text(profile)
         }
         
-        decision = agent.agent_router(req.command, context)
+        decision = await agent.agent_router(req.command, context)
         
         if "error" in decision:
             return decision
@@ -151,26 +131,34 @@ async def interact_with_agent(req: AgentRouterRequest):
         action = decision.get("action")
         
         if action == "MANIPULATION":
+            ops = decision.get("ops")
             code = decision.get("code")
-            if not code:
+            if not ops and not code:
                 return {"error": "Failed to generate manipulation code"}
             
-            # Execute Pandas Code
-            local_scope = {"df": df, "pd": pd}
+            from backend.services.edit_ops import apply_ops, edit_journal
+            ds = await concurrency.run_io(dataset_cache.get, filepath)
             try:
-                exec(code, {}, local_scope)
-                new_df = local_scope.get("df")
-                
-                # Save
-                if filepath.endswith('.csv'):
-                    new_df.to_csv(filepath, index=False)
+                if ops:
+                    # Validated op plan, applied as vectorized column operations
+                    new_df = (await concurrency.run_io(apply_ops, ds, ops))["df"]
                 else:
-                    new_df.to_excel(filepath, index=False)
+                    # Run in a sandbox worker process (time/memory limited), off the event loop
+                    new_df = await concurrency.run_io(sandbox_pool.run, code, ds.df)
+                
+                # Save the first sheet like /sheets/save: other sheets are kept, computed columns updated
+                from backend.routers.sheets import _save_edit
+                entry, new_df, _ = await concurrency.run_io(_save_edit, filepath, ds.df, new_df)
+                edit_journal.append(entry.dataset_id, req.command, ops=ops, code=code, version=entry.version,
+                                    rows_before=len(ds.df), rows_after=len(new_df))
+                await live_sync.publish(entry.dataset_id, None, ds.df, new_df, entry.version, command=req.command)
                 
                 return {
                     "status": "success",
                     "action": "MANIPULATION",
+                    "ops": ops,
                     "code": code,
+                    "source": decision.get("source"),
                     "message": "View updated. Data manipulation executed."
                 }
             except Exception as e:
@@ -186,7 +174,7 @@ async def interact_with_agent(req: AgentRouterRequest):
             # Ideally returns a "plan" to frontend to start training or starts it.
             
             # Check target exists
-            if target not in df.columns:
+            if target not in context["columns"]:
                  return {"error": f"Target '{target}' not found in dataset."}
             
             # Start Training (Short timeout for demo)
@@ -16,7 +16,7 @@ class PlanRequest(BaseModel):
     input: str
 
 @router.post("/plan")
-def create_plan(req: PlanRequest):
+async def create_plan(req: PlanRequest):
     core = OrchestratorCore()
-    result = core.run(req.input)
+    result = await core.run(req.input)
     return result
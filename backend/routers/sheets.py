@@ -1,14 +1,25 @@
 """
 Sheets Router - Fixed with proper error handling and Excel export
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from backend.config import UPLOAD_DIR
+from backend.services.dataset_cache import dataset_cache, list_sheets, resolve_sheet, SheetNotFound
+from backend.services.catalog import catalog, filename_from_ref
+from backend.services.concurrency import concurrency
+from backend.services.profiler import profile_store, profile_column_names, profile_sample_text
+from backend.services.result_cache import result_cache
+from backend.services.sandbox import sandbox_pool, SandboxError, SandboxTimeout, SandboxBusy
+from backend.services.edit_ops import edit_journal
+from backend.services.computed_columns import computed_store, recompute, compute_all, ComputedColumnError
+from backend.services.wire_format import frame_response
+from backend.services.live_sync import live_sync
 import os
 import pandas as pd
 import io
+import json
 from datetime import datetime
 import traceback
 
@@ -19,251 +30,577 @@ router = APIRouter(prefix="/sheets", tags=["Sheets"])
 
 class LoadRequest(BaseModel):
     url: str
+    sheet: Optional[str] = None         # workbook sheet, default the first
 
 class SaveRequest(BaseModel):
     url: str
     rows: List[Dict[str, Any]]
+    sheet: Optional[str] = None         # other sheets of the workbook are kept
+    client_id: Optional[str] = None     # echoed as "origin" in the live-sync diff
 
 class AgentEditRequest(BaseModel):
     url: str
     command: str
+    client_id: Optional[str] = None
+
+class ApplyOpsRequest(BaseModel):
+    url: str
+    ops: List[Dict[str, Any]]
+    command: Optional[str] = None
+    client_id: Optional[str] = None
+
+class ReplayRequest(BaseModel):
+    url: str                            # dataset to apply the edits to
+    source: str                         # dataset whose journal is replayed
+    entries: Optional[List[int]] = None # journal entry indexes, default all
+
+class QueryRequest(BaseModel):
+    url: str
+    filters: List[Dict[str, Any]] = []
+    search: Optional[str] = None
+    search_columns: Optional[List[str]] = None
+    sort: List[Dict[str, Any]] = []
+    offset: int = 0
+    limit: int = 100
+    sheet: Optional[str] = None
+
+class ComputedColumnRequest(BaseModel):
+    url: str
+    definition: Dict[str, Any]          # see services/computed_columns.py for the kinds
+    sheet: Optional[str] = None
+
+class DistinctRequest(BaseModel):
+    url: str
+    column: str
+    limit: int = 200
+    sheet: Optional[str] = None
+
+def _record_write(filepath: str, df: pd.DataFrame):
+    """Keep the dataset cache, profile, test results and catalog in sync after writing a file"""
+    dataset_cache.invalidate(filepath)
+    profile_store.invalidate(filepath)
+    result_cache.invalidate(filepath)
+    return catalog.register(filepath, df=df)
+
+def _write_frame(filepath: str, df: pd.DataFrame, sheet: Optional[str] = None):
+    """
+    Write a DataFrame back to its CSV/Excel file (or to one sheet of a workbook) and record
+    the write. Multi-sheet workbooks are updated in place so the other sheets are kept.
+    """
+    if filepath.endswith('.csv'):
+        df.to_csv(filepath, index=False)
+        return _record_write(filepath, df)
+    
+    names = list_sheets(filepath) if os.path.exists(filepath) and filepath.endswith('.xlsx') else []
+    target = sheet or (names[0] if names else "Sheet1")
+    if names and (len(names) > 1 or target not in names):
+        with pd.ExcelWriter(filepath, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+            df.to_excel(writer, sheet_name=target, index=False)
+    else:
+        df.to_excel(filepath, index=False, sheet_name=target, engine='openpyxl')
+    # Catalog details (rows, schema) describe the first sheet only
+    first = not names or target == names[0]
+    return _record_write(filepath, df if first else None)
+
+def _save_edit(filepath: str, old: Optional[pd.DataFrame], df: pd.DataFrame, sheet: Optional[str] = None):
+    """
+    Write an edited frame back: computed columns defined on the dataset are brought up to
+    date first (see services/computed_columns.py), then the file is written and recorded.
+    Returns (catalog entry, frame as written, recompute report or None).
+    """
+    recomputed = None
+    defs = computed_store.definitions(os.path.basename(filepath), sheet)
+    if defs:
+        try:
+            df, recomputed = recompute(old, df, defs)
+        except ComputedColumnError as e:
+            # Never lose the user's edits over a stale definition; save as sent
+            print(f"Warning: computed columns not updated for {filepath}: {e}")
+            recomputed = {"error": str(e)}
+    return _write_frame(filepath, df, sheet), df, recomputed
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload a CSV/Excel file"""
+@concurrency.limit("sheets.upload")
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """Upload a CSV/Excel file (large files: use the chunked /uploads protocol)"""
+    from backend.services.chunked_upload import save_upload_stream, unique_upload_name
+    from backend.services.ingest import ingest_dataset
+    
     try:
         # Generate unique filename
-        safe_name = file.filename.replace(" ", "_") if file.filename else "upload.csv"
-        unique_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_name}"
+        unique_name = unique_upload_name(file.filename)
         file_path = os.path.join(UPLOAD_DIR, unique_name)
         
-        # Save file
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        # Save file in blocks instead of reading it all into memory
+        size = await concurrency.run_io(save_upload_stream, file.file, file_path)
+        catalog.register(file_path)
+        background_tasks.add_task(ingest_dataset, file_path)
         
         return {
             "status": "success",
             "filename": unique_name,
             "url": f"http://localhost:8000/files/{unique_name}",
             "path": file_path,
-            "size": len(contents)
+            "size": size
         }
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.post("/load")
-async def load_sheet(req: LoadRequest):
-    """Load a sheet from URL or filename"""
+@concurrency.limit("sheets.load")
+async def load_sheet(req: LoadRequest, request: Request):
+    """
+    Load a sheet from URL or filename.
+    Response format follows the Accept header (see services/wire_format.py): row objects
+    (default), column-oriented typed arrays, or Arrow IPC.
+    """
     try:
-        # Extract filename from URL
-        if req.url.startswith("http"):
-            filename = req.url.split("/")[-1]
-        else:
-            filename = req.url
+        filepath = catalog.resolve(req.url)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {filename_from_ref(req.url)}"})
         
-        filepath = os.path.join(UPLOAD_DIR, filename)
+        # Load the sheet (parsed on first use only, then served from the dataset cache)
+        ds = await concurrency.run_io(dataset_cache.get, filepath, req.sheet)
+        sheets = await concurrency.run_io(list_sheets, filepath)
+        meta = {"status": "success", "sheet": ds.sheet or (sheets[0] if sheets else None), "sheets": sheets}
         
-        if not os.path.exists(filepath):
-            # Try without timestamp prefix
-            for f in os.listdir(UPLOAD_DIR):
-                if filename in f or f.endswith(filename):
-                    filepath = os.path.join(UPLOAD_DIR, f)
-                    break
-        
-        if not os.path.exists(filepath):
-            return JSONResponse(status_code=404, content={"error": f"File not found: {filename}"})
-        
-        # Load file
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        else:
-            df = pd.read_excel(filepath, sheet_name=0)
-        
-        # Convert to columns and rows format
-        columns = [{"key": col, "name": col, "editable": True} for col in df.columns]
-        rows = df.to_dict(orient='records')
-        
-        return {
-            "status": "success",
-            "columns": columns,
-            "rows": rows,
-            "total": len(rows)
-        }
+        # Serialize off the event loop; large sheets take a while in any format
+        return await concurrency.run_io(frame_response, request, ds.df, meta)
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.post("/save")
+@concurrency.limit("sheets.save")
 async def save_sheet(req: SaveRequest):
-    """Save edited rows back to file"""
+    """
+    Save edited rows back to file.
+    Computed columns defined on the dataset are brought up to date first: only the rows
+    (and derived columns) reachable from the edited cells are re-evaluated.
+    """
     try:
-        # Extract filename
-        if req.url.startswith("http"):
-            filename = req.url.split("/")[-1]
-        else:
-            filename = req.url
-        
-        filepath = os.path.join(UPLOAD_DIR, filename)
+        # Find actual file, or create a new one in UPLOAD_DIR
+        filepath = catalog.resolve(req.url) or os.path.join(UPLOAD_DIR, filename_from_ref(req.url))
         
-        # Find actual file
-        if not os.path.exists(filepath):
-            for f in os.listdir(UPLOAD_DIR):
-                if filename in f:
-                    filepath = os.path.join(UPLOAD_DIR, f)
-                    break
+        # Convert to DataFrame and save (a new sheet name adds the sheet to the workbook)
+        df = await concurrency.run_io(pd.DataFrame, req.rows)
+        sheet, old = req.sheet, None
+        if os.path.exists(filepath):
+            try:
+                sheet = resolve_sheet(filepath, sheet)
+                old = await concurrency.run_io(dataset_cache.get_df, filepath, sheet)
+            except SheetNotFound:
+                pass
         
-        # Convert to DataFrame and save
-        df = pd.DataFrame(req.rows)
+        entry, df, recomputed = await concurrency.run_io(_save_edit, filepath, old, df, sheet)
+        await live_sync.publish(entry.dataset_id, sheet, old, df, entry.version, origin=req.client_id)
         
-        if filepath.endswith('.csv'):
-            df.to_csv(filepath, index=False)
-        else:
-            df.to_excel(filepath, index=False, engine='openpyxl')
-        
-        return {"status": "success", "message": "Saved successfully", "rows_saved": len(req.rows)}
+        result = {"status": "success", "message": "Saved successfully", "rows_saved": len(req.rows)}
+        if recomputed is not None:
+            result["recomputed"] = recomputed
+        return result
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.post("/agent-edit")
-async def agent_edit_sheet(req: AgentEditRequest):
-    """Edit a sheet using natural language commands"""
+@concurrency.limit("sheets.agent_edit")
+async def agent_edit_sheet(req: AgentEditRequest, request: Request):
+    """
+    Edit a sheet using natural language commands.
+    The command is planned into validated ops (services/edit_ops.py) that run as vectorized
+    column operations on the cached dataset; commands the ops can't express fall back to
+    generated pandas code in the sandbox.
+    """
     try:
         from backend.services.agent_core import AgentCore
+        from backend.services.edit_ops import compile_plan, apply_ops, plan_to_code, EditOpError
         
         # Resolve file path
-        if req.url.startswith("http"):
-            filename = req.url.split("/")[-1]
-        else:
-            filename = req.url
-            
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        if not os.path.exists(filepath):
-             # Try search
-            for f in os.listdir(UPLOAD_DIR):
-                if filename in f:
-                    filepath = os.path.join(UPLOAD_DIR, f)
-                    break
-        
-        if not os.path.exists(filepath):
+        filepath = catalog.resolve(req.url)
+        if not filepath:
             return JSONResponse(status_code=404, content={"error": "File not found"})
             
-        # Load df
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        else:
-            df = pd.read_excel(filepath)
-            
-        # Agent
+        # Agent prompt from the stored column profile
+        profile = await concurrency.run_io(profile_store.get, filepath)
         agent = AgentCore()
-        cols = list(df.columns)
-        sample = df.head(3).to_string()
+        cols = profile_column_names(profile)
+        sample = profile_sample_text(profile)
         
-        code = agent.manipulate_data(req.command, cols, sample)
+        # 1. Ask for an op plan and validate it against the schema
+        ops = None
+        plan = await agent.plan_edit(req.command, cols, sample)
+        if plan.get("ops"):
+            try:
+                ops = compile_plan(plan["ops"], cols)
+            except EditOpError as e:
+                print(f"Warning: rejected edit plan, falling back to code generation: {e}")
         
-        if not code:
-            return JSONResponse(status_code=400, content={"error": "Could not generate code for command"})
-            
-        # Execute Code
-        # We need a local scope
-        local_scope = {"df": df, "pd": pd, "np": np}
-        
-        # Execute
-        try:
-            exec(code, {}, local_scope)
-        except Exception as e:
-            return JSONResponse(status_code=400, content={"error": f"Execution failed: {e}\nCode: {code}"})
-            
-        # Get result
-        new_df = local_scope.get("df")
-        if not isinstance(new_df, pd.DataFrame):
-            return JSONResponse(status_code=400, content={"error": "Code executed but `df` variable was lost"})
-            
-        # Save back
-        if filepath.endswith('.csv'):
-            new_df.to_csv(filepath, index=False)
+        ds = await concurrency.run_io(dataset_cache.get, filepath)
+        if ops is not None:
+            # 2a. Apply the ops in-process (no arbitrary code involved), off the event loop
+            try:
+                applied = await concurrency.run_io(apply_ops, ds, ops)
+            except EditOpError as e:
+                return JSONResponse(status_code=400, content={"error": f"Execution failed: {e}", "ops": ops})
+            new_df = applied["df"]
+            code = plan_to_code(ops)
         else:
-            new_df.to_excel(filepath, index=False)
+            # 2b. Free-form code, executed in a sandbox worker process (time/memory limited)
+            code = await agent.manipulate_data(req.command, cols, sample)
+            if not code:
+                return JSONResponse(status_code=400, content={"error": "Could not generate code for command"})
+            try:
+                # The sandbox works on its own copy, the cached frame is never modified
+                new_df = await concurrency.run_io(sandbox_pool.run, code, ds.df)
+            except SandboxTimeout as e:
+                return JSONResponse(status_code=408, content={"error": f"Execution failed: {e}\nCode: {code}"})
+            except SandboxBusy as e:
+                return JSONResponse(status_code=503, content={"error": str(e)})
+            except SandboxError as e:
+                return JSONResponse(status_code=400, content={"error": f"Execution failed: {e}\nCode: {code}"})
             
-        # Return new data
-        columns = [{"key": col, "name": col, "editable": True} for col in new_df.columns]
-        rows = new_df.to_dict(orient='records')
-        
-        return {
+        # Save back and journal the edit
+        entry, new_df, _ = await concurrency.run_io(_save_edit, filepath, ds.df, new_df)
+        edit_journal.append(entry.dataset_id, req.command, ops=ops, code=code, version=entry.version,
+                            rows_before=len(ds.df), rows_after=len(new_df))
+        await live_sync.publish(entry.dataset_id, None, ds.df, new_df, entry.version,
+                                origin=req.client_id, command=req.command)
+            
+        # Return new data in the negotiated wire format
+        meta = {
             "status": "success",
             "message": f"Executed: {req.command}",
-            "code_executed": code,
-            "columns": columns,
-            "rows": rows
+            "engine": "ops" if ops is not None else "sandbox",
+            "ops": ops,
+            "code_executed": code
         }
+        return await concurrency.run_io(frame_response, request, new_df, meta)
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-@router.get("/export/xlsx/{filename}")
-async def export_xlsx(filename: str):
-    """Export a dataset as Excel .xlsx file"""
+async def _apply_and_save(filepath: str, ops: List[Dict[str, Any]], command: Optional[str],
+                          origin: Optional[str] = None, **extra) -> Dict[str, Any]:
+    """Validates and applies an op plan to a dataset, writes it back and journals it"""
+    from backend.services.edit_ops import compile_plan, apply_ops, plan_to_code
+    
+    ds = await concurrency.run_io(dataset_cache.get, filepath)
+    ops = compile_plan(ops, [str(c) for c in ds.df.columns])
+    applied = await concurrency.run_io(apply_ops, ds, ops)
+    entry, new_df, _ = await concurrency.run_io(_save_edit, filepath, ds.df, applied["df"])
+    edit_journal.append(entry.dataset_id, command, ops=ops, code=plan_to_code(ops), version=entry.version,
+                        rows_before=applied["rows_before"], rows_after=applied["rows_after"], **extra)
+    await live_sync.publish(entry.dataset_id, None, ds.df, new_df, entry.version, origin=origin, command=command)
+    return {
+        "status": "success",
+        "dataset_id": entry.dataset_id,
+        "version": entry.version,
+        "ops": ops,
+        "rows_before": applied["rows_before"],
+        "rows_after": applied["rows_after"],
+        "took_ms": applied["took_ms"],
+        "columns": [{"key": col, "name": col, "editable": True} for col in new_df.columns]
+    }
+
+@router.post("/apply-ops")
+@concurrency.limit("sheets.apply_ops")
+async def apply_sheet_ops(req: ApplyOpsRequest):
+    """Apply an explicit op plan (same IR the agent produces) without calling the LLM"""
+    from backend.services.edit_ops import EditOpError
+    
     try:
-        # Try to find the file
-        filepath = os.path.join(UPLOAD_DIR, filename)
+        filepath = catalog.resolve(req.url)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {req.url}"})
+        return await _apply_and_save(filepath, req.ops, req.command, origin=req.client_id)
+    except EditOpError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/journal/{dataset_id}")
+async def get_journal(dataset_id: str):
+    """Edit history of a dataset: command, ops, equivalent code and version per edit"""
+    try:
+        entry = catalog.get(dataset_id)
+        name = entry.dataset_id if entry else filename_from_ref(dataset_id)
+        entries = edit_journal.entries(name)
+        return {"dataset_id": name, "entries": entries, "total": len(entries)}
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/replay")
+@concurrency.limit("sheets.replay")
+async def replay_journal(req: ReplayRequest):
+    """
+    Re-apply the recorded ops of `source` to the dataset at `url` (e.g. this month's export),
+    without calling the LLM. `entries` selects journal entries by index (default: all).
+    Raw-code edits are skipped since they were never compiled to ops.
+    """
+    from backend.services.edit_ops import EditOpError
+    
+    try:
+        filepath = catalog.resolve(req.url)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {req.url}"})
+        source = catalog.get(req.source)
+        source_id = source.dataset_id if source else filename_from_ref(req.source)
         
-        if not os.path.exists(filepath):
-            # Try with common extensions
-            for ext in ['', '.csv', '.xlsx', '.xls']:
-                test_path = os.path.join(UPLOAD_DIR, filename + ext) if ext else filepath
-                if os.path.exists(test_path):
-                    filepath = test_path
-                    break
-            # Try matching partial name
-            if not os.path.exists(filepath):
-                for f in os.listdir(UPLOAD_DIR):
-                    if filename in f:
-                        filepath = os.path.join(UPLOAD_DIR, f)
-                        break
+        ops = edit_journal.replay_ops(source_id, req.entries)
+        if not ops:
+            return JSONResponse(status_code=400, content={"error": f"No replayable edits recorded for {source_id}"})
+        return await _apply_and_save(filepath, ops, f"replay of {source_id}", replayed_from=source_id)
+    except EditOpError as e:
+        return JSONResponse(status_code=400, content={"error": f"Replay failed: {e}"})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/query")
+@concurrency.limit("sheets.query")
+async def query_sheet(req: QueryRequest):
+    """
+    Server-side filter, search and sort over the cached dataset.
+    Returns one page (`offset`/`limit`) plus the filtered total.
+    Filters: [{"column": "age", "op": "gte", "value": 30}, ...]
+    Ops: eq, ne, in, not_in, gt, gte, lt, lte, between, contains, startswith, isnull, notnull
+    Sort: [{"column": "age", "desc": true}, ...]
+    """
+    from backend.services.sheet_query import run_query, QueryError
+    
+    try:
+        filepath = catalog.resolve(req.url)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {req.url}"})
         
-        if not os.path.exists(filepath):
-            return JSONResponse(status_code=404, content={"error": f"File not found: {filename}"})
+        ds = await concurrency.run_io(dataset_cache.get, filepath, req.sheet)
+        result = await concurrency.run_io(
+            run_query,
+            ds,
+            filters=req.filters,
+            search=req.search,
+            search_columns=req.search_columns,
+            sort=req.sort,
+            offset=req.offset,
+            limit=req.limit
+        )
+        return {"status": "success", **result}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/query/distinct")
+@concurrency.limit("sheets.distinct")
+async def query_distinct(req: DistinctRequest):
+    """Distinct values with counts for one column (filter dropdowns)"""
+    from backend.services.sheet_query import distinct_values, QueryError
+    
+    try:
+        filepath = catalog.resolve(req.url)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {req.url}"})
         
-        # Load the file
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        else:
-            df = pd.read_excel(filepath)
+        ds = await concurrency.run_io(dataset_cache.get, filepath, req.sheet)
+        result = await concurrency.run_io(distinct_values, ds, req.column, req.limit)
+        return {"status": "success", **result}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/computed")
+@concurrency.limit("sheets.computed")
+async def define_computed_column(req: ComputedColumnRequest):
+    """
+    Add (or replace) a computed column, stored with the dataset and kept in sync on /save.
+    {"name": "margin", "expr": "(price - cost) / price"}
+    {"name": "sales_ma7", "kind": "rolling", "column": "sales", "window": 7, "agg": "mean"}
+    The column is evaluated once over the whole sheet and written to the file.
+    """
+    try:
+        filepath = catalog.resolve(req.url)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {req.url}"})
+        sheet = resolve_sheet(filepath, req.sheet)
+        ds = await concurrency.run_io(dataset_cache.get, filepath, sheet)
+        dataset_id = os.path.basename(filepath)
+        
+        # Evaluate before storing, so a definition that fails on this data is never kept
+        defs = computed_store.with_definition(dataset_id, req.definition, [str(c) for c in ds.df.columns], sheet)
+        df = await concurrency.run_io(compute_all, ds.df, defs)
+        computed_store.save(dataset_id, defs, sheet)
+        entry = await concurrency.run_io(_write_frame, filepath, df, sheet)
+        await live_sync.publish(entry.dataset_id, sheet, ds.df, df, entry.version)
+        return {
+            "status": "success",
+            "definitions": defs,
+            "columns": [{"key": col, "name": col, "editable": col not in {d["name"] for d in defs}} for col in df.columns]
+        }
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except ComputedColumnError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/computed/{dataset_id}")
+async def list_computed_columns(dataset_id: str, sheet: Optional[str] = None):
+    """Computed-column definitions of a dataset, in evaluation (dependency) order"""
+    try:
+        filepath = catalog.resolve(dataset_id)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {dataset_id}"})
+        defs = computed_store.definitions(os.path.basename(filepath), resolve_sheet(filepath, sheet))
+        return {"dataset_id": os.path.basename(filepath), "definitions": defs}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.delete("/computed/{dataset_id}/{name}")
+async def delete_computed_column(dataset_id: str, name: str, sheet: Optional[str] = None):
+    """Stop maintaining a computed column; its current values stay in the file"""
+    try:
+        filepath = catalog.resolve(dataset_id)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {dataset_id}"})
+        defs = computed_store.remove(os.path.basename(filepath), name, resolve_sheet(filepath, sheet))
+        return {"status": "success", "definitions": defs}
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except ComputedColumnError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.websocket("/live/{dataset_id}")
+async def live_sheet(websocket: WebSocket, dataset_id: str, sheet: Optional[str] = None,
+                     since: Optional[int] = None, client_id: Optional[str] = None):
+    """
+    Live-sync channel of one dataset (sheet). After every write (save, agent edit, ops,
+    replay, computed columns) subscribers receive a versioned diff of cells/rows/columns
+    instead of reloading the sheet. See services/live_sync.py for the message format.
+    `since`: the version the client already has; missed diffs are replayed on connect.
+    """
+    entry = catalog.get(dataset_id)
+    try:
+        sheet = resolve_sheet(entry.path, sheet) if entry else None
+    except SheetNotFound:
+        entry = None
+    if entry is None:
+        await websocket.close(code=4404)
+        return
+    
+    await live_sync.connect(websocket, entry.dataset_id, sheet, entry.version, client_id=client_id, since=since)
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                await live_sync.handle(websocket, entry.dataset_id, sheet, message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await live_sync.disconnect(websocket, entry.dataset_id, sheet)
+
+@router.get("/export/{fmt}/{filename}")
+async def export_dataset(fmt: str, filename: str, sheet: Optional[str] = None):
+    """
+    Export a dataset (one sheet of a workbook, default the first) as .xlsx, .csv or .parquet.
+    The file is read in chunks and streamed back, so memory stays bounded for large sheets.
+    """
+    from backend.services.sheet_export import EXPORTERS, EXPORT_MEDIA_TYPES, PYARROW_AVAILABLE
+
+    try:
+        fmt = fmt.lower()
+        if fmt not in EXPORTERS:
+            return JSONResponse(status_code=400, content={"error": f"Unsupported export format: {fmt}. Use one of {list(EXPORTERS)}"})
+        if fmt == "parquet" and not PYARROW_AVAILABLE:
+            return JSONResponse(status_code=501, content={"error": "Parquet export requires pyarrow. Run: pip install pyarrow"})
+
+        # Exact name, or an alias without extension / upload timestamp
+        filepath = catalog.resolve(filename)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {filename}"})
         
-        # Create Excel output
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='data', index=False)
-        output.seek(0)
+        sheet = resolve_sheet(filepath, sheet)
         
         # Clean filename for download
         clean_name = filename.split('/')[-1].replace('.csv', '').replace('.xlsx', '')
         
+        # Headers go out immediately, rows follow as each chunk is converted
         return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={clean_name}.xlsx"}
+            EXPORTERS[fmt](filepath, sheet=sheet),
+            media_type=EXPORT_MEDIA_TYPES[fmt],
+            headers={"Content-Disposition": f"attachment; filename={clean_name}.{fmt}"}
         )
+    except SheetNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.get("/list")
-async def list_files():
-    """List all uploaded/generated files"""
+async def list_files(offset: int = 0, limit: int = 100):
+    """List all uploaded/generated files (newest first, paginated)"""
     try:
-        files = []
-        if os.path.exists(UPLOAD_DIR):
-            for f in os.listdir(UPLOAD_DIR):
-                if f.endswith(('.xlsx', '.csv', '.xls')):
-                    filepath = os.path.join(UPLOAD_DIR, f)
-                    files.append({
-                        "name": f,
-                        "size": os.path.getsize(filepath),
-                        "url": f"http://localhost:8000/files/{f}"
-                    })
-        return {"files": files}
+        return catalog.list(offset=offset, limit=limit)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/{dataset_id}/sheets")
+async def list_workbook_sheets(dataset_id: str):
+    """Sheet names of a workbook, read from the workbook index without parsing any sheet"""
+    try:
+        filepath = catalog.resolve(dataset_id)
+        if not filepath:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {dataset_id}"})
+        return {"dataset_id": os.path.basename(filepath), "sheets": await concurrency.run_io(list_sheets, filepath)}
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/profile/{dataset_id}")
+async def profile_dataset(dataset_id: str):
+    """Column profile (dtypes, nulls, min/max, distinct estimates, quantiles, sample rows)"""
+    try:
+        entry = catalog.get(dataset_id)
+        if not entry:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {dataset_id}"})
+        profile = await concurrency.run_io(entry.profile)
+        return {"dataset_id": entry.dataset_id, "version": entry.version, **profile}
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/catalog/{dataset_id}")
+async def describe_dataset(dataset_id: str):
+    """Catalog entry for a dataset: path info, size, row count, schema and version"""
+    try:
+        entry = catalog.get(dataset_id)
+        if not entry:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {dataset_id}"})
+        await concurrency.run_io(entry.ensure_details)
+        return entry.to_dict(details=True)
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
@@ -8,6 +8,8 @@ from typing import Optional
 import traceback
 import os
 from backend.config import UPLOAD_DIR
+from backend.services.catalog import catalog
+from backend.services.concurrency import concurrency
 
 router = APIRouter(prefix="/synthetic", tags=["synthetic"])
 
@@ -19,13 +21,17 @@ class GenerateRequest(BaseModel):
     privacy_level: str = "medium"
 
 @router.post("/generate")
+@concurrency.limit("synthetic.generate", 2)
 async def generate_data(req: GenerateRequest):
-    """Generate synthetic data with proper error handling"""
+    """
+    Generate synthetic data with proper error handling.
+    Model fitting is CPU-bound, so it runs in the worker process pool.
+    """
     try:
-        from backend.services.syngen_core import SyngenCore
+        from backend.services.syngen_core import generate_synthetic
         
-        engine = SyngenCore()
-        result = engine.generate(
+        result = await concurrency.run_cpu(
+            generate_synthetic,
             dataset_id=req.dataset_id,
             rows=req.rows,
             domain=req.domain,
@@ -39,6 +45,9 @@ async def generate_data(req: GenerateRequest):
                 content={"error": result.get("message", "Generation failed")}
             )
         
+        if result.get("filename"):
+            # Written by a worker process: record it in this process's catalog too
+            await concurrency.run_io(catalog.register, os.path.join(UPLOAD_DIR, result["filename"]))
         return result
         
     except Exception as e:
@@ -65,19 +74,9 @@ async def download_file(filename: str):
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.get("/list")
-async def list_files():
-    """List generated files"""
+async def list_files(offset: int = 0, limit: int = 100):
+    """List generated files (newest first, paginated)"""
     try:
-        files = []
-        if os.path.exists(UPLOAD_DIR):
-            for f in os.listdir(UPLOAD_DIR):
-                if f.endswith(('.xlsx', '.csv')):
-                    filepath = os.path.join(UPLOAD_DIR, f)
-                    files.append({
-                        "name": f,
-                        "size": os.path.getsize(filepath),
-                        "url": f"http://localhost:8000/files/{f}"
-                    })
-        return {"files": files}
+        return catalog.list(offset=offset, limit=limit, extensions=('.xlsx', '.csv'))
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
@@ -40,38 +40,100 @@ def get_logs(tail: int = 100):
     except Exception as e:
         return {"error": str(e)}
 
+@router.get("/llm-cache")
+def llm_cache_stats() -> Dict[str, Any]:
+    """
+    Hit-rate metrics of the local LLM response cache (see services/llm_cache.py),
+    plus call/retry counters of the shared LLM client.
+    """
+    from backend.services.llm_cache import llm_cache
+    from backend.services.llm_client import get_llm_client
+    
+    try:
+        return {**llm_cache.stats(), "client": get_llm_client().stats()}
+    except Exception as e:
+        return {"error": str(e)}
+
+@router.delete("/llm-cache")
+def clear_llm_cache() -> Dict[str, Any]:
+    """
+    Drops all cached LLM responses (e.g. after changing prompts).
+    """
+    from backend.services.llm_cache import llm_cache
+    
+    llm_cache.clear()
+    return {"status": "success"}
+
+@router.get("/remote-cache")
+def remote_cache_stats() -> Dict[str, Any]:
+    """
+    Counters of the remote dataset fetcher (see services/remote_fetch.py):
+    full downloads vs. conditional requests answered with 304.
+    """
+    from backend.services.remote_fetch import remote_fetcher
+    
+    return remote_fetcher.stats()
+
+@router.get("/live-sync")
+def live_sync_stats() -> Dict[str, Any]:
+    """
+    Open live-sync channels and subscribers, and the diff traffic sent to them
+    (see services/live_sync.py).
+    """
+    from backend.services.live_sync import live_sync
+    
+    return live_sync.stats()
+
+@router.get("/result-cache")
+def result_cache_stats() -> Dict[str, Any]:
+    """
+    Hit-rate metrics of the memoized statistical test results (see services/result_cache.py).
+    """
+    from backend.services.result_cache import result_cache
+    
+    return result_cache.stats()
+
+@router.get("/concurrency")
+def concurrency_stats() -> Dict[str, Any]:
+    """
+    Worker pools and per-endpoint concurrency (active, waiting, served, rejected requests)
+    of the blocking endpoints (see services/concurrency.py).
+    """
+    from backend.services.concurrency import concurrency
+    
+    return concurrency.stats()
+
+@router.get("/plot-cache")
+def plot_cache_stats() -> Dict[str, Any]:
+    """
+    Rendered-plot cache: hits, misses, failures and average render time
+    (see services/plot_render.py).
+    """
+    from backend.services.plot_render import plot_renderer
+    
+    return plot_renderer.stats()
+
 @router.get("/files")
-def list_files():
+def list_files(offset: int = 0, limit: int = 100):
     """
-    Lists all generated files in the local storage directory.
-    Returns: { "files": [ { "name": str, "url": str, "size": str, "created": str } ] }
+    Lists the datasets in the local storage directory, newest first.
+    Backed by the dataset catalog, so no directory scan per request.
+    Returns: { "files": [ { "name": str, "url": str, "size": str, "created": str } ], "total": int }
     """
-    directory = os.path.join(os.getcwd(), "backend", "generated")
-    if not os.path.exists(directory):
-        return {"files": []}
-        
-    files_list = []
-    base_url = "http://localhost:8000/files" # Fallback if unknown host
+    from backend.services.catalog import catalog
     
     try:
-        # Sort by modification time (newest first)
-        with os.scandir(directory) as entries:
-            # Filter for files only
-            files = [e for e in entries if e.is_file()]
-            files.sort(key=lambda e: e.stat().st_mtime, reverse=True)
-            
-            for entry in files:
-                size_kb = round(entry.stat().st_size / 1024, 1)
-                from datetime import datetime
-                created_str = datetime.fromtimestamp(entry.stat().st_mtime).strftime('%Y-%m-%d %H:%M')
-                
-                files_list.append({
-                    "name": entry.name,
-                    "url": f"{base_url}/{entry.name}",
-                    "size": f"{size_kb} KB",
-                    "created": created_str
-                })
-                
-        return {"files": files_list}
+        listing = catalog.list(offset=offset, limit=limit)
+        listing["files"] = [
+            {
+                "name": f["name"],
+                "url": f["url"],
+                "size": f"{round(f['size'] / 1024, 1)} KB",
+                "created": f["created"],
+                "version": f["version"]
+            }
+            for f in listing["files"]
+        ]
+        return listing
     except Exception as e:
         return {"error": f"Failed to scan files: {str(e)}"}
@@ -0,0 +1,91 @@
+"""
+Uploads Router - Chunked, resumable uploads for large datasets
+
+Protocol:
+1. POST /uploads/init            {filename, size, checksum?, target}  -> upload_id
+2. PUT  /uploads/{id}?offset=N   raw bytes of the next chunk          -> new offset
+   (on a dropped connection: GET /uploads/{id} and resume from "offset")
+3. POST /uploads/{id}/complete   verifies size + sha256, moves the file into place
+   and starts background ingestion (catalog, parquet sidecar)
+"""
+from fastapi import APIRouter, Request, BackgroundTasks
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Optional
+import traceback
+from backend.services.chunked_upload import upload_manager, UploadError
+from backend.services.concurrency import concurrency
+from backend.services.ingest import ingest_dataset
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+class InitUploadRequest(BaseModel):
+    filename: str
+    size: int
+    checksum: Optional[str] = None  # sha256 hex, optionally prefixed "sha256:"
+    target: str = "sheets"          # "sheets" (datasets) or "meta" (experiment files)
+
+def _error(e: UploadError) -> JSONResponse:
+    return JSONResponse(status_code=e.status_code, content={"error": str(e), **e.extra})
+
+@router.post("/init")
+async def init_upload(req: InitUploadRequest):
+    """Start a chunked upload session"""
+    try:
+        return await concurrency.run_io(upload_manager.init, req.filename, req.size, req.checksum, req.target)
+    except UploadError as e:
+        return _error(e)
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/{upload_id}")
+async def upload_status(upload_id: str):
+    """Current offset of an upload, used to resume after a dropped connection"""
+    try:
+        return await concurrency.run_io(upload_manager.status, upload_id)
+    except UploadError as e:
+        return _error(e)
+
+@router.put("/{upload_id}")
+async def put_chunk(upload_id: str, request: Request, offset: int = 0):
+    """Append the request body at `offset`; the body is streamed straight to disk"""
+    try:
+        return await upload_manager.put_chunk(upload_id, offset, request.stream())
+    except UploadError as e:
+        return _error(e)
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(upload_id: str, background_tasks: BackgroundTasks):
+    """Verify and finalize an upload, then ingest it in the background"""
+    try:
+        result = await concurrency.run_io(upload_manager.complete, upload_id)
+    except UploadError as e:
+        return _error(e)
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    is_dataset = result["target"] == "sheets"
+    background_tasks.add_task(ingest_dataset, result["path"], register=is_dataset)
+
+    prefix = "" if is_dataset else "meta/"
+    return {
+        "status": "success",
+        **result,
+        "url": f"http://localhost:8000/files/{prefix}{result['filename']}",
+        "ingestion": "scheduled"
+    }
+
+@router.delete("/{upload_id}")
+async def abort_upload(upload_id: str):
+    """Abort an upload and delete the partial data"""
+    try:
+        await concurrency.run_io(upload_manager.status, upload_id)
+        await concurrency.run_io(upload_manager.discard, upload_id)
+        return {"status": "success", "upload_id": upload_id}
+    except UploadError as e:
+        return _error(e)
@@ -1,27 +1,64 @@
 import os
 import json
 import re
-from typing import Optional
+import time
+from typing import Callable, Optional
+from backend.services.llm_cache import llm_cache, make_key, normalize_text, schema_signature
+from backend.services.llm_client import get_llm_client, LLM_MODEL
+from backend.services.concurrency import concurrency
+
+MODEL = LLM_MODEL
+
+def _strip_fences(content: str) -> str:
+    """Remove markdown code fences around an LLM answer, if present"""
+    if "```json" in content:
+        return content.split("```json")[1].split("```")[0].strip()
+    if "```python" in content:
+        return content.split("```python")[1].split("```")[0].strip()
+    if "```" in content:
+        return content.split("```")[1].split("```")[0].strip()
+    return content
 
 class AgentCore:
-    """Agent for parsing natural language commands using Groq API."""
+    """
+    Agent for parsing natural language commands using Groq API.
+    Completions go through the shared async client (services/llm_client.py), so creating an
+    AgentCore per request is cheap and LLM calls never block the event loop.
+    """
     
     def __init__(self):
-        self.api_key = os.environ.get("GROQ_API_KEY")
-        self.client = None
+        llm = get_llm_client()
+        self.client = llm if llm.available else None
         
-        if self.api_key and self.api_key != "YOUR_GROQ_API_KEY_HERE":
-            try:
-                from groq import Groq
-                self.client = Groq(api_key=self.api_key)
-            except ImportError:
-                print("Warning: groq package not installed. Run: pip install groq")
-            except Exception as e:
-                print(f"Warning: Failed to initialize Groq client: {e}")
-        else:
+        if self.client is None:
             print("Warning: GROQ_API_KEY not found. AI features will use fallback mode.")
 
-    def parse_stat_command(self, command: str, columns: dict, sample_data: str) -> dict:
+    async def _chat(self, messages: list, temperature: float, max_tokens: int, kind: str,
+              validate: Optional[Callable[[str], object]] = None, **key_parts) -> str:
+        """
+        One chat completion, served from the local response cache when the same kind of
+        prompt was answered before for the same key parts (normalized command, schema, ...).
+        Without key parts the whole prompt text is the key. `validate` is applied to fresh
+        answers before they are cached; if it raises, nothing is stored.
+        """
+        if not key_parts:
+            key_parts = {"prompt": [normalize_text(m["content"]) for m in messages]}
+        key = make_key(kind, MODEL, temperature, max_tokens, **key_parts)
+        
+        # SQLite reads/writes (and their commits) run in the IO pool, not on the event loop
+        cached = await concurrency.run_io(llm_cache.get, key)
+        if cached is not None:
+            return cached
+        
+        start = time.perf_counter()
+        content = await self.client.chat(messages, model=MODEL, temperature=temperature, max_tokens=max_tokens)
+        if validate is not None:
+            validate(content)
+        await concurrency.run_io(llm_cache.put, key, content, kind=kind,
+                                 latency_ms=(time.perf_counter() - start) * 1000)
+        return content
+
+    async def parse_stat_command(self, command: str, columns: dict, sample_data: str) -> dict:
         """Parse a natural language command into a structured test specification."""
         
         # Fallback if no LLM configured
@@ -39,21 +76,18 @@ Return ONLY a JSON object (no markdown):
 {{"test": "name", "params": {{"key": "col_name"}}, "clarify": null}}"""
 
         try:
-            response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt}],
+            content = await self._chat(
+                [{"role": "user", "content": prompt}],
                 temperature=0,
-                max_tokens=500
+                max_tokens=500,
+                kind="parse_stat_command",
+                validate=lambda c: json.loads(_strip_fences(c)),
+                command=normalize_text(command),
+                schema=schema_signature(columns)
             )
-            content = response.choices[0].message.content.strip()
             
             # Remove markdown fences if present
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            return json.loads(content)
+            return json.loads(_strip_fences(content))
         except json.JSONDecodeError as e:
             return {"error": f"Failed to parse LLM response as JSON: {e}"}
         except Exception as e:
@@ -89,7 +123,7 @@ Return ONLY a JSON object (no markdown):
                 "clarify": "I assumed you want a t-test. Specify the test type for better results."
             }
 
-    def explain_result(self, result_json: dict) -> str:
+    async def explain_result(self, result_json: dict) -> str:
         """Generate a human-readable explanation of statistical results."""
         if not self.client:
             return self._fallback_explain(result_json)
@@ -99,13 +133,13 @@ Return ONLY a JSON object (no markdown):
 Focus on practical significance. Keep it short (2-3 sentences).
 Result: {json.dumps(result_json)}"""
 
-            response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt}],
+            return await self._chat(
+                [{"role": "user", "content": prompt}],
                 temperature=0.3,
-                max_tokens=300
+                max_tokens=300,
+                kind="explain_result",
+                result=json.dumps(result_json, sort_keys=True, default=str)
             )
-            return response.choices[0].message.content.strip()
         except Exception as e:
             return self._fallback_explain(result_json)
 
@@ -119,7 +153,7 @@ Result: {json.dumps(result_json)}"""
                 return f"The result is not statistically significant (p={p_value:.4f}). The observed difference could be due to chance."
         return "Analysis complete. Review the metrics above for insights."
 
-    def execute(self, command: str, context: str = "") -> dict:
+    async def execute(self, command: str, context: str = "") -> dict:
         """Execute a command and return parsed intent."""
         columns = {}
         if context:
@@ -131,84 +165,207 @@ Result: {json.dumps(result_json)}"""
             except:
                 pass
         
-        return self.parse_stat_command(command, columns, context)
+        return await self.parse_stat_command(command, columns, context)
 
     # --- Two-Engine Router Framework ---
     
-    def agent_router(self, user_instruction: str, df_context: dict) -> dict:
+    # Keyword sets for the rule-based pre-classifier (same idea as _fallback_parse)
+    PREDICTION_WORDS = ("predict", "forecast", "train", "build a model", "model for", "classify", "regress")
+    MANIPULATION_WORDS = ("delete", "drop", "remove", "rename", "fill", "filter", "sort", "clean",
+                          "replace", "add column", "compute", "create column", "duplicates", "cast", "convert")
+    
+    @staticmethod
+    def _match_column(text: str, columns: list) -> Optional[str]:
+        """Column named by `text` (exact, then case-insensitive, quotes ignored), or None"""
+        name = text.strip().strip("'\"`").strip()
+        if name in columns:
+            return name
+        lowered = {str(c).lower(): c for c in columns}
+        return lowered.get(name.lower())
+    
+    def _mentioned_columns(self, command: str, columns: list) -> list:
+        """Columns whose name occurs in the command as a whole word, longest names first"""
+        found = []
+        text = command.lower()
+        for col in sorted(columns, key=lambda c: -len(str(c))):
+            pattern = r"(?<![\w])" + re.escape(str(col).lower()) + r"(?![\w])"
+            if re.search(pattern, text):
+                found.append(col)
+                text = re.sub(pattern, " ", text)
+        return found
+    
+    def _fallback_ops(self, command: str, columns: list) -> Optional[list]:
+        """
+        Rule-based translation of common, unambiguous edits into ops (services/edit_ops.py).
+        Returns None when the command doesn't match a rule exactly.
+        """
+        text = command.strip().rstrip(".!")
+        col = lambda t: self._match_column(t, columns)
+        
+        m = re.fullmatch(r"(?i)rename\s+(?:the\s+)?(?:column\s+)?(.+?)\s+(?:to|as)\s+(.+)", text)
+        if m and col(m.group(1)):
+            return [{"op": "rename_column", "old": col(m.group(1)), "new": m.group(2).strip().strip("'\"`")}]
+        
+        m = re.fullmatch(r"(?i)(?:delete|drop|remove)\s+(?:the\s+)?columns?\s+(.+)", text)
+        if m:
+            names = [col(n) for n in re.split(r"\s*,\s*|\s+and\s+", m.group(1)) if n.strip()]
+            if names and all(names):
+                return [{"op": "delete_column", "columns": names}]
+        
+        m = re.fullmatch(r"(?i)(?:delete|drop|remove)\s+(?:the\s+)?(first|last)\s+(\d+)\s+rows?", text)
+        if m:
+            n = int(m.group(2))
+            span = {"start": 0, "stop": n} if m.group(1).lower() == "first" else {"start": -n}
+            return [{"op": "drop_rows", **span}]
+        
+        m = re.fullmatch(r"(?i)(?:delete|drop|remove)\s+(?:all\s+)?rows\s+(?:where|with)\s+(.+?)\s+(?:is|are)\s+(?:null|empty|missing|na|nan|blank)", text) \
+            or re.fullmatch(r"(?i)(?:delete|drop|remove)\s+(?:all\s+)?rows\s+with\s+(?:null|empty|missing|na|nan|blank)\s+(?:values\s+)?in\s+(.+)", text)
+        if m and col(m.group(1)):
+            return [{"op": "drop_na", "columns": [col(m.group(1))]}]
+        
+        m = re.fullmatch(r"(?i)fill\s+(?:the\s+)?(?:missing|null|empty|na|nan|blank)\s+(?:values\s+)?(?:in|of)\s+(.+?)\s+with\s+(?:the\s+)?(mean|median|mode|zero|0|average)", text)
+        if m and col(m.group(1)):
+            method = {"0": "zero", "average": "mean"}.get(m.group(2).lower(), m.group(2).lower())
+            return [{"op": "fill_na", "column": col(m.group(1)), "method": method}]
+        
+        m = re.fullmatch(r"(?i)sort\s+(?:the\s+)?(?:rows\s+|data\s+|sheet\s+)?by\s+(.+?)(?:\s+(asc|ascending|desc|descending))?", text)
+        if m and col(m.group(1)):
+            desc = (m.group(2) or "").lower().startswith("desc")
+            return [{"op": "sort_rows", "by": [{"column": col(m.group(1)), "desc": desc}]}]
+        
+        m = re.fullmatch(r"(?i)(?:remove|drop|delete)\s+(?:the\s+)?duplicate(?:s| rows)(?:\s+(?:by|in|on)\s+(.+))?", text)
+        if m:
+            if not m.group(1):
+                return [{"op": "drop_duplicates"}]
+            if col(m.group(1)):
+                return [{"op": "drop_duplicates", "columns": [col(m.group(1))]}]
+        return None
+    
+    def _preclassify(self, user_instruction: str, columns: list) -> Optional[dict]:
+        """
+        Local routing for unambiguous commands, no LLM call:
+        - an edit matching one of the _fallback_ops rules
+        - a prediction keyword with exactly one column named in the command
+        """
+        ops = self._fallback_ops(user_instruction, columns)
+        if ops:
+            return {"action": "MANIPULATION", "ops": ops, "source": "rules"}
+        
+        text = user_instruction.lower()
+        has_word = lambda words: any(re.search(r"\b" + re.escape(w), text) for w in words)
+        is_prediction = has_word(self.PREDICTION_WORDS)
+        is_manipulation = has_word(self.MANIPULATION_WORDS)
+        if is_prediction and not is_manipulation:
+            mentioned = self._mentioned_columns(user_instruction, columns)
+            if len(mentioned) == 1:
+                return {"action": "PREDICTION", "target": mentioned[0], "source": "rules"}
+        return None
+    
+    async def agent_router(self, user_instruction: str, df_context: dict) -> dict:
         """
         The 'Brain': Classifies intent and routes to correct Engine.
-        Engine 1: MANIPULATION (Pandas)
+        Engine 1: MANIPULATION (op plan, or Pandas code when ops can't express it)
         Engine 2: PREDICTION (AutoGluon)
+        Unambiguous commands are routed locally; everything else takes a single structured
+        LLM call that returns intent, target and the edit together.
         """
-        if not self.client:
-            return {"error": "Groq client not available"}
-
-        # Step 1: CLASSIFY Intent
-        system_prompt = """
-        You are a Data Assistant. Classify the user's intent into one of two categories:
-        1. 'MANIPULATION': If they want to edit, clean, delete, filter, or transform data.
-        2. 'PREDICTION': If they want to predict, train, forecast, or build a model.
+        from backend.services.edit_ops import OP_DOCS, compile_plan, plan_to_code, EditOpError
         
-        Return ONLY the word 'MANIPULATION' or 'PREDICTION'.
-        """
+        cols = df_context.get("columns", [])
+        sample = df_context.get("sample", "")
         
-        try:
-            response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_instruction}
-                ],
-                temperature=0,
-                max_tokens=10
-            )
-            intent = response.choices[0].message.content.strip().upper()
-        except Exception as e:
-            return {"error": f"Router failed: {str(e)}"}
+        # Step 1: local pre-classifier
+        decision = self._preclassify(user_instruction, cols)
+        
+        # Step 2: one structured call for everything else
+        if decision is None:
+            if not self.client:
+                return {"error": "Groq client not available"}
+            
+            prompt = f"""You are a Data Assistant. Classify the user's request and prepare it, in ONE answer.
+Intents:
+- MANIPULATION: edit, clean, delete, filter, sort or transform the data.
+- PREDICTION: predict, train, forecast or build a model.
+
+DataFrame columns: {json.dumps(cols)}
+Sample data: {sample[:500]}
+User Request: "{user_instruction}"
+
+Allowed edit operations:
+{OP_DOCS}
+
+Return strict JSON only, no markdown, no prose:
+{{"intent": "MANIPULATION" | "PREDICTION" | "UNKNOWN",
+  "target": "column to predict (PREDICTION only, else null)",
+  "ops": [operations above (MANIPULATION only, [] if they cannot express the request)],
+  "code": "pandas code assigning the result to `df`, only if ops is empty, else null"}}"""
             
-        print(f"Router Intent: {intent}")
+            try:
+                content = await self._chat(
+                    [{"role": "user", "content": prompt}],
+                    temperature=0,
+                    max_tokens=600,
+                    kind="agent_router",
+                    validate=lambda c: json.loads(_strip_fences(c)),
+                    command=normalize_text(user_instruction),
+                    schema=schema_signature(cols)
+                )
+                answer = json.loads(_strip_fences(content))
+            except json.JSONDecodeError as e:
+                return {"error": f"Router returned invalid JSON: {e}"}
+            except Exception as e:
+                return {"error": f"Router failed: {str(e)}"}
+            
+            decision = {
+                "action": str(answer.get("intent") or "UNKNOWN").upper(),
+                "target": answer.get("target"),
+                "ops": answer.get("ops") or [],
+                "code": answer.get("code"),
+                "source": "llm"
+            }
+            
+        print(f"Router Intent: {decision['action']} ({decision['source']})")
         
-        # Step 2: Route
-        if "MANIPULATION" in intent:
+        # Step 3: Route
+        if "MANIPULATION" in decision["action"]:
             # We don't execute here because we need the full DF loaded in the router endpoint
-            # We return the action and the generated code
-            cols = df_context.get("columns", [])
-            sample = df_context.get("sample", "")
-            code = self.manipulate_data(user_instruction, cols, sample)
+            # We return the validated ops (preferred) or the generated code
+            ops = None
+            if decision.get("ops"):
+                try:
+                    ops = compile_plan(decision["ops"], cols)
+                except EditOpError as e:
+                    print(f"Warning: rejected edit plan: {e}")
+            code = plan_to_code(ops) if ops else _strip_fences(decision.get("code") or "")
+            if not ops and not code:
+                # Last resort: a dedicated code generation call
+                code = await self.manipulate_data(user_instruction, cols, sample)
             return {
                 "action": "MANIPULATION",
+                "ops": ops,
                 "code": code,
-                "message": "Generated Pandas code for manipulation."
+                "source": decision["source"],
+                "message": "Planned edit operations." if ops else "Generated Pandas code for manipulation."
             }
             
-        elif "PREDICTION" in intent:
-            # Extract Target
-            extract_prompt = f"User said: '{user_instruction}'. What is the target column name? Return ONLY the name."
-            try:
-                ex_res = self.client.chat.completions.create(
-                    model="llama-3.1-8b-instant",
-                    messages=[{"role": "user", "content": extract_prompt}],
-                    temperature=0,
-                    max_tokens=50
-                )
-                target_col = ex_res.choices[0].message.content.strip()
-                # Remove quotes if present
-                target_col = target_col.replace("'", "").replace('"', "")
-                
-                return {
-                    "action": "PREDICTION",
-                    "target": target_col,
-                    "message": f"Identified training target: {target_col}"
-                }
-            except Exception as e:
-                return {"error": f"Failed to extract target: {e}"}
+        elif "PREDICTION" in decision["action"]:
+            target_col = str(decision.get("target") or "").replace("'", "").replace('"', "").strip()
+            # Map onto the real column name when the casing differs
+            target_col = self._match_column(target_col, cols) or target_col
+            if not target_col:
+                return {"error": "Failed to extract target column"}
+            return {
+                "action": "PREDICTION",
+                "target": target_col,
+                "source": decision["source"],
+                "message": f"Identified training target: {target_col}"
+            }
         
         else:
              # Fallback or unrelated
              return {"action": "UNKNOWN", "message": "Could not classify intent."}
 
-    def manipulate_data(self, command: str, columns: list, sample_data: str) -> str:
+    async def manipulate_data(self, command: str, columns: list, sample_data: str) -> str:
         """
         Generate Pandas code to manipulate the dataframe based on natural language command.
         Returns the Python code string.
@@ -241,21 +398,76 @@ Code: df = df.dropna(subset=['Age'])
 Result Code:"""
 
         try:
-            response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt}],
+            content = await self._chat(
+                [{"role": "user", "content": prompt}],
                 temperature=0,
-                max_tokens=200
+                max_tokens=200,
+                kind="manipulate_data",
+                command=normalize_text(command),
+                schema=schema_signature(columns)
             )
-            content = response.choices[0].message.content.strip()
             
             # Cleanup markdown
-            if "```python" in content:
-                content = content.split("```python")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
+            content = _strip_fences(content)
                 
             return content
         except Exception as e:
             print(f"Error generating manipulation code: {e}")
             return ""
+
+    async def plan_edit(self, command: str, columns: list, sample_data: str) -> dict:
+        """
+        Translate a natural language edit into the operation IR (see services/edit_ops.py).
+        Returns {"ops": [...]} or {"error": ...}; the caller validates the ops.
+        Common edits are matched by local rules first and never reach the LLM.
+        """
+        ops = self._fallback_ops(command, columns)
+        if ops:
+            return {"ops": ops, "source": "rules"}
+        
+        if not self.client:
+            return {"error": "Groq client not available"}
+
+        from backend.services.edit_ops import OP_DOCS
+
+        prompt = f"""You are a safe spreadsheet agent. Translate the user command into a plan of atomic operations.
+DataFrame columns: {json.dumps(columns)}
+Sample data: {sample_data[:500]}
+
+Allowed operations:
+{OP_DOCS}
+
+User Command: "{command}"
+
+Rules:
+1. Use only the operations above and only existing columns (or columns created by an earlier op).
+2. If the command cannot be expressed with these operations, return {{"ops": []}}.
+3. Output must be strict JSON, no markdown, no prose: {{"ops": [{{"op": "op_name", ...}}]}}
+
+Example:
+Command: "Delete the first 2 rows"
+{{"ops": [{{"op": "drop_rows", "start": 0, "stop": 2}}]}}
+
+Command: "Drop rows where Age is null"
+{{"ops": [{{"op": "drop_na", "columns": ["Age"]}}]}}"""
+
+        try:
+            content = await self._chat(
+                [{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=400,
+                kind="plan_edit",
+                validate=lambda c: json.loads(_strip_fences(c)),
+                command=normalize_text(command),
+                schema=schema_signature(columns)
+            )
+
+            # Remove markdown fences if present
+            plan = json.loads(_strip_fences(content))
+            if isinstance(plan, list):
+                plan = {"ops": plan}
+            return {"ops": plan.get("ops") or [], "source": "llm"}
+        except json.JSONDecodeError as e:
+            return {"error": f"Failed to parse LLM plan as JSON: {e}"}
+        except Exception as e:
+            return {"error": f"LLM call failed: {e}"}
@@ -0,0 +1,273 @@
+
+import os
+import re
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from backend.config import UPLOAD_DIR
+
+DATASET_EXTENSIONS = ('.xlsx', '.csv', '.xls')
+
+# Upload prefixes: "20240101_120000_name.csv" (sheets) and "20240101120000_name.csv" (meta)
+_TIMESTAMP_PREFIX = re.compile(r"^\d{8}_?\d{6}_")
+
+
+def count_csv_rows(path: str) -> int:
+    """
+    Data rows in a CSV file, without parsing it. Newlines inside quoted fields are not row
+    breaks: a newline ends a row only when it is preceded by an even number of quotes.
+    """
+    rows, in_quotes, last = 0, False, b""
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(1 << 20), b""):
+            if not in_quotes and b'"' not in buf:
+                rows += buf.count(b"\n")
+            else:
+                data = np.frombuffer(buf, dtype=np.uint8)
+                quoted = (np.cumsum(data == ord('"')) + in_quotes) & 1
+                rows += int(np.count_nonzero((data == ord("\n")) & (quoted == 0)))
+                in_quotes = bool(quoted[-1])
+            last = buf[-1:]
+    # A last line without a trailing newline is still a row
+    if last and last != b"\n":
+        rows += 1
+    # Minus the header line
+    return max(rows - 1, 0)
+
+
+def filename_from_ref(ref: str) -> str:
+    """Accepts a URL, a path or a bare filename and returns the filename part."""
+    if ref.startswith("http"):
+        ref = ref.split("?")[0]
+    return ref.replace("\\", "/").split("/")[-1]
+
+
+class CatalogEntry:
+    """Metadata for one dataset file. Schema and row count are filled in lazily."""
+
+    def __init__(self, dataset_id: str, path: str):
+        self.dataset_id = dataset_id
+        self.path = path
+        self.size = 0
+        self.mtime = 0.0
+        self.mtime_ns = 0
+        self.version = 0
+        self.rows: Optional[int] = None
+        self.schema: Optional[Dict[str, str]] = None
+        self.refresh_stat()
+
+    def refresh_stat(self):
+        self._set_stat(os.stat(self.path))
+
+    def _set_stat(self, st: os.stat_result):
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+
+    def changed(self, st: os.stat_result) -> bool:
+        return (st.st_size, st.st_mtime_ns) != (self.size, self.mtime_ns)
+
+    def new_version(self, st: os.stat_result):
+        """The file was rewritten: new stat, next version, details to be re-read."""
+        self._set_stat(st)
+        self.version += 1
+        self.rows = self.schema = None
+
+    def ensure_details(self):
+        """Reads the header (and counts rows) without parsing the whole file."""
+        if self.schema is not None and self.rows is not None:
+            return
+        if self.path.endswith('.csv'):
+            head = pd.read_csv(self.path, nrows=200)
+            self.rows = count_csv_rows(self.path)
+        else:
+            head = pd.read_excel(self.path, nrows=200)
+            if self.path.endswith('.xlsx'):
+                from openpyxl import load_workbook
+                wb = load_workbook(self.path, read_only=True)
+                try:
+                    self.rows = max((wb.worksheets[0].max_row or 1) - 1, 0)
+                finally:
+                    wb.close()
+            else:
+                self.rows = len(pd.read_excel(self.path))
+        self.schema = {str(c): str(t) for c, t in head.dtypes.items()}
+
+    def set_details(self, df: pd.DataFrame):
+        self.rows = len(df)
+        self.schema = {str(c): str(t) for c, t in df.dtypes.items()}
+
+    def set_profile(self, profile: Dict[str, Any]):
+        """Row count and schema from a column profile (see services/profiler.py)."""
+        self.rows = profile["rows"]
+        self.schema = {c["name"]: c["dtype"] for c in profile["columns"]}
+
+    def profile(self) -> Dict[str, Any]:
+        """Column profile for this dataset; computed in one pass if missing or stale."""
+        from backend.services.profiler import profile_store
+        profile = profile_store.get(self.path)
+        self.set_profile(profile)
+        return profile
+
+    def to_dict(self, details: bool = False) -> Dict[str, Any]:
+        out = {
+            "dataset_id": self.dataset_id,
+            "name": self.dataset_id,
+            "size": self.size,
+            "url": f"http://localhost:8000/files/{self.dataset_id}",
+            "created": datetime.fromtimestamp(self.mtime).strftime('%Y-%m-%d %H:%M'),
+            "version": self.version,
+            "rows": self.rows,
+        }
+        if details:
+            from backend.services.dataset_cache import list_sheets
+            out["schema"] = self.schema
+            out["sheets"] = list_sheets(self.path)
+        return out
+
+
+class DatasetCatalog:
+    """
+    In-memory index of the datasets in UPLOAD_DIR.
+    - Built from disk at startup, updated by every upload/write through register().
+    - Lookups are dict hits on the exact filename, or on an alias (name without the upload
+      timestamp prefix, or without extension) that points at the newest matching file.
+    - Files dropped into the directory by other code are picked up when the directory
+      mtime changes.
+    """
+
+    def __init__(self, directory: str = UPLOAD_DIR):
+        self.directory = directory
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._aliases: Dict[str, str] = {}
+        self._dir_mtime: Optional[int] = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _alias_keys(filename: str) -> List[str]:
+        keys = []
+        stripped = _TIMESTAMP_PREFIX.sub("", filename)
+        if stripped != filename:
+            keys.append(stripped)
+        for name in (filename, stripped):
+            stem, ext = os.path.splitext(name)
+            if ext:
+                keys.append(stem)
+        return keys
+
+    def _add(self, entry: CatalogEntry):
+        self._entries[entry.dataset_id] = entry
+        for key in self._alias_keys(entry.dataset_id):
+            current = self._aliases.get(key)
+            # Newest file wins an ambiguous alias
+            if current is None or current not in self._entries or \
+                    self._entries[current].mtime <= entry.mtime:
+                self._aliases[key] = entry.dataset_id
+
+    def _dir_signature(self) -> Optional[int]:
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def rebuild(self):
+        """Rescans the directory. Existing entries keep their version and cached details."""
+        with self._lock:
+            previous = self._entries
+            self._entries = {}
+            self._aliases = {}
+            self._dir_mtime = self._dir_signature()
+            if self._dir_mtime is None:
+                return
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if not e.is_file() or not e.name.endswith(DATASET_EXTENSIONS):
+                        continue
+                    old = previous.get(e.name)
+                    if old is not None:
+                        st = e.stat()
+                        if old.changed(st):
+                            old.new_version(st)
+                        self._add(old)
+                    else:
+                        self._add(CatalogEntry(e.name, e.path))
+
+    def _sync(self):
+        """Rescans only if files were added/removed since the last scan."""
+        if self._dir_signature() != self._dir_mtime:
+            self.rebuild()
+
+    def register(self, path: str, df: Optional[pd.DataFrame] = None) -> CatalogEntry:
+        """
+        Adds or updates a file after it was written. Existing entries get a new version even
+        when the rewrite kept the same size and mtime.
+        """
+        with self._lock:
+            name = os.path.basename(path)
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = CatalogEntry(name, path)
+                self._add(entry)
+            else:
+                entry.new_version(os.stat(entry.path))
+                # Re-point aliases if this is now the newest file
+                self._add(entry)
+            if df is not None:
+                entry.set_details(df)
+            self._dir_mtime = self._dir_signature()
+            return entry
+
+    def remove(self, path: str):
+        with self._lock:
+            self._entries.pop(os.path.basename(path), None)
+            self._aliases = {k: v for k, v in self._aliases.items() if v in self._entries}
+
+    def get(self, ref: str) -> Optional[CatalogEntry]:
+        """
+        Looks up a dataset by URL, filename or alias. A hit is re-stat'ed, so a file
+        overwritten in place by other code gets a new version.
+        """
+        filename = filename_from_ref(ref)
+        with self._lock:
+            for attempt in range(2):
+                entry = self._entries.get(filename)
+                if entry is None and filename in self._aliases:
+                    entry = self._entries.get(self._aliases[filename])
+                if entry is not None:
+                    try:
+                        st = os.stat(entry.path)
+                    except FileNotFoundError:
+                        self.remove(entry.path)
+                    else:
+                        if entry.changed(st):
+                            entry.new_version(st)
+                            self._add(entry)
+                        return entry
+                if attempt == 0:
+                    self._sync()
+        return None
+
+    def resolve(self, ref: str) -> Optional[str]:
+        """Returns the file path for a dataset reference, or None."""
+        entry = self.get(ref)
+        return entry.path if entry else None
+
+    def list(self, offset: int = 0, limit: int = 100,
+             extensions: tuple = DATASET_EXTENSIONS) -> Dict[str, Any]:
+        """Paginated listing, newest first."""
+        with self._lock:
+            self._sync()
+            entries = [e for e in self._entries.values() if e.dataset_id.endswith(extensions)]
+        entries.sort(key=lambda e: e.mtime, reverse=True)
+        page = entries[offset:offset + limit]
+        return {
+            "files": [e.to_dict() for e in page],
+            "total": len(entries),
+            "offset": offset,
+            "limit": limit
+        }
+
+
+catalog = DatasetCatalog()
@@ -0,0 +1,242 @@
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from backend.config import UPLOAD_DIR, CACHE_DIR, GENERATED_DIR
+from backend.services.concurrency import concurrency
+
+# Partial uploads live here until they are complete
+UPLOAD_TMP_DIR = os.path.join(str(CACHE_DIR), "uploads")
+# Suggested chunk size for clients (they may send any size)
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# Copy buffer when streaming to disk / hashing
+COPY_BUFFER_BYTES = 1024 * 1024
+
+# Where each upload target puts its finished files, and how it names them
+UPLOAD_TARGETS = {
+    "sheets": (UPLOAD_DIR, "%Y%m%d_%H%M%S"),
+    "meta": (str(GENERATED_DIR / "meta"), "%Y%m%d%H%M%S"),
+}
+
+
+class UploadError(Exception):
+    """Raised for invalid upload operations. `status_code` maps to the HTTP response."""
+
+    def __init__(self, message: str, status_code: int = 400, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.extra = extra
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def save_upload_stream(fileobj, dest_path: str) -> int:
+    """Copies a file-like object (e.g. UploadFile.file) to disk in fixed-size blocks."""
+    with open(dest_path, "wb") as out:
+        shutil.copyfileobj(fileobj, out, COPY_BUFFER_BYTES)
+    return os.path.getsize(dest_path)
+
+
+def unique_upload_name(filename: Optional[str], target: str = "sheets") -> str:
+    _, fmt = UPLOAD_TARGETS[target]
+    safe_name = os.path.basename(filename).replace(" ", "_") if filename else "upload.csv"
+    return f"{datetime.now().strftime(fmt)}_{safe_name}"
+
+
+class UploadManager:
+    """
+    Resumable chunked uploads: init -> put chunk(s) at an offset -> complete.
+    Each session is a `.part` file plus a `.json` manifest in UPLOAD_TMP_DIR, so an
+    interrupted upload can be resumed (even after a restart) from the bytes on disk.
+    The sha256 is updated as chunks arrive, so complete() doesn't re-read the file; after
+    a restart the running hash is rebuilt from the part file on the next chunk.
+    Disk writes and hashing run in the IO thread pool, never on the event loop.
+    """
+
+    def __init__(self, directory: str = UPLOAD_TMP_DIR):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # upload_id -> (running sha256, bytes it covers)
+        self._hashes: Dict[str, Tuple[Any, int]] = {}
+
+    # --- session bookkeeping ---
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _manifest_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        # upload ids are uuid hex; anything else could escape the directory
+        if not upload_id.isalnum():
+            raise UploadError("Invalid upload id", 400)
+        try:
+            with open(self._manifest_path(upload_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError(f"Upload not found: {upload_id}", 404)
+
+    def _save(self, manifest: Dict[str, Any]):
+        tmp = self._manifest_path(manifest["upload_id"]) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path(manifest["upload_id"]))
+
+    def _offset(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self._part_path(upload_id))
+        except FileNotFoundError:
+            return 0
+
+    # --- protocol ---
+
+    def init(self, filename: str, size: int, checksum: Optional[str] = None,
+             target: str = "sheets") -> Dict[str, Any]:
+        if target not in UPLOAD_TARGETS:
+            raise UploadError(f"Unknown upload target: {target}. Use one of {list(UPLOAD_TARGETS)}")
+        if size < 0:
+            raise UploadError("size must be >= 0")
+
+        upload_id = uuid.uuid4().hex
+        manifest = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "size": int(size),
+            "checksum": checksum.split(":", 1)[-1].lower() if checksum else None,
+            "target": target,
+            "created": datetime.now().isoformat(),
+        }
+        self._save(manifest)
+        open(self._part_path(upload_id), "wb").close()
+        return {**manifest, "offset": 0, "chunk_size": DEFAULT_CHUNK_SIZE}
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        manifest = self._load(upload_id)
+        offset = self._offset(upload_id)
+        return {**manifest, "offset": offset, "complete": offset == manifest["size"]}
+
+    async def put_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Appends a chunk at `offset`. The offset must equal the bytes already received,
+        so a client that lost track just asks status() and resumes from there.
+        """
+        manifest = self._load(upload_id)
+        lock = self._lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadError("Another chunk for this upload is in progress", 409)
+        try:
+            current = self._offset(upload_id)
+            if offset != current:
+                raise UploadError(f"Offset mismatch: expected {current}, got {offset}", 409, offset=current)
+
+            h = await concurrency.run_io(self._running_hash, upload_id, current)
+            out = await concurrency.run_io(open, self._part_path(upload_id), "ab")
+            written = 0
+            pending: List[bytes] = []
+            pending_bytes = 0
+            try:
+                async for block in chunks:
+                    if current + written + pending_bytes + len(block) > manifest["size"]:
+                        raise UploadError("Chunk exceeds declared upload size", 413)
+                    pending.append(block)
+                    pending_bytes += len(block)
+                    if pending_bytes >= COPY_BUFFER_BYTES:
+                        written += await concurrency.run_io(self._write, out, h, pending)
+                        pending, pending_bytes = [], 0
+                if pending:
+                    written += await concurrency.run_io(self._write, out, h, pending)
+            except UploadError:
+                # Drop the partial chunk so the offset stays consistent (the hash is rebuilt)
+                h = None
+                await concurrency.run_io(out.truncate, current)
+                raise
+            finally:
+                out.close()
+                if h is not None:
+                    # Bytes of a dropped connection stay on disk (resumable), and in the hash
+                    self._hashes[upload_id] = (h, current + written)
+            return {"upload_id": upload_id, "offset": current + written, "received": written}
+        finally:
+            lock.release()
+
+    def _running_hash(self, upload_id: str, offset: int):
+        """sha256 of the first `offset` bytes: the kept one, or rebuilt from the part file."""
+        kept = self._hashes.pop(upload_id, None)
+        if kept is not None and kept[1] == offset:
+            return kept[0]
+        h = hashlib.sha256()
+        with open(self._part_path(upload_id), "rb") as f:
+            remaining = offset
+            while remaining > 0:
+                block = f.read(min(COPY_BUFFER_BYTES, remaining))
+                if not block:
+                    break
+                h.update(block)
+                remaining -= len(block)
+        return h
+
+    @staticmethod
+    def _write(out, h, blocks: List[bytes]) -> int:
+        data = b"".join(blocks)
+        out.write(data)
+        h.update(data)
+        return len(data)
+
+    def complete(self, upload_id: str) -> Dict[str, Any]:
+        """
+        Checks size and checksum, then moves the file to its target directory.
+        Blocking (falls back to hashing the whole file after a restart): run it off the event loop.
+        """
+        manifest = self._load(upload_id)
+        part = self._part_path(upload_id)
+        offset = self._offset(upload_id)
+        if offset != manifest["size"]:
+            raise UploadError(f"Upload incomplete: {offset} of {manifest['size']} bytes", 409, offset=offset)
+
+        kept = self._hashes.get(upload_id)
+        digest = kept[0].hexdigest() if kept is not None and kept[1] == offset else sha256_file(part)
+        if manifest.get("checksum") and digest != manifest["checksum"]:
+            raise UploadError(f"Checksum mismatch: expected {manifest['checksum']}, got {digest}", 422)
+
+        directory, _ = UPLOAD_TARGETS[manifest["target"]]
+        unique_name = unique_upload_name(manifest["filename"], manifest["target"])
+        dest = os.path.join(directory, unique_name)
+        os.replace(part, dest)
+        self.discard(upload_id)
+
+        return {
+            "filename": unique_name,
+            "path": dest,
+            "size": manifest["size"],
+            "sha256": digest,
+            "target": manifest["target"],
+        }
+
+    def discard(self, upload_id: str):
+        for path in (self._part_path(upload_id), self._manifest_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+        self._hashes.pop(upload_id, None)
+
+
+upload_manager = UploadManager()
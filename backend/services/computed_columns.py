@@ -0,0 +1,283 @@
+
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from urllib.parse import quote
+from typing import Any, Dict, List, Optional, Tuple
+from backend.config import CACHE_DIR
+from backend.services.safe_expr import ExpressionError, parse_expression
+
+COMPUTED_DIR = os.path.join(str(CACHE_DIR), "computed")
+
+# Definition kinds:
+# - {"name": "margin", "kind": "expr", "expr": "(price - cost) / price"}   safe_expr syntax; row-wise unless
+#   it uses a reduction ("sales / sum(sales)"), which is recomputed over all rows on every change
+# - {"name": "ma7", "kind": "rolling", "column": "sales", "window": 7, "agg": "mean", "min_periods": 1}
+COMPUTED_KINDS = {"expr", "rolling"}
+ROLLING_AGGS = {"mean", "sum", "min", "max", "median", "std"}
+
+
+class ComputedColumnError(ValueError):
+    """A computed-column definition is malformed, unknown, or creates a cycle."""
+
+
+# --- Definitions and dependency graph ---
+
+def _expression(defn: Dict[str, Any], columns: Optional[List[str]] = None):
+    try:
+        return parse_expression(defn["expr"], columns)
+    except ExpressionError as e:
+        raise ComputedColumnError(f"Computed column '{defn['name']}': {e}")
+
+
+def parse_definition(defn: Dict[str, Any], columns: List[str],
+                     computed: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Normalizes one definition and records its direct dependencies in `depends_on`.
+    `computed` names the columns that are already computed (and may be redefined); any
+    other name in `columns` is an input column and can't be overwritten.
+    """
+    name = defn.get("name") or defn.get("new_col")
+    if not name:
+        raise ComputedColumnError("Computed column needs a 'name'")
+    if name in columns and name not in (computed or []):
+        # Recomputing on every save would apply the expression to its own output again
+        raise ComputedColumnError(f"Computed column '{name}' would overwrite the input column '{name}'; pick a new name")
+    kind = defn.get("kind") or ("rolling" if "window" in defn else "expr")
+    if kind not in COMPUTED_KINDS:
+        raise ComputedColumnError(f"Unknown computed column kind: {kind}. Use one of {sorted(COMPUTED_KINDS)}")
+
+    if kind == "expr":
+        expr = str(defn.get("expr") or "")
+        if not expr:
+            raise ComputedColumnError(f"Computed column '{name}' needs an 'expr'")
+        # Same whitelist as the compute_column edit op
+        parsed = _expression({"name": name, "expr": expr}, columns)
+        if name in parsed.columns:
+            raise ComputedColumnError(f"Computed column '{name}' can't refer to itself")
+        out = {"name": name, "kind": kind, "expr": expr, "depends_on": list(parsed.columns)}
+    else:
+        column = defn.get("column")
+        agg = defn.get("agg", "mean")
+        try:
+            window = int(defn.get("window"))
+            min_periods = int(defn.get("min_periods", 1))
+        except (TypeError, ValueError):
+            raise ComputedColumnError(f"Computed column '{name}': 'window' must be an integer")
+        if window < 1 or not 1 <= min_periods <= window:
+            raise ComputedColumnError(f"Computed column '{name}': need window >= 1 and 1 <= min_periods <= window")
+        if agg not in ROLLING_AGGS:
+            raise ComputedColumnError(f"Computed column '{name}': unknown agg {agg}. Use one of {sorted(ROLLING_AGGS)}")
+        if column == name:
+            raise ComputedColumnError(f"Computed column '{name}' can't refer to itself")
+        out = {"name": name, "kind": kind, "column": column, "window": window, "agg": agg,
+               "min_periods": min_periods, "depends_on": [column]}
+
+    missing = [c for c in out["depends_on"] if c not in columns]
+    if missing or (kind == "expr" and not out["depends_on"]):
+        raise ComputedColumnError(f"Computed column '{name}' references unknown columns: {missing or out.get('expr')}")
+    return out
+
+
+def topo_order(defs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Orders definitions so every column comes after the computed columns it reads."""
+    by_name = {d["name"]: d for d in defs}
+    order, state = [], {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ComputedColumnError(f"Computed columns form a cycle: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for dep in by_name[name]["depends_on"]:
+            if dep in by_name:
+                visit(dep, path + [name])
+        state[name] = "done"
+        order.append(by_name[name])
+
+    for d in defs:
+        visit(d["name"], [])
+    return order
+
+
+# --- Evaluation ---
+
+def _evaluate(df: pd.DataFrame, defn: Dict[str, Any], positions: Optional[np.ndarray] = None) -> pd.Series:
+    """Values of one computed column for the given row positions (default: all rows)."""
+    if defn["kind"] == "expr":
+        # Stored definitions are checked again: they may predate the whitelist
+        expr = _expression(defn, [str(c) for c in df.columns])
+        if expr.aggregate and positions is not None:
+            raise ComputedColumnError(f"Computed column '{defn['name']}' is not row-wise: evaluate all rows")
+        frame = df if positions is None else df.iloc[positions]
+        try:
+            value = expr.evaluate(frame)
+        except ExpressionError as e:
+            raise ComputedColumnError(f"Computed column '{defn['name']}': cannot evaluate {defn['expr']!r}: {e}")
+        if not isinstance(value, pd.Series):
+            value = pd.Series(np.full(len(frame), value), index=frame.index)
+        return value
+
+    source = pd.to_numeric(df[defn["column"]], errors="coerce")
+    window, min_periods = defn["window"], defn["min_periods"]
+    if positions is None:
+        return getattr(source.rolling(window, min_periods=min_periods), defn["agg"])()
+    # Only the span the affected rows can see: from window-1 rows before the first one
+    lo = max(int(positions.min()) - window + 1, 0)
+    hi = int(positions.max()) + 1
+    span = getattr(source.iloc[lo:hi].rolling(window, min_periods=min_periods), defn["agg"])()
+    return span.iloc[positions - lo]
+
+
+def compute_all(df: pd.DataFrame, defs: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Evaluates every computed column over the whole frame (in dependency order)."""
+    df = df.copy()
+    for defn in topo_order(defs):
+        df[defn["name"]] = _evaluate(df, defn)
+    return df
+
+
+def _changed_rows(old: pd.Series, new: pd.Series) -> np.ndarray:
+    """Boolean mask of rows whose value differs (NaN == NaN)."""
+    old_na, new_na = old.isna().to_numpy(), new.isna().to_numpy()
+    try:
+        equal = (old.to_numpy() == new.to_numpy())
+        equal = np.asarray(equal, dtype=bool) if np.ndim(equal) else np.zeros(len(new), dtype=bool)
+    except (TypeError, ValueError):
+        equal = np.zeros(len(new), dtype=bool)
+    return ~((equal & ~old_na & ~new_na) | (old_na & new_na))
+
+
+def _patch(previous: pd.Series, positions: np.ndarray, values: pd.Series) -> pd.Series:
+    """`previous` with the values at `positions` replaced, in a dtype that holds both."""
+    if isinstance(previous.dtype, np.dtype) and isinstance(values.dtype, np.dtype):
+        dtype = np.result_type(previous.dtype, values.dtype)
+        arr = previous.to_numpy(dtype=dtype, copy=True)
+        arr[positions] = values.to_numpy(dtype=dtype)
+        return pd.Series(arr, index=previous.index, name=previous.name)
+    arr = previous.to_numpy(dtype=object, copy=True)
+    arr[positions] = values.to_numpy(dtype=object)
+    return pd.Series(arr, index=previous.index, name=previous.name).infer_objects()
+
+
+def _affected_by_window(dirty: np.ndarray, window: int) -> np.ndarray:
+    """A change at row i moves the rolling value of rows i .. i+window-1."""
+    if window == 1:
+        return dirty
+    spread = np.convolve(dirty.astype(np.int32), np.ones(window, dtype=np.int32))[:len(dirty)]
+    return spread > 0
+
+
+def recompute(old: Optional[pd.DataFrame], new: pd.DataFrame,
+              defs: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Brings the computed columns of `new` (an edited version of `old`) up to date.
+    When the edit only changed cell values, dirty rows are tracked per column and pushed
+    through the dependency graph: each computed column is evaluated for the affected rows
+    only, and its unaffected values are taken over from `old`. An expression with a
+    reduction (sum, mean, ...) depends on every row, so it is evaluated in full once any
+    input changed, and the rows whose value moved become dirty for its dependents.
+    Row inserts/deletes (or a frame without its computed columns) fall back to evaluating
+    everything.
+    Returns the updated frame and a report {"mode", "columns": {name: rows recomputed}}.
+    """
+    ordered = topo_order(defs)
+    names = [d["name"] for d in ordered]
+    inputs = [c for c in new.columns if c not in names]
+
+    full = (old is None or len(old) != len(new)
+            or any(c not in old.columns for c in inputs + names))
+    if full:
+        df = compute_all(new, ordered)
+        return df, {"mode": "full", "columns": {n: len(df) for n in names}}
+
+    df = new.copy(deep=False)
+    # Only input edits count; derived cells sent back by the client are recomputed from old.
+    # Inputs no definition reads are never compared.
+    read = {c for d in ordered for c in d["depends_on"]}
+    dirty: Dict[str, np.ndarray] = {c: _changed_rows(old[c], new[c]) for c in inputs if c in read}
+    report = {}
+    for defn in ordered:
+        deps = [dirty[c] for c in defn["depends_on"] if c in dirty]
+        rows = np.logical_or.reduce(deps) if deps else np.zeros(len(df), dtype=bool)
+        previous = old[defn["name"]].set_axis(df.index)
+        if defn["kind"] == "expr" and rows.any() and _expression(defn).aggregate:
+            df[defn["name"]] = _evaluate(df, defn)
+            dirty[defn["name"]] = _changed_rows(previous, df[defn["name"]])
+            report[defn["name"]] = len(df)
+            continue
+        if defn["kind"] == "rolling":
+            rows = _affected_by_window(rows, defn["window"])
+        positions = np.flatnonzero(rows)
+        df[defn["name"]] = _patch(previous, positions, _evaluate(df, defn, positions)) if len(positions) else previous
+        dirty[defn["name"]] = rows
+        report[defn["name"]] = int(len(positions))
+    return df, {"mode": "incremental", "columns": report}
+
+
+# --- Storage ---
+
+class ComputedColumnStore:
+    """
+    Computed-column definitions per dataset (and sheet), persisted as JSON in
+    CACHE_DIR/computed and kept in dependency order.
+    """
+
+    def __init__(self, directory: str = COMPUTED_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, dataset_id: str, sheet: Optional[str] = None) -> str:
+        name = os.path.basename(dataset_id)
+        if sheet:
+            name += "." + quote(sheet, safe="")
+        return os.path.join(self.directory, name + ".json")
+
+    def definitions(self, dataset_id: str, sheet: Optional[str] = None) -> List[Dict[str, Any]]:
+        try:
+            with open(self._path(dataset_id, sheet)) as f:
+                return json.load(f)["columns"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return []
+
+    def save(self, dataset_id: str, defs: List[Dict[str, Any]], sheet: Optional[str] = None):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(dataset_id, sheet)
+        with self._lock:
+            if not defs:
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"columns": defs}, f)
+            os.replace(tmp, path)
+
+    def with_definition(self, dataset_id: str, defn: Dict[str, Any], columns: List[str],
+                        sheet: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        The dataset's definitions with `defn` added (or replaced), validated against the
+        schema and the graph. Nothing is stored until save() is called with the result.
+        """
+        defs = self.definitions(dataset_id, sheet)
+        names = [d["name"] for d in defs]
+        parsed = parse_definition(defn, list(columns) + names, computed=names)
+        return topo_order([d for d in defs if d["name"] != parsed["name"]] + [parsed])
+
+    def remove(self, dataset_id: str, name: str, sheet: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Drops a definition (the column keeps its last values). Refused while others read it."""
+        defs = self.definitions(dataset_id, sheet)
+        if not any(d["name"] == name for d in defs):
+            raise ComputedColumnError(f"Computed column not found: {name}")
+        users = [d["name"] for d in defs if name in d["depends_on"]]
+        if users:
+            raise ComputedColumnError(f"Computed column '{name}' is used by: {users}")
+        defs = [d for d in defs if d["name"] != name]
+        self.save(dataset_id, defs, sheet)
+        return defs
+
+
+computed_store = ComputedColumnStore()
@@ -0,0 +1,197 @@
+
+import os
+import sys
+import time
+import asyncio
+import weakref
+import functools
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+from fastapi.responses import JSONResponse
+
+# Threads for blocking file/parse/pandas work taken off the event loop
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "16"))
+# Processes for self-contained CPU-bound jobs (synthetic data, plot rendering); 0 runs them in IO threads
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Concurrent requests per endpoint unless the endpoint sets its own default
+ENDPOINT_CONCURRENCY = int(os.environ.get("ENDPOINT_CONCURRENCY", "8"))
+# Per-endpoint overrides, e.g. "synthetic.generate=1,analytics.run=4"
+ENDPOINT_LIMITS = os.environ.get("ENDPOINT_LIMITS", "")
+# How long a request waits for a slot of its endpoint before a 503 (seconds)
+ENDPOINT_QUEUE_TIMEOUT = float(os.environ.get("ENDPOINT_QUEUE_TIMEOUT", "30"))
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip()] = max(int(value), 1)
+    return limits
+
+
+async def _acquire(semaphore: asyncio.Semaphore, timeout: float) -> bool:
+    """
+    semaphore.acquire() that gives up after `timeout` seconds (returns False). The acquire
+    runs as its own task, so a permit granted just as the wait ends (timeout or a cancelled
+    request) is handed back instead of leaked, which asyncio.wait_for can do before 3.12.
+    """
+    task = asyncio.ensure_future(semaphore.acquire())
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+    except asyncio.CancelledError:
+        _abandon(semaphore, task)
+        raise
+    if done:
+        return True
+    _abandon(semaphore, task)
+    return False
+
+
+def _abandon(semaphore: asyncio.Semaphore, task: asyncio.Future):
+    if task.done():
+        if not task.cancelled() and task.exception() is None:
+            semaphore.release()
+        return
+    task.cancel()
+    # Cancelled before it got the permit: nothing to give back. Otherwise release it.
+    task.add_done_callback(lambda t: semaphore.release() if not t.cancelled() and t.exception() is None else None)
+
+
+class ConcurrencyManager:
+    """
+    Keeps blocking work off the event loop, so a slow Excel parse or scipy call in one
+    request doesn't stall the others:
+    - run_io(): bounded thread pool for file I/O, parsing and pandas/numpy work on the
+      in-process caches (separate from Starlette's pool, which serves the sync endpoints).
+    - run_cpu(): process pool for self-contained CPU-bound jobs; arguments and results are
+      pickled, so only functions that don't need the in-process caches belong there.
+    - limit(): per-endpoint cap on concurrent requests; waiting requests queue for up to
+      ENDPOINT_QUEUE_TIMEOUT, then get a 503 instead of piling up.
+    """
+
+    def __init__(self, io_workers: int = IO_WORKERS, cpu_workers: int = CPU_WORKERS,
+                 default_limit: int = ENDPOINT_CONCURRENCY, limits: Optional[Dict[str, int]] = None,
+                 queue_timeout: float = ENDPOINT_QUEUE_TIMEOUT):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.default_limit = default_limit
+        self.overrides = limits if limits is not None else _parse_limits(ENDPOINT_LIMITS)
+        self.queue_timeout = queue_timeout
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io")
+        self._cpu_pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # Semaphores belong to an event loop; one set per loop (tests run several loops)
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._defaults: Dict[str, Optional[int]] = {}
+
+    # --- Pools ---
+
+    async def run_io(self, func: Callable, *args, **kwargs) -> Any:
+        """func(*args, **kwargs) in the IO thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io_pool, functools.partial(func, *args, **kwargs))
+
+    def _get_cpu_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._cpu_pool is None:
+                # forkserver: workers don't inherit the server's threads and held locks
+                ctx = mp.get_context("forkserver" if sys.platform != "win32" else "spawn")
+                self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=ctx)
+            return self._cpu_pool
+
+    def submit_cpu(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        Sync counterpart of run_cpu() for code already off the event loop (returns a Future).
+        A crashed worker breaks the pool; it is replaced on the next submit.
+        """
+        if self.cpu_workers <= 0:
+            return self.io_pool.submit(func, *args, **kwargs)
+        pool = self._get_cpu_pool()
+        try:
+            return pool.submit(func, *args, **kwargs)
+        except BrokenProcessPool:
+            with self._pool_lock:
+                if self._cpu_pool is pool:
+                    self._cpu_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            return self._get_cpu_pool().submit(func, *args, **kwargs)
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        """func(*args, **kwargs) in a worker process (func must be a module-level function)."""
+        return await asyncio.wrap_future(self.submit_cpu(func, *args, **kwargs))
+
+    def shutdown(self):
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        with self._pool_lock:
+            if self._cpu_pool is not None:
+                self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+                self._cpu_pool = None
+
+    # --- Per-endpoint limits ---
+
+    def limit_for(self, name: str, default: Optional[int] = None) -> int:
+        return self.overrides.get(name, default or self.default_limit)
+
+    def _semaphore(self, name: str, default: Optional[int]) -> asyncio.Semaphore:
+        slots = self._slots.setdefault(asyncio.get_running_loop(), {})
+        if name not in slots:
+            slots[name] = asyncio.Semaphore(self.limit_for(name, default))
+        return slots[name]
+
+    def _stat(self, name: str) -> Dict[str, float]:
+        return self._stats.setdefault(name, {"active": 0, "waiting": 0, "served": 0, "rejected": 0, "busy_seconds": 0.0})
+
+    def limit(self, name: str, default: Optional[int] = None):
+        """
+        Decorator for async endpoints: at most limit_for(name) run at once. The wrapped
+        signature is kept (functools.wraps), so FastAPI sees the original parameters.
+        """
+        self._defaults[name] = default
+
+        def decorate(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                semaphore = self._semaphore(name, default)
+                stat = self._stat(name)
+                stat["waiting"] += 1
+                try:
+                    acquired = await _acquire(semaphore, self.queue_timeout)
+                finally:
+                    stat["waiting"] -= 1
+                if not acquired:
+                    stat["rejected"] += 1
+                    return JSONResponse(status_code=503, content={
+                        "error": f"Server busy: too many concurrent {name} requests, retry shortly"})
+                stat["active"] += 1
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    semaphore.release()
+                    stat["active"] -= 1
+                    stat["served"] += 1
+                    stat["busy_seconds"] += time.perf_counter() - start
+            return wrapper
+        return decorate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "io_workers": self.io_workers,
+            "io_queued": self.io_pool._work_queue.qsize(),
+            "cpu_workers": self.cpu_workers,
+            "cpu_pool_started": self._cpu_pool is not None,
+            "queue_timeout": self.queue_timeout,
+            "endpoints": {
+                name: {"limit": self.limit_for(name, self._defaults.get(name)),
+                       **{k: round(v, 3) if isinstance(v, float) else int(v) for k, v in stat.items()}}
+                for name, stat in sorted(self._stats.items())
+            },
+        }
+
+
+concurrency = ConcurrencyManager()
@@ -0,0 +1,157 @@
+
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, Optional, Tuple
+from scipy import sparse, stats
+
+# Cells expected to hold fewer rows than this make the chi-square approximation shaky (Cochran)
+CHI2_MIN_EXPECTED = 5
+
+
+def _label(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _map_levels(levels: pd.Index, values) -> Tuple[np.ndarray, pd.Index]:
+    """Integer codes of values on `levels`; unseen values are appended as new levels."""
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Index(uniques)
+    pos = levels.get_indexer(uniques)
+    new = pos < 0
+    if new.any():
+        pos[new] = len(levels) + np.arange(int(new.sum()))
+        levels = levels.append(uniques[new])
+    return pos[codes], levels
+
+
+class ContingencyTable:
+    """
+    Two-way contingency counts as a sparse (row levels x column levels) matrix, built chunk
+    by chunk. Each chunk's columns are factorized to integer codes on the levels seen so
+    far (new levels add rows/columns), and the code pairs are counted with bincount, or a
+    sort when the table is much bigger than the chunk. Memory is O(non-zero cells), so
+    columns with thousands of levels never need the dense table.
+    Rows with a missing value are skipped, as in pd.crosstab.
+    """
+
+    def __init__(self):
+        self.row_levels = pd.Index([], dtype=object)
+        self.col_levels = pd.Index([], dtype=object)
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+
+    @property
+    def n(self) -> int:
+        return int(self.counts.sum())
+
+    def _add(self, rows: np.ndarray, cols: np.ndarray, weights: Optional[np.ndarray] = None):
+        r, c = len(self.row_levels), len(self.col_levels)
+        keys = rows.astype(np.int64) * c + cols
+        if weights is None and r * c <= 4 * len(keys):
+            cells = np.bincount(keys, minlength=r * c)
+            keys = np.flatnonzero(cells)
+            weights = cells[keys]
+        elif weights is None:
+            keys, weights = np.unique(keys, return_counts=True)
+        added = sparse.coo_matrix((weights.astype(np.int64), (keys // c, keys % c)), shape=(r, c)).tocsr()
+        counts = self.counts.tocoo()
+        self.counts = sparse.csr_matrix((counts.data, (counts.row, counts.col)), shape=(r, c)) + added
+
+    def update(self, a: pd.Series, b: pd.Series):
+        a, b = pd.Series(a), pd.Series(b)
+        ok = a.notna().to_numpy() & b.notna().to_numpy()
+        if not ok.any():
+            return
+        if not ok.all():
+            a, b = a[ok], b[ok]
+        rows, self.row_levels = _map_levels(self.row_levels, a)
+        cols, self.col_levels = _map_levels(self.col_levels, b)
+        self._add(rows, cols)
+
+    def merge(self, other: "ContingencyTable"):
+        other_counts = other.counts.tocoo()
+        rows, self.row_levels = _map_levels(self.row_levels, other.row_levels.to_numpy())
+        cols, self.col_levels = _map_levels(self.col_levels, other.col_levels.to_numpy())
+        self._add(rows[other_counts.row], cols[other_counts.col], other_counts.data)
+
+    def _sorted(self, levels: pd.Index) -> np.ndarray:
+        try:
+            return np.argsort(levels.to_numpy(), kind="stable")
+        except TypeError:
+            return np.arange(len(levels))
+
+    def frame(self, max_levels: Optional[int] = None) -> pd.DataFrame:
+        """
+        Dense table with sorted labels (as pd.crosstab). With max_levels, only the largest
+        row/column levels are kept, e.g. for a heatmap.
+        """
+        rows, cols = self._sorted(self.row_levels), self._sorted(self.col_levels)
+        if max_levels:
+            row_totals = np.asarray(self.counts.sum(axis=1)).ravel()
+            col_totals = np.asarray(self.counts.sum(axis=0)).ravel()
+            rows = rows[np.isin(rows, np.argsort(-row_totals, kind="stable")[:max_levels])]
+            cols = cols[np.isin(cols, np.argsort(-col_totals, kind="stable")[:max_levels])]
+        table = self.counts[rows][:, cols].toarray()
+        return pd.DataFrame(table, index=pd.Index([_label(v) for v in self.row_levels[rows]]),
+                            columns=pd.Index([_label(v) for v in self.col_levels[cols]]))
+
+
+def contingency_table(chunks: Iterable[pd.DataFrame], col1: str, col2: str) -> ContingencyTable:
+    """Counts of col1 x col2 over one or more DataFrame chunks."""
+    table = ContingencyTable()
+    for chunk in chunks:
+        table.update(chunk[col1], chunk[col2])
+    return table
+
+
+def chi2_result(table: ContingencyTable, correction: bool = True,
+                min_expected: float = CHI2_MIN_EXPECTED) -> Dict[str, Any]:
+    """
+    Pearson chi-square test of independence from the sparse table. With row totals R,
+    column totals C and N rows, chi2 = N * (sum over non-zero cells of O^2 / (R_i C_j) - 1),
+    so empty cells cost nothing. 2x2 tables get Yates' correction (as scipy's
+    chi2_contingency); Cramér's V uses the uncorrected statistic.
+    Expected counts E_ij = R_i C_j / N are checked against Cochran's rule without building
+    them: per row, the columns with C_j < min_expected * N / R_i are found by binary search.
+    """
+    counts = table.counts.tocoo()
+    n_rows, n_cols = table.counts.shape
+    if n_rows < 2 or n_cols < 2:
+        return {"error": "chi2 needs at least 2 levels in each column"}
+    row_totals = np.asarray(table.counts.sum(axis=1), dtype=float).ravel()
+    col_totals = np.asarray(table.counts.sum(axis=0), dtype=float).ravel()
+    n = float(row_totals.sum())
+    dof = (n_rows - 1) * (n_cols - 1)
+
+    observed = counts.data.astype(float)
+    chi2_raw = max(n * (float(np.sum(observed * observed / (row_totals[counts.row] * col_totals[counts.col]))) - 1.0), 0.0)
+    chi2 = chi2_raw
+    if dof == 1 and correction:
+        chi2 = float(stats.chi2_contingency(table.counts.toarray(), correction=True)[0])
+    p = float(stats.chi2.sf(chi2, dof))
+    cramers_v = float(np.sqrt(chi2_raw / (n * (min(n_rows, n_cols) - 1))))
+
+    sorted_cols = np.sort(col_totals)
+    below = int(np.searchsorted(sorted_cols, min_expected * n / row_totals, side="left").sum())
+    below_one = int(np.searchsorted(sorted_cols, n / row_totals, side="left").sum())
+    cells = n_rows * n_cols
+    warnings = []
+    if below_one:
+        warnings.append(f"{below_one} of {cells} cells have an expected count below 1: the chi-square p-value is unreliable")
+    if below > 0.2 * cells:
+        warnings.append(f"{below / cells:.0%} of cells have an expected count below {min_expected:g} (Cochran's rule allows 20%): "
+                        "consider merging rare levels")
+
+    return {
+        "test": "chi2",
+        "chi2_statistic": chi2,
+        "p_value": p,
+        "dof": int(dof),
+        "n": int(n),
+        "cramers_v": cramers_v,
+        "levels": [n_rows, n_cols],
+        "nonzero_cells": int(counts.nnz),
+        "min_expected": float(row_totals.min() * col_totals.min() / n),
+        "expected_below_min": below,
+        "warnings": warnings,
+        "significant": bool(p < 0.05),
+    }
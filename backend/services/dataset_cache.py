@@ -0,0 +1,256 @@
+
+import os
+import re
+import zipfile
+import threading
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from urllib.parse import quote
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from backend.config import CACHE_DIR
+
+# How many parsed datasets we keep in memory at once (LRU)
+DATASET_CACHE_SIZE = int(os.environ.get("DATASET_CACHE_SIZE", "8"))
+
+SIDECAR_DIR = os.path.join(str(CACHE_DIR), "sidecars")
+
+# Default of the `sheet` field on request models; workbooks without such a sheet use their first one
+DEFAULT_SHEET = "data"
+
+_SHEET_TAG = re.compile(rb"<(?:\w+:)?sheet\b[^>]*?\bname=\"([^\"]*)\"")
+
+
+class SheetNotFound(KeyError):
+    """The requested sheet does not exist in the workbook."""
+
+    def __str__(self):
+        return self.args[0] if self.args else "Sheet not found"
+
+
+@lru_cache(maxsize=256)
+def _sheet_names(filepath: str, signature: Tuple[int, int]) -> Tuple[str, ...]:
+    if filepath.endswith('.xlsx'):
+        # Sheet names live in xl/workbook.xml; no worksheet XML is touched
+        with zipfile.ZipFile(filepath) as zf:
+            xml = zf.read("xl/workbook.xml")
+        from xml.sax.saxutils import unescape
+        return tuple(unescape(m.decode("utf-8"), {"&quot;": '"', "&apos;": "'"}) for m in _SHEET_TAG.findall(xml))
+    # Legacy .xls: xlrd has no cheaper way to list sheets
+    return tuple(pd.ExcelFile(filepath).sheet_names)
+
+
+def list_sheets(filepath: str) -> List[str]:
+    """Sheet names of a workbook, in order, without parsing any sheet. CSV/Parquet files have none."""
+    if not filepath.endswith(('.xlsx', '.xls')):
+        return []
+    st = os.stat(filepath)
+    return list(_sheet_names(filepath, (st.st_mtime_ns, st.st_size)))
+
+
+def resolve_sheet(filepath: str, sheet: Optional[str] = None) -> Optional[str]:
+    """
+    Normalizes a requested sheet to its cache key: None for the first sheet (and for CSV),
+    otherwise the sheet's name. Raises SheetNotFound for unknown names, except the
+    request-model default DEFAULT_SHEET, which falls back to the first sheet.
+    """
+    if not sheet:
+        return None
+    names = list_sheets(filepath)
+    if not names:
+        return None
+    if sheet not in names:
+        matches = [n for n in names if n.lower() == str(sheet).lower()]
+        if matches:
+            sheet = matches[0]
+        elif sheet == DEFAULT_SHEET:
+            return None
+        else:
+            raise SheetNotFound(f"Sheet not found: {sheet}. Available: {names}")
+    return None if sheet == names[0] else sheet
+
+
+def sidecar_path(filepath: str, sheet: Optional[str] = None) -> str:
+    """Location of the Parquet copy written for a dataset (or one of its sheets)."""
+    name = os.path.basename(filepath)
+    if sheet:
+        name += "." + quote(sheet, safe="")
+    return os.path.join(SIDECAR_DIR, name + ".parquet")
+
+
+def _fresh_sidecar(filepath: str, sheet: Optional[str] = None) -> Optional[str]:
+    path = sidecar_path(filepath, sheet)
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(filepath).st_mtime_ns:
+            return path
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def read_dataframe(filepath: str, sheet: Optional[str] = None) -> pd.DataFrame:
+    """
+    Parses a CSV file or one sheet of an Excel workbook (default: the first) into a DataFrame.
+    Only the requested sheet is parsed (openpyxl read-only mode under pandas).
+    Uses the Parquet sidecar when one exists and is newer than the source file.
+    """
+    sidecar = _fresh_sidecar(filepath, sheet)
+    if sidecar:
+        try:
+            return pd.read_parquet(sidecar)
+        except Exception as e:
+            print(f"Warning: unreadable sidecar {sidecar}: {e}")
+    if filepath.endswith('.csv'):
+        return pd.read_csv(filepath)
+    if filepath.endswith('.parquet'):
+        return pd.read_parquet(filepath)
+    return pd.read_excel(filepath, sheet_name=sheet if sheet else 0)
+
+
+class ColumnIndex:
+    """
+    Lazily built lookup structures for one column.
+    - Numeric / datetime columns get a sorted index (argsort order + sorted values) so range
+      predicates are answered with a binary search.
+    - Everything else gets a categorical code map (factorize) so equality, membership and
+      substring tests only touch the distinct values, then map back through integer codes.
+    Both expose `rank`, a dense per-row sort key used for multi-column sorts.
+    """
+
+    def __init__(self, series: pd.Series):
+        self.is_numeric = (pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)) \
+            or pd.api.types.is_datetime64_any_dtype(series)
+
+        if self.is_numeric:
+            values = series.to_numpy()
+            # NaN / NaT sort last
+            self.order = np.argsort(values, kind="stable")
+            self.sorted_values = values[self.order]
+            self.n_valid = int(series.notna().sum())
+            self.codes = None
+            self.uniques = None
+
+            # Dense rank: ties share a rank, missing values rank >= null_rank
+            changed = np.ones(len(values), dtype=bool)
+            if len(values) > 1:
+                changed[1:] = self.sorted_values[1:] != self.sorted_values[:-1]
+            dense = np.cumsum(changed) - 1
+            self.rank = np.empty(len(values), dtype=np.int64)
+            self.rank[self.order] = dense
+            self.null_rank = int(dense[self.n_valid]) if self.n_valid < len(dense) else len(dense)
+        else:
+            codes, uniques = pd.factorize(series, sort=True)
+            self.codes = codes.astype(np.int64)
+            self.uniques = pd.Index(uniques)
+            self.sorted_values = None
+            self.n_valid = int((self.codes >= 0).sum())
+
+            # Codes are already a dense rank; missing values (-1) go to the end
+            self.null_rank = len(self.uniques)
+            self.rank = np.where(self.codes < 0, self.null_rank, self.codes)
+            self.order = np.argsort(self.rank, kind="stable")
+
+    def code_of(self, value: Any) -> int:
+        """Integer code for a value, or -2 if the value does not occur in the column."""
+        loc = self.uniques.get_indexer([value])[0]
+        return int(loc) if loc >= 0 else -2
+
+    def value_range(self, low: Any = None, high: Any = None,
+                    include_low: bool = True, include_high: bool = True) -> np.ndarray:
+        """Row positions whose value lies within [low, high] (bounds optional)."""
+        valid = self.sorted_values[:self.n_valid]
+        start = 0
+        end = self.n_valid
+        if low is not None:
+            start = int(np.searchsorted(valid, low, side="left" if include_low else "right"))
+        if high is not None:
+            end = int(np.searchsorted(valid, high, side="right" if include_high else "left"))
+        if end <= start:
+            return np.empty(0, dtype=np.int64)
+        return self.order[start:end]
+
+
+class CachedDataset:
+    """A parsed DataFrame (one sheet of a file) plus its lazily built per-column indexes."""
+
+    def __init__(self, filepath: str, df: pd.DataFrame, signature: Tuple[int, int], sheet: Optional[str] = None):
+        self.filepath = filepath
+        self.sheet = sheet
+        self.df = df
+        self.signature = signature
+        self._indexes: Dict[str, ColumnIndex] = {}
+        self._lock = threading.Lock()
+
+    def index(self, column: str) -> ColumnIndex:
+        idx = self._indexes.get(column)
+        if idx is None:
+            with self._lock:
+                idx = self._indexes.get(column)
+                if idx is None:
+                    idx = ColumnIndex(self.df[column])
+                    self._indexes[column] = idx
+        return idx
+
+
+class DatasetCache:
+    """
+    Process-wide LRU cache of parsed datasets, keyed by file path and sheet (each sheet of a
+    workbook is parsed and cached on its own, on first use).
+    Entries are revalidated against the file's mtime/size on every lookup, so files changed
+    on disk are re-read automatically.
+    """
+
+    def __init__(self, max_entries: int = DATASET_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, Optional[str]], CachedDataset]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(filepath: str) -> Tuple[int, int]:
+        st = os.stat(filepath)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self, filepath: str, sheet: Optional[str] = None) -> CachedDataset:
+        """Cached dataset for a file's sheet (default: first). Raises SheetNotFound."""
+        signature = self._signature(filepath)
+        key = (filepath, resolve_sheet(filepath, sheet))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(key)
+                return entry
+
+        # Parse outside the lock so one slow file doesn't block the others
+        df = read_dataframe(filepath, key[1])
+        entry = CachedDataset(filepath, df, signature, key[1])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_df(self, filepath: str, sheet: Optional[str] = None) -> pd.DataFrame:
+        return self.get(filepath, sheet).df
+
+    def contains(self, filepath: str, sheet: Optional[str] = None) -> bool:
+        """True if the sheet is parsed and current (a get() would not touch the file)."""
+        try:
+            signature = self._signature(filepath)
+        except FileNotFoundError:
+            return False
+        entry = self._entries.get((filepath, resolve_sheet(filepath, sheet)))
+        return entry is not None and entry.signature == signature
+
+    def invalidate(self, filepath: Optional[str] = None):
+        """Drops all sheets of one file (or everything) from the cache."""
+        with self._lock:
+            if filepath is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == filepath]:
+                    del self._entries[key]
+
+
+dataset_cache = DatasetCache()
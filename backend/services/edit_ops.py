@@ -0,0 +1,504 @@
+
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from backend.config import CACHE_DIR
+from backend.services.dataset_cache import CachedDataset
+from backend.services.sheet_query import SUPPORTED_OPS as FILTER_OPS, QueryError, _filter_mask
+from backend.services.safe_expr import ExpressionError, parse_expression
+
+JOURNAL_DIR = os.path.join(str(CACHE_DIR), "journals")
+
+# Operation IR: {"op": name, ...fields}. Required fields per op (aliases are normalized first).
+OP_FIELDS = {
+    "delete_column": ["columns"],
+    "rename_column": ["old", "new"],
+    "fill_na": ["column", "method"],
+    "compute_column": ["new_col", "expr"],
+    "cast_column": ["column", "dtype"],
+    "replace_values": ["column", "mapping"],
+    "filter_rows": ["filters"],
+    "drop_rows": [],
+    "drop_na": [],
+    "drop_duplicates": [],
+    "sort_rows": ["by"],
+}
+FILL_METHODS = {"value", "zero", "mean", "median", "mode", "ffill", "bfill"}
+CAST_TYPES = {"int", "float", "str", "bool", "datetime", "category"}
+
+# Short description of every op, used in the LLM planning prompt
+OP_DOCS = """- {"op": "delete_column", "columns": ["col", ...]}
+- {"op": "rename_column", "old": "col", "new": "new_name"}
+- {"op": "fill_na", "column": "col", "method": "value|zero|mean|median|mode|ffill|bfill", "value": 0}
+- {"op": "compute_column", "new_col": "col", "expr": "price * qty"}   (columns, numbers, 'text', + - * / // % **, comparisons, and/or/not, functions abs sqrt exp log log10 log2 floor ceil round where isnull notnull, reductions sum mean median min max std count, e.g. "where(qty > 0, total / qty, 0)" or "sales / sum(sales)"; `backticks` for names with spaces; no methods or attributes)
+- {"op": "cast_column", "column": "col", "dtype": "int|float|str|bool|datetime|category"}
+- {"op": "replace_values", "column": "col", "mapping": {"old": "new"}}
+- {"op": "filter_rows", "filters": [{"column": "col", "op": "eq|ne|in|not_in|gt|gte|lt|lte|between|contains|startswith|isnull|notnull", "value": 1}]}   (keeps matching rows)
+- {"op": "drop_rows", "filters": [...]}  or  {"op": "drop_rows", "start": 0, "stop": 2}   (removes rows)
+- {"op": "drop_na", "columns": ["col", ...]}   (columns optional: any column)
+- {"op": "drop_duplicates", "columns": ["col", ...], "keep": "first|last"}
+- {"op": "sort_rows", "by": [{"column": "col", "desc": false}]}"""
+
+
+class EditOpError(ValueError):
+    """An op is malformed or does not fit the dataset's schema."""
+
+
+# --- Validation ---
+
+def _normalize(op: Dict[str, Any]) -> Dict[str, Any]:
+    """Maps the field spellings LLMs tend to use onto the canonical ones."""
+    op = dict(op)
+    name = op.get("op")
+    if name == "delete_column":
+        cols = op.pop("columns", None) or op.pop("column", None) or op.pop("name", None) or op.pop("value", None)
+        if "index" in op:
+            cols = op.pop("index")
+        op["columns"] = cols if isinstance(cols, list) else ([] if cols is None else [cols])
+    elif name == "rename_column":
+        op.setdefault("old", op.pop("column", None) or op.pop("name", None))
+    elif name == "compute_column":
+        op.setdefault("new_col", op.pop("column", None) or op.pop("name", None))
+        op.setdefault("expr", op.pop("expression", None))
+    elif name == "fill_na":
+        op.setdefault("method", "value" if "value" in op else "mean")
+    elif name == "sort_rows":
+        by = op.get("by")
+        if isinstance(by, str):
+            by = [{"column": by, "desc": bool(op.pop("desc", False))}]
+        elif isinstance(by, list):
+            by = [b if isinstance(b, dict) else {"column": b, "desc": False} for b in by]
+        op["by"] = by
+    elif name in ("drop_na", "drop_duplicates"):
+        cols = op.get("columns")
+        op["columns"] = [cols] if isinstance(cols, str) else cols
+    return op
+
+
+def compile_plan(ops: List[Dict[str, Any]], columns: List[str]) -> List[Dict[str, Any]]:
+    """
+    Validates a list of ops against the dataset's columns and returns them normalized.
+    The schema is tracked through the plan, so an op may use a column renamed or computed
+    by an earlier op. Raises EditOpError naming the offending op.
+    """
+    if not isinstance(ops, list) or not ops:
+        raise EditOpError("Plan must be a non-empty list of ops")
+
+    schema = [str(c) for c in columns]
+    compiled = []
+
+    def need(col, i):
+        if col not in schema:
+            raise EditOpError(f"Op {i} ({ops[i].get('op')}): column not found: {col}. Available: {schema}")
+
+    for i, raw in enumerate(ops):
+        if not isinstance(raw, dict) or raw.get("op") not in OP_FIELDS:
+            raise EditOpError(f"Op {i}: unknown op {raw.get('op') if isinstance(raw, dict) else raw!r}. "
+                              f"Use one of {sorted(OP_FIELDS)}")
+        op = _normalize(raw)
+        name = op["op"]
+        for field in OP_FIELDS[name]:
+            if op.get(field) in (None, "", []):
+                raise EditOpError(f"Op {i} ({name}): missing '{field}'")
+
+        if name == "delete_column":
+            resolved = []
+            for c in op["columns"]:
+                # Positional references (mcp_sheets style) are resolved against the current schema
+                if isinstance(c, int) and not isinstance(c, bool):
+                    if not -len(schema) <= c < len(schema):
+                        raise EditOpError(f"Op {i} (delete_column): column index out of range: {c}")
+                    c = schema[c]
+                need(c, i)
+                resolved.append(c)
+            op["columns"] = resolved
+            schema = [c for c in schema if c not in resolved]
+        elif name == "rename_column":
+            need(op["old"], i)
+            if op["new"] in schema and op["new"] != op["old"]:
+                raise EditOpError(f"Op {i} (rename_column): column already exists: {op['new']}")
+            schema = [op["new"] if c == op["old"] else c for c in schema]
+        elif name == "fill_na":
+            need(op["column"], i)
+            if op["method"] not in FILL_METHODS:
+                raise EditOpError(f"Op {i} (fill_na): unknown method {op['method']}. Use one of {sorted(FILL_METHODS)}")
+            if op["method"] == "value" and "value" not in op:
+                raise EditOpError(f"Op {i} (fill_na): method 'value' needs a 'value'")
+        elif name == "compute_column":
+            try:
+                parse_expression(op["expr"], schema)
+            except ExpressionError as e:
+                raise EditOpError(f"Op {i} (compute_column): {e}")
+            if op["new_col"] not in schema:
+                schema.append(op["new_col"])
+        elif name == "cast_column":
+            need(op["column"], i)
+            if op["dtype"] not in CAST_TYPES:
+                raise EditOpError(f"Op {i} (cast_column): unknown dtype {op['dtype']}. Use one of {sorted(CAST_TYPES)}")
+        elif name == "replace_values":
+            need(op["column"], i)
+            if not isinstance(op["mapping"], dict):
+                raise EditOpError(f"Op {i} (replace_values): 'mapping' must be an object")
+        elif name in ("filter_rows", "drop_rows"):
+            filters = op.get("filters")
+            if name == "drop_rows" and not filters:
+                if "start" not in op and "stop" not in op:
+                    raise EditOpError(f"Op {i} (drop_rows): needs 'filters' or a 'start'/'stop' range")
+            else:
+                if not isinstance(filters, list):
+                    filters = op["filters"] = [filters]
+                for spec in filters:
+                    if not isinstance(spec, dict):
+                        raise EditOpError(f"Op {i} ({name}): each filter must be an object")
+                    need(spec.get("column"), i)
+                    if spec.get("op", "eq") not in FILTER_OPS:
+                        raise EditOpError(f"Op {i} ({name}): unsupported filter op {spec.get('op')}")
+        elif name in ("drop_na", "drop_duplicates"):
+            for c in op.get("columns") or []:
+                need(c, i)
+            if op.get("keep", "first") not in ("first", "last"):
+                raise EditOpError(f"Op {i} (drop_duplicates): keep must be 'first' or 'last'")
+        elif name == "sort_rows":
+            for spec in op["by"]:
+                need(spec.get("column"), i)
+        compiled.append(op)
+    return compiled
+
+
+# --- Execution ---
+
+def _generic_mask(series: pd.Series, spec: Dict[str, Any]) -> np.ndarray:
+    """Vectorized filter predicate on a column that has no cached index (same semantics as /query)."""
+    op = spec.get("op", "eq")
+    value = spec.get("value")
+    if op == "isnull":
+        return series.isna().to_numpy()
+    if op == "notnull":
+        return series.notna().to_numpy()
+    notna = series.notna().to_numpy()
+    if op in ("contains", "startswith"):
+        text = series.astype(str).str.lower()
+        needle = str(value).lower()
+        hits = text.str.startswith(needle) if op == "startswith" else text.str.contains(needle, regex=False)
+        return hits.to_numpy() & notna
+    if op in ("eq", "ne", "in", "not_in"):
+        values = value if isinstance(value, list) else [value]
+        hits = series.isin(values).to_numpy()
+        return ~hits & notna if op in ("ne", "not_in") else hits
+    try:
+        if op == "between":
+            low, high = value
+            return ((series >= low) & (series <= high)).to_numpy()
+        compare = {"gt": series.gt, "gte": series.ge, "lt": series.lt, "lte": series.le}[op]
+        return compare(value).fillna(False).to_numpy(dtype=bool)
+    except (TypeError, ValueError) as e:
+        raise EditOpError(f"Cannot compare column '{series.name}' with {value!r}: {e}")
+
+
+class _PlanState:
+    """
+    Working state of a plan run. Columns are kept as a dict of Series over a base frame
+    plus `positions`, the surviving rows in output order. Row ops only narrow/reorder
+    `positions` and column ops only swap Series in the dict, so a plan of filters, fills and
+    computed columns touches each column once and builds the result in one final take().
+    Only ffill/bfill, which depend on neighbouring rows, compact the state mid-plan.
+    """
+
+    def __init__(self, ds: CachedDataset):
+        self.ds = ds
+        self.columns: Dict[str, pd.Series] = {str(c): ds.df[c] for c in ds.df.columns}
+        self.positions = np.arange(len(ds.df))
+        # current name -> original column, for columns still identical to the cached ones
+        self.pristine: Dict[str, Any] = {str(c): c for c in ds.df.columns}
+        self.compacted = False
+        self.passes = 0
+
+    def mask_for(self, spec: Dict[str, Any]) -> np.ndarray:
+        col = spec["column"]
+        if not self.compacted and col in self.pristine:
+            # Untouched column of the cached dataset: reuse its sorted / categorical index
+            try:
+                return _filter_mask(self.ds, {**spec, "column": self.pristine[col]})
+            except QueryError as e:
+                raise EditOpError(str(e))
+        return _generic_mask(self.columns[col], spec)
+
+    def set_column(self, name: str, series: pd.Series):
+        self.columns[name] = series
+        self.pristine.pop(name, None)
+
+    def visible(self, name: str) -> pd.Series:
+        """The column restricted to the surviving rows, in output order."""
+        series = self.columns[name]
+        if len(self.positions) == len(series) and np.array_equal(self.positions, np.arange(len(series))):
+            return series
+        return series.iloc[self.positions].reset_index(drop=True)
+
+    def compact(self):
+        """Materializes the surviving rows so positions become 0..n-1 again."""
+        self.columns = {name: self.visible(name) for name in self.columns}
+        self.positions = np.arange(len(self.positions))
+        self.compacted = True
+        self.pristine = {}
+        self.passes += 1
+
+    def result(self) -> pd.DataFrame:
+        self.passes += 1
+        return pd.DataFrame({name: self.visible(name) for name in self.columns})
+
+
+def _fill_na(state: _PlanState, op: Dict[str, Any]):
+    col = op["column"]
+    method = op["method"]
+    if method in ("ffill", "bfill"):
+        state.compact()
+        series = state.columns[col]
+        state.set_column(col, series.ffill() if method == "ffill" else series.bfill())
+        return
+    series = state.columns[col]
+    if method == "value":
+        fill = op["value"]
+    elif method == "zero":
+        fill = 0
+    else:
+        # Statistics over the rows that survive the plan so far
+        visible = state.visible(col)
+        if method == "mode":
+            modes = visible.mode()
+            fill = modes.iloc[0] if len(modes) else None
+        else:
+            if not pd.api.types.is_numeric_dtype(visible):
+                raise EditOpError(f"fill_na {method}: column '{col}' is not numeric")
+            fill = visible.mean() if method == "mean" else visible.median()
+    if fill is not None:
+        state.set_column(col, series.fillna(fill))
+
+
+def _compute(state: _PlanState, op: Dict[str, Any]):
+    try:
+        expr = parse_expression(op["expr"], list(state.columns))
+        if expr.aggregate:
+            # Reductions are over the rows that survive the plan so far
+            state.compact()
+        frame = pd.DataFrame(state.columns, copy=False)
+        value = expr.evaluate(frame)
+    except ExpressionError as e:
+        raise EditOpError(f"compute_column '{op['new_col']}': cannot evaluate {op['expr']!r}: {e}")
+    if not isinstance(value, pd.Series):
+        value = pd.Series(np.full(len(frame), value), index=frame.index)
+    state.set_column(op["new_col"], value)
+
+
+def _cast(series: pd.Series, dtype: str) -> pd.Series:
+    try:
+        if dtype == "int":
+            return pd.to_numeric(series).astype("Int64")
+        if dtype == "float":
+            return pd.to_numeric(series, errors="coerce").astype(float)
+        if dtype == "str":
+            return series.astype("string").astype(object).where(series.notna(), None)
+        if dtype == "bool":
+            return series.astype("boolean")
+        if dtype == "datetime":
+            return pd.to_datetime(series, errors="coerce")
+        return series.astype("category")
+    except (TypeError, ValueError) as e:
+        raise EditOpError(f"cast_column '{series.name}' to {dtype}: {e}")
+
+
+def _row_mask(state: _PlanState, filters: List[Dict[str, Any]]) -> np.ndarray:
+    mask = np.ones(len(next(iter(state.columns.values()))) if state.columns else 0, dtype=bool)
+    for spec in filters:
+        mask &= state.mask_for(spec)
+    return mask
+
+
+def apply_ops(ds: CachedDataset, ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Runs a compiled plan against a cached dataset and returns the new DataFrame.
+    The cached frame is never modified. Returns {"df", "rows_before", "rows_after", "passes", "took_ms"}.
+    """
+    start = time.perf_counter()
+    state = _PlanState(ds)
+
+    for op in ops:
+        name = op["op"]
+        if name == "delete_column":
+            for c in op["columns"]:
+                state.columns.pop(c, None)
+                state.pristine.pop(c, None)
+        elif name == "rename_column":
+            state.columns = {op["new"] if k == op["old"] else k: v for k, v in state.columns.items()}
+            if op["old"] in state.pristine:
+                state.pristine[op["new"]] = state.pristine.pop(op["old"])
+        elif name == "fill_na":
+            _fill_na(state, op)
+        elif name == "compute_column":
+            _compute(state, op)
+        elif name == "cast_column":
+            state.set_column(op["column"], _cast(state.columns[op["column"]], op["dtype"]))
+        elif name == "replace_values":
+            state.set_column(op["column"], state.columns[op["column"]].replace(op["mapping"]))
+        elif name == "filter_rows":
+            mask = _row_mask(state, op["filters"])
+            state.positions = state.positions[mask[state.positions]]
+        elif name == "drop_rows":
+            if op.get("filters"):
+                mask = _row_mask(state, op["filters"])
+                state.positions = state.positions[~mask[state.positions]]
+            else:
+                # Positional range over the current row order
+                state.positions = np.delete(state.positions, slice(op.get("start"), op.get("stop")))
+        elif name == "drop_na":
+            cols = op.get("columns") or list(state.columns)
+            keep = np.ones(len(state.positions), dtype=bool)
+            for c in cols:
+                keep &= state.columns[c].notna().to_numpy()[state.positions]
+            state.positions = state.positions[keep]
+        elif name == "drop_duplicates":
+            cols = op.get("columns") or list(state.columns)
+            frame = pd.DataFrame({c: state.visible(c) for c in cols})
+            dup = frame.duplicated(keep=op.get("keep", "first")).to_numpy()
+            state.positions = state.positions[~dup]
+        elif name == "sort_rows":
+            keys = []
+            for spec in reversed(op["by"]):
+                codes, _ = pd.factorize(state.visible(spec["column"]), sort=True)
+                rank = np.where(codes < 0, np.iinfo(np.int64).max, codes.astype(np.int64))
+                if spec.get("desc"):
+                    # Missing values stay last when sorting descending
+                    rank = np.where(codes < 0, rank, -rank)
+                keys.append(rank)
+            state.positions = state.positions[np.lexsort(keys)]
+
+    df = state.result()
+    return {
+        "df": df,
+        "rows_before": len(ds.df),
+        "rows_after": len(df),
+        "passes": state.passes,
+        "took_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+# --- Equivalent pandas code (shown to the user, kept in the journal) ---
+
+def plan_to_code(ops: List[Dict[str, Any]]) -> str:
+    lines = []
+    for op in ops:
+        name = op["op"]
+        if name == "delete_column":
+            lines.append(f"df = df.drop(columns={op['columns']!r})")
+        elif name == "rename_column":
+            lines.append(f"df = df.rename(columns={{{op['old']!r}: {op['new']!r}}})")
+        elif name == "fill_na":
+            col = op["column"]
+            method = op["method"]
+            if method in ("ffill", "bfill"):
+                lines.append(f"df[{col!r}] = df[{col!r}].{method}()")
+            elif method == "value":
+                lines.append(f"df[{col!r}] = df[{col!r}].fillna({op['value']!r})")
+            elif method == "zero":
+                lines.append(f"df[{col!r}] = df[{col!r}].fillna(0)")
+            elif method == "mode":
+                lines.append(f"df[{col!r}] = df[{col!r}].fillna(df[{col!r}].mode().iloc[0])")
+            else:
+                lines.append(f"df[{col!r}] = df[{col!r}].fillna(df[{col!r}].{method}())")
+        elif name == "compute_column":
+            lines.append(f"df[{op['new_col']!r}] = {parse_expression(op['expr']).to_code()}")
+        elif name == "cast_column":
+            lines.append(f"df[{op['column']!r}] = df[{op['column']!r}].astype({op['dtype']!r})")
+        elif name == "replace_values":
+            lines.append(f"df[{op['column']!r}] = df[{op['column']!r}].replace({op['mapping']!r})")
+        elif name in ("filter_rows", "drop_rows"):
+            if op.get("filters"):
+                cond = " & ".join(f"({_filter_code(f)})" for f in op["filters"])
+                lines.append(f"df = df[{cond}]" if name == "filter_rows" else f"df = df[~({cond})]")
+            else:
+                lines.append(f"df = df.drop(df.index[{op.get('start') or ''}:{op.get('stop') or ''}])")
+        elif name == "drop_na":
+            lines.append(f"df = df.dropna(subset={op.get('columns')!r})")
+        elif name == "drop_duplicates":
+            lines.append(f"df = df.drop_duplicates(subset={op.get('columns')!r}, keep={op.get('keep', 'first')!r})")
+        elif name == "sort_rows":
+            by = [s["column"] for s in op["by"]]
+            asc = [not s.get("desc") for s in op["by"]]
+            lines.append(f"df = df.sort_values(by={by!r}, ascending={asc!r})")
+    lines.append("df = df.reset_index(drop=True)")
+    return "\n".join(lines)
+
+
+def _filter_code(spec: Dict[str, Any]) -> str:
+    col = f"df[{spec['column']!r}]"
+    op = spec.get("op", "eq")
+    value = spec.get("value")
+    symbols = {"eq": "==", "ne": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+    if op in symbols:
+        return f"{col} {symbols[op]} {value!r}"
+    if op == "in":
+        return f"{col}.isin({value!r})"
+    if op == "not_in":
+        return f"~{col}.isin({value!r})"
+    if op == "between":
+        return f"{col}.between({value[0]!r}, {value[1]!r})"
+    if op in ("contains", "startswith"):
+        return f"{col}.astype(str).str.lower().str.{op}({str(value).lower()!r})"
+    return f"{col}.{op}()"
+
+
+# --- Edit journal ---
+
+class EditJournal:
+    """
+    Append-only log of the edits applied to each dataset (JSON lines in CACHE_DIR/journals).
+    Entries made from ops can be replayed on another dataset without the LLM; raw-code
+    edits (sandbox fallback) are recorded with their code but are not replayable.
+    """
+
+    def __init__(self, directory: str = JOURNAL_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, dataset_id: str) -> str:
+        return os.path.join(self.directory, os.path.basename(dataset_id) + ".jsonl")
+
+    def append(self, dataset_id: str, command: Optional[str], ops: Optional[List[Dict[str, Any]]] = None,
+               code: Optional[str] = None, **extra) -> Dict[str, Any]:
+        entry = {
+            "created": datetime.now().isoformat(),
+            "command": command,
+            "ops": ops,
+            "code": code,
+            "replayable": ops is not None,
+            **extra,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            with open(self._path(dataset_id), "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        return entry
+
+    def entries(self, dataset_id: str) -> List[Dict[str, Any]]:
+        try:
+            with open(self._path(dataset_id)) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def replay_ops(self, dataset_id: str, indexes: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Concatenated ops of the selected (default: all) replayable entries, in order."""
+        entries = self.entries(dataset_id)
+        selected = entries if indexes is None else [entries[i] for i in indexes if -len(entries) <= i < len(entries)]
+        ops = []
+        for entry in selected:
+            if entry.get("replayable"):
+                ops.extend(entry["ops"])
+        return ops
+
+
+edit_journal = EditJournal()
@@ -1,9 +1,9 @@
 
 import os
+import json
 from typing import TypedDict, List
 from langgraph.graph import StateGraph, END
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from backend.services.llm_client import get_llm_client, LLMError
 
 # Mock State
 class AgentState(TypedDict):
@@ -14,19 +14,28 @@ class AgentState(TypedDict):
 
 class OrchestratorCore:
     def __init__(self):
-        key = os.environ.get("OPENAI_API_KEY")
-        self.llm = ChatOpenAI(model="gpt-4o", api_key=key) if key else None
+        # Shared pooled async client (timeouts, retries, concurrency cap)
+        llm = get_llm_client()
+        self.llm = llm if llm.available else None
         self.graph = self._build_graph()
 
-    def _planner(self, state: AgentState):
+    async def _planner(self, state: AgentState):
         if not self.llm:
             return {"plan": ["mock_step_1", "mock_step_2"]}
             
         messages = [
-            SystemMessage(content="You are a data assistant. Return a list of execution steps."),
-            HumanMessage(content=state["input"])
+            {"role": "system", "content": "You are a data assistant. Return a list of execution steps "
+                                          "as a JSON array of short strings, nothing else."},
+            {"role": "user", "content": state["input"]}
         ]
-        # Simplified: In real app, we parse JSON plan
+        try:
+            content = await self.llm.chat(messages, temperature=0, max_tokens=300)
+            content = content.replace("```json", "").replace("```", "").strip()
+            plan = json.loads(content)
+            if isinstance(plan, list) and plan:
+                return {"plan": [str(step) for step in plan]}
+        except (LLMError, ValueError) as e:
+            print(f"Warning: planner failed, using default plan: {e}")
         return {"plan": ["step1", "step2"]}
 
     def _executor(self, state: AgentState):
@@ -46,7 +55,7 @@ class OrchestratorCore:
         
         return workflow.compile()
 
-    def run(self, user_input: str):
+    async def run(self, user_input: str):
         initial = {"input": user_input, "plan": [], "current_step": 0, "results": []}
-        final = self.graph.invoke(initial)
+        final = await self.graph.ainvoke(initial)
         return final
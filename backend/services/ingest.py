@@ -0,0 +1,58 @@
+
+import os
+import traceback
+from typing import Any, Dict
+from backend.services.catalog import catalog
+from backend.services.dataset_cache import SIDECAR_DIR, sidecar_path
+
+
+def write_sidecar(filepath: str) -> str:
+    """
+    Converts a dataset to Parquet chunk by chunk, so later loads skip CSV/Excel parsing.
+    Written to a temp name first; a half-written sidecar is never picked up.
+    """
+    from backend.services.sheet_export import stream_parquet
+
+    os.makedirs(SIDECAR_DIR, exist_ok=True)
+    target = sidecar_path(filepath)
+    tmp = target + ".tmp"
+    try:
+        with open(tmp, "wb") as out:
+            for block in stream_parquet(filepath):
+                out.write(block)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return target
+
+
+def ingest_dataset(filepath: str, register: bool = True) -> Dict[str, Any]:
+    """
+    Post-upload processing, meant to run as a background task:
+    single-pass column profile (stored with the catalog entry) and Parquet sidecar conversion.
+    `register=False` for files outside UPLOAD_DIR (e.g. meta uploads): sidecar only.
+    Each step is best effort; failures are logged and reported, never raised.
+    """
+    from backend.services.sheet_export import PYARROW_AVAILABLE
+    from backend.services.profiler import profile_store
+
+    report: Dict[str, Any] = {"path": filepath}
+    if register:
+        try:
+            entry = catalog.get(os.path.basename(filepath)) or catalog.register(filepath)
+            entry.set_profile(profile_store.get(filepath))
+            report["rows"] = entry.rows
+        except Exception as e:
+            traceback.print_exc()
+            report["profile_error"] = str(e)
+
+    if PYARROW_AVAILABLE:
+        try:
+            report["sidecar"] = write_sidecar(filepath)
+        except Exception as e:
+            print(f"Sidecar conversion failed for {filepath}: {e}")
+            report["sidecar_error"] = str(e)
+
+    print(f"[Ingest] {report}")
+    return report
@@ -0,0 +1,266 @@
+
+import asyncio
+import numpy as np
+import pandas as pd
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import WebSocket
+from backend.services.computed_columns import _changed_rows
+from backend.services.concurrency import concurrency
+from backend.services.wire_format import dumps, _python_values
+
+# Diffs kept per channel, so a client that briefly lost the socket can catch up
+LIVE_HISTORY = 50
+# Channels (dataset + sheet) kept in memory; the least recently used ones are dropped
+LIVE_MAX_CHANNELS = 200
+# A diff touching more than this share of the sheet's cells is sent as "reload" instead
+LIVE_DIFF_MAX_RATIO = 0.5
+
+
+# --- Diffs ---
+
+def _row_hashes(df: pd.DataFrame, columns: List[Any]) -> np.ndarray:
+    if not columns:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def _values_at(series: pd.Series, positions: np.ndarray) -> list:
+    return _python_values(series.iloc[positions])
+
+
+def _align_rows(old_h: np.ndarray, new_h: np.ndarray) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """
+    Row-level part of a diff, from per-row hashes over the shared columns.
+    Returns (row ops, source) where source[i] is the old position of new row i, or -1 for
+    rows that are new. Rows that merely had cells edited keep their position (no row ops).
+    """
+    n_old, n_new = len(old_h), len(new_h)
+
+    # Filters/dedups/sorts keep whole rows: map every new row to its old position
+    old_index = pd.Index(old_h)
+    if old_index.is_unique:
+        found = old_index.get_indexer(new_h)
+        if (found >= 0).all():
+            in_order = n_new < 2 or bool((np.diff(found) > 0).all())
+            if n_new == n_old and in_order:
+                return {}, found
+            if n_new < n_old and in_order:
+                removed = np.setdiff1d(np.arange(n_old), found, assume_unique=True)
+                return {"rows_removed": removed.tolist()}, found
+            return {"order": found.tolist()}, found
+    if n_old == n_new:
+        return {}, np.arange(n_new)
+
+    # Otherwise one block was inserted/replaced/removed: common prefix and suffix are kept
+    limit = min(n_old, n_new)
+    mismatch = np.flatnonzero(old_h[:limit] != new_h[:limit])
+    prefix = int(mismatch[0]) if len(mismatch) else limit
+    tail = np.flatnonzero(old_h[::-1][:limit - prefix] != new_h[::-1][:limit - prefix])
+    suffix = int(tail[0]) if len(tail) else limit - prefix
+
+    ops: Dict[str, Any] = {}
+    removed = np.arange(prefix, n_old - suffix)
+    if len(removed):
+        ops["rows_removed"] = removed.tolist()
+    source = np.full(n_new, -1, dtype=np.int64)
+    source[:prefix] = np.arange(prefix)
+    source[n_new - suffix:] = np.arange(n_old - suffix, n_old)
+    added = n_new - suffix - prefix
+    if added > 0:
+        ops["rows_added"] = {"at": prefix, "count": added}
+    return ops, source
+
+
+def compute_diff(old: pd.DataFrame, new: pd.DataFrame) -> Optional[Dict[str, Any]]:
+    """
+    Compact description of how `old` became `new`, applied by clients in this order:
+    1. rows:    "order" (new row i = old row order[i]) | "rows_removed" (old positions)
+                then "rows_added" {"at", "rows": [{col: value}]} inserted at new position "at"
+    2. columns: "columns_removed", "columns_added" {col: [values]}, then "columns" (final order)
+    3. cells:   "cells" {col: {"rows": [new positions], "values": [...]}}
+    Returns None when the frames are equal and the fields above are absent.
+    """
+    old_cols = [str(c) for c in old.columns]
+    new_cols = [str(c) for c in new.columns]
+    shared = [c for c in new_cols if c in old_cols]
+    old = old.set_axis(old_cols, axis=1)
+    new = new.set_axis(new_cols, axis=1)
+
+    diff: Dict[str, Any] = {}
+    row_ops, source = _align_rows(_row_hashes(old, shared), _row_hashes(new, shared))
+    if "rows_added" in row_ops:
+        at, count = row_ops["rows_added"]["at"], row_ops["rows_added"]["count"]
+        block = new.iloc[at:at + count]
+        row_ops["rows_added"] = {"at": at, "rows": [dict(zip(new_cols, row)) for row in
+                                 zip(*[_python_values(block[c]) for c in new_cols])]}
+    diff.update(row_ops)
+
+    removed = [c for c in old_cols if c not in new_cols]
+    added = [c for c in new_cols if c not in old_cols]
+    if removed:
+        diff["columns_removed"] = removed
+    if added:
+        diff["columns_added"] = {c: _python_values(new[c]) for c in added}
+    if removed or added or shared != [c for c in old_cols if c in new_cols]:
+        diff["columns"] = new_cols
+
+    # Cells: rows matched by hash are equal on the shared columns already; only rows kept
+    # in place (same length, no row ops) can have edited cells
+    if len(old) == len(new) and not row_ops:
+        cells = {}
+        for c in shared:
+            changed = np.flatnonzero(_changed_rows(old[c].reset_index(drop=True), new[c].reset_index(drop=True)))
+            if len(changed):
+                cells[c] = {"rows": changed.tolist(), "values": _values_at(new[c], changed)}
+        if cells:
+            diff["cells"] = cells
+    return diff or None
+
+
+def _diff_size(diff: Dict[str, Any], n_columns: int) -> int:
+    size = sum(len(v["rows"]) for v in diff.get("cells", {}).values())
+    size += len(diff.get("rows_added", {}).get("rows", [])) * n_columns
+    size += sum(len(v) for v in diff.get("columns_added", {}).values())
+    return size
+
+
+# --- Channels ---
+
+class _Channel:
+    def __init__(self, version: int, history: int = LIVE_HISTORY):
+        self.sockets: Dict[WebSocket, Optional[str]] = {}
+        self.version = version
+        self.history: deque = deque(maxlen=history)
+        self.lock = asyncio.Lock()
+
+
+class LiveSyncHub:
+    """
+    Per-dataset (and sheet) WebSocket channels. After every write, subscribers get one
+    message with the version it produces and the version it applies to:
+      {"type": "diff", "dataset_id", "sheet", "version", "base_version", "origin", "total", ...diff}
+    A client whose version != base_version asks {"type": "sync", "since": v} and gets the
+    missed diffs from the history, or {"type": "reload"} when they are no longer kept (or a
+    diff would be bigger than reloading the sheet).
+    """
+
+    def __init__(self, history: int = LIVE_HISTORY, max_channels: int = LIVE_MAX_CHANNELS):
+        self.history = history
+        self.max_channels = max_channels
+        self._channels: "OrderedDict[Tuple[str, Optional[str]], _Channel]" = OrderedDict()
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def _channel(self, dataset_id: str, sheet: Optional[str], version: int) -> _Channel:
+        key = (dataset_id, sheet)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _Channel(version, self.history)
+            # Drop idle channels beyond the limit (never ones with subscribers)
+            for old_key in list(self._channels):
+                if len(self._channels) <= self.max_channels:
+                    break
+                if not self._channels[old_key].sockets:
+                    del self._channels[old_key]
+        self._channels.move_to_end(key)
+        return channel
+
+    def subscribers(self, dataset_id: str, sheet: Optional[str] = None) -> int:
+        channel = self._channels.get((dataset_id, sheet))
+        return len(channel.sockets) if channel else 0
+
+    async def connect(self, websocket: WebSocket, dataset_id: str, sheet: Optional[str], version: int,
+                      client_id: Optional[str] = None, since: Optional[int] = None):
+        await websocket.accept()
+        channel = self._channel(dataset_id, sheet, version)
+        async with channel.lock:
+            channel.sockets[websocket] = client_id
+            await self._send(websocket, {"type": "hello", "dataset_id": dataset_id, "sheet": sheet,
+                                         "version": channel.version, "subscribers": len(channel.sockets)})
+            if since is not None:
+                await self._catch_up(websocket, channel, dataset_id, sheet, since)
+
+    async def disconnect(self, websocket: WebSocket, dataset_id: str, sheet: Optional[str]):
+        channel = self._channels.get((dataset_id, sheet))
+        if channel is not None:
+            channel.sockets.pop(websocket, None)
+
+    async def handle(self, websocket: WebSocket, dataset_id: str, sheet: Optional[str], message: Dict[str, Any]):
+        """Client -> server messages: {"type": "sync", "since": v} and {"type": "ping"}."""
+        channel = self._channels.get((dataset_id, sheet))
+        if channel is None:
+            return
+        if message.get("type") == "sync":
+            async with channel.lock:
+                await self._catch_up(websocket, channel, dataset_id, sheet, int(message.get("since", -1)))
+        elif message.get("type") == "ping":
+            await self._send(websocket, {"type": "pong", "version": channel.version})
+
+    async def _catch_up(self, websocket: WebSocket, channel: _Channel, dataset_id: str,
+                        sheet: Optional[str], since: int):
+        if since == channel.version:
+            return
+        missed = [m for m in channel.history if m["version"] > since]
+        if not missed or missed[0]["base_version"] != since:
+            await self._send(websocket, {"type": "reload", "dataset_id": dataset_id, "sheet": sheet,
+                                         "version": channel.version})
+            return
+        for message in missed:
+            await self._send(websocket, message)
+
+    async def publish(self, dataset_id: str, sheet: Optional[str], old: Optional[pd.DataFrame],
+                      new: pd.DataFrame, version: int, origin: Optional[str] = None, **extra):
+        """
+        Broadcasts the diff between `old` and `new` to the dataset's subscribers.
+        A no-op while nobody has subscribed to the dataset; with no one currently connected
+        only a "reload" marker is recorded, for clients that come back with an old version.
+        """
+        channel = self._channels.get((dataset_id, sheet))
+        if channel is None:
+            return
+        if old is None or not channel.sockets:
+            diff = None
+        else:
+            diff = await concurrency.run_io(compute_diff, old, new)
+        total_cells = max(len(new) * max(len(new.columns), 1), 1)
+        async with channel.lock:
+            base = channel.version
+            channel.version = version
+            header = {"dataset_id": dataset_id, "sheet": sheet, "version": version, "base_version": base,
+                      "origin": origin, "total": len(new), **extra}
+            if old is None or (diff and _diff_size(diff, len(new.columns)) > total_cells * LIVE_DIFF_MAX_RATIO):
+                message = {"type": "reload", **header}
+            else:
+                message = {"type": "diff", **header, **(diff or {})}
+            channel.history.append(message)
+            await self._broadcast(channel, message)
+
+    async def _broadcast(self, channel: _Channel, message: Dict[str, Any]):
+        payload = dumps(message).decode()
+        sockets = list(channel.sockets)
+        results = await asyncio.gather(*[ws.send_text(payload) for ws in sockets], return_exceptions=True)
+        for ws, result in zip(sockets, results):
+            if isinstance(result, Exception):
+                # Gone without a close frame; it will reconnect and sync
+                channel.sockets.pop(ws, None)
+            else:
+                self.messages_sent += 1
+                self.bytes_sent += len(payload)
+
+    async def _send(self, websocket: WebSocket, message: Dict[str, Any]):
+        payload = dumps(message).decode()
+        await websocket.send_text(payload)
+        self.messages_sent += 1
+        self.bytes_sent += len(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(self._channels),
+            "subscribers": sum(len(c.sockets) for c in self._channels.values()),
+            "messages_sent": self.messages_sent,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+live_sync = LiveSyncHub()
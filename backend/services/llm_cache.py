@@ -0,0 +1,156 @@
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+from backend.config import CACHE_DIR
+
+LLM_CACHE_PATH = os.path.join(str(CACHE_DIR), "llm_cache.sqlite3")
+# Set LLM_CACHE_ENABLED=0 to always call the LLM
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+# Entries older than this are ignored and purged (seconds, default 7 days)
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Least recently used entries are evicted beyond this many
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Whitespace-insensitive form of a user command ("Drop  rows." == "Drop rows"). Case is
+    kept: it can be part of a literal or a column name ('Paris' vs 'paris').
+    """
+    return _WS.sub(" ", str(text)).strip().rstrip(".!?")
+
+
+def schema_signature(columns: Any) -> str:
+    """Stable hash of a column schema: list of names or {name: dtype}."""
+    if isinstance(columns, dict):
+        payload = sorted((str(k), str(v)) for k, v in columns.items())
+    else:
+        payload = [str(c) for c in (columns or [])]
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()[:16]
+
+
+def make_key(kind: str, model: str, temperature: float, max_tokens: int, **parts) -> str:
+    """
+    Cache key for one LLM call. `kind` names the prompt template; `parts` are the inputs
+    that actually vary (normalized command, schema signature, ...). Anything else in the
+    prompt (e.g. sample rows) is deliberately not part of the key.
+    """
+    payload = {"kind": kind, "model": model, "temperature": temperature, "max_tokens": max_tokens,
+               "parts": {k: parts[k] for k in sorted(parts)}}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of raw LLM completions (SQLite in CACHE_DIR), with TTL and LRU eviction.
+    Only successful completions are stored. Keeps hit/miss counters for the current process
+    and remembers how long each original call took, to report the latency saved.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, enabled: bool = LLM_CACHE_ENABLED):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_ms = 0.0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, kind TEXT, content TEXT,"
+                " created REAL, last_used REAL, latency_ms REAL, hits INTEGER DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT content, created, latency_ms FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    db.commit()
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            self.saved_ms += row[2] or 0.0
+            return row[0]
+
+    def put(self, key: str, content: str, kind: str = "", latency_ms: float = 0.0):
+        if not self.enabled or content is None:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, content, created, last_used, latency_ms, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, kind, content, now, now, latency_ms)
+            )
+            self._evict(db, now)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        expired = db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+        (count,) = db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)", (overflow,)
+            )
+        self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM responses")
+            self._db().commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            by_kind = {}
+            entries = 0
+            if self.enabled:
+                rows = self._db().execute("SELECT kind, COUNT(*), SUM(hits) FROM responses GROUP BY kind").fetchall()
+                by_kind = {kind: {"entries": n, "hits": int(h or 0)} for kind, n, h in rows}
+                entries = sum(v["entries"] for v in by_kind.values())
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "evictions": self.evictions,
+                "saved_ms": round(self.saved_ms, 1),
+                "by_kind": by_kind,
+            }
+
+
+llm_cache = LLMResponseCache()
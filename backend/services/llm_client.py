@@ -0,0 +1,160 @@
+
+import os
+import random
+import asyncio
+import httpx
+from typing import Any, Dict, List, Optional
+
+# OpenAI-compatible chat completions endpoint (Groq by default). Point LLM_BASE_URL at a
+# local fake server (see tests/fake_llm_server.py) to run the agents without the network.
+DEFAULT_BASE_URL = "https://api.groq.com/openai/v1"
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", DEFAULT_BASE_URL)
+LLM_MODEL = os.environ.get("LLM_MODEL", "llama-3.1-8b-instant")
+# Per-call timeout (seconds), covering connect + read of the whole completion
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
+# Retries after the first attempt, for timeouts, connection errors, 429 and 5xx
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+# Completions in flight at once across the whole process; further calls wait their turn
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+# Pooled keep-alive connections to the LLM host
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+
+class LLMError(Exception):
+    """A completion failed for good (non-retryable status, or retries exhausted)."""
+
+
+def _api_key() -> Optional[str]:
+    key = os.environ.get("LLM_API_KEY") or os.environ.get("GROQ_API_KEY")
+    if not key or key == "YOUR_GROQ_API_KEY_HERE":
+        return None
+    return key
+
+
+class LLMClient:
+    """
+    Process-wide async client for chat completions.
+    - One pooled httpx.AsyncClient (keep-alive connections are reused across requests)
+    - Per-call timeout, bounded retries with exponential backoff and full jitter
+      (Retry-After is honoured when the server sends it)
+    - A global semaphore caps the completions in flight
+    The HTTP transport can be replaced (httpx.MockTransport) to fake the LLM in tests.
+    """
+
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: Optional[str] = None,
+                 timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, pool_size: int = LLM_POOL_SIZE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else _api_key()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    @property
+    def available(self) -> bool:
+        # A custom transport or endpoint (e.g. a local fake server) works without a key
+        return bool(self.api_key) or self.transport is not None or self.base_url != DEFAULT_BASE_URL
+
+    def _ensure(self) -> httpx.AsyncClient:
+        """Client and semaphore belong to the running event loop; recreate them if it changed."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                transport=self.transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_CAP)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+    async def chat(self, messages: List[Dict[str, str]], model: str = LLM_MODEL, temperature: float = 0,
+                   max_tokens: int = 500, timeout: Optional[float] = None) -> str:
+        """Returns the stripped text of the first choice. Raises LLMError."""
+        client = self._ensure()
+        payload: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        async with self._semaphore:
+            self.calls += 1
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    response = await client.post("/chat/completions", json=payload,
+                                                 timeout=timeout or self.timeout)
+                    if response.status_code == 200:
+                        return response.json()["choices"][0]["message"]["content"].strip()
+                    last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    if response.status_code not in RETRY_STATUS:
+                        break
+                    retry_after = response.headers.get("retry-after")
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                except (ValueError, KeyError, IndexError) as e:
+                    last_error = f"Malformed completion response: {e}"
+                    break
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, retry_after))
+            self.failures += 1
+            raise LLMError(f"LLM call failed: {last_error}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "available": self.available,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+def set_llm_client(client: Optional[LLMClient]):
+    """Swap the shared client (e.g. one with a MockTransport in tests); None resets it."""
+    global _llm_client
+    _llm_client = client
@@ -2,7 +2,6 @@
 import numpy as np
 import pandas as pd
 from scipy import stats
-import matplotlib.pyplot as plt
 import statsmodels.api as sm
 import os
 import io
@@ -77,46 +76,16 @@ class MetaCore:
         except Exception:
             return 0.0, 1.0, None
 
-    def funnel_plot(self, effects, ses, study_ids):
-        # Generate plot in memory
-        precision = 1.0 / ses
-        plt.figure(figsize=(8,6))
-        plt.scatter(effects, precision, alpha=0.6, c='blue', edgecolors='k')
+    def funnel_plot(self, effects, ses, study_ids, signed_ttl=None):
+        """URL of the funnel plot (rendered in a worker process, cached by data; see services/plot_render.py)."""
+        from backend.services.plot_render import plot_renderer
         
-        # Add labels if few studies
-        if len(study_ids) <= 20:
-             for i, s in enumerate(study_ids):
-                plt.annotate(s, (effects[i], precision[i]), fontsize=8, alpha=0.7)
-                
-        # Draw pooled line (Fixed for reference usually, or Random based on choice)
+        # Pooled line: fixed effect for reference
         pooled, _, _ = self.fixed_effects(effects, ses)
-        plt.axvline(pooled, color='r', linestyle='--', label=f'Pooled (FE): {pooled:.3f}')
-        
-        # Pseudo-confidence intervals (funnel shape)
-        # 1.96 * SE around pooled
-        # SE = 1/Precision -> Precision = 1/SE
-        # x = pooled +/- 1.96 * SE
-        max_se = np.max(ses) if len(ses) > 0 else 0.1
-        min_se = np.min(ses) if len(ses) > 0 else 0.01
-        
-        y_range = np.linspace(min(precision)*0.9, max(precision)*1.1, 100)
-        # se = 1/y
-        x_left = pooled - 1.96 * (1/y_range)
-        x_right = pooled + 1.96 * (1/y_range)
-        plt.plot(x_left, y_range, 'k:', alpha=0.3)
-        plt.plot(x_right, y_range, 'k:', alpha=0.3)
-        
-        plt.xlabel("Effect Size")
-        plt.ylabel("Precision (1/SE)")
-        plt.title("Funnel Plot")
-        plt.legend()
-        plt.tight_layout()
-        
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        plt.close()
-        return buf
+        data = {"effects": np.asarray(effects, dtype=float), "ses": np.asarray(ses, dtype=float),
+                "study_ids": [str(s) for s in study_ids], "pooled": float(pooled)}
+        return plot_renderer.render("funnel", data, {"figsize": (8, 6), "title": "Funnel Plot"},
+                                    storage=self.supabase, signed_ttl=signed_ttl)
 
     def run_analysis(self, summaries: List[Dict[str, Any]], method='random'):
         effects = np.array([float(s['effect_size']) for s in summaries])
@@ -136,20 +105,8 @@ class MetaCore:
         i2 = self.I2(Q, df)
         intercept, intercept_p, _ = self.egger_test(effects, ses)
         
-        # Upload Plot
-        plot_url = ""
-        if self.supabase:
-            try:
-                plot_buf = self.funnel_plot(effects, ses, study_ids)
-                path = f"meta/funnel_{pd.Timestamp.now().timestamp()}.png"
-                self.supabase.storage.from_("uploads").upload(path, plot_buf.read(), {"content-type": "image/png"})
-                
-                # Get URL
-                signed = self.supabase.storage.from_("uploads").create_signed_url(path, 3600)
-                if signed and 'signedURL' in signed:
-                    plot_url = signed['signedURL']
-            except Exception as e:
-                print(f"Plot upload failed: {e}")
+        # Plot URL (signed for an hour when served from storage)
+        plot_url = self.funnel_plot(effects, ses, study_ids, signed_ttl=3600) or ""
                 
         return {
             "pooled_effect": float(pooled),
@@ -0,0 +1,436 @@
+
+import os
+import io
+import re
+import json
+import time
+import hashlib
+import threading
+import contextlib
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+from backend.config import GENERATED_DIR
+from backend.services.concurrency import concurrency
+
+# Rendered plots; GENERATED_DIR is served under /files, so these stream from /files/plots/<name>
+PLOT_DIR = os.path.join(str(GENERATED_DIR), "plots")
+PLOT_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+# Default output format (png or svg) and resolution
+PLOT_FORMAT = os.environ.get("PLOT_FORMAT", "png")
+PLOT_DPI = int(os.environ.get("PLOT_DPI", "100"))
+# Oldest (least recently used) plot files are deleted beyond this many
+PLOT_CACHE_MAX_FILES = int(os.environ.get("PLOT_CACHE_MAX_FILES", "2000"))
+# Max seconds to wait for a render worker
+PLOT_RENDER_TIMEOUT = float(os.environ.get("PLOT_RENDER_TIMEOUT", "60"))
+# Set PLOT_STORAGE=local to always return local URLs, even when a storage client is configured
+PLOT_STORAGE = os.environ.get("PLOT_STORAGE", "storage")
+# Prefix of local plot URLs
+PLOT_BASE_URL = os.environ.get("PLOT_BASE_URL", "http://localhost:8000")
+# Scatter/regression/box plots of more rows than this are reduced before rendering
+PLOT_POINT_BUDGET = int(os.environ.get("PLOT_POINT_BUDGET", "5000"))
+# How large scatter/regression plots are reduced: aggregate (2D histogram), sample (stratified) or full (none)
+PLOT_LARGE_MODE = os.environ.get("PLOT_LARGE_MODE", "aggregate")
+# Bins per axis of aggregated scatter plots
+PLOT_HIST_BINS = int(os.environ.get("PLOT_HIST_BINS", "60"))
+# Reduced boxplots draw the largest groups only, with at most this many outliers each
+PLOT_MAX_GROUPS = int(os.environ.get("PLOT_MAX_GROUPS", "40"))
+PLOT_MAX_FLIERS = int(os.environ.get("PLOT_MAX_FLIERS", "50"))
+
+_NAME = re.compile(r"^[0-9a-f]{32}\.(png|svg)$")
+
+
+# --- Cache keys ---
+
+def _digest(value: Any, h) -> None:
+    """Feeds a stable byte form of plot data (frames, arrays, plain values) into the hash."""
+    if isinstance(value, pd.DataFrame):
+        h.update(json.dumps([[str(c), str(t)] for c, t in value.dtypes.items()]).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        h.update(f"{value.name}:{value.dtype}".encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(f"{value.dtype}:{value.shape}".encode())
+        h.update(pd.util.hash_pandas_object(pd.Series(value.ravel()), index=False).to_numpy().tobytes())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=str):
+            h.update(f"<{k}>".encode())
+            _digest(value[k], h)
+    elif isinstance(value, (list, tuple)):
+        h.update(f"[{len(value)}]".encode())
+        for v in value:
+            _digest(v, h)
+    else:
+        h.update(json.dumps(value, default=str).encode())
+
+
+def plot_key(kind: str, data: Any, spec: Dict[str, Any]) -> str:
+    h = hashlib.sha256(kind.encode())
+    _digest(spec, h)
+    _digest(data, h)
+    return h.hexdigest()[:32]
+
+
+# --- Reduction of large data (runs in the calling thread, vectorized; the worker gets a bounded payload) ---
+
+# Cells per axis of the strata grid for stratified scatter samples
+_SAMPLE_GRID = 20
+
+
+def stratified_sample(strata: np.ndarray, budget: int, seed: int = 0) -> np.ndarray:
+    """
+    Sorted positions of about `budget` rows, allocated to strata in proportion to their
+    size but at least one per stratum, so sparse regions (outliers) stay visible.
+    """
+    n = len(strata)
+    if n <= budget:
+        return np.arange(n)
+    _, codes = np.unique(strata, return_inverse=True)
+    counts = np.bincount(codes)
+    alloc = np.maximum(np.floor(counts * (budget / n)), 1).astype(np.int64)
+    # Random order within each stratum, then keep the first alloc[stratum] rows of it
+    order = np.random.default_rng(seed).permutation(n)
+    order = order[np.argsort(codes[order], kind="stable")]
+    rank = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.sort(order[rank < np.repeat(alloc, counts)])
+
+
+def _numeric_xy(data: pd.DataFrame, x: str, y: str):
+    xs = pd.to_numeric(data[x], errors="coerce").to_numpy(dtype=float)
+    ys = pd.to_numeric(data[y], errors="coerce").to_numpy(dtype=float)
+    ok = np.isfinite(xs) & np.isfinite(ys)
+    return xs[ok], ys[ok]
+
+
+def _edges(v: np.ndarray, bins: int) -> np.ndarray:
+    lo, hi = float(v.min()), float(v.max())
+    if hi <= lo:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+def _bin_codes(v: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    bins = len(edges) - 1
+    return np.clip(((v - edges[0]) / (edges[-1] - edges[0]) * bins).astype(np.int64), 0, bins - 1)
+
+
+def _fit_line(xs: np.ndarray, ys: np.ndarray, points: int = 100) -> Optional[Dict[str, np.ndarray]]:
+    """OLS line of y on x over the x range, with its 95% confidence band (all rows)."""
+    n = len(xs)
+    xm, ym = xs.mean(), ys.mean()
+    sxx = float(((xs - xm) ** 2).sum())
+    if n < 3 or sxx <= 0:
+        return None
+    slope = float(((xs - xm) * (ys - ym)).sum()) / sxx
+    intercept = ym - slope * xm
+    s2 = float(((ys - intercept - slope * xs) ** 2).sum()) / (n - 2)
+    grid = np.linspace(xs.min(), xs.max(), points)
+    fit = intercept + slope * grid
+    half = 1.96 * np.sqrt(s2 * (1.0 / n + (grid - xm) ** 2 / sxx))
+    return {"x": grid, "y": fit, "low": fit - half, "high": fit + half}
+
+
+def box_stats(data: pd.DataFrame, x: Optional[str], y: str, max_groups: int = PLOT_MAX_GROUPS,
+              max_fliers: int = PLOT_MAX_FLIERS) -> list:
+    """
+    Per-group boxplot statistics (quartiles, 1.5 IQR whiskers, most extreme outliers)
+    computed with grouped quantiles, for Axes.bxp. Largest `max_groups` groups only.
+    """
+    frame = pd.DataFrame({"g": data[x] if x else "all", "v": pd.to_numeric(data[y], errors="coerce")}).dropna()
+    sizes = frame.groupby("g", sort=True).size()
+    if len(sizes) > max_groups:
+        sizes = sizes[sizes.index.isin(sizes.nlargest(max_groups).index)]
+        frame = frame[frame["g"].isin(sizes.index)]
+    grouped = frame.groupby("g", sort=True)["v"]
+    q = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    q1, med, q3 = q[0.25], q[0.5], q[0.75]
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    inside = frame["v"].between(frame["g"].map(low), frame["g"].map(high))
+    whiskers = frame[inside].groupby("g", sort=True)["v"].agg(["min", "max"])
+    out = frame[~inside].assign(d=lambda f: (f["v"] - f["g"].map(med)).abs())
+    out = out.sort_values("d", ascending=False).groupby("g", sort=False).head(max_fliers)
+    fliers = out.groupby("g", sort=True)["v"].apply(lambda s: s.to_numpy())
+    return [{
+        "label": str(g), "med": float(med[g]), "q1": float(q1[g]), "q3": float(q3[g]),
+        "whislo": float(whiskers["min"].get(g, q1[g])), "whishi": float(whiskers["max"].get(g, q3[g])),
+        "fliers": fliers.get(g, np.empty(0)),
+    } for g in sizes.index]
+
+
+def reduce_plot(kind: str, data: Any, spec: Dict[str, Any]):
+    """
+    Replaces a scatter/regression/box plot of more than `budget` rows (spec "budget", default
+    PLOT_POINT_BUDGET) by a bounded equivalent, so render time doesn't grow with the data:
+    - scatter/regplot, mode "aggregate": 2D histogram of all rows (log-scaled counts);
+      mode "sample": stratified sample over a grid of the x/y range. A regression line
+      and its band are fitted on all rows either way.
+    - boxplot: quartiles, whiskers and outliers precomputed per group.
+    Mode "full" (spec "mode", default PLOT_LARGE_MODE) draws every row. Returns (kind, data, spec).
+    """
+    mode = spec.pop("mode", None) or PLOT_LARGE_MODE
+    budget = int(spec.pop("budget", None) or PLOT_POINT_BUDGET)
+    if mode == "full" or kind not in ("scatter", "regplot", "boxplot") or not isinstance(data, pd.DataFrame) \
+            or len(data) <= budget:
+        return kind, data, spec
+    x, y, total = spec.get("x"), spec.get("y"), len(data)
+
+    if kind == "boxplot":
+        groups = data[x].nunique() if x else 1
+        shown = f", largest {PLOT_MAX_GROUPS} of {groups} groups" if groups > PLOT_MAX_GROUPS else ""
+        return "bxp", box_stats(data, x, y), {**spec, "note": f"{total:,} rows (quartiles of all rows{shown})"}
+
+    xs, ys = _numeric_xy(data, x, y)
+    if len(xs) == 0:
+        return kind, data.iloc[stratified_sample(np.zeros(total), budget)], spec
+    line = _fit_line(xs, ys) if kind == "regplot" else None
+    if mode == "sample":
+        cells = _bin_codes(xs, _edges(xs, _SAMPLE_GRID)) * _SAMPLE_GRID + _bin_codes(ys, _edges(ys, _SAMPLE_GRID))
+        keep = stratified_sample(cells, budget)
+        sample = pd.DataFrame({x: xs[keep], y: ys[keep]})
+        return "scatter", sample, {**spec, "line": line, "note": f"{len(keep):,} of {len(xs):,} rows (stratified sample)"}
+
+    bins = int(spec.pop("bins", None) or PLOT_HIST_BINS)
+    x_edges, y_edges = _edges(xs, bins), _edges(ys, bins)
+    counts = np.bincount(_bin_codes(xs, x_edges) * bins + _bin_codes(ys, y_edges), minlength=bins * bins)
+    data = {"counts": counts.reshape(bins, bins), "x_edges": x_edges, "y_edges": y_edges, "line": line}
+    return "hist2d", data, {**spec, "note": f"{len(xs):,} rows (binned)"}
+
+
+# --- Rendering (runs in worker processes; object-oriented matplotlib, no pyplot state) ---
+
+def _boxplot(ax, data, spec):
+    import seaborn as sns
+    sns.boxplot(data=data, x=spec.get("x"), y=spec.get("y"), ax=ax)
+
+
+def _scatter(ax, data, spec):
+    import seaborn as sns
+    # Smaller markers for reduced (sampled) plots
+    sns.scatterplot(data=data, x=spec.get("x"), y=spec.get("y"), ax=ax, **({"s": 12} if spec.get("note") else {}))
+    _draw_line(ax, spec.get("line"))
+
+
+def _regplot(ax, data, spec):
+    import seaborn as sns
+    sns.regplot(data=data, x=spec.get("x"), y=spec.get("y"), ax=ax)
+
+
+def _heatmap(ax, data, spec):
+    import seaborn as sns
+    # Cell labels only while they stay legible (and cheap)
+    annot = spec.get("annot", data.size <= 400)
+    sns.heatmap(data, annot=annot, fmt=spec.get("fmt", "d"), cmap=spec.get("cmap", "YlGnBu"), ax=ax)
+
+
+def _draw_line(ax, line):
+    if line:
+        ax.plot(line["x"], line["y"], color="C3", linewidth=2)
+        ax.fill_between(line["x"], line["low"], line["high"], color="C3", alpha=0.2, linewidth=0)
+
+
+def _hist2d(ax, data, spec):
+    """Aggregated scatter: row counts per x/y bin (log color scale), from reduce_plot."""
+    from matplotlib.colors import LogNorm
+    counts = np.ma.masked_equal(np.asarray(data["counts"]).T, 0)
+    mesh = ax.pcolormesh(data["x_edges"], data["y_edges"], counts, cmap=spec.get("cmap", "viridis"),
+                         norm=LogNorm(vmin=1, vmax=max(int(counts.max() or 1), 2)))
+    ax.figure.colorbar(mesh, ax=ax, label="Rows")
+    _draw_line(ax, data.get("line"))
+    ax.set_xlabel(spec.get("x") or "")
+    ax.set_ylabel(spec.get("y") or "")
+
+
+def _bxp(ax, data, spec):
+    """Boxplot from precomputed statistics (box_stats)."""
+    boxes = ax.bxp(data, patch_artist=True, flierprops={"markersize": 3, "alpha": 0.5})
+    for patch in boxes["boxes"]:
+        patch.set_facecolor("C0")
+        patch.set_alpha(0.6)
+    if len(data) > 8:
+        ax.tick_params(axis="x", labelrotation=90)
+    ax.set_xlabel(spec.get("x") or "")
+    ax.set_ylabel(spec.get("y") or "")
+
+
+def _funnel(ax, data, spec):
+    """Meta-analysis funnel plot: effect vs precision, pooled line and 95% pseudo-CI funnel."""
+    effects, ses = np.asarray(data["effects"], dtype=float), np.asarray(data["ses"], dtype=float)
+    labels, pooled = data.get("study_ids") or [], data["pooled"]
+    precision = 1.0 / ses
+    ax.scatter(effects, precision, alpha=0.6, c='blue', edgecolors='k')
+    # Labels only when there are few studies
+    if len(labels) <= 20:
+        for i, s in enumerate(labels):
+            ax.annotate(s, (effects[i], precision[i]), fontsize=8, alpha=0.7)
+    ax.axvline(pooled, color='r', linestyle='--', label=f'Pooled (FE): {pooled:.3f}')
+    y_range = np.linspace(min(precision) * 0.9, max(precision) * 1.1, 100)
+    ax.plot(pooled - 1.96 / y_range, y_range, 'k:', alpha=0.3)
+    ax.plot(pooled + 1.96 / y_range, y_range, 'k:', alpha=0.3)
+    ax.set_xlabel("Effect Size")
+    ax.set_ylabel("Precision (1/SE)")
+    ax.legend()
+
+
+RENDERERS = {"boxplot": _boxplot, "scatter": _scatter, "regplot": _regplot, "heatmap": _heatmap, "funnel": _funnel,
+             "hist2d": _hist2d, "bxp": _bxp}
+
+
+def render_figure(kind: str, data: Any, spec: Dict[str, Any]) -> bytes:
+    """Draws one plot on its own Figure/Agg canvas and returns the encoded image."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=tuple(spec.get("figsize", (6, 4))), dpi=spec.get("dpi", PLOT_DPI))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    RENDERERS[kind](ax, data, spec)
+    if spec.get("title"):
+        ax.set_title(spec["title"])
+    if spec.get("note"):
+        ax.text(0.99, 0.01, spec["note"], transform=ax.transAxes, ha="right", va="bottom", fontsize=7, alpha=0.7)
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format=spec.get("format", PLOT_FORMAT))
+    return buf.getvalue()
+
+
+class PlotRenderer:
+    """
+    Renders plots in the CPU worker pool (services/concurrency.py), large ones reduced
+    first (reduce_plot), and caches the files
+    in PLOT_DIR, named by a hash of the plot kind, spec and data: the same plot of the
+    same data is rendered once, whichever request asks for it. Identical plots requested
+    at the same time render once too.
+    URLs point at the local file (/files/plots/...), or at the storage bucket when the
+    caller passes a Supabase client; each file is uploaded there once.
+    """
+
+    def __init__(self, directory: str = PLOT_DIR, fmt: str = PLOT_FORMAT, max_files: int = PLOT_CACHE_MAX_FILES,
+                 timeout: float = PLOT_RENDER_TIMEOUT, storage_mode: str = PLOT_STORAGE):
+        self.directory = directory
+        self.fmt = fmt if fmt in PLOT_FORMATS else "png"
+        self.max_files = max_files
+        self.timeout = timeout
+        self.storage_mode = storage_mode
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # name -> [lock, callers holding or waiting for it]; dropped when the last one leaves
+        self._key_locks: Dict[str, List[Any]] = {}
+        self._uploaded: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.render_seconds = 0.0
+
+    @contextlib.contextmanager
+    def _key_lock(self, name: str):
+        """Serializes renders of one plot; the lock lives as long as anyone uses or awaits it."""
+        with self._lock:
+            entry = self._key_locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[name]
+
+    def ensure(self, kind: str, data: Any, spec: Optional[Dict[str, Any]] = None) -> str:
+        """File name of the rendered plot (rendering it on a cache miss). Raises on render errors."""
+        if kind not in RENDERERS:
+            raise ValueError(f"Unknown plot kind: {kind}. Use one of {sorted(RENDERERS)}")
+        spec = dict(spec or {})
+        kind, data, spec = reduce_plot(kind, data, spec)
+        spec["format"] = spec.get("format") if spec.get("format") in PLOT_FORMATS else self.fmt
+        name = f"{plot_key(kind, data, spec)}.{spec['format']}"
+        path = os.path.join(self.directory, name)
+        with self._key_lock(name):
+            if os.path.exists(path):
+                os.utime(path)                          # recently used: pruned last
+                with self._lock:
+                    self.hits += 1
+                return name
+            start = time.perf_counter()
+            try:
+                image = concurrency.submit_cpu(render_figure, kind, data, spec).result(timeout=self.timeout)
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                raise
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(image)
+            os.replace(tmp, path)
+            with self._lock:
+                self.misses += 1
+                self.render_seconds += time.perf_counter() - start
+        self._prune()
+        return name
+
+    def render(self, kind: str, data: Any, spec: Optional[Dict[str, Any]] = None, storage=None,
+               signed_ttl: Optional[int] = None) -> Optional[str]:
+        """
+        URL of the plot, rendered or from the cache; None when rendering fails.
+        `storage`: Supabase client to serve the plot from the "uploads" bucket (signed URL
+        valid for `signed_ttl` seconds, else the public URL); local URL if the upload fails.
+        """
+        try:
+            name = self.ensure(kind, data, spec)
+        except Exception as e:
+            print(f"Plot generation failed: {e}")
+            return None
+        if storage is not None and self.storage_mode != "local":
+            try:
+                return self._storage_url(storage, name, signed_ttl)
+            except Exception as e:
+                print(f"Plot upload failed: {e} (Using local URL)")
+        return f"{PLOT_BASE_URL}/files/plots/{name}"
+
+    def _storage_url(self, storage, name: str, signed_ttl: Optional[int]) -> str:
+        path = f"plots/{name}"
+        bucket = storage.storage.from_("uploads")
+        if name not in self._uploaded:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                bucket.upload(path=path, file=f.read(),
+                              file_options={"content-type": PLOT_FORMATS[name.rsplit(".", 1)[1]], "upsert": "true"})
+            with self._lock:
+                self._uploaded.add(name)
+        if signed_ttl:
+            signed = bucket.create_signed_url(path, signed_ttl)
+            return signed["signedURL"]
+        return bucket.get_public_url(path)
+
+    def _prune(self):
+        try:
+            with os.scandir(self.directory) as it:
+                files = [(e.stat().st_mtime, e.path) for e in it if e.is_file() and _NAME.match(e.name)]
+        except FileNotFoundError:
+            return
+        if len(files) <= self.max_files:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "directory": self.directory,
+                "format": self.fmt,
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_render_ms": round(self.render_seconds / self.misses * 1000, 1) if self.misses else None,
+                "uploaded": len(self._uploaded),
+            }
+
+
+plot_renderer = PlotRenderer()
@@ -0,0 +1,313 @@
+
+import os
+import json
+import math
+import threading
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+from backend.config import CACHE_DIR
+
+PROFILE_DIR = os.path.join(str(CACHE_DIR), "profiles")
+# Exact distinct counts / top values are tracked up to this many distinct values,
+# beyond that only the HyperLogLog estimate is kept
+EXACT_DISTINCT_LIMIT = 1000
+# Reservoir size per numeric column for the quantile sketch
+QUANTILE_SAMPLE_SIZE = 10_000
+SAMPLE_ROWS = 5
+QUANTILES = {"p01": 0.01, "p05": 0.05, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p95": 0.95, "p99": 0.99}
+
+
+class HyperLogLog:
+    """Mergeable distinct-count estimator (2^p registers, ~1.04/sqrt(2^p) relative error)."""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = (hashes << np.uint64(self.p)) & np.uint64(0xFFFFFFFFFFFFFFFF)
+        # rho = position of the leftmost 1-bit in the remaining 64-p bits
+        with np.errstate(divide="ignore"):
+            highest = np.floor(np.log2(rest.astype(np.float64)))
+        rho = np.where(rest == 0, 64 - self.p + 1, 64 - highest).astype(np.uint8)
+        rho = np.minimum(rho, 64 - self.p + 1)
+        np.maximum.at(self.registers, idx, rho)
+
+    def add_series(self, series: pd.Series):
+        values = series.dropna()
+        if len(values):
+            self.add_hashes(pd.util.hash_pandas_object(values, index=False).to_numpy())
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+class ColumnProfiler:
+    """Accumulates one column's statistics over successive chunks."""
+
+    def __init__(self, name: str, seed: int = 0):
+        self.name = name
+        self.dtypes: List[str] = []
+        self.count = 0
+        self.nulls = 0
+        self.hll = HyperLogLog()
+        self.exact: Optional[Dict[Any, int]] = {}
+        self.numeric = True
+        self.n_num = 0
+        self.shift: Optional[float] = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Any = None
+        self.max: Any = None
+        self.reservoir = np.empty(0, dtype=np.float64)
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, series: pd.Series):
+        dtype = str(series.dtype)
+        if dtype not in self.dtypes:
+            self.dtypes.append(dtype)
+        self.count += len(series)
+        valid = series.dropna()
+        self.nulls += len(series) - len(valid)
+        if len(valid) == 0:
+            return
+
+        self.hll.add_series(valid)
+        if self.exact is not None and pd.api.types.is_float_dtype(valid):
+            # Continuous values: exact counting rarely stays small, rely on HLL
+            self.exact = None
+        if self.exact is not None:
+            for value, n in valid.value_counts().items():
+                self.exact[value] = self.exact.get(value, 0) + int(n)
+            if len(self.exact) > EXACT_DISTINCT_LIMIT:
+                self.exact = None
+
+        is_num = pd.api.types.is_numeric_dtype(valid) and not pd.api.types.is_bool_dtype(valid)
+        if not is_num:
+            self.numeric = False
+            try:
+                lo, hi = valid.min(), valid.max()
+                self.min = lo if self.min is None else min(self.min, lo)
+                self.max = hi if self.max is None else max(self.max, hi)
+            except TypeError:
+                pass
+            return
+        if not self.numeric:
+            return
+
+        values = valid.to_numpy(dtype=np.float64)
+        # Merge chunk mean / sum of squared deviations (Chan et al.), stable for large values:
+        # moments are kept relative to the first value, so the running mean stays small
+        if self.shift is None:
+            self.shift = float(values[0])
+        shifted = values - self.shift
+        n_a, n_b = self.n_num, len(values)
+        mean_b = float(shifted.mean())
+        m2_b = float(np.square(shifted - mean_b).sum())
+        delta = mean_b - self.mean
+        self.n_num = n_a + n_b
+        self.mean += delta * n_b / self.n_num
+        self.m2 += m2_b + delta * delta * n_a * n_b / self.n_num
+        lo, hi = float(values.min()), float(values.max())
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+        self._reservoir_add(values)
+
+    def _reservoir_add(self, values: np.ndarray):
+        """Batched reservoir sampling (Algorithm R) over the stream of numeric values."""
+        k = QUANTILE_SAMPLE_SIZE
+        seen_before = self.n_num - len(values)
+        free = max(k - len(self.reservoir), 0)
+        if free:
+            self.reservoir = np.concatenate([self.reservoir, values[:free]])
+            values = values[free:]
+            seen_before += free
+        if len(values) == 0:
+            return
+        t = seen_before + np.arange(1, len(values) + 1)
+        accepted = self._rng.random(len(values)) < k / t
+        slots = self._rng.integers(0, k, size=int(accepted.sum()))
+        self.reservoir[slots] = values[accepted]
+
+    def _dtype(self) -> str:
+        if len(self.dtypes) == 1:
+            return self.dtypes[0]
+        if self.numeric and self.n_num:
+            return "float64"
+        return "object"
+
+    def result(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "name": self.name,
+            "dtype": self._dtype(),
+            "count": self.count,
+            "nulls": self.nulls,
+        }
+        if self.exact is not None:
+            out["distinct"] = len(self.exact)
+            out["distinct_exact"] = True
+        else:
+            out["distinct"] = self.hll.estimate()
+            out["distinct_exact"] = False
+
+        if self.numeric and self.n_num:
+            cast = int if out["dtype"].startswith(("int", "uint")) else float
+            out.update({
+                "min": cast(self.min),
+                "max": cast(self.max),
+                "mean": self.shift + self.mean,
+                "std": math.sqrt(self.m2 / max(self.n_num - 1, 1)),
+                "quantiles": {k: float(np.quantile(self.reservoir, q)) for k, q in QUANTILES.items()},
+                "quantiles_exact": self.n_num <= QUANTILE_SAMPLE_SIZE,
+            })
+        else:
+            out["min"] = _jsonable(self.min)
+            out["max"] = _jsonable(self.max)
+            if self.exact is not None:
+                top = sorted(self.exact.items(), key=lambda kv: -kv[1])[:10]
+                out["top_values"] = [{"value": _jsonable(v), "count": n} for v, n in top]
+        return out
+
+
+def _jsonable(value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(value)
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value if isinstance(value, (str, int, float, bool)) else str(value)
+
+
+def profile_chunks(chunks) -> Dict[str, Any]:
+    """Single pass over an iterable of DataFrame chunks."""
+    columns: Dict[str, ColumnProfiler] = {}
+    order: List[str] = []
+    rows = 0
+    sample: Optional[pd.DataFrame] = None
+
+    for chunk in chunks:
+        if sample is None:
+            sample = chunk.head(SAMPLE_ROWS)
+        rows += len(chunk)
+        for col in chunk.columns:
+            key = str(col)
+            if key not in columns:
+                columns[key] = ColumnProfiler(key, seed=len(order))
+                order.append(key)
+            columns[key].update(chunk[col])
+
+    sample_records = []
+    if sample is not None:
+        sample_records = sample.astype(object).where(sample.notna(), None).to_dict(orient="records")
+        sample_records = [{str(k): _jsonable(v) for k, v in r.items()} for r in sample_records]
+
+    return {
+        "rows": rows,
+        "columns": [columns[c].result() for c in order],
+        "sample": sample_records,
+    }
+
+
+def profile_file(filepath: str) -> Dict[str, Any]:
+    from backend.services.sheet_export import iter_frame_chunks
+    return profile_chunks(iter_frame_chunks(filepath))
+
+
+def profile_frame(df: pd.DataFrame) -> Dict[str, Any]:
+    return profile_chunks([df])
+
+
+# --- Prompt helpers: what the agents used to compute from the full DataFrame ---
+
+def profile_dtypes(profile: Dict[str, Any]) -> Dict[str, str]:
+    """{column: dtype}, the same shape as {c: str(df[c].dtype)}"""
+    return {c["name"]: c["dtype"] for c in profile["columns"]}
+
+
+def profile_column_names(profile: Dict[str, Any]) -> List[str]:
+    return [c["name"] for c in profile["columns"]]
+
+
+def profile_sample_text(profile: Dict[str, Any], n: int = 3) -> str:
+    """Equivalent of df.head(n).to_string() built from the stored sample rows."""
+    sample = pd.DataFrame(profile["sample"][:n], columns=profile_column_names(profile))
+    return sample.to_string()
+
+
+class ProfileStore:
+    """
+    Keeps one profile per dataset, tied to the file's mtime/size.
+    Profiles are cached in memory and persisted as JSON in CACHE_DIR/profiles,
+    so they survive restarts; a changed file gets re-profiled on next use.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _json_path(self, filepath: str) -> str:
+        return os.path.join(self.directory, os.path.basename(filepath) + ".json")
+
+    @staticmethod
+    def _signature(filepath: str) -> List[int]:
+        st = os.stat(filepath)
+        return [st.st_mtime_ns, st.st_size]
+
+    def _lookup(self, filepath: str, signature: List[int]) -> Optional[Dict[str, Any]]:
+        profile = self._memory.get(filepath)
+        if profile is None:
+            try:
+                with open(self._json_path(filepath)) as f:
+                    profile = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return None
+        if profile.get("signature") != signature:
+            return None
+        self._memory[filepath] = profile
+        return profile
+
+    def store(self, filepath: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+        profile["signature"] = self._signature(filepath)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._json_path(filepath) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(profile, f, default=str)
+        os.replace(tmp, self._json_path(filepath))
+        with self._lock:
+            self._memory[filepath] = profile
+        return profile
+
+    def get(self, filepath: str, compute: bool = True) -> Optional[Dict[str, Any]]:
+        """Stored profile if still valid, otherwise a fresh single-pass profile."""
+        with self._lock:
+            profile = self._lookup(filepath, self._signature(filepath))
+        if profile is None and compute:
+            profile = self.store(filepath, profile_file(filepath))
+        return profile
+
+    def invalidate(self, filepath: str):
+        with self._lock:
+            self._memory.pop(filepath, None)
+
+
+profile_store = ProfileStore()
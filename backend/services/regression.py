@@ -0,0 +1,277 @@
+
+import os
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional
+from scipy import linalg, sparse, stats
+from backend.services.stat_batch import numeric_matrix, _num
+
+# Categorical features with more distinct values than this are refused (one column per level)
+REGRESSION_MAX_LEVELS = int(os.environ.get("REGRESSION_MAX_LEVELS", "200"))
+
+
+class RegressionError(ValueError):
+    """The regression can't be set up (unknown columns, too many levels, no rows, ...)."""
+
+
+def split_features(df: pd.DataFrame, features: List[str], categorical: Optional[List[str]] = None):
+    """(numeric, categorical) features: non-numeric and bool columns are categorical by default."""
+    forced = set(categorical or [])
+    cats = [f for f in features if f in forced or not pd.api.types.is_numeric_dtype(df[f])
+            or pd.api.types.is_bool_dtype(df[f])]
+    return [f for f in features if f not in cats], cats
+
+
+class RegressionAccumulator:
+    """
+    Least-squares regression of one or more targets on numeric and categorical features,
+    built from X'X, X'Y and Y'Y accumulated chunk by chunk. Only these (p x p) sums are
+    kept, so any number of rows can stream through, and every target shares the design.
+    - Categoricals are one-hot encoded as sparse matrices, one column per level seen so
+      far; the matrices grow when a chunk brings new levels. At fit time the first level
+      (sorted) is dropped as the reference, as patsy/statsmodels do.
+    - Numeric columns and targets are shifted by their first-chunk means, so the sums
+      don't lose precision for large values; the intercept is shifted back at the end.
+    Rows with a missing feature or target are skipped (one design for all targets).
+    Non-numeric values in a numeric column count as missing.
+    """
+
+    def __init__(self, targets: List[str], features: List[str], categorical: Optional[List[str]] = None,
+                 max_levels: int = REGRESSION_MAX_LEVELS):
+        self.targets = list(targets)
+        self.features = list(features)
+        self.forced = categorical
+        self.max_levels = max_levels
+        self.numeric: List[str] = []
+        self.categorical: List[str] = []
+        self.levels: Dict[str, Dict[Any, int]] = {}       # categorical -> {label: design column}
+        self.names: List[str] = []
+        self.xtx = self.xty = self.yty = None
+        self.n = 0
+        self.x_shift: Optional[np.ndarray] = None
+        self.y_shift: Optional[np.ndarray] = None
+
+    def _setup(self, chunk: pd.DataFrame):
+        """Numeric vs categorical features are decided on the first chunk's dtypes."""
+        self.numeric, self.categorical = split_features(chunk, self.features, self.forced)
+        self.levels = {c: {} for c in self.categorical}
+        self.names = ["Intercept"] + self.numeric
+        p, t = len(self.names), len(self.targets)
+        self.xtx = np.zeros((p, p))
+        self.xty = np.zeros((p, t))
+        self.yty = np.zeros(t)
+
+    def _grow(self, extra: int):
+        p = self.xtx.shape[0]
+        xtx = np.zeros((p + extra, p + extra))
+        xtx[:p, :p] = self.xtx
+        self.xtx = xtx
+        self.xty = np.vstack([self.xty, np.zeros((extra, len(self.targets)))])
+
+    def _level_columns(self, column: str, values: pd.Series) -> np.ndarray:
+        """Design column of every row's level (new levels get new columns)."""
+        codes, uniques = pd.factorize(values)
+        known = self.levels[column]
+        new = [u for u in uniques if (u.item() if isinstance(u, np.generic) else u) not in known]
+        if len(known) + len(new) > self.max_levels:
+            raise RegressionError(f"Column '{column}' has more than {self.max_levels} levels; "
+                                  f"treat it as numeric or filter it first")
+        for label in new:
+            label = label.item() if isinstance(label, np.generic) else label
+            known[label] = len(self.names)
+            self.names.append(f"{column}[{label}]")
+        if new:
+            self._grow(len(new))
+        lookup = np.array([known[u.item() if isinstance(u, np.generic) else u] for u in uniques], dtype=np.int64)
+        return lookup[codes]
+
+    def update(self, chunk: pd.DataFrame):
+        if self.xtx is None:
+            self._setup(chunk)
+        x = numeric_matrix(chunk, self.numeric)
+        y = numeric_matrix(chunk, self.targets)
+        keep = ~(np.isnan(x).any(axis=1) | np.isnan(y).any(axis=1))
+        for c in self.categorical:
+            keep &= chunk[c].notna().to_numpy()
+        if not keep.any():
+            return
+        x, y = x[keep], y[keep]
+        if self.x_shift is None:
+            self.x_shift, self.y_shift = x.mean(axis=0), y.mean(axis=0)
+        x = x - self.x_shift
+        y = y - self.y_shift
+        rows = len(x)
+
+        # X = [D | S]: dense intercept + numeric block, sparse one-hot block (one 1 per row
+        # and categorical), so X'X is filled block by block without densifying S
+        D = np.column_stack([np.ones(rows), x])
+        q = D.shape[1]
+        dummy_cols = [self._level_columns(c, chunk[c][keep]) - q for c in self.categorical]
+        self.xtx[:q, :q] += D.T @ D
+        self.xty[:q] += D.T @ y
+        if dummy_cols:
+            cols = np.concatenate(dummy_cols)
+            row_idx = np.tile(np.arange(rows), len(dummy_cols))
+            S = sparse.csr_matrix((np.ones(len(cols)), (row_idx, cols)), shape=(rows, len(self.names) - q))
+            St = S.T.tocsr()
+            cross = np.asarray(St @ D)
+            self.xtx[q:, :q] += cross
+            self.xtx[:q, q:] += cross.T
+            self.xtx[q:, q:] += (St @ S).toarray()
+            self.xty[q:] += np.asarray(St @ y)
+        self.yty += (y * y).sum(axis=0)
+        self.n += rows
+
+    def _design_order(self):
+        """Kept design columns (intercept, numeric, then each categorical's levels sorted,
+        minus the first as reference) and {categorical: reference label}."""
+        order = list(range(1 + len(self.numeric)))
+        refs = {}
+        for c, levels in self.levels.items():
+            try:
+                labels = sorted(levels)
+            except TypeError:
+                labels = list(levels)
+            if labels:
+                refs[c] = labels[0]
+                order += [levels[l] for l in labels[1:]]
+        return order, refs
+
+    def fit(self, alpha: float = 0.05) -> Dict[str, Any]:
+        """
+        Solves the normal equations with a Cholesky factorization of the (diagonally
+        scaled) X'X. If X'X is singular, aliased columns are found with a pivoted QR of
+        X'X and dropped. Returns the shared design info and one result per target.
+        """
+        if self.n == 0:
+            raise RegressionError("No rows with all features and targets present")
+        keep, refs = self._design_order()
+        A = self.xtx[np.ix_(keep, keep)]
+        B = self.xty[keep]
+        k = len(keep)
+        if self.n <= k:
+            raise RegressionError(f"Need more complete rows ({self.n}) than coefficients ({k})")
+
+        scale = np.sqrt(np.where(np.diag(A) > 0, np.diag(A), 1.0))
+        As = A / scale[:, None] / scale[None, :]
+        aliased: List[int] = []
+        try:
+            factor = linalg.cho_factor(As, check_finite=False)
+            if np.min(np.abs(np.diag(factor[0]))) ** 2 < 1e-10:
+                raise linalg.LinAlgError("X'X is numerically singular")
+            inv_s = linalg.cho_solve(factor, np.eye(k), check_finite=False)
+        except linalg.LinAlgError:
+            _, R, piv = linalg.qr(As, pivoting=True)
+            diag = np.abs(np.diag(R))
+            rank = int(np.sum(diag > diag[0] * 1e-10))
+            aliased = sorted(piv[rank:].tolist())
+            ok = sorted(piv[:rank].tolist())
+            inv_s = np.zeros((k, k))
+            inv_s[np.ix_(ok, ok)] = linalg.inv(As[np.ix_(ok, ok)])
+        inv = inv_s / scale[:, None] / scale[None, :]           # (X'X)^-1 on the kept columns
+        cond = float(np.linalg.cond(As)) if not aliased else float("inf")
+        beta = inv @ B                                            # (k x targets)
+
+        names = [self.names[j] for j in keep]
+        n_numeric = len(self.numeric)
+        # Intercept on the original scale: b0 + y_shift - sum(b_j * x_shift_j)
+        shift_vec = np.zeros(k)
+        shift_vec[0] = 1.0
+        shift_vec[1:1 + n_numeric] = -self.x_shift if self.x_shift is not None else 0.0
+
+        rank = k - len(aliased)
+        df_resid = self.n - rank
+        df_model = rank - 1
+        results = {}
+        for t, target in enumerate(self.targets):
+            b = beta[:, t]
+            sse = max(self.yty[t] - b @ B[:, t], 0.0)
+            sst = self.yty[t] - B[0, t] ** 2 / self.n
+            sigma2 = sse / df_resid if df_resid > 0 else np.nan
+            cov = inv * sigma2
+            se = np.sqrt(np.maximum(np.diag(cov), 0.0))
+            coef = b.copy()
+            y_shift = self.y_shift[t] if self.y_shift is not None else 0.0
+            coef[0] = shift_vec @ b + y_shift
+            se[0] = np.sqrt(max(shift_vec @ cov @ shift_vec, 0.0))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                tvals = coef / se
+                pvals = 2 * stats.t.sf(np.abs(tvals), df_resid)
+                r2 = 1 - sse / sst if sst > 0 else np.nan
+                adj = 1 - (1 - r2) * (self.n - 1) / df_resid if df_resid > 0 else np.nan
+                f = ((sst - sse) / df_model) / sigma2 if df_model > 0 else np.nan
+            crit = stats.t.ppf(1 - alpha / 2, df_resid) if df_resid > 0 else np.nan
+            llf = -self.n / 2 * (np.log(2 * np.pi * sse / self.n) + 1) if sse > 0 else np.nan
+            coefficients = {}
+            for i, name in enumerate(names):
+                if i in aliased:
+                    coefficients[name] = {"coef": None, "aliased": True}
+                    continue
+                coefficients[name] = {
+                    "coef": _num(coef[i]), "std_err": _num(se[i]), "t": _num(tvals[i]),
+                    "p_value": _num(pvals[i]),
+                    "ci_low": _num(coef[i] - crit * se[i]), "ci_high": _num(coef[i] + crit * se[i]),
+                }
+            results[target] = {
+                "coefficients": coefficients,
+                "r_squared": _num(r2),
+                "adj_r_squared": _num(adj),
+                "f_statistic": _num(f),
+                "f_pvalue": _num(stats.f.sf(f, df_model, df_resid)) if df_model > 0 and df_resid > 0 else None,
+                "rmse": _num(np.sqrt(sigma2)),
+                "log_likelihood": _num(llf),
+                "aic": _num(2 * rank - 2 * llf) if np.isfinite(llf) else None,
+                "bic": _num(np.log(self.n) * rank - 2 * llf) if np.isfinite(llf) else None,
+            }
+        return {
+            "n": self.n,
+            "df_model": df_model,
+            "df_resid": df_resid,
+            "columns": names,
+            "reference_levels": refs,
+            "aliased": [names[i] for i in aliased],
+            "condition_number": _num(cond),
+            "targets": results,
+        }
+
+
+def fit_regression(chunks: Iterable[pd.DataFrame], targets: List[str], features: List[str],
+                   categorical: Optional[List[str]] = None, alpha: float = 0.05,
+                   max_levels: int = REGRESSION_MAX_LEVELS) -> Dict[str, Any]:
+    """One pass over DataFrame chunks (a list with one frame works too), then the fit."""
+    acc = RegressionAccumulator(targets, features, categorical, max_levels)
+    for chunk in chunks:
+        acc.update(chunk)
+    return acc.fit(alpha)
+
+
+def check_columns(columns, targets: List[str], features: List[str], categorical: Optional[List[str]] = None):
+    if not targets or not features:
+        raise RegressionError("Regression requires target and feature columns")
+    missing = [c for c in dict.fromkeys(targets + features + list(categorical or [])) if c not in columns]
+    if missing:
+        raise RegressionError(f"Columns not found: {missing}")
+    overlap = set(targets) & set(features)
+    if overlap:
+        raise RegressionError(f"Columns can't be both target and feature: {sorted(overlap)}")
+
+
+def linreg_result(fit: Dict[str, Any], target: str, features: List[str]) -> Dict[str, Any]:
+    """The /analytics/run "linreg" shape: slope of the first feature, overall F-test p-value."""
+    res = fit["targets"][target]
+    coefs = res["coefficients"]
+    p = res["f_pvalue"]
+    first = coefs.get(features[0], {}).get("coef")
+    return {
+        "test": "linreg",
+        "slope": first,
+        "intercept": coefs["Intercept"]["coef"],
+        "r_squared": res["r_squared"],
+        "adj_r_squared": res["adj_r_squared"],
+        "p_value": p,
+        "n": fit["n"],
+        "coefficients": coefs,
+        "reference_levels": fit["reference_levels"],
+        "aliased": fit["aliased"],
+        "significant": bool(p is not None and p < 0.05),
+    }
@@ -0,0 +1,171 @@
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any, Dict, Optional
+from backend.config import CACHE_DIR
+
+# Downloaded remote datasets, stored by content hash (identical files share one blob)
+REMOTE_CACHE_DIR = os.path.join(str(CACHE_DIR), "remote")
+# Seconds to wait for the server to connect / send the next block
+REMOTE_FETCH_TIMEOUT = float(os.environ.get("REMOTE_FETCH_TIMEOUT", "30"))
+# Keep-alive connections kept per host
+REMOTE_FETCH_POOL = int(os.environ.get("REMOTE_FETCH_POOL", "10"))
+
+DOWNLOAD_BLOCK_BYTES = 1024 * 1024
+
+# Leading bytes of the binary formats we read; anything else is treated as CSV text
+MAGIC_BYTES = [
+    (b"PK\x03\x04", "xlsx"),                        # zip container (OOXML workbook)
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "xls"),   # OLE2 compound file (legacy Excel)
+    (b"PAR1", "parquet"),
+]
+
+
+def detect_format(head: bytes) -> str:
+    """File format from its first bytes: "xlsx", "xls", "parquet" or "csv"."""
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            return fmt
+    return "csv"
+
+
+def sniff_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return detect_format(f.read(8))
+
+
+class RemoteFetcher:
+    """
+    Fetches remote datasets into a local content-addressed cache.
+    - One pooled requests.Session (keep-alive, bounded retries on connection errors/5xx)
+    - Bodies are streamed to disk in blocks and hashed on the way, never held in memory
+    - Validators (ETag / Last-Modified) are kept per URL, so a repeat fetch is a single
+      conditional request answered with 304 when nothing changed
+    Blobs are named <sha256>.<format>; an unchanged file keeps its path, which keeps the
+    dataset cache entry for it warm as well.
+    """
+
+    def __init__(self, directory: str = REMOTE_CACHE_DIR, timeout: float = REMOTE_FETCH_TIMEOUT,
+                 pool_size: int = REMOTE_FETCH_POOL):
+        self.directory = directory
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(["GET", "HEAD"]))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self.downloads = 0
+        self.not_modified = 0
+        self.bytes_downloaded = 0
+
+    def _index_path(self, url: str) -> str:
+        return os.path.join(self.directory, "index", hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def _read_index(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._index_path(url)) as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # The blob may have been cleaned up; then the validators are useless
+        return record if os.path.exists(record.get("path", "")) else None
+
+    def _write_index(self, url: str, record: Dict[str, Any]):
+        path = self._index_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp, path)
+
+    def _url_lock(self, url: str) -> threading.Lock:
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def fetch(self, url: str) -> Dict[str, Any]:
+        """
+        Local copy of `url`: {"path", "format", "sha256", "size", "status"} where status is
+        "downloaded" or "not_modified". Raises requests.HTTPError on failure.
+        """
+        # Concurrent loads of the same URL share one download
+        with self._url_lock(url):
+            record = self._read_index(url)
+            headers = {}
+            if record:
+                if record.get("etag"):
+                    headers["If-None-Match"] = record["etag"]
+                if record.get("last_modified"):
+                    headers["If-Modified-Since"] = record["last_modified"]
+
+            with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304 and record:
+                    self.not_modified += 1
+                    record["checked"] = time.time()
+                    self._write_index(url, record)
+                    return {**record, "status": "not_modified"}
+                response.raise_for_status()
+                path, digest, size, fmt = self._download(response)
+
+            record = {
+                "url": url,
+                "path": path,
+                "format": fmt,
+                "sha256": digest,
+                "size": size,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "checked": time.time(),
+            }
+            self._write_index(url, record)
+            return {**record, "status": "downloaded"}
+
+    def _download(self, response: requests.Response):
+        """Streams the body to a temp file, then moves it to its content-addressed name."""
+        blobs = os.path.join(self.directory, "blobs")
+        os.makedirs(blobs, exist_ok=True)
+        sha = hashlib.sha256()
+        size = 0
+        head = b""
+        fd, tmp = tempfile.mkstemp(dir=blobs, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for block in response.iter_content(DOWNLOAD_BLOCK_BYTES):
+                    if len(head) < 8:
+                        head += block[:8 - len(head)]
+                    sha.update(block)
+                    out.write(block)
+                    size += len(block)
+            digest = sha.hexdigest()
+            fmt = detect_format(head)
+            path = os.path.join(blobs, f"{digest}.{fmt}")
+            if os.path.exists(path):
+                # Same content as a blob we already have (another URL, or a re-upload)
+                os.remove(tmp)
+            else:
+                os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.downloads += 1
+        self.bytes_downloaded += size
+        return path, digest, size, fmt
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "downloads": self.downloads,
+            "not_modified": self.not_modified,
+            "bytes_downloaded": self.bytes_downloaded,
+        }
+
+
+remote_fetcher = RemoteFetcher()
@@ -0,0 +1,349 @@
+
+import os
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+from backend.services.concurrency import concurrency, CPU_WORKERS
+
+# Processes of the shared CPU pool one resampling request may occupy (1 = run in the calling thread)
+RESAMPLE_WORKERS = int(os.environ.get("RESAMPLE_WORKERS", str(CPU_WORKERS)))
+# Resamples per task. Tasks (and their seeds) don't depend on the worker count, so a
+# given seed gives the same result on any machine.
+RESAMPLE_TASK_SIZE = 250
+# Cells (resamples x rows) of one vectorized batch inside a task
+RESAMPLE_BATCH_CELLS = 4_000_000
+# Below this much work (rows x resamples) the pool costs more than it saves
+RESAMPLE_POOL_MIN_WORK = 50_000_000
+# Bootstraps of more rows than this use the bag of little bootstraps
+RESAMPLE_BLB_MIN_ROWS = 100_000
+# Little-bootstrap subsets have n ** BLB_GAMMA rows; each gets BLB_RESAMPLES resamples
+BLB_GAMMA = 0.6
+BLB_RESAMPLES = 500
+RESAMPLE_MAX = 100_000
+
+RESAMPLE_METHODS = {"bootstrap", "permutation"}
+RESAMPLE_STATISTICS = {"mean_diff", "median_diff", "correlation"}
+ALTERNATIVES = {"two-sided", "greater", "less"}
+
+
+# --- Statistics (row-wise over a batch) ---
+
+def _weighted_median(sorted_values: np.ndarray, weights: np.ndarray, total: int) -> np.ndarray:
+    """Median per row of `weights` (counts per sorted value, each row summing to `total`)."""
+    cum = np.cumsum(weights, axis=1)
+    lo = (cum > (total - 1) // 2).argmax(axis=1)
+    hi = (cum > total // 2).argmax(axis=1)
+    return (sorted_values[lo] + sorted_values[hi]) / 2
+
+
+def _center(values: np.ndarray, kind: str) -> float:
+    return float(np.mean(values) if kind == "mean" else np.median(values))
+
+
+def _correlation_rows(x: np.ndarray, y: np.ndarray, w: Optional[np.ndarray] = None) -> np.ndarray:
+    """Pearson r per row of x/y (batch x rows), or of x/y vectors weighted by the rows of w."""
+    if w is None:
+        xc = x - x.mean(axis=1, keepdims=True)
+        yc = y - y.mean(axis=1, keepdims=True)
+        sxy, sxx, syy = (xc * yc).sum(axis=1), (xc * xc).sum(axis=1), (yc * yc).sum(axis=1)
+    else:
+        n = w.sum(axis=1)
+        mx, my = (w @ x) / n, (w @ y) / n
+        sxy = w @ (x * y) - n * mx * my
+        sxx = w @ (x * x) - n * mx * mx
+        syy = w @ (y * y) - n * my * my
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sxy / np.sqrt(sxx * syy)
+
+
+def _random_subsets(rng: np.random.Generator, n: int, m: int, k: int) -> np.ndarray:
+    """
+    k uniform random m-subsets of range(n) as a (k x n) boolean mask. Every element gets a
+    random byte: those below a cutoff near m/n are in, and the few still missing are
+    picked at random among the elements whose byte lies in a narrow band around the
+    cutoff. By symmetry the subset is uniform, and its size is exactly m.
+    """
+    p = m / n
+    keys = rng.integers(0, 256, (k, n), dtype=np.uint8)
+    # The band spans 6 standard deviations of the count below the cutoff either side
+    spread = 6 * 256 * np.sqrt(p * (1 - p) / n)
+    lo, hi = max(int(np.floor(256 * p - spread)), 0), min(int(np.ceil(256 * p + spread)), 256)
+    sel = keys < lo
+    band = keys >= lo if hi == 256 else (keys >= lo) & (keys < hi)
+    need = m - np.count_nonzero(sel, axis=1)
+    flat = np.flatnonzero(band)
+    rows = flat // n
+    # Band members of each row in random order; the first `need` of them join the subset
+    order = np.argsort(rows + rng.random(len(rows)))
+    flat, rows = flat[order], rows[order]
+    starts = np.searchsorted(rows, np.arange(k))
+    take = np.arange(len(rows)) - starts[rows] < need[rows]
+    sel.ravel()[flat[take]] = True
+    # A count outside the band (far beyond 6 sd): draw that row directly
+    for i in np.flatnonzero((need < 0) | (need > np.bincount(rows, minlength=k))):
+        sel[i] = False
+        sel[i, rng.choice(n, m, replace=False)] = True
+    return sel
+
+
+def _kth_members(mask: np.ndarray, ranks: List[int], block: int = 1024) -> np.ndarray:
+    """
+    Column of the r-th (0-based) True of every row of `mask`, for each r in `ranks`
+    (k x len(ranks)). Counts per block of columns locate the block, so only one block
+    per row is scanned instead of a cumulative sum over the whole matrix.
+    """
+    k, n = mask.shape
+    if n % block:
+        mask = np.pad(mask, ((0, 0), (0, block - n % block)))
+    blocks = mask.reshape(k, -1, block)
+    cum = blocks.sum(axis=2).cumsum(axis=1)
+    out = np.empty((k, len(ranks)), dtype=np.int64)
+    rows = np.arange(k)
+    for j, r in enumerate(ranks):
+        b = (cum > r).argmax(axis=1)
+        before = np.where(b > 0, cum[rows, b - 1], 0)
+        inner = blocks[rows, b].cumsum(axis=1)
+        out[:, j] = b * block + (inner > (r - before)[:, None]).argmax(axis=1)
+    return out
+
+
+def _subset_medians(pooled: np.ndarray, mask: np.ndarray, size: int) -> np.ndarray:
+    """Median of pooled[mask[i]] per row i; pooled is sorted and each row has `size` members."""
+    pos = _kth_members(mask, [(size - 1) // 2, size // 2])
+    return (pooled[pos[:, 0]] + pooled[pos[:, 1]]) / 2
+
+
+# --- Tasks (run in the pool workers, or inline) ---
+
+def _batches(count: int, rows: int):
+    step = max(RESAMPLE_BATCH_CELLS // max(rows, 1), 1)
+    for start in range(0, count, step):
+        yield min(step, count - start)
+
+
+def _bootstrap_task(data: Dict[str, Any], seed, count: int) -> np.ndarray:
+    """Plain bootstrap: `count` resamples drawn as batched index matrices."""
+    rng = np.random.default_rng(seed)
+    out = []
+    if data["statistic"] == "correlation":
+        x, y = data["x"], data["y"]
+        for k in _batches(count, len(x)):
+            idx = rng.integers(0, len(x), (k, len(x)), dtype=np.int64)
+            out.append(_correlation_rows(x[idx], y[idx]))
+    else:
+        a, b = data["a"], data["b"]
+        reduce = np.mean if data["statistic"] == "mean_diff" else np.median
+        for k in _batches(count, len(a) + len(b)):
+            ia = rng.integers(0, len(a), (k, len(a)), dtype=np.int64)
+            ib = rng.integers(0, len(b), (k, len(b)), dtype=np.int64)
+            out.append(reduce(a[ia], axis=1) - reduce(b[ib], axis=1))
+    return np.concatenate(out) if out else np.empty(0)
+
+
+def _little_bootstrap(rng: np.random.Generator, values: np.ndarray, size: int, count: int, kind: str):
+    """
+    `count` size-n resample statistics of one subset, as deviations from the subset's own
+    statistic: n draws from `size` distinct (sorted) values are multinomial counts over
+    them, so a resample costs O(size), not O(n).
+    """
+    n = len(values)
+    subset = values[np.sort(rng.choice(n, size, replace=False))]
+    out = []
+    for k in _batches(count, size):
+        w = rng.multinomial(n, np.full(size, 1.0 / size), size=k)
+        out.append(w @ subset / n if kind == "mean" else _weighted_median(subset, w, n))
+    return np.concatenate(out) - _center(subset, kind)
+
+
+def _blb_task(data: Dict[str, Any], seed, count: int) -> np.ndarray:
+    """
+    One subset of the bag of little bootstraps (Kleiner et al. 2014). Returns the
+    resample statistics minus the subset's statistic: a subset of n ** BLB_GAMMA rows
+    estimates the spread well but its center poorly, so only the spread is kept.
+    """
+    rng = np.random.default_rng(seed)
+    if data["statistic"] == "correlation":
+        x, y = data["x"], data["y"]
+        n = len(x)
+        size = min(int(n ** BLB_GAMMA), n)
+        pick = np.sort(rng.choice(n, size, replace=False))
+        xs, ys = x[pick], y[pick]
+        out = []
+        for k in _batches(count, size):
+            w = rng.multinomial(n, np.full(size, 1.0 / size), size=k).astype(np.float64)
+            out.append(_correlation_rows(xs, ys, w))
+        return np.concatenate(out) - _correlation_rows(xs[None, :], ys[None, :])[0]
+    kind = "mean" if data["statistic"] == "mean_diff" else "median"
+    a, b = data["a"], data["b"]
+    return (_little_bootstrap(rng, a, min(int(len(a) ** BLB_GAMMA), len(a)), count, kind)
+            - _little_bootstrap(rng, b, min(int(len(b) ** BLB_GAMMA), len(b)), count, kind))
+
+
+def _permutation_task(data: Dict[str, Any], seed, count: int) -> np.ndarray:
+    """`count` statistics under random relabelling (groups) or re-pairing (correlation)."""
+    rng = np.random.default_rng(seed)
+    out = []
+    if data["statistic"] == "correlation":
+        xs, ys = data["xs"], data["ys"]
+        for k in _batches(count, len(xs)):
+            shuffled = rng.permuted(np.broadcast_to(ys, (k, len(ys))), axis=1)
+            out.append(np.clip(shuffled @ xs / (len(xs) - 1), -1.0, 1.0))
+        return np.concatenate(out)
+
+    pooled, m = data["pooled"], len(data["a"])
+    n = len(pooled)
+    total = pooled.sum()
+    for k in _batches(count, n):
+        sel = _random_subsets(rng, n, m, k)
+        if data["statistic"] == "mean_diff":
+            s1 = sel.astype(np.float64) @ pooled
+            out.append(s1 / m - (total - s1) / (n - m))
+        else:
+            # pooled is sorted, so each group's members are in order: medians by rank
+            out.append(_subset_medians(pooled, sel, m) - _subset_medians(pooled, ~sel, n - m))
+    return np.concatenate(out)
+
+
+_TASKS = {"bootstrap": _bootstrap_task, "blb": _blb_task, "permutation": _permutation_task}
+
+
+def _run_chunk(kind: str, data: Dict[str, Any], seeds: List[np.random.SeedSequence],
+               counts: List[int]) -> List[np.ndarray]:
+    return [_TASKS[kind](data, s, c) for s, c in zip(seeds, counts)]
+
+
+def _run_tasks(kind: str, data: Dict[str, Any], counts: List[int], seed: int, workers: int,
+               rows: int) -> List[np.ndarray]:
+    """
+    Runs the tasks with one child seed each; results come back in task order. `rows` (the
+    rows resampled) times the resample count decides whether the CPU pool is worth it.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    workers = min(workers, concurrency.cpu_workers, len(counts))
+    if workers <= 1 or rows * sum(counts) < RESAMPLE_POOL_MIN_WORK:
+        return _run_chunk(kind, data, seeds, counts)
+    # One run of consecutive tasks per worker of the shared (forkserver) CPU pool, so the
+    # data is pickled once per worker. The seeds are per task, not per run, so the
+    # result doesn't depend on how many workers took part.
+    bounds = np.linspace(0, len(counts), workers + 1).astype(int)
+    futures = [concurrency.submit_cpu(_run_chunk, kind, data, seeds[lo:hi], counts[lo:hi])
+               for lo, hi in zip(bounds[:-1], bounds[1:])]
+    return [part for future in futures for part in future.result()]
+
+
+# --- Entry point ---
+
+def _two_groups(df: pd.DataFrame, group_col: str, value_col: str,
+                groups: Optional[List[Any]] = None) -> Tuple[List[Any], np.ndarray, np.ndarray]:
+    keys = df[group_col]
+    labels = list(groups) if groups else [v.item() if isinstance(v, np.generic) else v
+                                          for v in keys.dropna().unique()[:2]]
+    if len(labels) < 2:
+        raise ValueError(f"Column '{group_col}' must have at least 2 groups")
+    values = pd.to_numeric(df[value_col], errors="coerce")
+    a = values[keys == labels[0]].dropna().to_numpy(dtype=np.float64)
+    b = values[keys == labels[1]].dropna().to_numpy(dtype=np.float64)
+    if len(a) < 2 or len(b) < 2:
+        raise ValueError(f"Need at least 2 values in each of the groups {labels[:2]}")
+    return labels[:2], np.sort(a), np.sort(b)
+
+
+def resample_test(df: pd.DataFrame, method: str, statistic: str, params: Dict[str, Any],
+                  n_resamples: int = 10_000, confidence: float = 0.95, alternative: str = "two-sided",
+                  seed: int = 0, workers: int = RESAMPLE_WORKERS) -> Dict[str, Any]:
+    """
+    Bootstrap confidence interval or permutation test for a difference in means/medians
+    between two groups (params: group_col, value_col, optional groups) or for a Pearson
+    correlation (params: col1, col2).
+    Resamples are drawn in vectorized batches (index matrices, multinomial weights or
+    random label masks) and split into fixed-size tasks with their own SeedSequence
+    children, run on the shared CPU process pool for big inputs: the same seed gives the same answer
+    on any machine. Bootstraps of more than RESAMPLE_BLB_MIN_ROWS rows use the bag of
+    little bootstraps, which costs O(n ** 0.6) per resample instead of O(n).
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"Unknown method: {method}. Use one of {sorted(RESAMPLE_METHODS)}")
+    if statistic not in RESAMPLE_STATISTICS:
+        raise ValueError(f"Unknown statistic: {statistic}. Use one of {sorted(RESAMPLE_STATISTICS)}")
+    if alternative not in ALTERNATIVES:
+        raise ValueError(f"Unknown alternative: {alternative}. Use one of {sorted(ALTERNATIVES)}")
+    if not 1 <= n_resamples <= RESAMPLE_MAX:
+        raise ValueError(f"n_resamples must be between 1 and {RESAMPLE_MAX}")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1")
+
+    needed = [params.get(k) for k in (("col1", "col2") if statistic == "correlation" else ("group_col", "value_col"))]
+    missing = [c for c in needed if c and c not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found: {missing}. Available: {list(df.columns)}")
+
+    out: Dict[str, Any] = {"test": method, "method": method, "statistic": statistic, "seed": seed}
+    if statistic == "correlation":
+        col1, col2 = params.get("col1"), params.get("col2")
+        if not col1 or not col2:
+            raise ValueError("correlation requires col1 and col2 parameters")
+        pair = df[[col1, col2]].apply(pd.to_numeric, errors="coerce").dropna()
+        if len(pair) < 3:
+            raise ValueError(f"Need at least 3 rows with both {col1} and {col2}")
+        x, y = pair[col1].to_numpy(dtype=np.float64), pair[col2].to_numpy(dtype=np.float64)
+        data = {"statistic": statistic, "x": x, "y": y}
+        observed = float(_correlation_rows(x[None, :], y[None, :])[0])
+        n = len(x)
+        out["n"] = n
+        if method == "permutation":
+            # Standardized once: each re-pairing's r is then a dot product
+            data["xs"] = (x - x.mean()) / x.std(ddof=1)
+            data["ys"] = (y - y.mean()) / y.std(ddof=1)
+    else:
+        group_col, value_col = params.get("group_col"), params.get("value_col")
+        if not group_col or not value_col:
+            raise ValueError(f"{statistic} requires group_col and value_col parameters")
+        labels, a, b = _two_groups(df, group_col, value_col, params.get("groups"))
+        kind = "mean" if statistic == "mean_diff" else "median"
+        data = {"statistic": statistic, "a": a, "b": b}
+        observed = _center(a, kind) - _center(b, kind)
+        n = len(a) + len(b)
+        out.update({"groups": labels, "n1": len(a), "n2": len(b),
+                    "group1_" + kind: _center(a, kind), "group2_" + kind: _center(b, kind)})
+        if method == "permutation":
+            data["pooled"] = np.sort(np.concatenate([a, b]))
+    out["estimate"] = observed
+
+    if method == "bootstrap":
+        blb = n > RESAMPLE_BLB_MIN_ROWS
+        per_task = BLB_RESAMPLES if blb else RESAMPLE_TASK_SIZE
+        counts = [per_task] * (n_resamples // per_task) + ([n_resamples % per_task] if n_resamples % per_task else [])
+        parts = _run_tasks("blb" if blb else "bootstrap", data, counts, seed, workers, n)
+        tail = (1 - confidence) / 2 * 100
+        if blb:
+            # Each subset gives the quantiles of the deviation from its own estimate;
+            # their average is placed around the full-data estimate
+            bounds = np.array([np.nanpercentile(p, [tail, 100 - tail]) for p in parts])
+            ci = observed + bounds.mean(axis=0)
+            std_error = float(np.mean([np.nanstd(p, ddof=1) for p in parts]))
+            out.update({"scheme": "bag_of_little_bootstraps", "subsets": len(parts),
+                        "subset_rows": int(n ** BLB_GAMMA)})
+        else:
+            draws = np.concatenate(parts)
+            ci = np.nanpercentile(draws, [tail, 100 - tail])
+            std_error = float(np.nanstd(draws, ddof=1))
+            out["scheme"] = "full"
+        out.update({"ci": [float(ci[0]), float(ci[1])], "confidence": confidence,
+                    "std_error": std_error, "n_resamples": n_resamples})
+        return out
+
+    counts = [RESAMPLE_TASK_SIZE] * (n_resamples // RESAMPLE_TASK_SIZE)
+    if n_resamples % RESAMPLE_TASK_SIZE:
+        counts.append(n_resamples % RESAMPLE_TASK_SIZE)
+    null = np.concatenate(_run_tasks("permutation", data, counts, seed, workers, n))
+    if alternative == "greater":
+        extreme = np.sum(null >= observed - 1e-12)
+    elif alternative == "less":
+        extreme = np.sum(null <= observed + 1e-12)
+    else:
+        extreme = np.sum(np.abs(null) >= abs(observed) - 1e-12)
+    p = (extreme + 1) / (len(null) + 1)
+    out.update({"p_value": float(p), "alternative": alternative, "n_resamples": n_resamples,
+                "null_mean": float(null.mean()), "null_std": float(null.std(ddof=1)) if len(null) > 1 else None,
+                "significant": bool(p < 0.05)})
+    return out
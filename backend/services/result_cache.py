@@ -0,0 +1,120 @@
+
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from backend.services.dataset_cache import resolve_sheet
+
+# Results kept in memory (least recently used are dropped beyond this)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "512"))
+# Set RESULT_CACHE_ENABLED=0 to always recompute
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+
+
+def _canonical(value: Any) -> Any:
+    """Params in a stable form: dict keys sorted (by json), None entries dropped, numpy -> Python."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def params_key(test: str, params: Dict[str, Any]) -> str:
+    payload = {"test": test, "params": _canonical(params or {})}
+    return json.dumps(payload, sort_keys=True, default=str)
+
+
+class TestResultCache:
+    """
+    In-memory memo of statistical test results, keyed by dataset file, sheet, the file's
+    version (catalog version plus mtime/size, so edits made outside the API count too),
+    the test name and its canonicalized params. Sheet writes call invalidate() to free
+    the entries of the old version right away. Only results without "error" are kept.
+    Identical requests running at the same time compute once.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, enabled: bool = RESULT_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(filepath: str, sheet: Optional[str], version: int, test: str, params: Dict[str, Any]) -> str:
+        st = os.stat(filepath)
+        raw = json.dumps([filepath, resolve_sheet(filepath, sheet), version, st.st_mtime_ns, st.st_size,
+                          params_key(test, params)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def memoize(self, filepath: str, sheet: Optional[str], version: int, test: str, params: Dict[str, Any],
+                compute: Callable[[], Optional[Dict[str, Any]]]) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Cached result of compute() for this dataset version and test, or computes it.
+        Returns (result, {"status": "hit" | "miss" | "disabled", "version"}).
+        Raises SheetNotFound for unknown sheets.
+        """
+        if not self.enabled:
+            return compute(), {"status": "disabled", "version": version}
+        key = self._key(filepath, sheet, version, test, params)
+        with self._key_lock(key):
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return cached[1], {"status": "hit", "version": version}
+                self.misses += 1
+            try:
+                result = compute()
+                if result is not None and "error" not in result:
+                    with self._lock:
+                        self._entries[key] = (filepath, result)
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+        return result, {"status": "miss", "version": version}
+
+    def invalidate(self, filepath: Optional[str] = None):
+        """Drops the results of one file (all sheets), or everything."""
+        with self._lock:
+            if filepath is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [k for k, (path, _) in self._entries.items() if path == filepath]
+                for k in keys:
+                    del self._entries[k]
+                dropped = len(keys)
+            self.invalidations += dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidated": self.invalidations,
+            }
+
+
+result_cache = TestResultCache()
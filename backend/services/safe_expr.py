@@ -0,0 +1,254 @@
+
+import ast
+import re
+import copy
+import operator
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+# Column expressions of compute_column ops and computed columns, e.g. "(price - cost) / price",
+# "where(qty > 0, total / qty, 0)", "sales / sum(sales)", "`unit price` * 2".
+# Parsed with ast and checked against a whitelist: column names, number/string/bool literals,
+# arithmetic, comparisons, and/or/not, and the functions below. No attribute access,
+# subscripts or other calls, so nothing can reach methods of the objects involved.
+
+# Element-wise functions
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "log2": np.log2,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "round": lambda x, digits=0: np.round(x, int(digits)),
+    "where": lambda cond, a, b: np.where(cond, a, b),
+    "isnull": pd.isna,
+    "notnull": pd.notna,
+}
+# Reductions over all rows: an expression using one is not row-wise
+AGGREGATES = {"sum", "mean", "median", "min", "max", "std", "count"}
+
+_BINARY = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_,
+}
+_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+_BACKTICK = re.compile(r"`([^`]*)`")
+
+
+class ExpressionError(ValueError):
+    """The expression is malformed, uses something outside the whitelist, or can't be evaluated."""
+
+
+class Expression:
+    """A validated column expression: `columns` it reads, `aggregate` if it reduces over rows."""
+
+    def __init__(self, text: str, tree: ast.Expression, names: Dict[str, str]):
+        self.text = text
+        self.tree = tree
+        self._names = names                       # identifier in the tree -> column name
+        self.columns: List[str] = []
+        self.aggregate = False
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id in names and names[node.id] not in self.columns:
+                self.columns.append(names[node.id])
+            elif isinstance(node, ast.Call) and node.func.id in AGGREGATES:
+                self.aggregate = True
+
+    def evaluate(self, frame: pd.DataFrame) -> Any:
+        """Series aligned with `frame` (or a scalar, for constant expressions)."""
+        try:
+            value = self._eval(self.tree.body, frame)
+        except ExpressionError:
+            raise
+        except Exception as e:
+            raise ExpressionError(f"{type(e).__name__}: {e}")
+        if isinstance(value, np.ndarray):
+            value = pd.Series(value, index=frame.index)
+        return value
+
+    def _eval(self, node: ast.AST, frame: pd.DataFrame) -> Any:
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            return frame[self._names[node.id]]
+        if isinstance(node, ast.BinOp):
+            left, right = self._eval(node.left, frame), self._eval(node.right, frame)
+            if isinstance(node.op, ast.Pow) and isinstance(left, int) and isinstance(right, int):
+                # Two Python ints would be raised exactly (9 ** 9 ** 9 never returns)
+                left = float(left)
+            if isinstance(node.op, ast.Mult) and (_is_text(left) or _is_text(right)):
+                raise ExpressionError("Text can't be multiplied")
+            return _BINARY[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp):
+            value = self._eval(node.operand, frame)
+            if isinstance(node.op, ast.USub):
+                return -value
+            if isinstance(node.op, ast.UAdd):
+                return +value
+            return ~value if isinstance(value, (pd.Series, np.ndarray)) else not value
+        if isinstance(node, ast.BoolOp):
+            # Element-wise, as in pandas eval: and -> &, or -> |
+            combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+            result = self._eval(node.values[0], frame)
+            for value in node.values[1:]:
+                result = combine(result, self._eval(value, frame))
+            return result
+        if isinstance(node, ast.Compare):
+            left, result = self._eval(node.left, frame), None
+            for op, right_node in zip(node.ops, node.comparators):
+                right = self._eval(right_node, frame)
+                if isinstance(op, (ast.In, ast.NotIn)):
+                    hits = left.isin(right) if isinstance(left, pd.Series) else left in right
+                    step = (~hits if isinstance(hits, pd.Series) else not hits) if isinstance(op, ast.NotIn) else hits
+                else:
+                    step = _COMPARE[type(op)](left, right)
+                result = step if result is None else result & step
+                left = right
+            return result
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [self._eval(e, frame) for e in node.elts]
+        if isinstance(node, ast.Call):
+            args = [self._eval(a, frame) for a in node.args]
+            name = node.func.id
+            if name in AGGREGATES:
+                series = args[0] if isinstance(args[0], pd.Series) else pd.Series(args[0], index=frame.index)
+                return getattr(series, name)()
+            return FUNCTIONS[name](*args)
+        raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+
+    def to_code(self, frame_name: str = "df") -> str:
+        """Equivalent pandas/numpy code, for plan_to_code and the edit journal."""
+        names = self._names
+
+        class ToPandas(ast.NodeTransformer):
+            def visit_Name(self, node):
+                return ast.Subscript(value=ast.Name(id=frame_name, ctx=ast.Load()),
+                                     slice=ast.Constant(value=names[node.id]), ctx=ast.Load())
+
+            def visit_BoolOp(self, node):
+                self.generic_visit(node)
+                op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+                result = node.values[0]
+                for value in node.values[1:]:
+                    result = ast.BinOp(left=result, op=op, right=value)
+                return result
+
+            def visit_UnaryOp(self, node):
+                self.generic_visit(node)
+                return ast.UnaryOp(op=ast.Invert(), operand=node.operand) if isinstance(node.op, ast.Not) else node
+
+            def visit_Call(self, node):
+                node.args = [self.visit(arg) for arg in node.args]
+                name = node.func.id
+                if name in AGGREGATES:
+                    return ast.Call(func=ast.Attribute(value=node.args[0], attr=name, ctx=ast.Load()), args=[], keywords=[])
+                if name in ("isnull", "notnull"):
+                    return ast.Call(func=ast.Attribute(value=ast.Name(id="pd", ctx=ast.Load()), attr=name[:-4] + "na",
+                                                       ctx=ast.Load()), args=node.args, keywords=[])
+                return ast.Call(func=ast.Attribute(value=ast.Name(id="np", ctx=ast.Load()), attr=name, ctx=ast.Load()),
+                                args=node.args, keywords=[])
+
+        return ast.unparse(ast.fix_missing_locations(ToPandas().visit(copy.deepcopy(self.tree))))
+
+
+def _is_text(value: Any) -> bool:
+    if isinstance(value, str):
+        return True
+    return isinstance(value, pd.Series) and (pd.api.types.is_string_dtype(value) or value.dtype == object)
+
+
+def _check(node: ast.AST, names: Dict[str, str], columns: Optional[set]):
+    """Raises ExpressionError for anything outside the whitelist."""
+    if isinstance(node, ast.Expression):
+        return _check(node.body, names, columns)
+    if isinstance(node, ast.Constant):
+        if node.value is not None and not isinstance(node.value, (bool, int, float, str)):
+            raise ExpressionError(f"Literal not allowed: {node.value!r}")
+        return
+    if isinstance(node, ast.Name):
+        column = names.get(node.id, node.id)
+        if columns is not None and column not in columns:
+            raise ExpressionError(f"Unknown column: {column}")
+        names[node.id] = column
+        return
+    if isinstance(node, ast.BinOp):
+        if type(node.op) not in _BINARY:
+            raise ExpressionError(f"Operator not allowed: {type(node.op).__name__}")
+    elif isinstance(node, ast.UnaryOp):
+        if not isinstance(node.op, (ast.USub, ast.UAdd, ast.Not, ast.Invert)):
+            raise ExpressionError(f"Operator not allowed: {type(node.op).__name__}")
+    elif isinstance(node, ast.Compare):
+        _check(node.left, names, columns)
+        for op, right in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                # The only place a list may appear: literal values on the right of in / not in
+                if not isinstance(right, (ast.List, ast.Tuple)):
+                    raise ExpressionError("'in' needs a list of values, e.g. region in ['north', 'south']")
+                for element in right.elts:
+                    if not isinstance(element, ast.Constant):
+                        raise ExpressionError("Lists may only hold literal values")
+                    _check(element, names, columns)
+                continue
+            if type(op) not in _COMPARE:
+                raise ExpressionError(f"Comparison not allowed: {type(op).__name__}")
+            _check(right, names, columns)
+        return
+    elif isinstance(node, (ast.List, ast.Tuple)):
+        raise ExpressionError(f"Lists are only allowed after 'in' / 'not in': {ast.unparse(node)}")
+    elif isinstance(node, ast.Call):
+        func = node.func
+        if not isinstance(func, ast.Name) or (func.id not in FUNCTIONS and func.id not in AGGREGATES):
+            label = func.id if isinstance(func, ast.Name) else ast.unparse(func)
+            raise ExpressionError(f"Function not allowed: {label}. Use one of {sorted(set(FUNCTIONS) | AGGREGATES)}")
+        if node.keywords:
+            raise ExpressionError(f"{func.id}() takes positional arguments only")
+        if func.id in AGGREGATES and len(node.args) != 1:
+            raise ExpressionError(f"{func.id}() takes one argument")
+        if not node.args:
+            raise ExpressionError(f"{func.id}() needs an argument")
+        for arg in node.args:
+            _check(arg, names, columns)
+        return
+    elif not isinstance(node, ast.BoolOp):
+        raise ExpressionError(f"Not allowed in an expression: {type(node).__name__} ({ast.unparse(node)})")
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, (ast.operator, ast.unaryop, ast.cmpop, ast.boolop, ast.expr_context)):
+            continue
+        _check(child, names, columns)
+
+
+def parse_expression(expr: str, columns: Optional[List[str]] = None) -> Expression:
+    """
+    Validates `expr` against the whitelist and, if given, the available `columns`. Column
+    names with spaces or symbols go in backticks, as in pandas eval. Raises ExpressionError.
+    """
+    text = str(expr or "").strip()
+    if not text:
+        raise ExpressionError("Empty expression")
+    names: Dict[str, str] = {}
+
+    def placeholder(match):
+        name = f"_col{len(names)}_"
+        while name in text:
+            name += "_"
+        names[name] = match.group(1)
+        return name
+
+    source = _BACKTICK.sub(placeholder, text)
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}")
+    _check(tree, names, None if columns is None else {str(c) for c in columns})
+    return Expression(text, tree, names)
@@ -4,10 +4,7 @@ import numpy as np
 import io
 import os
 import traceback
-import matplotlib.pyplot as plt
-import seaborn as sns
 from scipy import stats
-import statsmodels.api as sm
 from statsmodels.formula.api import ols
 from typing import Dict, Any, Optional, List
 from supabase import create_client, Client
@@ -41,6 +38,8 @@ class SAMCore:
 
         results = {"test": test}
         plot_url = None
+        # Large plots: "aggregate" | "sample" | "full", and the row budget before reducing
+        plot_opts = {"mode": params.get("plot_mode"), "budget": params.get("plot_points")}
         
         try:
             if test == "t-test" or test == "t_test":
@@ -69,7 +68,7 @@ class SAMCore:
                 })
                 
                 # Generate Boxplot
-                plot_url = self._generate_plot(df, "boxplot", x=col_group, y=col_val)
+                plot_url = self._generate_plot(df, "boxplot", x=col_group, y=col_val, **plot_opts)
 
             elif test == "pearson":
                 col1 = params.get("col1")
@@ -86,7 +85,7 @@ class SAMCore:
                     "n": len(clean_df)
                 })
                 
-                plot_url = self._generate_plot(clean_df, "scatter", x=col1, y=col2)
+                plot_url = self._generate_plot(clean_df, "scatter", x=col1, y=col2, **plot_opts)
 
             elif test == "linreg":
                 target = params.get("target_col")
@@ -97,35 +96,62 @@ class SAMCore:
                 if not target or not features:
                     return {"error": "Missing target_col or feature_cols"}
                 
-                X = df[features]
-                y = df[target]
-                X = sm.add_constant(X)
-                
-                model = sm.OLS(y, X, missing='drop').fit()
+                # Shared engine: dummy-encodes text/bool features, fits from X'X
+                from backend.services.regression import fit_regression
+                fit = fit_regression([df], [target], features, params.get("categorical_cols"))
+                res = fit["targets"][target]
                 
                 results.update({
-                    "r_squared": float(model.rsquared),
-                    "f_pvalue": float(model.f_pvalue),
-                    "coefficients": model.params.to_dict(),
-                    "summary": str(model.summary2())
+                    "r_squared": res["r_squared"],
+                    "adj_r_squared": res["adj_r_squared"],
+                    "f_pvalue": res["f_pvalue"],
+                    "n": fit["n"],
+                    "coefficients": {k: v["coef"] for k, v in res["coefficients"].items()},
+                    "coefficient_table": res["coefficients"],
+                    "reference_levels": fit["reference_levels"],
                 })
                 # Plot observed vs predicted if single feature
                 if len(features) == 1:
-                     plot_url = self._generate_plot(df, "regplot", x=features[0], y=target)
+                     plot_url = self._generate_plot(df, "regplot", x=features[0], y=target, **plot_opts)
 
             elif test == "chi2":
                 col1 = params.get("col1")
                 col2 = params.get("col2")
                 
-                contingency = pd.crosstab(df[col1], df[col2])
-                chi2, p, dof, ex = stats.chi2_contingency(contingency)
+                if not col1 or not col2:
+                    return {"error": "Missing col1 or col2"}
+                
+                # Sparse table of factorized codes (high-cardinality columns stay cheap)
+                from backend.services.contingency import contingency_table, chi2_result
+                table = contingency_table([df], col1, col2)
+                res = chi2_result(table)
+                if "error" in res:
+                    return res
                 
                 results.update({
-                    "statistic": float(chi2),
-                    "p_value": float(p),
-                    "dof": int(dof)
+                    "statistic": res["chi2_statistic"],
+                    "p_value": res["p_value"],
+                    "dof": res["dof"],
+                    "n": res["n"],
+                    "cramers_v": res["cramers_v"],
+                    "levels": res["levels"],
+                    "warnings": res["warnings"],
                 })
-                plot_url = self._generate_plot(df, "heatmap", data=contingency)
+                # Heatmap of the largest levels only
+                plot_url = self._generate_plot(df, "heatmap", data=table.frame(max_levels=30))
+
+            elif test in ("bootstrap", "permutation"):
+                # Distribution-free inference: params {"statistic": mean_diff | median_diff | correlation, ...}
+                from backend.services.resampling import resample_test
+                results.update(resample_test(
+                    df, test, params.get("statistic", "mean_diff"), params,
+                    n_resamples=int(params.get("n_resamples", 10000)),
+                    confidence=float(params.get("confidence", 0.95)),
+                    alternative=params.get("alternative", "two-sided"),
+                    seed=int(params.get("seed", 0)),
+                ))
+                if "group_col" in params and "value_col" in params:
+                    plot_url = self._generate_plot(df, "boxplot", x=params["group_col"], y=params["value_col"], **plot_opts)
 
             else:
                 return {"error": f"Unknown test type: {test}"}
@@ -158,37 +184,17 @@ class SAMCore:
             results["meaning"] = f"The model explains {r2*100:.1f}% of the variance in the target variable."
 
     def _generate_plot(self, df, kind, **kwargs):
-        """Generates a matplotlib/seaborn plot and uploads to Supabase."""
-        if not self.supabase:
-            return None
+        """
+        Renders a seaborn plot in a worker process (services/plot_render.py), cached by data
+        and spec. Served from Supabase storage when configured, else from /files/plots.
+        Plots of many rows are binned, sampled or drawn from quartiles (mode/budget kwargs).
+        """
+        from backend.services.plot_render import plot_renderer
         
-        plt.figure(figsize=(6, 4))
-        try:
-            if kind == "boxplot":
-                sns.boxplot(data=df, x=kwargs.get('x'), y=kwargs.get('y'))
-            elif kind == "scatter":
-                sns.scatterplot(data=df, x=kwargs.get('x'), y=kwargs.get('y'))
-            elif kind == "regplot":
-                sns.regplot(data=df, x=kwargs.get('x'), y=kwargs.get('y'))
-            elif kind == "heatmap":
-                sns.heatmap(kwargs.get('data'), annot=True, fmt='d', cmap="YlGnBu")
-            
-            plt.tight_layout()
-            
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            buf.seek(0)
-            plt.close()
-            
-            filename = f"plot_{pd.Timestamp.now().timestamp()}.png"
-            path = f"plots/{filename}"
-            
-            self.supabase.storage.from_("uploads").upload(path, buf.read(), {"content-type": "image/png"})
-            
-            # Prefer signed URL for security, or public if easy
-            return self.supabase.storage.from_("uploads").get_public_url(path)
-
-        except Exception as e:
-            print(f"Plot generation failed: {e}")
-            plt.close()
-            return None
+        if kind == "heatmap":
+            data = kwargs.get('data')
+        else:
+            # Only the plotted columns go to the worker (and into the cache key)
+            data = df[[c for c in dict.fromkeys([kwargs.get('x'), kwargs.get('y')]) if c is not None]]
+        spec = {"x": kwargs.get('x'), "y": kwargs.get('y'), "mode": kwargs.get('mode'), "budget": kwargs.get('budget')}
+        return plot_renderer.render(kind, data, spec, storage=self.supabase)
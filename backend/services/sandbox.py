@@ -0,0 +1,222 @@
+
+import os
+import sys
+import queue
+import pickle
+import atexit
+import threading
+import multiprocessing as mp
+import pandas as pd
+from typing import Optional, Tuple
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Number of pre-started worker processes = max concurrent agent executions
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", "2"))
+# Wall-clock limit per snippet (seconds); the worker is killed and replaced on timeout
+SANDBOX_TIMEOUT = float(os.environ.get("SANDBOX_TIMEOUT", "30"))
+# Memory a snippet may allocate on top of the worker's baseline (MB), enforced with setrlimit where available
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", "2048"))
+# How long a request waits for a free worker before giving up (seconds)
+SANDBOX_QUEUE_TIMEOUT = float(os.environ.get("SANDBOX_QUEUE_TIMEOUT", "10"))
+
+
+class SandboxError(Exception):
+    """The snippet failed (exception, bad result, worker crash)."""
+
+
+class SandboxTimeout(SandboxError):
+    """The snippet exceeded the wall-clock limit and its worker was killed."""
+
+
+class SandboxBusy(SandboxError):
+    """No worker became free within SANDBOX_QUEUE_TIMEOUT."""
+
+
+# --- DataFrame transport: Arrow IPC stream bytes, pickle when Arrow can't represent the frame ---
+
+def encode_frame(df: pd.DataFrame) -> Tuple[str, bytes]:
+    if PYARROW_AVAILABLE:
+        try:
+            table = pa.Table.from_pandas(df)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return "arrow", sink.getvalue().to_pybytes()
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            pass
+    return "pickle", pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_frame(fmt: str, payload: bytes) -> pd.DataFrame:
+    if fmt == "arrow":
+        return pa.ipc.open_stream(pa.py_buffer(payload)).read_all().to_pandas()
+    return pickle.loads(payload)
+
+
+# --- Worker process ---
+
+def _limit_memory(memory_mb: int):
+    """Caps the worker's address space at its current size plus `memory_mb`."""
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            baseline = int(f.read().split()[0]) * resource.getpagesize()
+        limit = baseline + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        # Not available (e.g. Windows, no /proc): rely on the wall-clock limit only
+        pass
+
+
+def _worker_main(conn, memory_mb: int):
+    """Loop: receive (code, frame) -> exec with `df`, `pd`, `np` in scope -> send back `df`."""
+    import numpy as np
+    _limit_memory(memory_mb)
+
+    while True:
+        try:
+            header = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if header is None:
+            break
+
+        code, fmt = header
+        try:
+            df = decode_frame(fmt, conn.recv_bytes())
+            local_scope = {"df": df, "pd": pd, "np": np}
+            exec(code, {}, local_scope)
+            new_df = local_scope.get("df")
+            if not isinstance(new_df, pd.DataFrame):
+                conn.send(("error", "Code executed but `df` variable was lost"))
+                continue
+            out_fmt, payload = encode_frame(new_df)
+            conn.send(("ok", out_fmt))
+            conn.send_bytes(payload)
+        except MemoryError:
+            conn.send(("error", f"Memory limit exceeded ({memory_mb} MB)"))
+            # Heap may be fragmented / half-allocated: let the pool replace us
+            break
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+    def kill(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+
+
+class SandboxPool:
+    """
+    Pool of pre-started worker processes that run LLM-generated pandas code away from the
+    API process. A snippet gets the DataFrame over a pipe (Arrow IPC), runs under a memory
+    limit, and is killed if it exceeds the wall-clock limit. At most `size` snippets run
+    at once; further requests wait up to SANDBOX_QUEUE_TIMEOUT for a free worker.
+    """
+
+    def __init__(self, size: int = SANDBOX_WORKERS, timeout: float = SANDBOX_TIMEOUT,
+                 memory_mb: int = SANDBOX_MEMORY_MB):
+        self.size = size
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        # forkserver, not fork: replacements are started while the API process runs threads
+        # (IO pool, LLM client) whose held locks a forked child would inherit. The fork
+        # server preloads this module (pandas, pyarrow), so a new worker still starts fast.
+        # Windows only has spawn.
+        if sys.platform != "win32":
+            self._ctx = mp.get_context("forkserver")
+            self._ctx.set_forkserver_preload([__name__])
+        else:
+            self._ctx = mp.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn, self.memory_mb), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        self._workers.append(worker)
+        return worker
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            self._started = True
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except (OSError, BrokenPipeError):
+                    pass
+                worker.kill()
+            self._workers = []
+            self._idle = queue.Queue()
+            self._started = False
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            return self._spawn()
+
+    def run(self, code: str, df: pd.DataFrame, timeout: Optional[float] = None) -> pd.DataFrame:
+        """Executes `code` against `df` in a worker and returns the resulting `df`. Blocking."""
+        self.start()
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            worker = self._idle.get(timeout=SANDBOX_QUEUE_TIMEOUT)
+        except queue.Empty:
+            raise SandboxBusy(f"All {self.size} sandbox workers are busy, try again shortly")
+
+        healthy = True
+        try:
+            fmt, payload = encode_frame(df)
+            worker.conn.send((code, fmt))
+            worker.conn.send_bytes(payload)
+
+            if not worker.conn.poll(timeout):
+                healthy = False
+                raise SandboxTimeout(f"Execution exceeded {timeout:.0f}s and was stopped")
+
+            status, detail = worker.conn.recv()
+            if status != "ok":
+                # MemoryError makes the worker exit; anything else leaves it reusable
+                healthy = worker.process.is_alive() and "Memory limit" not in detail
+                raise SandboxError(detail)
+            return decode_frame(detail, worker.conn.recv_bytes())
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError) as e:
+            healthy = False
+            raise SandboxError(f"Sandbox worker crashed: {e}")
+        finally:
+            if not healthy:
+                worker = self._replace(worker)
+            self._idle.put(worker)
+
+
+sandbox_pool = SandboxPool()
+atexit.register(sandbox_pool.shutdown)
@@ -0,0 +1,268 @@
+
+import io
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Rows per chunk read from the source file. Keeps memory bounded for large sheets.
+EXPORT_CHUNK_ROWS = 50_000
+# Size of the byte blocks handed to the HTTP response
+STREAM_BLOCK_BYTES = 64 * 1024
+
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _check_columns(available: List[str], columns: Optional[List[str]]):
+    missing = [c for c in (columns or []) if c not in available]
+    if missing:
+        raise KeyError(f"Columns not found: {missing}. Available: {list(available)}")
+
+
+def iter_frame_chunks(filepath: str, chunksize: int = EXPORT_CHUNK_ROWS,
+                      sheet: Optional[str] = None, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Reads a CSV file or one Excel sheet (default: the first) as a sequence of DataFrames of
+    at most `chunksize` rows.
+    CSV uses the pandas chunked reader; Excel is read row by row in openpyxl read-only mode,
+    so the whole sheet is never materialized at once. Parquet files (and a fresh Parquet
+    sidecar of the source) are read one record batch at a time.
+    `columns` limits the chunks to those columns (CSV/Parquet don't parse the others);
+    unknown names raise KeyError before anything is yielded.
+    """
+    from backend.services.dataset_cache import _fresh_sidecar
+    parquet = filepath if filepath.endswith('.parquet') else _fresh_sidecar(filepath, sheet)
+    if parquet and PYARROW_AVAILABLE:
+        pf = pq.ParquetFile(parquet)
+        _check_columns(pf.schema_arrow.names, columns)
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    if filepath.endswith('.csv'):
+        if columns is not None:
+            _check_columns(list(pd.read_csv(filepath, nrows=0).columns), columns)
+        for chunk in pd.read_csv(filepath, chunksize=chunksize, usecols=columns):
+            yield chunk if columns is None else chunk[columns]
+        return
+
+    if filepath.endswith('.xls'):
+        # Legacy .xls has no streaming reader, fall back to a full parse
+        df = pd.read_excel(filepath, sheet_name=sheet if sheet else 0)
+        _check_columns(list(df.columns), columns)
+        if columns is not None:
+            df = df[columns]
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        _check_columns(names, columns)
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunksize:
+                chunk = pd.DataFrame.from_records(batch, columns=names)
+                yield chunk if columns is None else chunk[columns]
+                batch = []
+        if batch:
+            chunk = pd.DataFrame.from_records(batch, columns=names)
+            yield chunk if columns is None else chunk[columns]
+    finally:
+        wb.close()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that keeps only the bytes written since the last drain().
+    tell() keeps counting the absolute offset, which the Parquet footer depends on.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream_csv(filepath: str, sheet: Optional[str] = None) -> Iterator[bytes]:
+    """Yields the dataset as CSV bytes, one chunk at a time."""
+    header_written = False
+    for chunk in iter_frame_chunks(filepath, sheet=sheet):
+        text = chunk.to_csv(index=False, header=not header_written)
+        header_written = True
+        yield text.encode("utf-8")
+
+    if not header_written:
+        # Empty source: still emit an empty document
+        yield b""
+
+
+def stream_xlsx(filepath: str, sheet: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Writes the dataset with an openpyxl write-only workbook (rows are flushed to a temp file
+    as they are appended) and streams the finished file back in fixed-size blocks.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet or "data")
+    header_written = False
+
+    for chunk in iter_frame_chunks(filepath, sheet=sheet):
+        if not header_written:
+            ws.append([str(c) for c in chunk.columns])
+            header_written = True
+        # NaN/NaT -> empty cell, same as DataFrame.to_excel
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            block = tmp.read(STREAM_BLOCK_BYTES)
+            if not block:
+                break
+            yield block
+
+
+def _merge_types(a: "pa.DataType", b: "pa.DataType") -> "pa.DataType":
+    """Narrowest type both chunks fit: ints and floats mix into float64, other clashes into string."""
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    numeric = lambda t: pa.types.is_integer(t) or pa.types.is_floating(t)
+    if numeric(a) and numeric(b):
+        return pa.float64()
+    return pa.string()
+
+
+def _column_type(series: pd.Series) -> "pa.DataType":
+    try:
+        return pa.array(series, from_pandas=True).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed values within one chunk (e.g. numbers and text from Excel)
+        return pa.string()
+
+
+def _profile_schema(profile: dict) -> Optional["pa.Schema"]:
+    """
+    Schema from a stored whole-file profile (see services/profiler.py), or None when a
+    column's dtype doesn't settle its Arrow type (mixed "object" columns, tz-aware dates).
+    """
+    fields = []
+    for col in profile["columns"]:
+        if col["dtype"] in ("str", "string"):
+            fields.append(pa.field(col["name"], pa.string()))
+            continue
+        try:
+            fields.append(pa.field(col["name"], pa.from_numpy_dtype(np.dtype(col["dtype"]))))
+        except (TypeError, pa.ArrowNotImplementedError):
+            return None
+    return pa.schema(fields)
+
+
+def parquet_schema(filepath: str, sheet: Optional[str] = None, chunksize: int = EXPORT_CHUNK_ROWS) -> "pa.Schema":
+    """
+    Arrow schema every chunk of the dataset fits, without reading the data where possible:
+    Parquet sources and fresh sidecars carry one, and the stored profile of the first sheet
+    records each column's dtype over the whole file. Otherwise (or for ambiguous dtypes)
+    CSV/Excel are scanned once, since a column can be numeric in the first chunk and text
+    further down.
+    """
+    from backend.services.dataset_cache import _fresh_sidecar
+    parquet = filepath if filepath.endswith('.parquet') else _fresh_sidecar(filepath, sheet)
+    if parquet:
+        return pq.ParquetFile(parquet).schema_arrow.remove_metadata()
+    if sheet is None:
+        from backend.services.profiler import profile_store
+        profile = profile_store.get(filepath, compute=False)
+        schema = _profile_schema(profile) if profile else None
+        if schema is not None:
+            return schema
+    types = {}
+    for chunk in iter_frame_chunks(filepath, chunksize, sheet=sheet):
+        for c in chunk.columns:
+            t = _column_type(chunk[c])
+            types[str(c)] = _merge_types(types[str(c)], t) if str(c) in types else t
+    return pa.schema([pa.field(c, t) for c, t in types.items()])
+
+
+def _to_table(chunk: pd.DataFrame, schema: "pa.Schema") -> "pa.Table":
+    """Chunk as an Arrow table of the unified schema (columns promoted to string are stringified)."""
+    chunk = chunk.rename(columns=str)
+    promoted = {f.name: chunk[f.name].astype("string") for f in schema
+                if pa.types.is_string(f.type) and not pd.api.types.is_string_dtype(chunk[f.name])}
+    if promoted:
+        chunk = chunk.assign(**promoted)
+    return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+def stream_parquet(filepath: str, sheet: Optional[str] = None, chunksize: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Writes one Parquet row group per chunk into a small in-memory buffer and yields the
+    bytes after every row group. The schema is settled before the first row group
+    (parquet_schema), so a type change after the first chunk can't break the stream; when
+    it needs a scan of the source, the first byte waits for that scan.
+    """
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("Parquet export requires pyarrow. Run: pip install pyarrow")
+
+    schema = parquet_schema(filepath, sheet, chunksize)
+    buffer = _ChunkSink()
+    sink = pa.PythonFile(buffer, mode="w")
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in iter_frame_chunks(filepath, chunksize, sheet=sheet):
+            writer.write_table(_to_table(chunk, schema))
+            yield buffer.drain()
+    finally:
+        writer.close()
+
+    yield buffer.drain()
+
+
+EXPORTERS = {
+    "xlsx": stream_xlsx,
+    "csv": stream_csv,
+    "parquet": stream_parquet,
+}
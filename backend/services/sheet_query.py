@@ -0,0 +1,264 @@
+
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+from backend.services.dataset_cache import CachedDataset, ColumnIndex
+
+RANGE_OPS = {"gt", "gte", "lt", "lte", "between"}
+SUPPORTED_OPS = RANGE_OPS | {"eq", "ne", "in", "not_in", "contains", "startswith", "isnull", "notnull"}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _coerce(idx: ColumnIndex, series: pd.Series, value: Any) -> Any:
+    """Converts a JSON filter value to something comparable with the column."""
+    if value is None:
+        return None
+    if pd.api.types.is_datetime64_any_dtype(series):
+        try:
+            return np.datetime64(pd.Timestamp(value))
+        except (TypeError, ValueError):
+            raise QueryError(f"Column '{series.name}' holds dates, got unparseable value {value!r}")
+    if idx.is_numeric:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise QueryError(f"Column '{series.name}' is numeric, got non-numeric value {value!r}")
+    return value
+
+
+def _positions_to_mask(positions: np.ndarray, n: int) -> np.ndarray:
+    mask = np.zeros(n, dtype=bool)
+    mask[positions] = True
+    return mask
+
+
+def _codes_mask(idx: ColumnIndex, matching_codes: np.ndarray) -> np.ndarray:
+    """Rows whose categorical code is one of `matching_codes` (distinct-value space -> rows)."""
+    lookup = np.zeros(len(idx.uniques) + 1, dtype=bool)
+    lookup[matching_codes] = True
+    # code -1 (missing) maps onto the trailing False slot
+    return lookup[idx.codes]
+
+
+def _text_match(idx: ColumnIndex, needle: str, mode: str = "contains") -> np.ndarray:
+    """Codes of the distinct values matching a case-insensitive text test."""
+    labels = pd.Series(idx.uniques.astype(str)).str.lower()
+    needle = str(needle).lower()
+    if mode == "startswith":
+        hits = labels.str.startswith(needle)
+    else:
+        hits = labels.str.contains(needle, regex=False)
+    return np.flatnonzero(hits.to_numpy())
+
+
+def _filter_mask(ds: CachedDataset, spec: Dict[str, Any]) -> np.ndarray:
+    column = spec.get("column")
+    op = spec.get("op", "eq")
+    value = spec.get("value")
+    df = ds.df
+    n = len(df)
+
+    if column not in df.columns:
+        raise QueryError(f"Column not found: {column}. Available: {list(df.columns)}")
+    if op not in SUPPORTED_OPS:
+        raise QueryError(f"Unsupported filter op: {op}. Use one of {sorted(SUPPORTED_OPS)}")
+
+    series = df[column]
+    idx = ds.index(column)
+
+    if op == "isnull":
+        return series.isna().to_numpy()
+    if op == "notnull":
+        return series.notna().to_numpy()
+    if op in RANGE_OPS and op != "between" and value is None:
+        raise QueryError(f"'{op}' needs a value")
+    if op == "between" and (not isinstance(value, list) or len(value) != 2):
+        raise QueryError("'between' expects a [low, high] pair")
+
+    if op in ("eq", "ne", "in", "not_in"):
+        # null in the value(s) matches missing cells, for every column type
+        values = value if isinstance(value, list) else [value]
+        nulls = series.isna().to_numpy() if any(v is None for v in values) else np.zeros(n, dtype=bool)
+        values = [v for v in values if v is not None]
+
+    if idx.is_numeric:
+        if op in ("eq", "ne", "in", "not_in"):
+            mask = nulls.copy()
+            for v in values:
+                v = _coerce(idx, series, v)
+                mask |= _positions_to_mask(idx.value_range(v, v), n)
+            return ~mask & series.notna().to_numpy() if op in ("ne", "not_in") else mask
+        if op in RANGE_OPS:
+            if op == "between":
+                low, high = (_coerce(idx, series, v) for v in value)
+                positions = idx.value_range(low, high)
+            else:
+                v = _coerce(idx, series, value)
+                if op == "gt":
+                    positions = idx.value_range(low=v, include_low=False)
+                elif op == "gte":
+                    positions = idx.value_range(low=v)
+                elif op == "lt":
+                    positions = idx.value_range(high=v, include_high=False)
+                else:
+                    positions = idx.value_range(high=v)
+            return _positions_to_mask(positions, n)
+        # Text ops on numbers: match on their string form
+        text = series.astype(str).str.lower()
+        needle = str(value).lower()
+        hits = text.str.startswith(needle) if op == "startswith" else text.str.contains(needle, regex=False)
+        return hits.to_numpy() & series.notna().to_numpy()
+
+    # Categorical columns: resolve the predicate on distinct values, then map through codes
+    if op in ("eq", "ne", "in", "not_in"):
+        codes = np.array([c for c in (idx.code_of(v) for v in values) if c >= 0], dtype=np.int64)
+        mask = _codes_mask(idx, codes) | nulls
+        return ~mask & (idx.codes >= 0) if op in ("ne", "not_in") else mask
+    if op in ("contains", "startswith"):
+        return _codes_mask(idx, _text_match(idx, value, op))
+    if op in RANGE_OPS:
+        # Codes are assigned in sorted order, so a value range is a code range
+        labels = idx.uniques
+        try:
+            if op == "between":
+                # A null bound leaves that side open, as for numeric columns
+                low, high = value
+                lo_code = 0 if low is None else labels.searchsorted(low, side="left")
+                hi_code = len(labels) if high is None else labels.searchsorted(high, side="right")
+            elif op in ("gt", "gte"):
+                lo_code = labels.searchsorted(value, side="right" if op == "gt" else "left")
+                hi_code = len(labels)
+            else:
+                lo_code = 0
+                hi_code = labels.searchsorted(value, side="left" if op == "lt" else "right")
+        except TypeError:
+            raise QueryError(f"Column '{column}' can't be compared with {value!r}")
+        return (idx.codes >= lo_code) & (idx.codes < hi_code)
+
+    raise QueryError(f"Unsupported filter op for column '{column}': {op}")
+
+
+def _search_mask(ds: CachedDataset, search: str, columns: Optional[List[str]] = None) -> np.ndarray:
+    """Case-insensitive substring search across text columns (OR across columns)."""
+    df = ds.df
+    mask = np.zeros(len(df), dtype=bool)
+    for col in columns or list(df.columns):
+        if col not in df.columns:
+            continue
+        idx = ds.index(col)
+        if idx.is_numeric:
+            # Only exact numeric matches for numeric columns
+            try:
+                v = _coerce(idx, df[col], search)
+            except (QueryError, ValueError):
+                continue
+            mask[idx.value_range(v, v)] = True
+        else:
+            mask |= _codes_mask(idx, _text_match(idx, search))
+    return mask
+
+
+def _sort_positions(ds: CachedDataset, positions: np.ndarray, sort: List[Dict[str, Any]]) -> np.ndarray:
+    if not sort:
+        return positions
+
+    for spec in sort:
+        if spec.get("column") not in ds.df.columns:
+            raise QueryError(f"Sort column not found: {spec.get('column')}")
+
+    if len(sort) == 1:
+        # Walk the precomputed sort order and keep the rows that passed the filters
+        spec = sort[0]
+        idx = ds.index(spec["column"])
+        keep = _positions_to_mask(positions, len(ds.df))
+        order = idx.order[keep[idx.order]]
+        if spec.get("desc"):
+            # Keep missing values at the end when reversing
+            valid = order[:np.count_nonzero(idx.rank[order] < idx.null_rank)]
+            order = np.concatenate([valid[::-1], order[len(valid):]])
+        return order
+
+    # Multi-column: lexsort on the per-column ranks (last key is primary for lexsort)
+    keys = []
+    for spec in reversed(sort):
+        idx = ds.index(spec["column"])
+        rank = idx.rank[positions]
+        if spec.get("desc"):
+            # Missing values have the highest ranks; leave them positive so they stay last
+            rank = np.where(rank < idx.null_rank, -rank, rank)
+        keys.append(rank)
+    return positions[np.lexsort(keys)]
+
+
+def _json_rows(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Row records with NaN/NaT replaced by None so they serialize as JSON null."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def run_query(ds: CachedDataset,
+              filters: Optional[List[Dict[str, Any]]] = None,
+              search: Optional[str] = None,
+              search_columns: Optional[List[str]] = None,
+              sort: Optional[List[Dict[str, Any]]] = None,
+              offset: int = 0,
+              limit: int = 100) -> Dict[str, Any]:
+    """
+    Filters, searches and sorts a cached dataset and returns one page of rows.
+    All predicates are combined with AND; `search` is OR-ed across columns.
+    """
+    start = time.perf_counter()
+    df = ds.df
+
+    mask = np.ones(len(df), dtype=bool)
+    for spec in filters or []:
+        mask &= _filter_mask(ds, spec)
+    if search:
+        mask &= _search_mask(ds, search, search_columns)
+
+    positions = np.flatnonzero(mask)
+    positions = _sort_positions(ds, positions, sort or [])
+
+    offset = max(int(offset), 0)
+    limit = max(int(limit), 0)
+    window = positions[offset:offset + limit]
+    page = df.iloc[window]
+
+    rows = _json_rows(page)
+    # Keep the original row number so edits can be mapped back
+    for row_id, row in zip(window.tolist(), rows):
+        row.setdefault("__row", row_id)
+
+    return {
+        "columns": [{"key": col, "name": col, "editable": True} for col in df.columns],
+        "rows": rows,
+        "total": int(len(positions)),
+        "total_unfiltered": int(len(df)),
+        "offset": offset,
+        "limit": limit,
+        "took_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+def distinct_values(ds: CachedDataset, column: str, limit: int = 200) -> Dict[str, Any]:
+    """Distinct values and their counts for a column, e.g. for filter dropdowns."""
+    if column not in ds.df.columns:
+        raise QueryError(f"Column not found: {column}")
+    idx = ds.index(column)
+    if idx.is_numeric:
+        counts = ds.df[column].value_counts(dropna=True)
+        values = [{"value": v, "count": int(c)} for v, c in counts.head(limit).items()]
+        n_distinct = int(len(counts))
+    else:
+        counts = np.bincount(idx.codes[idx.codes >= 0], minlength=len(idx.uniques))
+        top = np.argsort(-counts, kind="stable")[:limit]
+        values = [{"value": idx.uniques[i], "count": int(counts[i])} for i in top]
+        n_distinct = int(len(idx.uniques))
+    # numpy scalars -> plain Python for JSON
+    for v in values:
+        if isinstance(v["value"], np.generic):
+            v["value"] = v["value"].item()
+    return {"column": column, "distinct": n_distinct, "values": values}
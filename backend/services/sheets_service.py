@@ -2,8 +2,9 @@
 import pandas as pd
 import os
 import io
-import requests
 from typing import List, Dict, Any, Optional
+from backend.services.dataset_cache import dataset_cache
+from backend.services.remote_fetch import remote_fetcher, sniff_file
 
 class SheetsService:
     def __init__(self):
@@ -15,31 +16,34 @@ class SheetsService:
         """
         Reads a file from a URL (local or remote) and returns structured JSON 
         compatibile with React Data Grid.
+        Remote files go through the fetch cache (services/remote_fetch.py): streamed to disk
+        once, then revalidated with a conditional GET (304 when unchanged).
         """
         try:
             print(f"SheetsService: Loading from {file_url}")
             
             # Determine read method
             if file_url.startswith("http"):
-                # Download into memory
-                response = requests.get(file_url)
-                response.raise_for_status()
-                file_content = io.BytesIO(response.content)
+                # Local content-addressed copy, named by detected format (magic bytes)
+                fetched = remote_fetcher.fetch(file_url)
+                print(f"SheetsService: {fetched['status']} ({fetched['size']} bytes, {fetched['format']})")
+                df = dataset_cache.get_df(fetched["path"])
             else:
                 # Local path? Unlikely context, but handle just in case
-                if os.path.exists(file_url):
-                    file_content = file_url
-                else:
+                if not os.path.exists(file_url):
                     return {"error": f"File not found: {file_url}"}
-
-            # Try parsing as Excel first, then CSV
-            try:
-                df = pd.read_excel(file_content)
-            except:
-                file_content.seek(0)
-                df = pd.read_csv(file_content)
+                fmt = sniff_file(file_url)
+                if file_url.endswith("." + fmt):
+                    df = dataset_cache.get_df(file_url)
+                elif fmt == "csv":
+                    df = pd.read_csv(file_url)
+                elif fmt == "parquet":
+                    df = pd.read_parquet(file_url)
+                else:
+                    df = pd.read_excel(file_url)
             
             # Replace NaN with null/empty string for JSON serialization
+            # (fillna returns a copy; the cached frame is left untouched)
             df = df.fillna("")
             
             # Convert to React Data Grid format
@@ -0,0 +1,392 @@
+
+import warnings
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+from scipy import stats, sparse
+
+# Multiple-comparison corrections accepted by adjust_pvalues
+ADJUST_METHODS = {"none", "bonferroni", "holm", "fdr_bh", "fdr_by"}
+# Tests run as one vectorized pass per (test, grouping) in run_batch; others run one by one
+BATCHED_TESTS = {"t-test", "anova", "pearson"}
+CORRELATION_METHODS = {"pearson", "spearman"}
+# Cells (rows x columns) per block when accumulating a correlation matrix
+CORR_BLOCK_CELLS = 4_000_000
+# Heatmaps wider than this only show the columns of the returned pairs
+CORR_HEATMAP_MAX_COLUMNS = 300
+
+
+def _num(value: Any) -> Optional[float]:
+    """Plain float for JSON, None for NaN/inf."""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def numeric_matrix(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Columns as one float64 (rows x columns) matrix, NaN for missing / unparseable."""
+    if columns and all(pd.api.types.is_numeric_dtype(df[c]) for c in columns):
+        # One conversion for the whole block instead of one per column
+        return df[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.column_stack([pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                            for c in columns]) if columns else np.empty((len(df), 0))
+
+
+def numeric_columns(df: pd.DataFrame, exclude: Optional[List[str]] = None) -> List[str]:
+    exclude = set(exclude or [])
+    return [c for c in df.columns if c not in exclude
+            and pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+
+
+# --- Multiple comparisons ---
+
+def adjust_pvalues(pvalues: np.ndarray, method: str = "fdr_bh") -> np.ndarray:
+    """Adjusted p-values (NaN entries are ignored and stay NaN)."""
+    if method not in ADJUST_METHODS:
+        raise ValueError(f"Unknown adjustment: {method}. Use one of {sorted(ADJUST_METHODS)}")
+    p = np.asarray(pvalues, dtype=np.float64)
+    out = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(np.isfinite(p))
+    m = len(valid)
+    if m == 0 or method == "none":
+        out[valid] = p[valid]
+        return out
+    pv = p[valid]
+    if method == "bonferroni":
+        adj = pv * m
+    else:
+        order = np.argsort(pv)
+        ranked = pv[order]
+        ranks = np.arange(1, m + 1)
+        if method == "holm":
+            adj_sorted = np.maximum.accumulate(ranked * (m - ranks + 1))
+        else:
+            scale = 1.0 if method == "fdr_bh" else np.sum(1.0 / ranks)
+            adj_sorted = np.minimum.accumulate((ranked * m * scale / ranks)[::-1])[::-1]
+        adj = np.empty(m)
+        adj[order] = adj_sorted
+    out[valid] = np.minimum(adj, 1.0)
+    return out
+
+
+# --- Group moments (shared by t-tests and ANOVA) ---
+
+def _shift(values: np.ndarray, sample: int = 1024) -> np.ndarray:
+    """Per-column value near the mean (from the first rows); sums are taken around it."""
+    head = values[:sample]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN head -> NaN, zeroed below
+        shift = np.nanmean(head, axis=0) if len(head) else np.zeros(values.shape[1])
+    return np.nan_to_num(shift)
+
+
+def group_moments(values: np.ndarray, codes: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-group count, mean and sum of squared deviations for every column of `values`
+    (rows x columns, NaN = missing). `codes` are group numbers 0..n_groups-1 (-1 = row
+    without a group). Returns three (n_groups x columns) arrays.
+    All groups and columns are reduced at once as sparse one-hot (groups x rows) products
+    with the data, shifted to near each column's mean first so the sums of squares don't cancel.
+    """
+    missing = np.isnan(values)
+    x = values - _shift(values)
+    x[missing] = 0.0
+    rows = np.flatnonzero(codes >= 0)
+    onehot = sparse.csr_matrix((np.ones(len(rows)), (codes[rows], rows)), shape=(n_groups, len(values)))
+
+    counts = onehot.sum(axis=1).A - np.asarray(onehot @ missing.astype(np.float32))
+    sums = np.asarray(onehot @ x)
+    np.multiply(x, x, out=x)
+    squares = np.asarray(onehot @ x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        m2 = np.maximum(squares - sums * means, 0.0)
+    return counts, means + _shift(values), np.where(counts > 0, m2, 0.0)
+
+
+def welch_from_moments(n1, m1, s1, n2, m2, s2) -> Dict[str, np.ndarray]:
+    """Welch t-test per column from counts, means and sums of squared deviations."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        v1 = s1 / (n1 - 1)
+        v2 = s2 / (n2 - 1)
+        a, b = v1 / n1, v2 / n2
+        t = (m1 - m2) / np.sqrt(a + b)
+        dof = (a + b) ** 2 / (a * a / (n1 - 1) + b * b / (n2 - 1))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    return {"t": t, "df": dof, "p": p}
+
+
+def anova_from_moments(counts: np.ndarray, means: np.ndarray, m2: np.ndarray) -> Dict[str, np.ndarray]:
+    """One-way ANOVA per column from group moments (groups with no values are skipped)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = counts.sum(axis=0)
+        k = (counts > 0).sum(axis=0)
+        grand = np.nansum(counts * np.nan_to_num(means), axis=0) / n
+        ssb = np.nansum(counts * (np.nan_to_num(means) - grand) ** 2, axis=0)
+        ssw = m2.sum(axis=0)
+        df_b, df_w = k - 1, n - k
+        f = (ssb / df_b) / (ssw / df_w)
+        p = stats.f.sf(f, df_b, df_w)
+    return {"f": f, "df_between": df_b, "df_within": df_w, "p": p}
+
+
+# --- Correlations ---
+
+def pearson_pairs(a: np.ndarray, b: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Pearson r of a[:, j] with b[:, j] for every column j (b may be one column, broadcast),
+    each over its own pairwise-complete rows.
+    """
+    x = a - _shift(a)
+    if b.shape[1] == 1:
+        # One target: every sum is a matrix-vector product against it
+        y = b[:, 0] - _shift(b)[0]
+        y_missing = np.isnan(y)
+        y[y_missing] = 0.0
+        mask = ~(np.isnan(a) | y_missing[:, None])
+        x[~mask] = 0.0
+        n = mask.sum(axis=0).astype(np.float64)
+        sx, sy = x.sum(axis=0), y @ mask
+        sxy, syy = y @ x, (y * y) @ mask
+        sxx = np.einsum("ij,ij->j", x, x)
+    else:
+        y = b - _shift(b)
+        mask = ~(np.isnan(x) | np.isnan(y))
+        x[~mask] = 0.0
+        y[~mask] = 0.0
+        n = mask.sum(axis=0).astype(np.float64)
+        sx, sy = x.sum(axis=0), y.sum(axis=0)
+        sxy, sxx, syy = (np.einsum("ij,ij->j", x, y), np.einsum("ij,ij->j", x, x),
+                         np.einsum("ij,ij->j", y, y))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        r = cov / np.sqrt((sxx - sx * sx / n) * (syy - sy * sy / n))
+        r = np.clip(r, -1.0, 1.0)
+        t = r * np.sqrt((n - 2) / (1 - r * r))
+        p = 2 * stats.t.sf(np.abs(t), n - 2)
+    p = np.where(np.abs(r) == 1.0, 0.0, p)
+    return {"r": r, "n": n, "p": p}
+
+
+def _rank_columns(values: np.ndarray) -> np.ndarray:
+    """Average ranks per column (ties share a rank), NaN stays NaN."""
+    return pd.DataFrame(values).rank(method="average").to_numpy(dtype=np.float64)
+
+
+def correlation_matrix(values: np.ndarray, method: str = "pearson", min_periods: int = 3,
+                       block_cells: int = CORR_BLOCK_CELLS) -> Dict[str, np.ndarray]:
+    """
+    All-pairs correlation of the columns of `values` (rows x columns, NaN = missing).
+    Every pair uses its own pairwise-complete rows: with W the presence matrix and X the
+    data (zero where missing), the per-pair counts, sums, sums of squares and cross
+    products are the matrix products W'W, X'W, (X*X)'W and X'X, accumulated over row
+    blocks so memory stays bounded for long tables.
+    Spearman correlates ranks; each column is ranked over its own observed values, which
+    is exact for pairs without missing values. p-values use the t approximation (n - 2 df),
+    like scipy. Returns (columns x columns) arrays r, n and p; r is NaN for pairs with
+    fewer than `min_periods` rows or a constant column.
+    """
+    if method not in CORRELATION_METHODS:
+        raise ValueError(f"Unknown correlation method: {method}. Use one of {sorted(CORRELATION_METHODS)}")
+    if method == "spearman":
+        values = _rank_columns(values)
+    k = values.shape[1]
+    shift = _shift(values)
+    n = np.zeros((k, k))
+    sx = np.zeros((k, k))      # sx[i, j]: sum of column i over rows where i and j are present
+    sxx = np.zeros((k, k))
+    sxy = np.zeros((k, k))
+    step = max(block_cells // max(k, 1), 1024)
+    for start in range(0, len(values), step):
+        x = values[start:start + step] - shift
+        missing = np.isnan(x)
+        if not missing.any():
+            # Complete block: every pair sees every row, only X'X needs a matrix product
+            n += len(x)
+            sx += x.sum(axis=0)[:, None]
+            sxx += np.einsum("ij,ij->j", x, x)[:, None]
+            sxy += x.T @ x
+            continue
+        x[missing] = 0.0
+        w = (~missing).astype(np.float64)
+        n += w.T @ w
+        sx += x.T @ w
+        sxy += x.T @ x
+        np.multiply(x, x, out=x)
+        sxx += x.T @ w
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = sxx - sx * sx / n          # var[i, j]: spread of i over the (i, j) rows
+        r = (sxy - sx * sx.T / n) / np.sqrt(var * var.T)
+        r = np.clip(r, -1.0, 1.0)
+        r[n < max(min_periods, 2)] = np.nan
+        diag = np.diag_indices(k)
+        r[diag] = np.where(np.isfinite(r[diag]), 1.0, np.nan)
+        t = r * np.sqrt((n - 2) / (1 - r * r))
+        p = 2 * stats.t.sf(np.abs(t), n - 2)
+    p = np.where(np.abs(r) == 1.0, 0.0, p)
+    return {"r": r, "n": n.astype(np.int64), "p": p}
+
+
+def correlation_pairs(corr: Dict[str, np.ndarray], columns: List[str], threshold: Optional[float] = None,
+                      top_k: Optional[int] = None, adjust: str = "none") -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Distinct column pairs of a correlation matrix, strongest |r| first. p-values are
+    adjusted over all pairs before `threshold` (min |r|) and `top_k` cut the list down.
+    Returns (pairs, number of pairs passing the threshold).
+    """
+    i, j = np.triu_indices(len(columns), k=1)
+    r, n, p = corr["r"][i, j], corr["n"][i, j], corr["p"][i, j]
+    p_adj = adjust_pvalues(p, adjust)
+    keep = np.flatnonzero(np.isfinite(r) & (np.abs(r) >= (threshold or 0.0)))
+    matched = len(keep)
+    strength = np.abs(r[keep])
+    if top_k is not None and top_k < matched:
+        keep = keep[np.argpartition(-strength, top_k - 1)[:top_k]]
+        strength = np.abs(r[keep])
+    keep = keep[np.argsort(-strength, kind="stable")]
+    pairs = [{
+        "col1": columns[i[q]], "col2": columns[j[q]],
+        "r": _num(r[q]), "n": int(n[q]),
+        "p_value": _num(p[q]), "p_adjusted": _num(p_adj[q]),
+    } for q in keep]
+    return pairs, matched
+
+
+def matrix_list(m: np.ndarray, digits: Optional[int] = None) -> List[List[Any]]:
+    """Nested lists for JSON, None where not finite."""
+    out = (np.round(m, digits) if digits is not None else m).astype(object)
+    out[~np.isfinite(m.astype(np.float64))] = None
+    return out.tolist()
+
+
+def _strength(r: float) -> str:
+    return f"{'Strong' if abs(r) > 0.7 else 'Moderate' if abs(r) > 0.4 else 'Weak'} {'positive' if r > 0 else 'negative'}"
+
+
+# --- Batch runner ---
+
+def _group_codes(series: pd.Series, groups: Optional[List[Any]] = None) -> Tuple[np.ndarray, List[Any]]:
+    """Group numbers per row, in order of first appearance (or the given group order)."""
+    codes, uniques = pd.factorize(series)
+    labels = [v.item() if isinstance(v, np.generic) else v for v in uniques]
+    if groups:
+        lookup = {g: i for i, g in enumerate(groups)}
+        remap = np.array([lookup.get(label, -1) for label in labels] + [-1])
+        return remap[codes], list(groups)
+    return codes, labels
+
+
+def expand_specs(df: pd.DataFrame, tests: List[Dict[str, Any]], group_col: Optional[str] = None,
+                 target_col: Optional[str] = None, columns: Optional[List[str]] = None,
+                 group_tests: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Explicit specs plus the shorthands: every numeric column vs group_col / target_col."""
+    specs = [{"test": t.get("test"), "params": dict(t.get("params") or {})} for t in tests]
+    if group_col:
+        kinds = [k for k in (group_tests or ["t-test"]) if k in ("t-test", "anova")]
+        cols = columns or numeric_columns(df, exclude=[group_col])
+        for kind in kinds:
+            specs += [{"test": kind, "params": {"group_col": group_col, "value_col": c}} for c in cols if c != group_col]
+    if target_col:
+        cols = columns or numeric_columns(df, exclude=[target_col])
+        specs += [{"test": "pearson", "params": {"col1": c, "col2": target_col}} for c in cols if c != target_col]
+    return specs
+
+
+def run_batch(df: pd.DataFrame, specs: List[Dict[str, Any]], adjust: str = "fdr_bh", alpha: float = 0.05,
+              fallback=None) -> List[Dict[str, Any]]:
+    """
+    Runs many test specs on one loaded frame. t-tests and ANOVAs that share a group column
+    are computed together from one set of group moments over a column matrix; Pearson
+    pairs are computed together with pairwise-complete rows. Anything else goes through
+    `fallback(test, params, df)` one by one. p-values are adjusted across the whole batch.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(specs)
+    columns = set(df.columns)
+
+    # Bucket the batchable specs
+    by_group: Dict[Tuple[str, Tuple], List[int]] = {}
+    pearson: List[int] = []
+    for i, spec in enumerate(specs):
+        test, params = spec["test"], spec["params"]
+        if test in ("t-test", "anova"):
+            group_col, value_col = params.get("group_col"), params.get("value_col")
+            if not group_col or not value_col:
+                results[i] = {"error": f"{test} requires group_col and value_col parameters"}
+            elif group_col not in columns or value_col not in columns:
+                results[i] = {"error": f"Columns not found. Available: {list(df.columns)}"}
+            else:
+                groups = tuple(params.get("groups") or ()) if test == "t-test" else ()
+                by_group.setdefault((group_col, groups), []).append(i)
+        elif test == "pearson":
+            col1, col2 = params.get("col1"), params.get("col2")
+            if not col1 or not col2:
+                results[i] = {"error": "Pearson requires col1 and col2 parameters"}
+            elif col1 not in columns or col2 not in columns:
+                results[i] = {"error": f"Columns not found. Available: {list(df.columns)}"}
+            else:
+                pearson.append(i)
+        elif fallback is not None:
+            results[i] = fallback(test, params, df)
+        else:
+            results[i] = {"error": f"Unknown test: {test}"}
+
+    # t-tests / ANOVAs: one moments pass per grouping, over all value columns it needs
+    for (group_col, groups), idx in by_group.items():
+        value_cols = list(dict.fromkeys(specs[i]["params"]["value_col"] for i in idx))
+        codes, labels = _group_codes(df[group_col], list(groups) or None)
+        counts, means, m2 = group_moments(numeric_matrix(df, value_cols), codes, len(labels))
+        col_pos = {c: j for j, c in enumerate(value_cols)}
+        anova = anova_from_moments(counts, means, m2) if any(specs[i]["test"] == "anova" for i in idx) else None
+        welch = None
+        if len(labels) >= 2 and any(specs[i]["test"] == "t-test" for i in idx):
+            welch = welch_from_moments(counts[0], means[0], m2[0], counts[1], means[1], m2[1])
+        for i in idx:
+            j = col_pos[specs[i]["params"]["value_col"]]
+            if specs[i]["test"] == "t-test":
+                if welch is None:
+                    results[i] = {"error": "Need at least 2 groups for t-test"}
+                    continue
+                results[i] = {
+                    "test": "t-test",
+                    "t_statistic": _num(welch["t"][j]),
+                    "df": _num(welch["df"][j]),
+                    "p_value": _num(welch["p"][j]),
+                    "group1": labels[0], "group2": labels[1],
+                    "group1_mean": _num(means[0, j]), "group2_mean": _num(means[1, j]),
+                    "n1": int(counts[0, j]), "n2": int(counts[1, j]),
+                }
+            else:
+                results[i] = {
+                    "test": "anova",
+                    "f_statistic": _num(anova["f"][j]),
+                    "df_between": int(anova["df_between"][j]),
+                    "df_within": int(anova["df_within"][j]),
+                    "p_value": _num(anova["p"][j]),
+                }
+
+    # Pearson: all pairs as two aligned column matrices
+    if pearson:
+        a = numeric_matrix(df, [specs[i]["params"]["col1"] for i in pearson])
+        b = numeric_matrix(df, [specs[i]["params"]["col2"] for i in pearson])
+        corr = pearson_pairs(a, b)
+        for j, i in enumerate(pearson):
+            r = corr["r"][j]
+            results[i] = {
+                "test": "pearson",
+                "correlation": _num(r),
+                "n": int(corr["n"][j]),
+                "p_value": _num(corr["p"][j]),
+                "meaning": f"{_strength(r)} correlation (r={r:.3f})" if np.isfinite(r) else "Not enough paired values",
+            }
+
+    # Adjust across the batch
+    raw = np.array([r.get("p_value") if r and r.get("p_value") is not None else np.nan for r in results], dtype=float)
+    adjusted = adjust_pvalues(raw, adjust)
+    out = []
+    for spec, result, p_adj in zip(specs, results, adjusted):
+        result = dict(result or {})
+        if "p_value" in result and result["p_value"] is not None:
+            result["p_adjusted"] = _num(p_adj)
+            result["significant"] = bool(p_adj < alpha)
+        out.append({"spec": spec, **result})
+    return out
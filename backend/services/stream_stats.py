@@ -0,0 +1,236 @@
+
+import os
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+from scipy import stats
+from backend.services.dataset_cache import resolve_sheet
+from backend.services.sheet_export import iter_frame_chunks
+from backend.services.stat_batch import (group_moments, welch_from_moments, anova_from_moments,
+                                         numeric_matrix, _num, _strength)
+from backend.services.regression import RegressionAccumulator, RegressionError, linreg_result
+from backend.services.contingency import ContingencyTable, chi2_result
+
+# Rows per chunk when a test streams its file
+STREAM_CHUNK_ROWS = int(os.environ.get("STREAM_CHUNK_ROWS", "200000"))
+# mode="auto" streams files at least this big (bytes) that aren't in the dataset cache yet
+STREAM_TEST_MIN_BYTES = int(os.environ.get("STREAM_TEST_MIN_BYTES", str(200 * 1024 * 1024)))
+STREAMING_TESTS = {"t-test", "anova", "chi2", "pearson", "linreg"}
+
+
+# --- Mergeable sufficient statistics ---
+
+def _label(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class GroupMoments:
+    """
+    Count, mean and sum of squared deviations (M2) of value columns per group, over any
+    number of chunks. Chunks are reduced with group_moments() and merged with Chan et al.'s
+    pairwise update, so the result equals a single pass over all rows.
+    Groups keep the order they were first seen in (like Series.unique()).
+    """
+
+    def __init__(self, n_columns: int):
+        self.n_columns = n_columns
+        self.groups: Dict[Any, List[np.ndarray]] = {}
+
+    def update(self, keys: pd.Series, values: np.ndarray):
+        codes, uniques = pd.factorize(keys)
+        counts, means, m2 = group_moments(values, codes, len(uniques))
+        for g, label in enumerate(uniques):
+            self._merge(_label(label), counts[g], np.nan_to_num(means[g]), m2[g])
+
+    def _merge(self, label: Any, n_b: np.ndarray, mean_b: np.ndarray, m2_b: np.ndarray):
+        current = self.groups.get(label)
+        if current is None:
+            self.groups[label] = [n_b.copy(), mean_b.copy(), m2_b.copy()]
+            return
+        n_a, mean_a, m2_a = current
+        n = n_a + n_b
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean_b - mean_a
+            share = np.where(n > 0, n_b / n, 0.0)
+            current[1] = mean_a + delta * share
+            current[2] = m2_a + m2_b + np.where(n > 0, delta * delta * n_a * share, 0.0)
+        current[0] = n
+
+    def merge(self, other: "GroupMoments"):
+        for label, (n, mean, m2) in other.groups.items():
+            self._merge(label, n, mean, m2)
+
+    def arrays(self) -> Tuple[List[Any], np.ndarray, np.ndarray, np.ndarray]:
+        """(labels, counts, means, m2), each array (groups x columns)."""
+        labels = list(self.groups)
+        if not labels:
+            empty = np.zeros((0, self.n_columns))
+            return labels, empty, empty, empty
+        counts, means, m2 = (np.array([self.groups[g][i] for g in labels]) for i in range(3))
+        return labels, counts, np.where(counts > 0, means, np.nan), m2
+
+
+class CrossProducts:
+    """
+    Row count, column means and co-moment matrix sum((x - mean)(x - mean)') over the rows
+    where every column is present, merged chunk by chunk (multivariate Chan update).
+    Enough for Pearson correlations of any pair of the columns.
+    """
+
+    def __init__(self, n_columns: int):
+        self.n = 0
+        self.mean = np.zeros(n_columns)
+        self.comoment = np.zeros((n_columns, n_columns))
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values).any(axis=1)]
+        if len(values):
+            mean = values.mean(axis=0)
+            centered = values - mean
+            self._merge(len(values), mean, centered.T @ centered)
+
+    def _merge(self, n_b: int, mean_b: np.ndarray, comoment_b: np.ndarray):
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.comoment += comoment_b + np.outer(delta, delta) * self.n * n_b / n
+        self.mean += delta * n_b / n
+        self.n = n
+
+    def merge(self, other: "CrossProducts"):
+        if other.n:
+            self._merge(other.n, other.mean, other.comoment)
+
+
+# --- Tests from the statistics ---
+
+def _welch_result(moments: GroupMoments) -> Dict[str, Any]:
+    labels, counts, means, m2 = moments.arrays()
+    if len(labels) < 2:
+        return {"error": "Need at least 2 groups for t-test"}
+    welch = welch_from_moments(counts[0], means[0], m2[0], counts[1], means[1], m2[1])
+    p = welch["p"][0]
+    return {
+        "test": "t-test",
+        "t_statistic": _num(welch["t"][0]),
+        "df": _num(welch["df"][0]),
+        "p_value": _num(p),
+        "group1": labels[0], "group2": labels[1],
+        "group1_mean": _num(means[0, 0]),
+        "group2_mean": _num(means[1, 0]),
+        "n1": int(counts[0, 0]), "n2": int(counts[1, 0]),
+        "significant": bool(p < 0.05),
+        "meaning": f"The difference between groups is {'statistically significant' if p < 0.05 else 'not statistically significant'} (p={p:.4f})"
+    }
+
+
+def _anova_result(moments: GroupMoments) -> Dict[str, Any]:
+    labels, counts, means, m2 = moments.arrays()
+    keep = counts[:, 0] > 0
+    if keep.sum() < 2:
+        return {"error": "Need at least 2 groups for ANOVA"}
+    anova = anova_from_moments(counts[keep], means[keep], m2[keep])
+    p = anova["p"][0]
+    return {
+        "test": "anova",
+        "f_statistic": _num(anova["f"][0]),
+        "df_between": int(anova["df_between"][0]),
+        "df_within": int(anova["df_within"][0]),
+        "p_value": _num(p),
+        "significant": bool(p < 0.05),
+    }
+
+
+def _pearson_result(xp: CrossProducts) -> Dict[str, Any]:
+    if xp.n < 3:
+        return {"error": "Pearson needs at least 3 rows with both values"}
+    c = xp.comoment
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = float(np.clip(c[0, 1] / np.sqrt(c[0, 0] * c[1, 1]), -1.0, 1.0))
+        t = r * np.sqrt((xp.n - 2) / (1 - r * r))
+    p = 0.0 if abs(r) == 1.0 else float(2 * stats.t.sf(abs(t), xp.n - 2))
+    return {
+        "test": "pearson",
+        "correlation": _num(r),
+        "n": xp.n,
+        "p_value": _num(p),
+        "significant": bool(p < 0.05),
+        "meaning": f"{_strength(r)} correlation (r={r:.3f})" if np.isfinite(r) else "Constant column",
+    }
+
+
+def _linreg_result(acc: RegressionAccumulator, target: str, features: List[str]) -> Dict[str, Any]:
+    try:
+        return linreg_result(acc.fit(), target, features)
+    except RegressionError as e:
+        return {"error": str(e)}
+
+
+# --- Streaming runner ---
+
+def should_stream(filepath: str, test: str, cached: bool, mode: str = "auto") -> bool:
+    """mode "stream"/"memory" decide; "auto" streams big files that aren't parsed yet."""
+    if test not in STREAMING_TESTS or mode == "memory":
+        return False
+    if mode == "stream":
+        return True
+    return not cached and os.path.getsize(filepath) >= STREAM_TEST_MIN_BYTES
+
+
+def stream_test(filepath: str, sheet: Optional[str], test: str, params: Dict[str, Any],
+                chunk_rows: int = STREAM_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Runs one test over the file in chunks, reading only the columns it needs and keeping
+    only its sufficient statistics: per-group moments (t-test, ANOVA), contingency counts
+    (chi2, sparse: services/contingency.py), a cross-product matrix (pearson) or X'X (linreg, services/regression.py).
+    Memory is O(groups x columns) instead of O(rows). Same result keys as
+    run_statistical_test.
+    """
+    sheet = resolve_sheet(filepath, sheet)
+
+    if test in ("t-test", "anova"):
+        group_col, value_col = params.get("group_col"), params.get("value_col")
+        if not group_col or not value_col:
+            return {"error": f"{test} requires group_col and value_col parameters"}
+        columns = [group_col, value_col]
+        acc = GroupMoments(1)
+        update = lambda chunk: acc.update(chunk[group_col], numeric_matrix(chunk, [value_col]))
+        finish = (lambda: _welch_result(acc)) if test == "t-test" else (lambda: _anova_result(acc))
+    elif test == "chi2":
+        col1, col2 = params.get("col1"), params.get("col2")
+        if not col1 or not col2:
+            return {"error": "chi2 requires col1 and col2 parameters"}
+        columns = [col1, col2]
+        acc = ContingencyTable()
+        update = lambda chunk: acc.update(chunk[col1], chunk[col2])
+        finish = lambda: chi2_result(acc)
+    elif test == "pearson":
+        col1, col2 = params.get("col1"), params.get("col2")
+        if not col1 or not col2:
+            return {"error": "Pearson requires col1 and col2 parameters"}
+        columns = [col1, col2]
+        acc = CrossProducts(2)
+        update = lambda chunk: acc.update(numeric_matrix(chunk, columns))
+        finish = lambda: _pearson_result(acc)
+    elif test == "linreg":
+        target, features = params.get("target_col"), params.get("feature_cols")
+        if not target or not features:
+            return {"error": "Regression requires target_col and feature_cols"}
+        features = list(features) if isinstance(features, (list, tuple)) else [features]
+        columns = features + [target]
+        acc = RegressionAccumulator([target], features, params.get("categorical_cols"))
+        update = acc.update
+        finish = lambda: _linreg_result(acc, target, features)
+    else:
+        return {"error": f"Test {test} can't be streamed. Streaming supports: {sorted(STREAMING_TESTS)}"}
+
+    rows = chunks = 0
+    try:
+        for chunk in iter_frame_chunks(filepath, chunk_rows, sheet=sheet, columns=list(dict.fromkeys(columns))):
+            update(chunk)
+            rows += len(chunk)
+            chunks += 1
+    except KeyError as e:
+        return {"error": str(e.args[0]) if e.args else str(e)}
+    except RegressionError as e:
+        return {"error": str(e)}
+    return {**finish(), "streamed": {"rows": rows, "chunks": chunks}}
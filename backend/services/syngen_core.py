@@ -51,6 +51,9 @@ class SyngenCore:
                     "generated_rows": rows
                 }]).to_excel(writer, sheet_name='metadata', index=False)
             
+            from backend.services.catalog import catalog
+            catalog.register(local_path, df=synthetic_df)
+            
             # Default to local URL
             # Note: In docker/prod, this needs correct external host. For now localhost is fine.
             final_url = f"http://localhost:8000/files/{output_filename}"
@@ -83,6 +86,7 @@ class SyngenCore:
                 "status": "success", 
                 "dataset_id": dataset_id or "generated",
                 "file_url": final_url,
+                "filename": output_filename,
                 "sheet": "data",
                 "metadata": { 
                     "method": "CTGAN+CopulaGAN", 
@@ -184,3 +188,8 @@ class SyngenCore:
             traceback.print_exc()
             # Fallback: Simple Sampling
             return df.sample(n=rows, replace=True)
+
+
+def generate_synthetic(**kwargs) -> Dict[str, Any]:
+    """SyngenCore().generate() as a module-level function, so it can run in a worker process."""
+    return SyngenCore().generate(**kwargs)
@@ -0,0 +1,179 @@
+
+import gzip
+import json
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Optional
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Response formats for row payloads, chosen by the Accept header
+ROWS_MEDIA_TYPE = "application/json"                      # [{col: value, ...}, ...] (default)
+COLUMNS_MEDIA_TYPE = "application/vnd.mcp.columns+json"   # {col: [values]} typed arrays
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"  # Arrow IPC stream, metadata in the schema
+
+# Bodies above this size are gzipped when the client accepts it
+GZIP_MIN_BYTES = 32 * 1024
+GZIP_LEVEL = 1  # most of the size win for a fraction of the CPU of higher levels
+# Text columns with fewer distinct values than this share of rows are dictionary-encoded
+DICTIONARY_RATIO = 0.5
+
+
+def negotiate(request: Optional[Request]) -> str:
+    """Picks the response format from the Accept header ("rows", "columns" or "arrow")."""
+    accept = (request.headers.get("accept") or "") if request is not None else ""
+    if ARROW_MEDIA_TYPE in accept and PYARROW_AVAILABLE:
+        return "arrow"
+    if COLUMNS_MEDIA_TYPE in accept:
+        return "columns"
+    return "rows"
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON bytes; numpy arrays/scalars serialize natively and NaN becomes null."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, allow_nan=False).encode()
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+def _column_values(series: pd.Series) -> Dict[str, Any]:
+    """One typed column: plain numeric array, ISO strings, or dictionary + codes."""
+    dtype = str(series.dtype)
+    if pd.api.types.is_bool_dtype(series) and not series.isna().any():
+        return {"dtype": dtype, "values": series.to_numpy(dtype=bool)}
+    if pd.api.types.is_integer_dtype(series):
+        # Nullable Int64 with missing values: ints and nulls, not floats
+        return {"dtype": dtype, "values": series.to_numpy(dtype=np.int64) if not series.hasnans
+                else _python_values(series)}
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        if not ORJSON_AVAILABLE:
+            values = [None if v != v else v for v in values.tolist()]
+        return {"dtype": dtype, "values": values}
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return {"dtype": dtype, "values": _python_values(series)}
+
+    codes, uniques = pd.factorize(series)
+    uniques = [v.item() if isinstance(v, np.generic) else (v if isinstance(v, (str, int, float, bool)) else str(v))
+               for v in uniques]
+    if len(series) and len(uniques) < len(series) * DICTIONARY_RATIO:
+        # Repeated labels: send each distinct value once, rows as small integer codes (-1 = null)
+        code_dtype = np.int8 if len(uniques) < 127 else (np.int16 if len(uniques) < 32767 else np.int32)
+        return {"dtype": dtype, "dictionary": uniques, "codes": codes.astype(code_dtype)}
+    lookup = np.array(uniques + [None], dtype=object)
+    return {"dtype": dtype, "values": lookup[codes].tolist()}
+
+
+def _iso_unit(values: np.ndarray) -> str:
+    """Coarsest of s/ms/us/ns that represents every value exactly (fractions only when present)."""
+    ticks = values[~np.isnat(values)].astype("datetime64[ns]").view(np.int64)
+    for unit, step in (("s", 10 ** 9), ("ms", 10 ** 6), ("us", 10 ** 3)):
+        if not (ticks % step).any():
+            return unit
+    return "ns"
+
+
+def _iso_strings(series: pd.Series) -> list:
+    """
+    Datetimes as ISO 8601 strings, in one vectorized pass instead of per-value Timestamp
+    objects. Seconds, plus the fraction digits the column needs, so values round-trip.
+    Tz-aware values keep their offset as isoformat() writes it (+00:00).
+    """
+    if pd.api.types.is_datetime64_dtype(series):
+        values = series.to_numpy()
+        return np.datetime_as_string(values, unit=_iso_unit(values)).tolist()
+    values = series.dt.tz_localize(None).to_numpy()
+    local = np.datetime_as_string(values, unit=_iso_unit(values))
+    offset = series.dt.strftime("%z").fillna("").to_numpy(dtype=object)
+    offset = np.array([o[:3] + ":" + o[3:] if o else "" for o in offset], dtype=object)
+    return (local.astype(object) + offset).tolist()
+
+
+def _python_values(series: pd.Series) -> list:
+    """Column as a list of plain Python values, None for missing."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = _iso_strings(series)
+    else:
+        values = series.tolist()
+    if series.hasnans:
+        mask = series.isna().to_numpy()
+        for i in np.flatnonzero(mask).tolist():
+            values[i] = None
+    return values
+
+
+def frame_rows(df: pd.DataFrame) -> list:
+    """Row records with NaN/NaT as None (the default, backwards compatible format)."""
+    keys = list(df.columns)
+    columns = [_python_values(df[col]) for col in keys]
+    return [dict(zip(keys, row)) for row in zip(*columns)]
+
+
+def frame_columns(df: pd.DataFrame) -> Dict[str, Any]:
+    return {str(col): _column_values(df[col]) for col in df.columns}
+
+
+def arrow_bytes(df: pd.DataFrame, meta: Dict[str, Any]) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"meta": dumps(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _maybe_gzip(request: Optional[Request], body: bytes, headers: Dict[str, str]) -> bytes:
+    encoding = (request.headers.get("accept-encoding") or "") if request is not None else ""
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in encoding:
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def frame_response(request: Optional[Request], df: pd.DataFrame, meta: Dict[str, Any]) -> Response:
+    """
+    Response carrying `meta` (status, message, ...) plus the frame's columns/rows in the
+    format the client asked for:
+    - rows (default):  {..meta, "columns": [...], "rows": [{...}], "total": n}
+    - columns:         {..meta, "columns": [...], "data": {col: {"dtype", "values" | "dictionary"+"codes"}}, "total": n}
+    - arrow:           Arrow IPC stream; meta (incl. "columns") in the schema metadata under b"meta"
+    Large bodies are gzipped when the client sends Accept-Encoding: gzip.
+    """
+    fmt = negotiate(request)
+    columns = [{"key": col, "name": col, "editable": True} for col in df.columns]
+    headers = {"Vary": "Accept, Accept-Encoding"}
+
+    if fmt == "arrow":
+        body = arrow_bytes(df, {**meta, "columns": columns, "total": len(df)})
+        media_type = ARROW_MEDIA_TYPE
+    elif fmt == "columns":
+        body = dumps({**meta, "columns": columns, "data": frame_columns(df), "total": len(df)})
+        media_type = COLUMNS_MEDIA_TYPE
+    else:
+        body = dumps({**meta, "columns": columns, "rows": frame_rows(df), "total": len(df)})
+        media_type = ROWS_MEDIA_TYPE
+
+    body = _maybe_gzip(request, body, headers)
+    return Response(content=body, media_type=media_type, headers=headers)
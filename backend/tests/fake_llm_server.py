@@ -0,0 +1,54 @@
+"""
+Fake OpenAI-compatible LLM server for running the agent endpoints offline.
+
+    python backend/tests/fake_llm_server.py            # listens on :8001
+    LLM_BASE_URL=http://localhost:8001/v1 python -m backend.main
+
+Answers are canned per prompt type; LLM_FAKE_DELAY adds latency, LLM_FAKE_FAIL_EVERY makes
+every Nth call return 503 to exercise the client's retries.
+"""
+import os
+import json
+import time
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Fake LLM")
+DELAY = float(os.environ.get("LLM_FAKE_DELAY", "0"))
+FAIL_EVERY = int(os.environ.get("LLM_FAKE_FAIL_EVERY", "0"))
+calls = {"n": 0}
+
+def answer_for(prompt: str) -> str:
+    if "statistical assistant" in prompt:
+        return json.dumps({"test": "t-test", "params": {"group_col": "group", "value_col": "value"}, "clarify": None})
+    if "Classify the user's request" in prompt:
+        return json.dumps({"intent": "MANIPULATION", "target": None, "ops": [{"op": "drop_na"}], "code": None})
+    if "safe spreadsheet agent" in prompt:
+        return json.dumps({"ops": [{"op": "drop_na"}]})
+    if "Pandas Data Manipulation Expert" in prompt:
+        return "df = df.dropna()"
+    if "execution steps" in prompt:
+        return json.dumps(["load data", "summarize"])
+    return "The result is statistically significant."
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    calls["n"] += 1
+    if FAIL_EVERY and calls["n"] % FAIL_EVERY == 0:
+        return JSONResponse(status_code=503, content={"error": "fake overload"})
+    if DELAY:
+        await asyncio.sleep(DELAY)
+    body = await request.json()
+    prompt = "\n".join(m["content"] for m in body["messages"])
+    return {
+        "id": f"fake-{calls['n']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer_for(prompt)}, "finish_reason": "stop"}]
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8001)
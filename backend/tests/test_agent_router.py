@@ -0,0 +1,85 @@
+import asyncio
+import json
+import httpx
+import pytest
+from backend.services import agent_core
+from backend.services.llm_cache import LLMResponseCache
+from backend.services.llm_client import LLMClient, set_llm_client
+from backend.tests import fake_llm_server
+
+# Runs in-process: python -m pytest backend/tests/test_agent_router.py
+
+COLUMNS = ["Age", "Name", "unit price", "Sales"]
+CONTEXT = {"columns": COLUMNS, "sample": ""}
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    """AgentCore talking to the fake LLM server in-process; `seen` collects the prompts sent"""
+    seen = []
+
+    async def handler(request):
+        seen.append(json.loads(request.content)["messages"][0]["content"])
+        return await asgi.handle_async_request(request)
+
+    asgi = httpx.ASGITransport(app=fake_llm_server.app)
+    monkeypatch.setattr(agent_core, "llm_cache", LLMResponseCache(path=str(tmp_path / "llm.sqlite3")))
+    set_llm_client(LLMClient(base_url="http://fake/v1", api_key="", transport=httpx.MockTransport(handler)))
+    yield agent_core.AgentCore(), seen
+    set_llm_client(None)
+
+@pytest.mark.parametrize("command, ops", [
+    ("Rename column age to years", [{"op": "rename_column", "old": "Age", "new": "years"}]),
+    ("delete columns Name and 'unit price'", [{"op": "delete_column", "columns": ["Name", "unit price"]}]),
+    ("Drop the last 3 rows.", [{"op": "drop_rows", "start": -3}]),
+    ("remove rows where age is null", [{"op": "drop_na", "columns": ["Age"]}]),
+    ("Fill missing values in Sales with the average", [{"op": "fill_na", "column": "Sales", "method": "mean"}]),
+    ("sort by unit price descending", [{"op": "sort_rows", "by": [{"column": "unit price", "desc": True}]}]),
+    ("remove duplicates", [{"op": "drop_duplicates", "columns": None}]),
+])
+def test_rule_edits_skip_the_llm(agent, command, ops):
+    core, seen = agent
+    out = asyncio.run(core.agent_router(command, CONTEXT))
+    assert (out["action"], out["source"]) == ("MANIPULATION", "rules")
+    assert out["ops"] == ops
+    assert out["code"].startswith("df")
+    assert seen == []
+
+def test_prediction_with_one_named_column_skips_the_llm(agent):
+    core, seen = agent
+    out = asyncio.run(core.agent_router("Train a model to predict sales", CONTEXT))
+    assert out == {"action": "PREDICTION", "target": "Sales", "source": "rules",
+                   "message": "Identified training target: Sales"}
+    assert seen == []
+
+@pytest.mark.parametrize("command", [
+    "predict sales from age",               # two columns named
+    "drop sales outliers and predict age",  # mixed intent
+    "rename the unknown column to x",       # rule matches, column does not
+])
+def test_ambiguous_commands_are_not_preclassified(agent, command):
+    core, _ = agent
+    assert core._preclassify(command, COLUMNS) is None
+
+def test_ambiguous_command_takes_one_structured_call(agent):
+    core, seen = agent
+    out = asyncio.run(core.agent_router("tidy up the sheet a bit", CONTEXT))
+    assert (out["action"], out["source"]) == ("MANIPULATION", "llm")
+    assert out["ops"] == [{"op": "drop_na", "columns": None}]
+    assert len(seen) == 1 and "Classify the user's request" in seen[0]
+
+def test_code_generation_only_when_the_answer_has_no_edit(agent, monkeypatch):
+    core, seen = agent
+    empty = json.dumps({"intent": "MANIPULATION", "target": None, "ops": [], "code": None})
+    answer_for = fake_llm_server.answer_for
+    monkeypatch.setattr(fake_llm_server, "answer_for",
+                        lambda prompt: empty if "Classify the user's request" in prompt else answer_for(prompt))
+    out = asyncio.run(core.agent_router("tidy up the sheet a bit", CONTEXT))
+    assert out["ops"] is None and out["code"] == "df = df.dropna()"
+    assert len(seen) == 2 and "Pandas Data Manipulation Expert" in seen[1]
+
+def test_plan_edit_uses_the_same_rules(agent):
+    core, seen = agent
+    assert asyncio.run(core.plan_edit("sort by age", COLUMNS, "")) == {
+        "ops": [{"op": "sort_rows", "by": [{"column": "Age", "desc": False}]}], "source": "rules"}
+    assert asyncio.run(core.plan_edit("tidy up the sheet", COLUMNS, "")) == {"ops": [{"op": "drop_na"}], "source": "llm"}
+    assert len(seen) == 1
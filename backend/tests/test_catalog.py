@@ -0,0 +1,108 @@
+import os
+import pandas as pd
+import pytest
+from backend.services.catalog import DatasetCatalog, count_csv_rows, filename_from_ref
+
+# Runs in-process: python -m pytest backend/tests/test_catalog.py
+
+def write(directory, name, df=None, mtime=None):
+    path = os.path.join(str(directory), name)
+    (df if df is not None else pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})).to_csv(path, index=False)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+@pytest.fixture
+def catalog(tmp_path):
+    write(tmp_path, "20240101_120000_sales.csv", mtime=1_000)
+    write(tmp_path, "20240301_120000_sales.csv", mtime=2_000)
+    write(tmp_path, "20240201120000_people.csv", mtime=1_500)
+    write(tmp_path, "notes.txt")
+    cat = DatasetCatalog(str(tmp_path))
+    cat.rebuild()
+    return cat
+
+def test_filename_from_ref():
+    assert filename_from_ref("http://localhost:8000/files/a.csv?x=1") == "a.csv"
+    assert filename_from_ref("C:\\data\\b.xlsx") == "b.xlsx"
+    assert filename_from_ref("c.csv") == "c.csv"
+
+def test_lookup_by_filename_url_and_alias(catalog):
+    assert catalog.get("20240101_120000_sales.csv").dataset_id == "20240101_120000_sales.csv"
+    assert catalog.get("http://localhost:8000/files/20240201120000_people.csv").dataset_id == "20240201120000_people.csv"
+    # Aliases without the upload prefix or extension point at the newest file
+    for alias in ("sales.csv", "sales", "20240101_120000_sales"):
+        assert catalog.resolve(alias) is not None
+    assert catalog.get("sales").dataset_id == "20240301_120000_sales.csv"
+    assert catalog.get("people").dataset_id == "20240201120000_people.csv"
+    assert catalog.get("notes.txt") is None and catalog.get("missing") is None
+
+def test_register_bumps_version_and_repoints_aliases(catalog, tmp_path):
+    entry = catalog.get("20240101_120000_sales.csv")
+    path = write(tmp_path, entry.dataset_id, pd.DataFrame({"a": [1, 2, 3]}), mtime=3_000)
+    df = pd.read_csv(path)
+    assert catalog.register(path, df) is entry
+    assert entry.version == 1 and entry.rows == 3 and entry.schema == {"a": "int64"}
+    assert catalog.get("sales") is entry
+
+def test_files_changed_behind_its_back_are_picked_up(catalog, tmp_path):
+    path = write(tmp_path, "extra.csv")
+    assert catalog.resolve("extra") == path
+    os.remove(path)
+    assert catalog.get("extra.csv") is None
+
+    people = catalog.get("people")
+    write(tmp_path, people.dataset_id, pd.DataFrame({"a": range(5)}), mtime=4_000)
+    write(tmp_path, "trigger.csv")              # the rescan is keyed on the directory mtime
+    assert catalog.list()["total"] == 4
+    assert catalog.get("people") is people and people.version == 1 and people.rows is None
+    assert catalog.get("20240101_120000_sales.csv").version == 0
+
+def test_in_place_overwrites_get_a_new_version(catalog, tmp_path):
+    entry = catalog.get("people")
+    entry.ensure_details()
+    # Same name, same directory listing: only the file's own stat changes
+    write(tmp_path, entry.dataset_id, pd.DataFrame({"a": range(7)}), mtime=5_000)
+    assert catalog.get("20240201120000_people.csv") is entry
+    assert entry.version == 1 and entry.rows is None
+    assert catalog.get("people").version == 1
+    entry.ensure_details()
+    assert entry.rows == 7
+
+    # Every registered write is a new version, even with an unchanged signature
+    write(tmp_path, entry.dataset_id, pd.DataFrame({"a": range(7)}), mtime=5_000)
+    assert catalog.register(entry.path).version == 2
+
+def test_list_is_paginated_newest_first(catalog):
+    page = catalog.list(offset=1, limit=1)
+    assert page["total"] == 3 and page["offset"] == 1
+    assert [f["dataset_id"] for f in page["files"]] == ["20240201120000_people.csv"]
+    assert [f["name"] for f in catalog.list()["files"]][0] == "20240301_120000_sales.csv"
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_csv_details_count_rows_without_parsing(tmp_path, trailing_newline):
+    path = write(tmp_path, "rows.csv", pd.DataFrame({"n": range(1234), "s": ["v"] * 1234}))
+    if not trailing_newline:
+        with open(path, "rb+") as f:
+            f.truncate(os.path.getsize(path) - 1)
+    cat = DatasetCatalog(str(tmp_path))
+    entry = cat.get("rows")
+    entry.ensure_details()
+    assert entry.rows == 1234 and entry.schema == {"n": "int64", "s": "str"}
+
+def test_xlsx_details(tmp_path):
+    pytest.importorskip("openpyxl")
+    path = os.path.join(str(tmp_path), "book.xlsx")
+    pd.DataFrame({"n": range(300)}).to_excel(path, index=False)
+    entry = DatasetCatalog(str(tmp_path)).get("book")
+    entry.ensure_details()
+    assert entry.rows == 300 and entry.schema == {"n": "int64"}
+
+def test_csv_rows_with_quoted_newlines(tmp_path):
+    df = pd.DataFrame({"note": ["one\nline", 'say "hi"\n\nbye', "plain", "x,\ny"], "n": range(4)})
+    path = write(tmp_path, "quoted.csv", pd.concat([df] * 100_000, ignore_index=True))
+    assert os.path.getsize(path) > 1 << 21        # quotes span several read buffers
+    assert count_csv_rows(path) == 400_000
+    entry = DatasetCatalog(str(tmp_path)).get("quoted")
+    entry.ensure_details()
+    assert entry.rows == 400_000
@@ -0,0 +1,48 @@
+import os
+import asyncio
+import hashlib
+import pytest
+from backend.services import chunked_upload
+from backend.services.chunked_upload import UploadManager, UploadError
+
+# Runs in-process (no server): python -m pytest backend/tests/test_chunked_upload.py
+
+async def body(data: bytes, block: int = 1000):
+    for i in range(0, len(data), block):
+        yield data[i:i + block]
+
+def put(manager, upload_id, offset, data):
+    return asyncio.run(manager.put_chunk(upload_id, offset, body(data)))
+
+def test_checksum_is_computed_while_receiving(tmp_path, monkeypatch):
+    data = os.urandom(300_000)
+    manager = UploadManager(str(tmp_path))
+    upload_id = manager.init("t.bin", len(data), hashlib.sha256(data).hexdigest())["upload_id"]
+    for offset in range(0, len(data), 70_000):
+        assert put(manager, upload_id, offset, data[offset:offset + 70_000])["offset"] == min(offset + 70_000, len(data))
+
+    # complete() must not re-read the file
+    monkeypatch.setattr(chunked_upload, "sha256_file", lambda path: pytest.fail("file was re-hashed"))
+    result = manager.complete(upload_id)
+    try:
+        assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    finally:
+        os.remove(result["path"])
+
+def test_resume_after_restart_and_rejected_chunk(tmp_path):
+    data = os.urandom(50_000)
+    manager = UploadManager(str(tmp_path))
+    upload_id = manager.init("t.bin", len(data), hashlib.sha256(data).hexdigest())["upload_id"]
+    put(manager, upload_id, 0, data[:20_000])
+
+    # New process: no running hash, rebuilt from the part file
+    manager = UploadManager(str(tmp_path))
+    with pytest.raises(UploadError):
+        put(manager, upload_id, 20_000, data[20_000:] + b"too long")
+    assert manager.status(upload_id)["offset"] == 20_000
+    put(manager, upload_id, 20_000, data[20_000:])
+    result = manager.complete(upload_id)
+    try:
+        assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    finally:
+        os.remove(result["path"])
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from backend.services.computed_columns import parse_definition, compute_all, recompute, ComputedColumnError
+
+# Runs in-process: python -m pytest backend/tests/test_computed_columns.py
+
+COLUMNS = ["sales", "cost"]
+
+def defs(*specs):
+    parsed = []
+    for spec in specs:
+        parsed.append(parse_definition(spec, COLUMNS + [d["name"] for d in parsed]))
+    return parsed
+
+def edit(df, row, column, value):
+    new = df.copy()
+    new.loc[row, column] = value
+    return new
+
+@pytest.mark.parametrize("expr", ["cost.values.tofile('/tmp/computed_pwn')", "sales.sum()", "sales[0]", "x = 1"])
+def test_rejects_non_whitelisted_expressions(expr):
+    with pytest.raises(ComputedColumnError):
+        parse_definition({"name": "x", "expr": expr}, COLUMNS)
+
+def test_stored_definition_is_checked_when_evaluated():
+    df = pd.DataFrame({"sales": [1.0], "cost": [2.0]})
+    stored = {"name": "x", "kind": "expr", "expr": "cost.values.tofile('/tmp/computed_pwn')", "depends_on": ["cost"]}
+    with pytest.raises(ComputedColumnError):
+        compute_all(df, [stored])
+
+def test_reductions_are_recomputed_over_all_rows():
+    columns = defs({"name": "share", "expr": "sales / sum(sales)"}, {"name": "pct", "expr": "share * 100"})
+    old = compute_all(pd.DataFrame({"sales": [10.0, 20.0, 30.0, 40.0], "cost": [1.0, 1.0, 1.0, 1.0]}), columns)
+    df, report = recompute(old, edit(old, 1, "sales", 120.0), columns)
+    assert np.allclose(df["share"], [0.05, 0.60, 0.15, 0.20])
+    assert np.allclose(df["pct"], [5.0, 60.0, 15.0, 20.0])
+    assert report == {"mode": "incremental", "columns": {"share": 4, "pct": 4}}
+
+def test_incremental_matches_full_recompute():
+    rng = np.random.default_rng(0)
+    base = pd.DataFrame({"sales": rng.uniform(1, 100, 50), "cost": rng.uniform(1, 50, 50)})
+    columns = defs(
+        {"name": "margin", "expr": "(sales - cost) / sales"},
+        {"name": "ma3", "column": "margin", "window": 3},
+        {"name": "high", "expr": "where(ma3 > mean(ma3), 1, 0)"},
+        {"name": "flag", "expr": "margin > 0.5 and not isnull(cost)"},
+    )
+    old = compute_all(base, columns)
+    new = edit(edit(old, 7, "sales", 500.0), 30, "cost", np.nan)
+    df, report = recompute(old, new, columns)
+    assert report["mode"] == "incremental"
+    assert report["columns"]["margin"] == 2
+    pd.testing.assert_frame_equal(df, compute_all(new[COLUMNS], columns), check_dtype=False)
+
+@pytest.mark.parametrize("spec", [
+    {"name": "sales", "expr": "sales * 1.1"},
+    {"name": "sales", "expr": "cost * 2"},
+    {"name": "x", "expr": "x + sales"},
+    {"name": "sales", "kind": "rolling", "column": "sales", "window": 3},
+])
+def test_definitions_cannot_overwrite_inputs_or_read_themselves(spec):
+    with pytest.raises(ComputedColumnError):
+        parse_definition(spec, COLUMNS + ["x"], computed=["x"])
+
+def test_store_allows_redefining_a_computed_column(tmp_path):
+    from backend.services.computed_columns import ComputedColumnStore
+    store = ComputedColumnStore(str(tmp_path))
+    store.save("d.csv", store.with_definition("d.csv", {"name": "margin", "expr": "sales - cost"}, COLUMNS))
+    redefined = store.with_definition("d.csv", {"name": "margin", "expr": "(sales - cost) / sales"}, COLUMNS + ["margin"])
+    assert [d["expr"] for d in redefined] == ["(sales - cost) / sales"]
+    with pytest.raises(ComputedColumnError, match="overwrite the input column"):
+        store.with_definition("d.csv", {"name": "cost", "expr": "sales * 2"}, COLUMNS + ["margin"])
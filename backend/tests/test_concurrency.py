@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import pytest
+from backend.services.concurrency import ConcurrencyManager, _acquire, _parse_limits
+
+# Runs in-process: python -m pytest backend/tests/test_concurrency.py
+
+@pytest.fixture
+def manager():
+    mgr = ConcurrencyManager(io_workers=4, cpu_workers=0, default_limit=2,
+                             limits={"slow.one": 1}, queue_timeout=0.2)
+    yield mgr
+    mgr.shutdown()
+
+def endpoint(manager, name, hold=0.05, state=None, default=None):
+    state = state if state is not None else {"active": 0, "peak": 0}
+
+    @manager.limit(name, default)
+    async def handler(i):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(hold)
+        state["active"] -= 1
+        return i
+    return handler, state
+
+def test_parse_limits():
+    assert _parse_limits("synthetic.generate=1, analytics.run=4,bad,x=0,y=z") == {
+        "synthetic.generate": 1, "analytics.run": 4, "x": 1}
+
+def test_requests_queue_up_to_the_limit(manager):
+    handler, state = endpoint(manager, "fast.two")
+
+    async def run():
+        return await asyncio.gather(*[handler(i) for i in range(6)])
+    results = asyncio.run(run())
+    assert results == list(range(6)) and state["peak"] == 2
+    stats = manager.stats()["endpoints"]["fast.two"]
+    assert stats["served"] == 6 and stats["active"] == 0 and stats["waiting"] == 0 and stats["limit"] == 2
+
+def test_overrides_and_endpoint_defaults(manager):
+    assert manager.limit_for("slow.one") == 1
+    assert manager.limit_for("other", default=5) == 5
+    assert manager.limit_for("slow.one", default=5) == 1
+    handler, state = endpoint(manager, "slow.one")
+
+    async def run():
+        return await asyncio.gather(*[handler(i) for i in range(3)])
+    asyncio.run(run())
+    assert state["peak"] == 1
+
+def test_busy_endpoints_answer_503_after_the_queue_timeout(manager):
+    handler, _ = endpoint(manager, "slow.one", hold=0.5)
+
+    async def run():
+        results = await asyncio.gather(*[handler(i) for i in range(3)])
+        # The permits of the rejected requests were not leaked: capacity is back to 1
+        assert manager._semaphore("slow.one", None)._value == 1
+        return results
+    results = asyncio.run(run())
+    assert results[0] == 0
+    assert [r.status_code for r in results[1:]] == [503, 503]
+    assert manager.stats()["endpoints"]["slow.one"]["rejected"] == 2
+
+def test_acquire_never_leaks_permits():
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        for timeout in (0, 0.001, 0.002):
+            await semaphore.acquire()
+            waiters = [asyncio.ensure_future(_acquire(semaphore, timeout)) for _ in range(20)]
+            await asyncio.sleep(timeout)
+            semaphore.release()
+            granted = sum(await asyncio.gather(*waiters))
+            for _ in range(granted):
+                semaphore.release()
+            await asyncio.sleep(0.01)
+            assert semaphore._value == 1
+        # A request cancelled while queued gives its place back too
+        await semaphore.acquire()
+        waiter = asyncio.ensure_future(_acquire(semaphore, 10))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        semaphore.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.01)
+        assert semaphore._value == 1
+    asyncio.run(run())
+
+def test_cpu_workers_zero_runs_jobs_in_io_threads(manager):
+    main = threading.get_ident()
+    # Unpicklable callables work too: nothing leaves the process
+    assert asyncio.run(manager.run_cpu(lambda x: (x * 2, threading.get_ident() != main), 21)) == (42, True)
+    assert manager.submit_cpu(sum, [1, 2, 3]).result() == 6
+    assert manager._cpu_pool is None and manager.stats()["cpu_pool_started"] is False
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from scipy.stats.contingency import association
+from backend.services.contingency import ContingencyTable, contingency_table, chi2_result
+
+# Runs in-process: python -m pytest backend/tests/test_contingency.py
+
+def make_df(n=3000, levels=(40, 25), seed=13):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, levels[0], n)
+    b = (a * 7 + rng.integers(0, 6, n)) % levels[1]
+    df = pd.DataFrame({"a": [f"k{v}" for v in a], "b": b.astype(float)})
+    df.loc[rng.choice(n, 50, replace=False), "b"] = np.nan
+    return df
+
+def chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+@pytest.mark.parametrize("size", [97, 100_000])
+def test_table_matches_crosstab(size):
+    df = make_df()
+    table = contingency_table(chunks(df, size), "a", "b")
+    ref = pd.crosstab(df["a"], df["b"])
+    pd.testing.assert_frame_equal(table.frame(), ref, check_names=False, check_index_type=False,
+                                  check_column_type=False, check_dtype=False)
+
+def test_merge_equals_one_pass():
+    df = make_df()
+    parts = [contingency_table([c], "a", "b") for c in chunks(df, 700)]
+    merged = ContingencyTable()
+    for part in parts:
+        merged.merge(part)
+    pd.testing.assert_frame_equal(merged.frame(), contingency_table([df], "a", "b").frame())
+
+def test_chi2_matches_scipy():
+    df = make_df()
+    out = chi2_result(contingency_table(chunks(df, 500), "a", "b"))
+    observed = pd.crosstab(df["a"], df["b"]).to_numpy()
+    chi2, p, dof, expected = stats.chi2_contingency(observed)
+    assert out["chi2_statistic"] == pytest.approx(chi2, rel=1e-9)
+    assert out["p_value"] == pytest.approx(p, rel=1e-6, abs=1e-300)
+    assert out["dof"] == dof
+    assert out["cramers_v"] == pytest.approx(association(observed, method="cramer"), rel=1e-9)
+    assert out["expected_below_min"] == int((expected < 5).sum())
+
+def test_two_by_two_uses_yates_correction():
+    df = pd.DataFrame({"x": list("aabbbaabab") * 5, "y": list("ccddcdcddd") * 5})
+    out = chi2_result(contingency_table([df], "x", "y"))
+    chi2, p, _, _ = stats.chi2_contingency(pd.crosstab(df["x"], df["y"]).to_numpy(), correction=True)
+    assert out["chi2_statistic"] == pytest.approx(chi2)
+    assert out["p_value"] == pytest.approx(p)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from backend.services.stat_batch import correlation_matrix, correlation_pairs, matrix_list
+
+# Runs in-process: python -m pytest backend/tests/test_correlation_matrix.py
+
+def make_values(n=2500, seed=7):
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=n)
+    values = np.column_stack([base * 1e3 + 1e7, base + rng.normal(size=n), rng.normal(size=n),
+                              -base + 0.5 * rng.normal(size=n)])
+    values[rng.choice(n, 40, replace=False), 1] = np.nan
+    values[rng.choice(n, 25, replace=False), 3] = np.nan
+    return values
+
+@pytest.mark.parametrize("block_cells", [4096, 10 ** 7])   # blocks of 1024 rows, or one block
+def test_pearson_matches_pairwise_complete_scipy(block_cells):
+    values = make_values()
+    corr = correlation_matrix(values, "pearson", block_cells=block_cells)
+    assert np.allclose(corr["r"], pd.DataFrame(values).corr().to_numpy(), atol=1e-10)
+    for i in range(4):
+        for j in range(i + 1, 4):
+            ok = ~np.isnan(values[:, i]) & ~np.isnan(values[:, j])
+            ref = stats.pearsonr(values[ok, i], values[ok, j])
+            assert corr["n"][i, j] == ok.sum()
+            assert corr["p"][i, j] == pytest.approx(ref.pvalue, rel=1e-6, abs=1e-300)
+
+def test_spearman_matches_scipy_on_complete_columns():
+    values = make_values()[:, [0, 2]]
+    corr = correlation_matrix(values, "spearman")
+    ref = stats.spearmanr(values[:, 0], values[:, 1])
+    assert corr["r"][0, 1] == pytest.approx(ref.statistic, rel=1e-9)
+    assert corr["p"][0, 1] == pytest.approx(ref.pvalue, rel=1e-6)
+
+def test_short_and_constant_columns_are_nan():
+    values = np.column_stack([np.arange(10.0), np.full(10, 3.0), [1.0, 2.0] + [np.nan] * 8])
+    r = correlation_matrix(values, min_periods=3)["r"]
+    assert np.isnan(r[0, 1]) and np.isnan(r[0, 2]) and np.isnan(r[1, 1])
+    assert r[0, 0] == 1.0
+
+def test_pairs_are_sorted_and_cut():
+    columns = ["a", "b", "c", "d"]
+    corr = correlation_matrix(make_values())
+    pairs, matched = correlation_pairs(corr, columns, threshold=0.3, top_k=2)
+    strongest = sorted(((abs(corr["r"][i, j]), columns[i], columns[j]) for i in range(4) for j in range(i + 1, 4)),
+                       reverse=True)
+    assert matched == sum(1 for s, _, _ in strongest if s >= 0.3)
+    assert [(p["col1"], p["col2"]) for p in pairs] == [(a, b) for _, a, b in strongest[:2]]
+
+def test_matrix_list_is_json_ready():
+    m = np.array([[1.0, 0.123456], [np.nan, -np.inf]])
+    assert matrix_list(m, 2) == [[1.0, 0.12], [None, None]]
+    assert matrix_list(np.array([[3, 4]])) == [[3, 4]]
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from backend.services.dataset_cache import CachedDataset
+from backend.services.edit_ops import compile_plan, apply_ops, plan_to_code, EditOpError
+
+# Runs in-process: python -m pytest backend/tests/test_edit_ops.py
+
+def make_ds():
+    df = pd.DataFrame({
+        "price": [10.0, 20.0, 30.0, 40.0],
+        "cost": [4.0, 5.0, 6.0, 7.0],
+        "unit qty": [1, 2, 0, 4],
+        "region": ["north", "south", "north", "east"],
+    })
+    return CachedDataset("memory.csv", df, (0, 0))
+
+def run(ds, *ops):
+    return apply_ops(ds, compile_plan(list(ops), [str(c) for c in ds.df.columns]))["df"]
+
+@pytest.mark.parametrize("expr", [
+    "cost.values.tofile('/tmp/edit_ops_pwn')",
+    "cost.__class__",
+    "price[0]",
+    "open('/etc/passwd')",
+    "(lambda: 1)()",
+    "price.sum()",
+    "abs(price, out=cost)",
+    "[0]*3",
+    "(1,2)+(3,)",
+    "price + [1, 2]",
+    "region in [price]",
+    "price == (1, 2)",
+])
+def test_compute_column_rejects_non_whitelisted_expressions(expr):
+    with pytest.raises(EditOpError):
+        run(make_ds(), {"op": "compute_column", "new_col": "x", "expr": expr})
+    assert not os.path.exists("/tmp/edit_ops_pwn")
+
+def test_compute_column_rejects_unknown_columns():
+    with pytest.raises(EditOpError, match="Unknown column: profit"):
+        compile_plan([{"op": "compute_column", "new_col": "x", "expr": "profit * 2"}], ["price"])
+
+def test_compute_column_evaluates_whitelisted_expressions():
+    ds = make_ds()
+    out = run(ds,
+              {"op": "compute_column", "new_col": "margin", "expr": "(price - cost) / price"},
+              {"op": "compute_column", "new_col": "per_unit", "expr": "where(`unit qty` > 0, price / `unit qty`, 0)"},
+              {"op": "compute_column", "new_col": "big_north", "expr": "price > 15 and region in ['north', 'east']"},
+              {"op": "compute_column", "new_col": "share", "expr": "margin / sum(margin)"})
+    margin = (ds.df["price"] - ds.df["cost"]) / ds.df["price"]
+    assert np.allclose(out["margin"], margin)
+    assert out["per_unit"].tolist() == [10.0, 10.0, 0.0, 10.0]
+    assert out["big_north"].tolist() == [False, False, True, True]
+    assert np.allclose(out["share"], margin / margin.sum())
+
+def test_reductions_only_see_surviving_rows():
+    out = run(make_ds(),
+              {"op": "filter_rows", "filters": [{"column": "region", "op": "eq", "value": "north"}]},
+              {"op": "compute_column", "new_col": "share", "expr": "price / sum(price)"})
+    assert out["share"].tolist() == [0.25, 0.75]
+
+def test_plan_code_matches_execution():
+    ds = make_ds()
+    ops = compile_plan([
+        {"op": "compute_column", "new_col": "per_unit", "expr": "where(`unit qty` > 0, price / `unit qty`, 0)"},
+        {"op": "compute_column", "new_col": "flag", "expr": "not (price > 15 or isnull(cost))"},
+        {"op": "compute_column", "new_col": "share", "expr": "round(price / sum(price), 2)"},
+    ], [str(c) for c in ds.df.columns])
+    code = plan_to_code(ops)
+    assert "eval" not in code
+    scope = {"df": ds.df.copy(), "np": np, "pd": pd}
+    exec(code, {}, scope)
+    pd.testing.assert_frame_equal(scope["df"], apply_ops(ds, ops)["df"], check_dtype=False)
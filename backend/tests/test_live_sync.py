@@ -0,0 +1,146 @@
+import asyncio
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from backend.services.live_sync import LiveSyncHub, compute_diff
+
+# Runs in-process: python -m pytest backend/tests/test_live_sync.py
+
+def apply_diff(old: pd.DataFrame, diff) -> pd.DataFrame:
+    """What a client does with a diff, in the order documented on compute_diff"""
+    df = old.reset_index(drop=True)
+    diff = diff or {}
+    if "order" in diff:
+        df = df.iloc[diff["order"]]
+    elif "rows_removed" in diff:
+        df = df.drop(index=df.index[diff["rows_removed"]])
+    df = df.reset_index(drop=True)
+    if "rows_added" in diff:
+        at, rows = diff["rows_added"]["at"], pd.DataFrame(diff["rows_added"]["rows"])
+        rows = rows.reindex(columns=df.columns)
+        df = pd.concat([df.iloc[:at], rows, df.iloc[at:]], ignore_index=True)
+    df = df.drop(columns=diff.get("columns_removed", []))
+    for col, values in diff.get("columns_added", {}).items():
+        df[col] = values
+    if "columns" in diff:
+        df = df[diff["columns"]]
+    for col, cells in diff.get("cells", {}).items():
+        df.loc[cells["rows"], col] = [np.nan if v is None else v for v in cells["values"]]
+    return df
+
+def make_df(n=40, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"id": np.arange(n), "name": [f"n{i % 7}" for i in range(n)],
+                         "value": rng.normal(size=n).round(3)})
+
+def edit_cells(df):
+    df = df.copy()
+    df.loc[[3, 17], "value"] = [100.0, np.nan]
+    df.loc[5, "name"] = "changed"
+    return df
+
+def insert_block(df):
+    block = pd.DataFrame({"id": [-1, -2], "name": ["x", "y"], "value": [0.5, 0.25]})
+    return pd.concat([df.iloc[:10], block, df.iloc[10:]], ignore_index=True)
+
+EDITS = {
+    "cells": edit_cells,
+    "filter": lambda df: df[df["value"] > 0],
+    "sort": lambda df: df.sort_values("value"),
+    "dedup_on_non_unique_rows": lambda df: df[["name"]].drop_duplicates(),
+    "insert_block": insert_block,
+    "delete_block": lambda df: df.drop(index=range(12, 20)),
+    "add_and_drop_columns": lambda df: df.drop(columns=["name"]).assign(double=df["value"] * 2),
+    "reorder_columns": lambda df: df[["value", "id", "name"]],
+}
+
+@pytest.mark.parametrize("edit", list(EDITS))
+def test_applying_the_diff_reproduces_the_new_frame(edit):
+    old = make_df()
+    if edit == "dedup_on_non_unique_rows":
+        old = old[["name"]]
+    new = EDITS[edit](old)
+    diff = json.loads(json.dumps(compute_diff(old, new)))     # as it travels over the socket
+    pd.testing.assert_frame_equal(apply_diff(old, diff), new.reset_index(drop=True), check_dtype=False)
+
+def test_diffs_are_compact():
+    old = make_df()
+    assert compute_diff(old, old.copy()) is None
+    assert set(compute_diff(old, edit_cells(old))) == {"cells"}
+    assert compute_diff(old, EDITS["filter"](old)).keys() == {"rows_removed"}
+    diff = compute_diff(old, insert_block(old))
+    assert diff["rows_added"]["at"] == 10 and len(diff["rows_added"]["rows"]) == 2 and "rows_removed" not in diff
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.fail:
+            raise ConnectionError("gone")
+        self.received.append(json.loads(text))
+
+def test_hub_broadcasts_versioned_diffs():
+    hub = LiveSyncHub()
+    a, b = FakeSocket(), FakeSocket()
+    old = make_df()
+
+    async def run():
+        await hub.publish("ds", None, old, edit_cells(old), 2)       # nobody subscribed yet: no-op
+        await hub.connect(a, "ds", None, 2, client_id="A")
+        await hub.connect(b, "ds", None, 2)
+        await hub.publish("ds", None, old, edit_cells(old), 3, origin="A", command="edit")
+    asyncio.run(run())
+
+    assert a.received[0] == {"type": "hello", "dataset_id": "ds", "sheet": None, "version": 2, "subscribers": 1}
+    message = b.received[-1]
+    assert message == a.received[-1]
+    assert {k: message[k] for k in ("type", "version", "base_version", "origin", "total", "command")} == {
+        "type": "diff", "version": 3, "base_version": 2, "origin": "A", "total": 40, "command": "edit"}
+    assert message["cells"]["value"] == {"rows": [3, 17], "values": [100.0, None]}
+    assert hub.stats()["subscribers"] == 2
+
+def test_clients_catch_up_from_history_or_reload():
+    hub = LiveSyncHub(history=2)
+    frames = [make_df()]
+    for i in range(4):
+        frame = frames[-1].copy()
+        frame.loc[i, "value"] = -i
+        frames.append(frame)
+    live, late, stale = FakeSocket(), FakeSocket(), FakeSocket()
+
+    async def run():
+        await hub.connect(live, "ds", None, 0)
+        for v in range(1, 5):
+            await hub.publish("ds", None, frames[v - 1], frames[v], v)
+        await hub.connect(late, "ds", None, 4, since=2)
+        await hub.handle(stale, "ds", None, {"type": "sync", "since": 1})
+        await hub.handle(stale, "ds", None, {"type": "ping"})
+    asyncio.run(run())
+
+    assert [m["version"] for m in late.received[1:]] == [3, 4]
+    df = frames[2]
+    for message in late.received[1:]:
+        df = apply_diff(df, message)
+    pd.testing.assert_frame_equal(df, frames[4])
+    assert [m["type"] for m in stale.received] == ["reload", "pong"]
+
+def test_large_diffs_and_dead_sockets():
+    hub = LiveSyncHub()
+    ok, dead = FakeSocket(), FakeSocket()
+    old = make_df()
+
+    async def run():
+        await hub.connect(ok, "ds", None, 0)
+        await hub.connect(dead, "ds", None, 0)
+        dead.fail = True
+        await hub.publish("ds", None, old, old.assign(value=old["value"] + 1, name="z"), 1)
+    asyncio.run(run())
+
+    assert ok.received[-1]["type"] == "reload" and "cells" not in ok.received[-1]
+    assert hub.subscribers("ds") == 1
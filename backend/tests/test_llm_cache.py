@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+import httpx
+import pytest
+from backend.services import agent_core
+from backend.services.llm_cache import LLMResponseCache, make_key, normalize_text, schema_signature
+from backend.services.llm_client import LLMClient, set_llm_client
+from backend.tests import fake_llm_server
+
+# Runs in-process: python -m pytest backend/tests/test_llm_cache.py
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(path=str(tmp_path / "llm.sqlite3"), ttl=3600, max_entries=3)
+
+def test_keys_ignore_whitespace_and_column_order_but_keep_case():
+    assert normalize_text("  Drop   Rows WHERE age is null. ") == "Drop Rows WHERE age is null"
+    assert schema_signature({"a": "int", "b": "str"}) == schema_signature({"b": "str", "a": "int"})
+    key = lambda cmd, **kw: make_key("plan_edit", "m", 0, 400, command=normalize_text(cmd), **kw)
+    assert key("Sort by age") == key("Sort  by age!")
+    assert key("Sort by age") != key("Sort by name")
+    assert key("keep rows where city == 'Paris'") != key("keep rows where city == 'paris'")
+    assert key("rename col to Revenue_USD") != key("rename col to revenue_usd")
+    assert key("x", schema="1") != key("x", schema="2")
+    assert make_key("plan_edit", "m", 0, 400, command="x") != make_key("plan_edit", "m", 0.3, 400, command="x")
+
+def test_hit_miss_and_saved_latency(cache):
+    assert cache.get("k") is None
+    cache.put("k", "answer", kind="plan_edit", latency_ms=250)
+    assert cache.get("k") == "answer"
+    assert cache.get("k") == "answer"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3, abs=1e-4)
+    assert stats["saved_ms"] == 500
+    assert stats["by_kind"] == {"plan_edit": {"entries": 1, "hits": 2}}
+
+def test_expired_entries_are_misses_and_purged(cache):
+    cache.put("k", "answer")
+    cache.ttl = -1          # everything stored so far is now older than the TTL
+    assert cache.get("k") is None
+    cache.ttl = 3600
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_is_evicted(cache):
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+    cache.get("a")          # "b" is now the least recently used
+    cache.put("d", "D")
+    assert cache.get("b") is None
+    assert [cache.get(k) for k in ("a", "c", "d")] == ["A", "C", "D"]
+    assert cache.stats()["evictions"] == 1
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm.sqlite3"), enabled=False)
+    cache.put("k", "answer")
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+@pytest.fixture
+def agent(cache, monkeypatch):
+    """AgentCore talking to the fake LLM server in-process, with a private cache"""
+    seen = []
+
+    async def handler(request):
+        seen.append(json.loads(request.content)["messages"][0]["content"])
+        return await asgi.handle_async_request(request)
+
+    asgi = httpx.ASGITransport(app=fake_llm_server.app)
+    monkeypatch.setattr(agent_core, "llm_cache", cache)
+    set_llm_client(LLMClient(base_url="http://fake/v1", api_key="", transport=httpx.MockTransport(handler)))
+    yield agent_core.AgentCore(), seen
+    set_llm_client(None)
+
+def test_agent_repeats_are_served_from_cache(agent, cache):
+    core, seen = agent
+    columns = {"group": "object", "value": "float64"}
+    first = asyncio.run(core.parse_stat_command("Compare value by group", columns, "sample A"))
+    again = asyncio.run(core.parse_stat_command("Compare  value by group.", columns, "sample B"))
+    assert first == again == {"test": "t-test", "params": {"group_col": "group", "value_col": "value"}, "clarify": None}
+    assert len(seen) == 1
+    assert cache.stats()["by_kind"]["parse_stat_command"] == {"entries": 1, "hits": 1}
+
+    asyncio.run(core.parse_stat_command("Compare value by group", {**columns, "extra": "int64"}, ""))
+    assert len(seen) == 2
+
+def test_invalid_answers_are_not_cached(agent, cache, monkeypatch):
+    core, seen = agent
+    monkeypatch.setattr(fake_llm_server, "answer_for", lambda prompt: "not json")
+    for _ in range(2):
+        assert "error" in asyncio.run(core.parse_stat_command("Compare value by group", {"value": "float64"}, ""))
+    assert len(seen) == 2
+    assert cache.stats()["entries"] == 0
+
+def test_cache_io_runs_off_the_event_loop(agent, cache, monkeypatch):
+    core, _ = agent
+    threads = []
+    for name in ("get", "put"):
+        method = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda *a, _m=method, **kw: threads.append(threading.current_thread()) or _m(*a, **kw))
+    asyncio.run(core.parse_stat_command("Compare value by group", {"value": "float64"}, ""))
+    assert len(threads) == 2 and threading.main_thread() not in threads
@@ -0,0 +1,109 @@
+import asyncio
+import httpx
+import pytest
+from backend.services.llm_client import LLMClient, LLMError, BACKOFF_CAP
+from backend.tests import fake_llm_server
+
+# Runs in-process: python -m pytest backend/tests/test_llm_client.py
+
+def completion(content="ok"):
+    return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": f" {content}\n"}}]})
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Records the backoff of each retry instead of sleeping"""
+    seen = []
+    backoff = LLMClient._backoff
+    monkeypatch.setattr(LLMClient, "_backoff", staticmethod(lambda attempt, retry_after=None:
+                                                            seen.append(backoff(attempt, retry_after)) or 0))
+    return seen
+
+def make_client(responses, **kwargs):
+    """Client whose transport replays `responses` (Responses or exceptions) in order"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        item = responses[min(len(requests), len(responses)) - 1]
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    return LLMClient(base_url="http://fake/v1", api_key="k", transport=httpx.MockTransport(handler), **kwargs), requests
+
+def chat(client, **kwargs):
+    async def run():
+        try:
+            return await client.chat([{"role": "user", "content": "hi"}], **kwargs)
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+def test_retries_transient_errors_then_succeeds(delays):
+    client, requests = make_client([httpx.Response(503), httpx.ReadTimeout("slow"), completion("fine")])
+    assert chat(client) == "fine"
+    assert len(requests) == 3 and client.retries == 2 and client.failures == 0
+    assert requests[0].headers["authorization"] == "Bearer k"
+    assert requests[0].url.path == "/v1/chat/completions"
+    assert len(delays) == 2
+
+def test_gives_up_after_max_retries(delays):
+    client, requests = make_client([httpx.Response(429, text="slow down")], max_retries=2)
+    with pytest.raises(LLMError, match="HTTP 429: slow down"):
+        chat(client)
+    assert len(requests) == 3 and client.failures == 1
+    assert client.stats()["retries"] == 2
+
+@pytest.mark.parametrize("response", [httpx.Response(400, text="bad request"), httpx.Response(200, json={"choices": []})])
+def test_client_errors_and_malformed_answers_are_not_retried(delays, response):
+    client, requests = make_client([response, completion()])
+    with pytest.raises(LLMError):
+        chat(client)
+    assert len(requests) == 1 and delays == []
+
+def test_retry_after_is_honoured(delays):
+    client, _ = make_client([httpx.Response(503, headers={"Retry-After": "2"}), completion()])
+    assert chat(client) == "ok"
+    assert delays == [2.0]
+
+def test_backoff_is_capped_full_jitter():
+    assert LLMClient._backoff(0, "120") == BACKOFF_CAP
+    for attempt in range(8):
+        for _ in range(50):
+            assert 0 <= LLMClient._backoff(attempt, "soon") <= min(BACKOFF_CAP, 0.5 * 2 ** attempt)
+
+def test_concurrency_is_capped_and_connections_pooled():
+    state = {"active": 0, "peak": 0}
+
+    async def handler(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        return completion()
+
+    client = LLMClient(base_url="http://fake/v1", api_key="k", transport=httpx.MockTransport(handler), max_concurrency=2)
+
+    async def run():
+        pooled = client._ensure()
+        answers = await asyncio.gather(*[client.chat([{"role": "user", "content": str(i)}]) for i in range(6)])
+        assert client._ensure() is pooled
+        await client.aclose()
+        return answers
+
+    assert asyncio.run(run()) == ["ok"] * 6
+    assert state["peak"] == 2
+
+def test_fake_server_failures_are_retried(delays, monkeypatch):
+    monkeypatch.setattr(fake_llm_server, "FAIL_EVERY", 2)
+    monkeypatch.setitem(fake_llm_server.calls, "n", 0)
+    client = LLMClient(base_url="http://fake/v1", api_key="",
+                       transport=httpx.ASGITransport(app=fake_llm_server.app))
+
+    async def run():
+        answers = [await client.chat([{"role": "user", "content": "explain"}]) for _ in range(3)]
+        await client.aclose()
+        return answers
+
+    assert asyncio.run(run()) == ["The result is statistically significant."] * 3
+    assert fake_llm_server.calls["n"] == 5 and client.retries == 2
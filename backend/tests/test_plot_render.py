@@ -0,0 +1,110 @@
+import time
+import threading
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+import pytest
+from matplotlib import cbook
+from scipy import stats
+from backend.services import plot_render
+from backend.services.plot_render import PlotRenderer, box_stats, reduce_plot, render_figure, stratified_sample
+
+# Runs in-process: python -m pytest backend/tests/test_plot_render.py
+
+def slow_render(calls):
+    """
+    submit_cpu stand-in: counts renders and holds each one long enough for callers to
+    pile up. The first render fails, so a waiting caller has to render again.
+    """
+    def submit(func, kind, data, spec):
+        calls.append(kind)
+        time.sleep(0.2)
+        future = Future()
+        if len(calls) == 1:
+            future.set_exception(RuntimeError("render failed"))
+        else:
+            future.set_result(b"image")
+        return future
+    return submit
+
+def test_identical_concurrent_plots_never_render_in_parallel(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(plot_render.concurrency, "submit_cpu", slow_render(calls))
+    renderer = PlotRenderer(directory=str(tmp_path), fmt="png")
+    data = pd.DataFrame({"a": [1, 2, 3], "b": [3, 1, 2]})
+    names = []
+
+    def ask(delay):
+        time.sleep(delay)
+        try:
+            names.append(renderer.ensure("scatter", data, {"x": "a", "y": "b"}))
+        except RuntimeError:
+            pass
+
+    # Staggered: callers keep arriving while the failed render is retried by a waiter
+    threads = [threading.Thread(target=ask, args=(i * 0.05,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["scatter", "scatter"]
+    assert len(names) == 7 and len(set(names)) == 1
+    assert renderer.failures == 1 and renderer.misses == 1 and renderer.hits == 6
+    assert renderer._key_locks == {}
+
+def make_points(n=20_000, seed=2):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=n)
+    df = pd.DataFrame({"x": x, "y": 3 * x + rng.normal(size=n), "g": rng.choice(list("abcde"), n, p=[.4, .3, .2, .05, .05])})
+    df.loc[:9, "y"] = np.nan
+    return df
+
+def test_box_stats_match_matplotlib():
+    df = make_points()
+    for box in box_stats(df, "g", "y", max_fliers=10 ** 6):
+        ref = cbook.boxplot_stats(df.loc[df["g"] == box["label"], "y"].dropna().to_numpy())[0]
+        for k in ("med", "q1", "q3", "whislo", "whishi"):
+            assert box[k] == pytest.approx(ref[k]), k
+        assert sorted(box["fliers"]) == sorted(ref["fliers"])
+
+def test_box_stats_keep_the_largest_groups_and_extreme_fliers():
+    df = make_points()
+    boxes = box_stats(df, "g", "y", max_groups=2, max_fliers=3)
+    assert [b["label"] for b in boxes] == ["a", "b"]
+    values = df.loc[df["g"] == "a", "y"].dropna()
+    extreme = values.iloc[(values - values.median()).abs().argsort()[::-1][:3]]
+    assert sorted(boxes[0]["fliers"]) == sorted(extreme)
+
+def test_stratified_sample_keeps_every_stratum():
+    strata = np.repeat([0, 1, 2, 3], [9000, 900, 90, 1])
+    keep = stratified_sample(strata, 1000)
+    assert (np.diff(keep) > 0).all()
+    counts = np.bincount(strata[keep], minlength=4)
+    assert counts.tolist() == [900, 90, 9, 1]
+    assert stratified_sample(strata[:500], 1000).tolist() == list(range(500))
+
+def test_small_or_full_plots_are_not_reduced():
+    df = make_points(100)
+    assert reduce_plot("scatter", df, {"x": "x", "y": "y"})[1] is df
+    assert reduce_plot("scatter", make_points(), {"x": "x", "y": "y", "mode": "full"})[0] == "scatter"
+
+def test_aggregate_mode_bins_every_row_and_fits_on_all_rows():
+    df = make_points()
+    kind, data, spec = reduce_plot("regplot", df, {"x": "x", "y": "y", "bins": 30})
+    ok = df.dropna()
+    ref, _, _ = np.histogram2d(ok["x"], ok["y"], bins=[data["x_edges"], data["y_edges"]])
+    assert kind == "hist2d" and data["counts"].shape == (30, 30)
+    assert np.array_equal(data["counts"], ref)
+    fit = stats.linregress(ok["x"], ok["y"])
+    assert data["line"]["y"] == pytest.approx(fit.intercept + fit.slope * data["line"]["x"])
+    assert spec["note"] == f"{len(ok):,} rows (binned)"
+    assert render_figure(kind, data, spec)[:4] == b"\x89PNG"
+
+def test_sample_mode_and_boxplots_are_bounded():
+    df = make_points()
+    kind, data, spec = reduce_plot("scatter", df, {"x": "x", "y": "y", "mode": "sample", "budget": 500})
+    assert kind == "scatter" and 500 <= len(data) <= 500 + 400 and spec["line"] is None
+    assert data["x"].max() == df["x"].max() and data["x"].min() == df["x"].min()
+    kind, data, spec = reduce_plot("boxplot", df, {"x": "g", "y": "y", "budget": 500})
+    assert kind == "bxp" and len(data) == 5
+    assert render_figure(kind, data, spec)[:4] == b"\x89PNG"
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from backend.services.profiler import (HyperLogLog, ProfileStore, profile_chunks, profile_frame,
+                                       profile_sample_text, QUANTILES)
+
+# Runs in-process: python -m pytest backend/tests/test_profiler.py
+
+def make_df(n=5000, seed=4):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "big": rng.normal(size=n) + 1e9,
+        "count": rng.integers(0, 50, n),
+        "city": rng.choice(["Oslo", "Lima", "Pune", "Nice"], n, p=[.5, .3, .15, .05]),
+    })
+    df.loc[rng.choice(n, n // 50, replace=False), "big"] = np.nan
+    return df
+
+def by_name(profile):
+    return {c["name"]: c for c in profile["columns"]}
+
+@pytest.mark.parametrize("chunk", [333, 100_000])
+def test_chunked_profile_matches_pandas(chunk):
+    df = make_df()
+    cols = by_name(profile_chunks(df.iloc[i:i + chunk] for i in range(0, len(df), chunk)))
+    big = cols["big"]
+    assert (big["count"], big["nulls"], big["dtype"]) == (5000, 100, "float64")
+    assert big["mean"] == pytest.approx(df["big"].mean(), rel=1e-15)
+    assert big["std"] == pytest.approx(df["big"].std(), rel=1e-9)
+    assert (big["min"], big["max"]) == (df["big"].min(), df["big"].max())
+    assert big["quantiles_exact"] is True
+    for key, q in QUANTILES.items():
+        assert big["quantiles"][key] == pytest.approx(df["big"].quantile(q), rel=1e-15)
+
+    count = cols["count"]
+    assert count["distinct_exact"] and count["distinct"] == df["count"].nunique()
+    assert isinstance(count["min"], int) and count["max"] == int(df["count"].max())
+
+    city = cols["city"]
+    assert (city["min"], city["max"]) == ("Lima", "Pune")
+    assert city["top_values"] == [{"value": v, "count": int(n)} for v, n in df["city"].value_counts().items()]
+
+def test_high_cardinality_uses_the_estimate():
+    n = 50_000
+    df = pd.DataFrame({"id": [f"u{i}" for i in range(n)], "x": np.random.default_rng(1).normal(size=n)})
+    cols = by_name(profile_chunks(df.iloc[i:i + 7000] for i in range(0, n, 7000)))
+    assert cols["id"]["distinct_exact"] is False and "top_values" not in cols["id"]
+    assert cols["id"]["distinct"] == pytest.approx(n, rel=0.05)
+    assert cols["x"]["quantiles_exact"] is False
+    assert cols["x"]["quantiles"]["p50"] == pytest.approx(0, abs=0.05)
+    assert cols["x"]["quantiles"]["p95"] == pytest.approx(1.645, abs=0.1)
+
+def test_hyperloglog_merge_is_the_union():
+    a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    left, right = pd.Series(np.arange(0, 30_000)), pd.Series(np.arange(20_000, 60_000))
+    a.add_series(left)
+    b.add_series(right)
+    both.add_series(pd.concat([left, right]))
+    a.merge(b)
+    assert np.array_equal(a.registers, both.registers)
+    assert a.estimate() == pytest.approx(60_000, rel=0.05)
+    small = HyperLogLog()
+    small.add_series(pd.Series(["a", "b", "c", "a", None]))
+    assert small.estimate() == 3
+
+def test_sample_text_matches_head():
+    df = make_df(20)
+    assert profile_sample_text(profile_frame(df)) == df.head(3).to_string()
+
+def test_store_persists_and_invalidates_on_change(tmp_path):
+    path = str(tmp_path / "data.csv")
+    make_df(200).to_csv(path, index=False)
+    store = ProfileStore(str(tmp_path / "profiles"))
+    assert store.get(path, compute=False) is None
+    profile = store.get(path)
+    assert profile["rows"] == 200
+    assert store.get(path) is profile
+
+    # A new process reads the persisted JSON instead of re-profiling
+    again = ProfileStore(str(tmp_path / "profiles")).get(path, compute=False)
+    assert again["rows"] == 200 and again["columns"] == profile["columns"]
+
+    make_df(50).to_csv(path, index=False)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert store.get(path, compute=False) is None
+    assert store.get(path)["rows"] == 50
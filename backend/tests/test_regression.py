@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.formula.api as smf
+from backend.services.regression import fit_regression, RegressionError
+
+# Runs in-process: python -m pytest backend/tests/test_regression.py
+
+def make_df(n=600, seed=11):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "x1": rng.normal(size=n) * 100 + 5e4,
+        "x2": rng.normal(size=n),
+        "region": rng.choice(["north", "south", "east", "west"], n),
+    })
+    effect = df["region"].map({"north": 0.0, "south": 1.5, "east": -0.7, "west": 0.2})
+    df["y"] = 0.02 * df["x1"] - 2 * df["x2"] + effect + rng.normal(size=n)
+    df["z"] = df["x2"] + rng.normal(size=n)
+    df.loc[rng.choice(n, 30, replace=False), "x2"] = np.nan
+    return df
+
+def chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+@pytest.mark.parametrize("size", [50, 10_000])
+def test_matches_statsmodels_ols(size):
+    df = make_df()
+    fit = fit_regression(chunks(df, size), ["y", "z"], ["x1", "x2", "region"])
+    for target in ("y", "z"):
+        ref = smf.ols(f"{target} ~ x1 + x2 + C(region)", data=df.dropna()).fit()
+        res = fit["targets"][target]
+        assert fit["n"] == int(ref.nobs)
+        for name, ref_name in [("Intercept", "Intercept"), ("x1", "x1"), ("x2", "x2"),
+                               ("region[south]", "C(region)[T.south]"), ("region[west]", "C(region)[T.west]")]:
+            coef = res["coefficients"][name]
+            assert coef["coef"] == pytest.approx(ref.params[ref_name], rel=1e-6, abs=1e-9)
+            assert coef["std_err"] == pytest.approx(ref.bse[ref_name], rel=1e-6)
+            assert coef["p_value"] == pytest.approx(ref.pvalues[ref_name], rel=1e-5, abs=1e-300)
+        assert res["r_squared"] == pytest.approx(ref.rsquared, rel=1e-8)
+        assert res["f_statistic"] == pytest.approx(ref.fvalue, rel=1e-6)
+        assert res["aic"] == pytest.approx(ref.aic, rel=1e-8)
+    assert fit["reference_levels"] == {"region": "east"}
+
+def test_levels_first_seen_in_later_chunks():
+    df = make_df().sort_values("region", kind="stable")
+    fit = fit_regression(chunks(df, 100), ["y"], ["x1", "region"])
+    ref = smf.ols("y ~ x1 + C(region)", data=df).fit()
+    assert fit["targets"]["y"]["coefficients"]["region[west]"]["coef"] == pytest.approx(
+        ref.params["C(region)[T.west]"], rel=1e-6)
+
+def test_collinear_feature_is_reported_as_aliased():
+    df = make_df().dropna()
+    df["x3"] = 2 * df["x2"]
+    fit = fit_regression([df], ["y"], ["x2", "x3"])
+    assert fit["aliased"] == ["x3"]
+    assert fit["targets"]["y"]["coefficients"]["x3"]["aliased"] is True
+
+def test_too_many_levels():
+    df = make_df()
+    with pytest.raises(RegressionError, match="more than 3 levels"):
+        fit_regression([df], ["y"], ["region"], max_levels=3)
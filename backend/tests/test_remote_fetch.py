@@ -0,0 +1,126 @@
+import io
+import os
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import pytest
+import requests
+from backend.services.remote_fetch import RemoteFetcher, detect_format, sniff_file
+
+# Runs in-process: python -m pytest backend/tests/test_remote_fetch.py
+
+class Files:
+    """What the local server serves: path -> (body, headers); plus a request log"""
+
+    def __init__(self):
+        self.files = {}
+        self.fail = {}
+        self.requests = []
+        self.ports = set()
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"      # keep-alive
+
+    def do_GET(self):
+        state = self.server.state
+        state.requests.append((self.path, dict(self.headers)))
+        state.ports.add(self.client_address[1])
+        if state.fail.get(self.path, 0) > 0:
+            state.fail[self.path] -= 1
+            return self._send(503, b"busy")
+        if self.path not in state.files:
+            return self._send(404, b"missing")
+        body, headers = state.files[self.path]
+        etag, modified = headers.get("ETag"), headers.get("Last-Modified")
+        if (etag and self.headers.get("If-None-Match") == etag) or \
+                (not etag and modified and self.headers.get("If-Modified-Since") == modified):
+            return self._send(304, b"", headers)
+        self._send(200, body, headers)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.state = Files()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.state, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def fetcher(tmp_path):
+    return RemoteFetcher(directory=str(tmp_path / "remote"), timeout=5)
+
+CSV = b"a,b\n1,x\n2,y\n"
+
+def test_repeat_fetch_is_one_conditional_request(server, fetcher):
+    state, base = server
+    state.files["/data.csv"] = (CSV, {"ETag": '"v1"'})
+    first = fetcher.fetch(base + "/data.csv")
+    assert first["status"] == "downloaded" and first["format"] == "csv" and first["size"] == len(CSV)
+    assert first["sha256"] == hashlib.sha256(CSV).hexdigest()
+    assert os.path.basename(first["path"]) == first["sha256"] + ".csv"
+    with open(first["path"], "rb") as f:
+        assert f.read() == CSV
+
+    second = fetcher.fetch(base + "/data.csv")
+    assert second["status"] == "not_modified" and second["path"] == first["path"]
+    assert state.requests[-1][1]["If-None-Match"] == '"v1"'
+    assert fetcher.stats() == {"downloads": 1, "not_modified": 1, "bytes_downloaded": len(CSV)}
+    assert len(state.ports) == 1           # the pooled connection was reused
+
+def test_last_modified_and_changed_content(server, fetcher):
+    state, base = server
+    state.files["/lm.csv"] = (CSV, {"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    first = fetcher.fetch(base + "/lm.csv")
+    assert fetcher.fetch(base + "/lm.csv")["status"] == "not_modified"
+
+    state.files["/lm.csv"] = (CSV + b"3,z\n", {"Last-Modified": "Tue, 02 Jan 2024 00:00:00 GMT"})
+    changed = fetcher.fetch(base + "/lm.csv")
+    assert changed["status"] == "downloaded" and changed["path"] != first["path"]
+
+    # A second URL with identical content shares the blob
+    state.files["/copy.csv"] = (CSV, {})
+    assert fetcher.fetch(base + "/copy.csv")["path"] == first["path"]
+
+def test_missing_blob_forces_a_full_download(server, fetcher):
+    state, base = server
+    state.files["/data.csv"] = (CSV, {"ETag": '"v1"'})
+    os.remove(fetcher.fetch(base + "/data.csv")["path"])
+    again = fetcher.fetch(base + "/data.csv")
+    assert again["status"] == "downloaded" and os.path.exists(again["path"])
+    assert "If-None-Match" not in state.requests[-1][1]
+
+def test_transient_errors_are_retried_and_others_raise(server, fetcher):
+    state, base = server
+    state.files["/flaky.csv"] = (CSV, {})
+    state.fail["/flaky.csv"] = 1
+    assert fetcher.fetch(base + "/flaky.csv")["status"] == "downloaded"
+    assert len(state.requests) == 2
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch(base + "/nope.csv")
+
+def test_format_from_magic_bytes(server, fetcher, tmp_path):
+    pytest.importorskip("openpyxl")
+    state, base = server
+    book = io.BytesIO()
+    pd.DataFrame({"a": [1, 2]}).to_excel(book, index=False)
+    state.files["/book"] = (book.getvalue(), {})
+    got = fetcher.fetch(base + "/book")
+    assert got["format"] == "xlsx" and got["path"].endswith(".xlsx") and sniff_file(got["path"]) == "xlsx"
+    assert pd.read_excel(got["path"])["a"].tolist() == [1, 2]
+    assert detect_format(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1rest") == "xls"
+    assert detect_format(b"PAR1\x15\x04") == "parquet"
+    assert detect_format(b"PK") == "csv"
@@ -0,0 +1,76 @@
+import collections
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from backend.services import resampling
+from backend.services.resampling import resample_test, _random_subsets
+
+# Runs in-process: python -m pytest backend/tests/test_resampling.py
+
+def groups(n=400, shift=0.3, seed=1):
+    rng = np.random.default_rng(seed)
+    g = rng.integers(0, 2, n)
+    return pd.DataFrame({"g": g, "v": rng.normal(size=n) + shift * g})
+
+def test_random_subsets_are_uniform_with_exact_size():
+    rng = np.random.default_rng(0)
+    sel = _random_subsets(rng, 5, 2, 50_000)
+    assert (sel.sum(axis=1) == 2).all()
+    counts = collections.Counter(tuple(np.flatnonzero(row)) for row in sel)
+    assert len(counts) == 10
+    assert stats.chisquare(list(counts.values())).pvalue > 0.001
+    assert (_random_subsets(rng, 200_000, 70_000, 3).sum(axis=1) == 70_000).all()
+
+@pytest.mark.parametrize("statistic, func", [("mean_diff", np.mean), ("median_diff", np.median)])
+def test_permutation_matches_scipy(statistic, func):
+    df = groups()
+    a, b = df.loc[df.g == 0, "v"].to_numpy(), df.loc[df.g == 1, "v"].to_numpy()
+    ours = resample_test(df, "permutation", statistic, {"group_col": "g", "value_col": "v", "groups": [0, 1]},
+                         n_resamples=4000, workers=1)
+    ref = stats.permutation_test((a, b), lambda x, y: func(x) - func(y), n_resamples=4000, random_state=0)
+    assert ours["estimate"] == pytest.approx(ref.statistic)
+    assert ours["p_value"] == pytest.approx(ref.pvalue, abs=0.02)
+    assert ours["null_std"] == pytest.approx(np.std(ref.null_distribution), rel=0.1)
+
+def test_bootstrap_ci_matches_scipy():
+    rng = np.random.default_rng(2)
+    x = rng.normal(size=300)
+    df = pd.DataFrame({"x": x, "y": 0.5 * x + rng.normal(size=300)})
+    ours = resample_test(df, "bootstrap", "correlation", {"col1": "x", "col2": "y"}, n_resamples=4000, workers=1)
+    ref = stats.bootstrap((df.x.to_numpy(), df.y.to_numpy()), lambda a, b: stats.pearsonr(a, b)[0],
+                          paired=True, vectorized=False, n_resamples=1000, method="percentile", random_state=0)
+    assert ours["ci"] == pytest.approx([ref.confidence_interval.low, ref.confidence_interval.high], abs=0.03)
+
+def test_pool_gives_the_same_answer_as_inline(monkeypatch):
+    monkeypatch.setattr(resampling, "RESAMPLE_POOL_MIN_WORK", 0)
+    monkeypatch.setattr(resampling.concurrency, "cpu_workers", 2)
+    df = groups(2000)
+    params = {"group_col": "g", "value_col": "v"}
+    inline = resample_test(df, "permutation", "median_diff", params, n_resamples=1000, workers=1)
+    pooled = resample_test(df, "permutation", "median_diff", params, n_resamples=1000, workers=2)
+    assert pooled == inline
+
+@pytest.mark.parametrize("method, statistic, params", [
+    ("bootstrap", "mean_diff", {"group_col": "g", "value_col": "v"}),
+    ("bootstrap", "median_diff", {"group_col": "g", "value_col": "v"}),
+    ("permutation", "mean_diff", {"group_col": "g", "value_col": "v"}),
+    ("bootstrap", "correlation", {"col1": "g", "col2": "v"}),
+])
+def test_big_jobs_use_the_pool(monkeypatch, method, statistic, params):
+    submits = []
+
+    def submit(func, *args):
+        submits.append(func)
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+    monkeypatch.setattr(resampling, "RESAMPLE_POOL_MIN_WORK", 1)
+    monkeypatch.setattr(resampling.concurrency, "cpu_workers", 4)
+    monkeypatch.setattr(resampling.concurrency, "submit_cpu", submit)
+    df = groups()
+    pooled = resample_test(df, method, statistic, params, n_resamples=4000, workers=4)
+    assert len(submits) == 4
+    assert pooled == resample_test(df, method, statistic, params, n_resamples=4000, workers=1)
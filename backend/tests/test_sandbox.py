@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+from backend.services.sandbox import SandboxPool, SandboxError, SandboxTimeout
+
+# Runs in-process (starts its own workers): python -m pytest backend/tests/test_sandbox.py
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1, timeout=3, memory_mb=512)
+    yield pool
+    pool.shutdown()
+
+def test_runs_snippet(pool):
+    out = pool.run("df['b'] = df['a'] * 2", pd.DataFrame({"a": [1, 2, 3]}))
+    assert out["b"].tolist() == [2, 4, 6]
+
+def test_errors_are_reported_and_worker_reused(pool):
+    with pytest.raises(SandboxError, match="KeyError"):
+        pool.run("df = df['missing']", pd.DataFrame({"a": [1]}))
+    assert pool.run("df = df + 1", pd.DataFrame({"a": [1]}))["a"].tolist() == [2]
+
+def test_timeout_replaces_worker(pool):
+    with pytest.raises(SandboxTimeout):
+        pool.run("while True: pass", pd.DataFrame({"a": [1]}), timeout=1)
+    # The replacement worker comes from the fork server, not a fork of this process
+    out = pool.run("import threading\ndf = pd.DataFrame({'threads': [threading.active_count()]})", pd.DataFrame())
+    assert out["threads"].tolist() == [1]
@@ -0,0 +1,74 @@
+import io
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from backend.services import dataset_cache, profiler, sheet_export
+from backend.services.sheet_export import stream_parquet, parquet_schema
+
+# Runs in-process: python -m pytest backend/tests/test_sheet_export.py
+
+def test_parquet_stream_mixed_types_across_chunks(tmp_path):
+    """A column that turns to text after the first chunk must not truncate the stream."""
+    src = tmp_path / "mixed.csv"
+    src.write_text("a,b,c\n1,1,x\n2,2,y\nz,2.5,\n4,3,w\n5,4,v\n")
+
+    schema = parquet_schema(str(src), chunksize=2)
+    assert str(schema.field("a").type) == "string"
+    assert str(schema.field("b").type) == "double"
+
+    data = b"".join(stream_parquet(str(src), chunksize=2))
+    df = pq.read_table(io.BytesIO(data)).to_pandas()
+    assert len(df) == 5
+    assert df["a"].tolist() == ["1", "2", "z", "4", "5"]
+    assert df["b"].tolist() == [1.0, 2.0, 2.5, 3.0, 4.0]
+    assert df["c"].isna().tolist() == [False, False, True, False, False]
+
+def test_parquet_stream_round_trip(tmp_path):
+    src = tmp_path / "plain.csv"
+    expected = pd.DataFrame({"id": range(10), "value": [i * 0.5 for i in range(10)]})
+    expected.to_csv(src, index=False)
+
+    data = b"".join(stream_parquet(str(src), chunksize=3))
+    df = pq.read_table(io.BytesIO(data)).to_pandas()
+    pd.testing.assert_frame_equal(df, expected)
+
+@pytest.fixture
+def no_scan(tmp_path, monkeypatch):
+    """Fresh profile and sidecar stores; a pre-scan of the source fails the test"""
+    monkeypatch.setattr(profiler, "profile_store", profiler.ProfileStore(str(tmp_path / "profiles")))
+    monkeypatch.setattr(dataset_cache, "SIDECAR_DIR", str(tmp_path / "sidecars"))
+    scans = []
+    column_type = sheet_export._column_type
+    monkeypatch.setattr(sheet_export, "_column_type", lambda s: scans.append(s.name) or column_type(s))
+    return scans
+
+def test_parquet_schema_from_the_sidecar(tmp_path, no_scan):
+    src = tmp_path / "data.csv"
+    src.write_text("a,b\n1,x\n2,y\n")
+    sidecar = dataset_cache.sidecar_path(str(src))
+    os.makedirs(os.path.dirname(sidecar))
+    pd.read_csv(src).to_parquet(sidecar)
+    schema = parquet_schema(str(src), chunksize=1)
+    assert str(schema.field("a").type) == "int64" and "string" in str(schema.field("b").type)
+    assert no_scan == []
+
+def test_parquet_schema_from_the_profile(tmp_path, no_scan):
+    src = tmp_path / "profiled.csv"
+    src.write_text("a,b,c\n1,x,\n2,y,2.5\n3,z,\n")
+    profiler.profile_store.get(str(src))
+    schema = parquet_schema(str(src), chunksize=1)
+    assert [str(f.type) for f in schema] == ["int64", "string", "double"]
+    assert no_scan == []
+    df = pq.read_table(io.BytesIO(b"".join(stream_parquet(str(src), chunksize=1)))).to_pandas()
+    assert df["a"].tolist() == [1, 2, 3] and df["b"].tolist() == ["x", "y", "z"]
+
+def test_ambiguous_profiles_fall_back_to_the_scan(tmp_path, no_scan):
+    src = tmp_path / "mixed.csv"
+    src.write_text("a,b\n1,1\n2,2\nz,2.5\n")
+    profile = profiler.profile_store.get(str(src))
+    assert profiler.profile_dtypes(profile) == {"a": "str", "b": "float64"}
+    # Profiled with other chunk boundaries, "a" is int64 in one chunk and text in another
+    profiler.profile_store.store(str(src), profiler.profile_chunks(pd.read_csv(src, chunksize=2)))
+    schema = parquet_schema(str(src), chunksize=2)
+    assert str(schema.field("a").type) == "string" and no_scan
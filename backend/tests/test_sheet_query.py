@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from backend.services.dataset_cache import CachedDataset
+from backend.services.sheet_query import run_query, QueryError
+
+# Runs in-process: python -m pytest backend/tests/test_sheet_query.py
+
+def make_ds():
+    df = pd.DataFrame({
+        "num": [1.0, np.nan, 3.0, 4.0, np.nan],
+        "text": ["a", None, "c", "d", "b"],
+    })
+    return CachedDataset("memory.csv", df, (0, 0))
+
+def total(ds, *filters):
+    return run_query(ds, filters=list(filters))["total"]
+
+def test_null_equality_matches_missing_cells():
+    ds = make_ds()
+    for column, missing in (("num", 2), ("text", 1)):
+        assert total(ds, {"column": column, "op": "eq", "value": None}) == missing
+        assert total(ds, {"column": column, "op": "ne", "value": None}) == 5 - missing
+
+def test_in_with_null():
+    ds = make_ds()
+    assert total(ds, {"column": "num", "op": "in", "value": [3, None]}) == 3
+    assert total(ds, {"column": "num", "op": "not_in", "value": [3, None]}) == 2
+    assert total(ds, {"column": "text", "op": "in", "value": ["a", None]}) == 2
+    assert total(ds, {"column": "text", "op": "not_in", "value": ["a", None]}) == 3
+
+def test_bad_range_values_are_query_errors():
+    ds = make_ds()
+    for spec in ({"column": "text", "op": "between", "value": "a"},
+                 {"column": "num", "op": "between", "value": [1]},
+                 {"column": "num", "op": "gt", "value": None},
+                 {"column": "text", "op": "gt", "value": 5}):
+        with pytest.raises(QueryError):
+            total(ds, spec)
+
+def test_bad_date_values_are_query_errors():
+    ds = CachedDataset("memory.csv", pd.DataFrame({"day": pd.to_datetime(["2024-01-01", "2024-02-01", "2024-03-01"])}), (0, 0))
+    assert total(ds, {"column": "day", "op": "gt", "value": "2024-01-15"}) == 2
+    for value in ("not a date", ["2024-01-01"], {"y": 2024}):
+        with pytest.raises(QueryError, match="unparseable"):
+            total(ds, {"column": "day", "op": "gt", "value": value})
+
+def test_categorical_between():
+    ds = make_ds()
+    assert total(ds, {"column": "text", "op": "between", "value": ["b", "c"]}) == 2
+    assert total(ds, {"column": "text", "op": "between", "value": ["b", None]}) == 3
@@ -0,0 +1,39 @@
+import os
+import pandas as pd
+import pytest
+from backend.routers import sheets
+from backend.services.catalog import DatasetCatalog
+from backend.services.computed_columns import ComputedColumnStore
+
+# Runs in-process: python -m pytest backend/tests/test_sheet_writes.py
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    pytest.importorskip("openpyxl")
+    monkeypatch.setattr(sheets, "catalog", DatasetCatalog(str(tmp_path)))
+    monkeypatch.setattr(sheets, "computed_store", ComputedColumnStore(str(tmp_path / "computed")))
+    path = str(tmp_path / "book.xlsx")
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame({"price": [10.0, 20.0], "qty": [1, 2]}).to_excel(writer, sheet_name="data", index=False)
+        pd.DataFrame({"key": ["seed"], "value": [42]}).to_excel(writer, sheet_name="metadata", index=False)
+    return path
+
+def test_edits_keep_the_other_sheets(workbook):
+    old = pd.read_excel(workbook, sheet_name="data")
+    entry, df, recomputed = sheets._save_edit(workbook, old, old.iloc[:1])
+    assert recomputed is None and entry.rows == 1
+    book = pd.read_excel(workbook, sheet_name=None)
+    assert list(book) == ["data", "metadata"]
+    assert len(book["data"]) == 1 and book["metadata"]["value"].tolist() == [42]
+
+def test_edits_update_computed_columns(workbook):
+    dataset_id = os.path.basename(workbook)
+    old = pd.read_excel(workbook, sheet_name="data")
+    defs = sheets.computed_store.with_definition(dataset_id, {"name": "total", "expr": "price * qty"}, list(old.columns))
+    sheets.computed_store.save(dataset_id, defs)
+    old = old.assign(total=old["price"] * old["qty"])
+
+    edited = old.assign(qty=[1, 5])
+    entry, df, recomputed = sheets._save_edit(workbook, old, edited)
+    assert recomputed == {"mode": "incremental", "columns": {"total": 1}}
+    assert pd.read_excel(workbook, sheet_name="data")["total"].tolist() == [10.0, 100.0]
@@ -1,6 +1,7 @@
 import requests
 import pandas as pd
 import os
+import io
 import time
 
 BASE_URL = "http://localhost:8000"
@@ -47,7 +48,181 @@ def test_sheets_api():
     
     print("Sheets API passed!")
 
+def test_sheets_query():
+    print("Testing /query...")
+    filename = "test_sheet.xlsx"
+    
+    payload = {
+        "url": filename,
+        "filters": [{"column": "id", "op": "gte", "value": 2}],
+        "sort": [{"column": "name", "desc": True}],
+        "limit": 10
+    }
+    r = requests.post(f"{BASE_URL}/sheets/query", json=payload)
+    assert r.status_code == 200, f"Query failed: {r.text}"
+    data = r.json()
+    print("Query Response:", data)
+    assert data["total"] == 2
+    assert data["rows"][0]["name"] == "Charlie"
+    
+    r = requests.post(f"{BASE_URL}/sheets/query", json={"url": filename, "search": "ali"})
+    assert r.json()["total"] == 1
+    
+    r = requests.post(f"{BASE_URL}/sheets/query", json={"url": filename, "filters": [{"column": "missing", "op": "eq", "value": 1}]})
+    assert r.status_code == 400
+    
+    print("Sheets query passed!")
+
+def test_sheets_export():
+    print("Testing /export...")
+    filename = "test_sheet.xlsx"
+    
+    for fmt in ["xlsx", "csv", "parquet"]:
+        r = requests.get(f"{BASE_URL}/sheets/export/{fmt}/{filename}", stream=True)
+        assert r.status_code == 200, f"Export {fmt} failed: {r.text}"
+        content = r.content
+        
+        if fmt == "xlsx":
+            df = pd.read_excel(io.BytesIO(content))
+        elif fmt == "csv":
+            df = pd.read_csv(io.BytesIO(content))
+        else:
+            df = pd.read_parquet(io.BytesIO(content))
+        print(f"Export {fmt}: {len(df)} rows")
+        assert "name" in df.columns
+    
+    r = requests.get(f"{BASE_URL}/sheets/export/pdf/{filename}")
+    assert r.status_code == 400
+    
+    print("Sheets export passed!")
+
+def test_sheets_apply_ops():
+    print("Testing /apply-ops and /replay...")
+    source = "test_ops.csv"
+    target = "test_ops_next.csv"
+    df = pd.DataFrame({"id": [1, 2, 3, 4], "price": [10.0, None, 30.0, 40.0], "qty": [1, 2, 3, 0]})
+    df.to_csv(os.path.join(GENERATED_DIR, source), index=False)
+    df.to_csv(os.path.join(GENERATED_DIR, target), index=False)
+    
+    ops = [
+        {"op": "fill_na", "column": "price", "method": "value", "value": 0},
+        {"op": "compute_column", "new_col": "total", "expr": "price * qty"},
+        {"op": "filter_rows", "filters": [{"column": "qty", "op": "gt", "value": 0}]}
+    ]
+    r = requests.post(f"{BASE_URL}/sheets/apply-ops", json={"url": source, "ops": ops})
+    assert r.status_code == 200, f"Apply ops failed: {r.text}"
+    assert r.json()["rows_after"] == 3
+    
+    r = requests.post(f"{BASE_URL}/sheets/apply-ops", json={"url": source, "ops": [{"op": "delete_column", "columns": ["missing"]}]})
+    assert r.status_code == 400
+    
+    r = requests.get(f"{BASE_URL}/sheets/journal/{source}")
+    assert r.json()["total"] >= 1
+    
+    # Same edits on another file, no LLM involved
+    r = requests.post(f"{BASE_URL}/sheets/replay", json={"url": target, "source": source})
+    assert r.status_code == 200, f"Replay failed: {r.text}"
+    replayed = pd.read_csv(os.path.join(GENERATED_DIR, target))
+    assert list(replayed["total"]) == [10.0, 0.0, 90.0]
+    
+    print("Sheets apply-ops passed!")
+
+def test_sheets_wire_formats():
+    print("Testing /load wire formats...")
+    filename = "test_sheet.xlsx"
+    
+    r = requests.post(f"{BASE_URL}/sheets/load", json={"url": filename},
+                      headers={"Accept": "application/vnd.mcp.columns+json"})
+    assert r.status_code == 200, f"Columnar load failed: {r.text}"
+    data = r.json()
+    assert data["total"] == len(data["data"]["id"]["values"])
+    
+    r = requests.post(f"{BASE_URL}/sheets/load", json={"url": filename},
+                      headers={"Accept": "application/vnd.apache.arrow.stream"})
+    assert r.status_code == 200
+    import pyarrow as pa
+    table = pa.ipc.open_stream(r.content).read_all()
+    assert "name" in table.column_names
+    
+    print("Sheets wire formats passed!")
+
+def test_sheets_multi_sheet():
+    print("Testing multi-sheet workbooks...")
+    filename = "test_workbook.xlsx"
+    filepath = os.path.join(GENERATED_DIR, filename)
+    with pd.ExcelWriter(filepath) as writer:
+        pd.DataFrame({"x": [1, 2, 3]}).to_excel(writer, sheet_name="data", index=False)
+        pd.DataFrame({"column": ["x"], "desc": ["a number"]}).to_excel(writer, sheet_name="metadata", index=False)
+    
+    r = requests.get(f"{BASE_URL}/sheets/{filename}/sheets")
+    assert r.json()["sheets"] == ["data", "metadata"]
+    
+    r = requests.post(f"{BASE_URL}/sheets/load", json={"url": filename, "sheet": "metadata"})
+    assert r.status_code == 200, f"Load failed: {r.text}"
+    assert r.json()["rows"] == [{"column": "x", "desc": "a number"}]
+    
+    r = requests.post(f"{BASE_URL}/sheets/load", json={"url": filename, "sheet": "missing"})
+    assert r.status_code == 404
+    
+    # Saving one sheet keeps the others
+    r = requests.post(f"{BASE_URL}/sheets/save", json={"url": filename, "sheet": "data", "rows": [{"x": 9}]})
+    assert r.status_code == 200
+    assert pd.read_excel(filepath, sheet_name="metadata").shape == (1, 2)
+    
+    print("Multi-sheet workbooks passed!")
+
+def test_sheets_computed_columns():
+    print("Testing computed columns...")
+    filename = "test_computed.csv"
+    filepath = os.path.join(GENERATED_DIR, filename)
+    pd.DataFrame({"price": [10.0, 20.0, 40.0], "cost": [5.0, 5.0, 10.0]}).to_csv(filepath, index=False)
+    
+    r = requests.post(f"{BASE_URL}/sheets/computed",
+                      json={"url": filename, "definition": {"name": "margin", "expr": "(price - cost) / price"}})
+    assert r.status_code == 200, f"Define failed: {r.text}"
+    r = requests.post(f"{BASE_URL}/sheets/computed",
+                      json={"url": filename, "definition": {"name": "high", "expr": "margin > 0.6"}})
+    assert [d["name"] for d in r.json()["definitions"]] == ["margin", "high"]
+    
+    # Editing one input cell recomputes only that row, through both derived columns
+    rows = pd.read_csv(filepath).to_dict(orient="records")
+    rows[0]["cost"] = 1.0
+    r = requests.post(f"{BASE_URL}/sheets/save", json={"url": filename, "rows": rows})
+    assert r.json()["recomputed"] == {"mode": "incremental", "columns": {"margin": 1, "high": 1}}
+    saved = pd.read_csv(filepath)
+    assert abs(saved.loc[0, "margin"] - 0.9) < 1e-9 and bool(saved.loc[0, "high"])
+    
+    print("Computed columns passed!")
+
+def test_sheets_save_invalidates_results():
+    print("Testing analytics result cache invalidation...")
+    filename = "test_result_cache.csv"
+    filepath = os.path.join(GENERATED_DIR, filename)
+    pd.DataFrame({"a": [1.0, 2.0, 3.0, 4.0], "b": [2.0, 4.0, 5.0, 9.0]}).to_csv(filepath, index=False)
+    body = {"dataset_id": filename, "test": "pearson", "params": {"col1": "a", "col2": "b"}}
+    
+    requests.post(f"{BASE_URL}/analytics/run", json=body)
+    r = requests.post(f"{BASE_URL}/analytics/run", json=body)
+    assert r.json()["cache"]["status"] == "hit", r.text
+    
+    # An edit through /sheets/save makes the next run recompute on the new version
+    rows = pd.read_csv(filepath).to_dict(orient="records")
+    rows[3]["b"] = -9.0
+    requests.post(f"{BASE_URL}/sheets/save", json={"url": filename, "rows": rows})
+    r = requests.post(f"{BASE_URL}/analytics/run", json=body)
+    assert r.json()["cache"]["status"] == "miss", r.text
+    assert r.json()["results"]["correlation"] < 0.5
+    
+    print("Result cache invalidation passed!")
+
 if __name__ == "__main__":
     # Wait for server if needed
     time.sleep(2)
     test_sheets_api()
+    test_sheets_query()
+    test_sheets_export()
+    test_sheets_apply_ops()
+    test_sheets_wire_formats()
+    test_sheets_multi_sheet()
+    test_sheets_computed_columns()
+    test_sheets_save_invalidates_results()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from statsmodels.stats.multitest import multipletests
+from backend.services.stat_batch import run_batch, expand_specs, adjust_pvalues
+
+# Runs in-process: python -m pytest backend/tests/test_stat_batch.py
+
+def make_df(n=300, seed=5):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "group": rng.choice(["a", "b", "c"], n),
+        "flag": rng.choice(["yes", "no"], n),
+        "target": rng.normal(size=n),
+    })
+    for i in range(4):
+        df[f"v{i}"] = rng.normal(size=n) * 10 ** i + 1e5 + 0.3 * i * df["target"]
+        df.loc[rng.choice(n, 15, replace=False), f"v{i}"] = np.nan
+    return df
+
+@pytest.mark.parametrize("method", ["bonferroni", "holm", "fdr_bh", "fdr_by"])
+def test_adjust_pvalues_matches_statsmodels(method):
+    p = np.random.default_rng(0).uniform(0, 0.2, 40)
+    p[[3, 17]] = np.nan
+    ours = adjust_pvalues(p, method)
+    valid = np.isfinite(p)
+    assert np.isnan(ours[~valid]).all()
+    assert np.allclose(ours[valid], multipletests(p[valid], method=method)[1])
+
+def test_batched_tests_match_scipy():
+    df = make_df()
+    values = [f"v{i}" for i in range(4)]
+    specs = expand_specs(df, [], group_col="flag", target_col="target", columns=values)
+    specs += [{"test": "anova", "params": {"group_col": "group", "value_col": c}} for c in values]
+    results = run_batch(df, specs, adjust="holm")
+
+    raw = []
+    for res in results:
+        params = res["spec"]["params"]
+        if res["test"] == "t-test":
+            g = {k: v.dropna() for k, v in df.groupby("flag")[params["value_col"]]}
+            ref = stats.ttest_ind(g[res["group1"]], g[res["group2"]], equal_var=False)
+            assert res["t_statistic"] == pytest.approx(ref.statistic, rel=1e-8)
+        elif res["test"] == "anova":
+            ref = stats.f_oneway(*[v.dropna() for _, v in df.groupby("group")[params["value_col"]]])
+            assert res["f_statistic"] == pytest.approx(ref.statistic, rel=1e-8)
+        else:
+            pair = df[[params["col1"], params["col2"]]].dropna()
+            ref = stats.pearsonr(pair.iloc[:, 0], pair.iloc[:, 1])
+            assert res["correlation"] == pytest.approx(ref.statistic, rel=1e-8)
+            assert res["n"] == len(pair)
+        assert res["p_value"] == pytest.approx(ref.pvalue, rel=1e-6)
+        raw.append(ref.pvalue)
+    assert [r["p_adjusted"] for r in results] == pytest.approx(list(multipletests(raw, method="holm")[1]), rel=1e-6)
+
+def test_unbatched_tests_use_the_fallback():
+    df = make_df()
+    calls = []
+    results = run_batch(df, [{"test": "chi2", "params": {"col1": "group", "col2": "flag"}},
+                             {"test": "t-test", "params": {"group_col": "flag"}}],
+                        fallback=lambda test, params, frame: calls.append(test) or {"test": test, "p_value": 0.01})
+    assert calls == ["chi2"]
+    assert results[0]["significant"] is True
+    assert "error" in results[1]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from backend.services.stream_stats import stream_test
+
+# Runs in-process: python -m pytest backend/tests/test_stream_stats.py
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    rng = np.random.default_rng(3)
+    n = 500
+    df = pd.DataFrame({
+        "group": rng.choice(["a", "b", "c"], n),
+        "pair": rng.choice(["x", "y"], n),
+        "value": rng.normal(size=n) * 1000 + 1e6,
+        "other": rng.normal(size=n),
+    })
+    df["value"] += (df["group"] == "b") * 300
+    df["other"] += 0.001 * df["value"]
+    df.loc[rng.choice(n, 20, replace=False), "value"] = np.nan
+    path = tmp_path_factory.mktemp("stream") / "data.csv"
+    df.to_csv(path, index=False)
+    return df, str(path)
+
+@pytest.mark.parametrize("chunk_rows", [37, 10_000])
+def test_welch_t_test(data, chunk_rows):
+    df, path = data
+    out = stream_test(path, None, "t-test", {"group_col": "pair", "value_col": "value"}, chunk_rows=chunk_rows)
+    g = {k: v.dropna() for k, v in df.groupby("pair")["value"]}
+    ref = stats.ttest_ind(g[out["group1"]], g[out["group2"]], equal_var=False)
+    assert out["t_statistic"] == pytest.approx(ref.statistic, rel=1e-9)
+    assert out["p_value"] == pytest.approx(ref.pvalue, rel=1e-9)
+
+@pytest.mark.parametrize("chunk_rows", [37, 10_000])
+def test_anova(data, chunk_rows):
+    df, path = data
+    out = stream_test(path, None, "anova", {"group_col": "group", "value_col": "value"}, chunk_rows=chunk_rows)
+    ref = stats.f_oneway(*[v.dropna() for _, v in df.groupby("group")["value"]])
+    assert out["f_statistic"] == pytest.approx(ref.statistic, rel=1e-9)
+    assert out["p_value"] == pytest.approx(ref.pvalue, rel=1e-9)
+
+@pytest.mark.parametrize("chunk_rows", [37, 10_000])
+def test_pearson(data, chunk_rows):
+    df, path = data
+    out = stream_test(path, None, "pearson", {"col1": "value", "col2": "other"}, chunk_rows=chunk_rows)
+    pair = df[["value", "other"]].dropna()
+    ref = stats.pearsonr(pair["value"], pair["other"])
+    assert out["n"] == len(pair)
+    assert out["correlation"] == pytest.approx(ref.statistic, rel=1e-9)
+    assert out["p_value"] == pytest.approx(ref.pvalue, rel=1e-6)
+
+@pytest.mark.parametrize("chunk_rows", [37, 10_000])
+def test_chi2(data, chunk_rows):
+    df, path = data
+    out = stream_test(path, None, "chi2", {"col1": "group", "col2": "pair"}, chunk_rows=chunk_rows)
+    chi2, p, dof, _ = stats.chi2_contingency(pd.crosstab(df["group"], df["pair"]))
+    assert out["chi2_statistic"] == pytest.approx(chi2, rel=1e-9)
+    assert out["p_value"] == pytest.approx(p, rel=1e-9)
+    assert out["dof"] == dof
+
+@pytest.mark.parametrize("chunk_rows", [37, 10_000])
+def test_linreg(data, chunk_rows):
+    import statsmodels.formula.api as smf
+    df, path = data
+    out = stream_test(path, None, "linreg", {"target_col": "other", "feature_cols": ["value", "group"]},
+                      chunk_rows=chunk_rows)
+    ref = smf.ols("other ~ value + C(group)", data=df.dropna()).fit()
+    assert out["n"] == int(ref.nobs)
+    assert out["slope"] == pytest.approx(ref.params["value"], rel=1e-6)
+    assert out["coefficients"]["group[b]"]["coef"] == pytest.approx(ref.params["C(group)[T.b]"], rel=1e-6)
+    assert out["coefficients"]["group[b]"]["std_err"] == pytest.approx(ref.bse["C(group)[T.b]"], rel=1e-6)
+    assert out["r_squared"] == pytest.approx(ref.rsquared, rel=1e-6)
+    assert out["p_value"] == pytest.approx(ref.f_pvalue, rel=1e-6)
@@ -0,0 +1,51 @@
+import requests
+import hashlib
+import time
+
+BASE_URL = "http://localhost:8000"
+
+def test_chunked_upload():
+    print("Testing /uploads (chunked)...")
+    
+    data = ("id,value\n" + "".join(f"{i},{i * 0.5}\n" for i in range(50000))).encode()
+    checksum = hashlib.sha256(data).hexdigest()
+    chunk_size = 64 * 1024
+    
+    # 1. Init
+    r = requests.post(f"{BASE_URL}/uploads/init", json={
+        "filename": "test_chunked.csv",
+        "size": len(data),
+        "checksum": checksum
+    })
+    assert r.status_code == 200, f"Init failed: {r.text}"
+    upload_id = r.json()["upload_id"]
+    
+    # 2. Send the first chunk, then "lose" the connection and resume from the server offset
+    r = requests.put(f"{BASE_URL}/uploads/{upload_id}", params={"offset": 0}, data=data[:chunk_size])
+    assert r.json()["offset"] == chunk_size
+    
+    r = requests.put(f"{BASE_URL}/uploads/{upload_id}", params={"offset": 0}, data=data[:chunk_size])
+    assert r.status_code == 409, "Stale offset should be rejected"
+    
+    offset = requests.get(f"{BASE_URL}/uploads/{upload_id}").json()["offset"]
+    while offset < len(data):
+        r = requests.put(f"{BASE_URL}/uploads/{upload_id}", params={"offset": offset}, data=data[offset:offset + chunk_size])
+        assert r.status_code == 200, f"Chunk failed: {r.text}"
+        offset = r.json()["offset"]
+    
+    # 3. Complete
+    r = requests.post(f"{BASE_URL}/uploads/{upload_id}/complete")
+    assert r.status_code == 200, f"Complete failed: {r.text}"
+    result = r.json()
+    print("Complete Response:", result)
+    assert result["sha256"] == checksum
+    
+    # File is usable right away
+    r = requests.post(f"{BASE_URL}/sheets/load", json={"url": result["filename"]})
+    assert r.json()["total"] == 50000
+    
+    print("Chunked upload passed!")
+
+if __name__ == "__main__":
+    time.sleep(2)
+    test_chunked_upload()
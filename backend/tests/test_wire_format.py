@@ -0,0 +1,40 @@
+import json
+import pandas as pd
+from backend.services.wire_format import frame_rows, frame_columns, dumps
+
+# Runs in-process: python -m pytest backend/tests/test_wire_format.py
+
+def make_df():
+    return pd.DataFrame({
+        "aware": pd.to_datetime(["2024-01-01 10:00:00", "2024-07-01 12:30:05", None]).tz_localize("Europe/Berlin"),
+        "naive": pd.to_datetime(["2024-01-01", None, "2024-01-03"]),
+        "count": pd.array([1, None, 3], dtype="Int64"),
+    })
+
+def test_rows_and_columns_carry_the_same_values():
+    df = make_df()
+    rows = json.loads(dumps(frame_rows(df)))
+    columns = json.loads(dumps(frame_columns(df)))
+    for col in df.columns:
+        assert [r[col] for r in rows] == columns[col]["values"], col
+
+def test_datetimes_use_isoformat():
+    values = json.loads(dumps(frame_columns(make_df())))["aware"]["values"]
+    assert values == [make_df()["aware"][0].isoformat(), "2024-07-01T12:30:05+02:00", None]
+
+def test_nullable_ints_stay_ints():
+    assert json.loads(dumps(frame_columns(make_df())))["count"]["values"] == [1, None, 3]
+
+def test_sub_second_timestamps_round_trip():
+    stamps = ["2024-01-01 10:00:00.123000", "2024-01-01 10:00:01.000456", None]
+    df = pd.DataFrame({"naive": pd.to_datetime(stamps),
+                       "aware": pd.to_datetime(stamps).tz_localize("UTC").tz_convert("Asia/Kolkata")})
+    rows = json.loads(dumps(frame_rows(df)))
+    assert rows[0]["naive"] == "2024-01-01T10:00:00.123000"
+    assert rows[1]["aware"] == "2024-01-01T15:30:01.000456+05:30"
+    back = pd.DataFrame(rows)
+    pd.testing.assert_series_equal(pd.to_datetime(back["naive"]), df["naive"], check_dtype=False)
+    pd.testing.assert_series_equal(pd.to_datetime(back["aware"]).dt.tz_convert("Asia/Kolkata"), df["aware"],
+                                   check_dtype=False)
+    millis = pd.Series(pd.to_datetime(["2024-01-01 00:00:00.5", "2024-01-02 00:00:00.0"]))
+    assert json.loads(dumps(frame_rows(millis.to_frame("t"))))[0]["t"] == "2024-01-01T00:00:00.500"